@@ -9,6 +9,7 @@ from apps.api.routes.detetive_routes import router as detetive_router  # ✅ adi
 
 
 from apps.api.routes import admin_routes
+from apps.api.routes import admin_banco_routes
 
 settings = get_settings()
 
@@ -33,3 +34,4 @@ app.include_router(leads_router, prefix="/v1")
 app.include_router(health_router, prefix="/v1")
 app.include_router(detetive_router)  # ✅ isso habilita a rota do modo detetive
 app.include_router(admin_routes.router)
+app.include_router(admin_banco_routes.router)  # /v1/admin/db/* (fila + métricas)
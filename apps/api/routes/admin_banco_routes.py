@@ -1,10 +1,12 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import PlainTextResponse
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from packages.database.session import get_session
+from apps.api.services.queue_metrics_service import coletar_metricas_fila, formatar_prometheus
 
 router = APIRouter(prefix="/v1/admin", tags=["Admin/DB"])
 
@@ -27,3 +29,18 @@ async def listar_fila(db: AsyncSession = Depends(get_session)):
         LIMIT 100
     """))
     return [dict(r._mapping) for r in rs.fetchall()]
+
+@router.get("/db/queue/metrics")
+async def metricas_fila(
+    janela_min: int = Query(60, ge=1, le=7 * 24 * 60),
+    db: AsyncSession = Depends(get_session),
+):
+    return await coletar_metricas_fila(db, janela_min)
+
+@router.get("/db/queue/metrics/prometheus", response_class=PlainTextResponse)
+async def metricas_fila_prometheus(
+    janela_min: int = Query(60, ge=1, le=7 * 24 * 60),
+    db: AsyncSession = Depends(get_session),
+):
+    m = await coletar_metricas_fila(db, janela_min)
+    return PlainTextResponse(formatar_prometheus(m), media_type="text/plain; version=0.0.4")
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 from uuid import uuid4
 from typing import Literal
 
@@ -10,6 +11,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from packages.database.session import get_session
 from packages.jobs.queue import enqueue
+from packages.jobs.download import catalogo
 from apps.api.services import admin_service
 
 # 👉 prefix agora é /v1 (bate com o front)
@@ -27,6 +29,7 @@ class ImportacaoPayload(BaseModel):
 class DownloadPayload(BaseModel):
     distribuidora: str
     ano: int
+    max_kbps: int | None = None  # teto só deste download; padrão: orçamento do host
 
 class EnrichPayload(BaseModel):
     lead_ids: list[str] | None = None
@@ -36,19 +39,8 @@ class ImportacaoSelecionados(BaseModel):
     distribuidoras: list[str] = Field(default_factory=list)
     anos: list[int] = Field(default_factory=list)
 
-# mapeia nomes do UI -> nomes da VIEW dataset_url_normalized.distribuidora
-UI_TO_DB = {
-    "ENEL DISTRIBUIÇÃO SP": "ENEL_SP",
-    "ENEL DISTRIBUIÇÃO RIO": "ENEL_RJ",
-    "ELETROPAULO": "ENEL_SP",  # histórico
-    "LIGHT": "LIGHT",
-    "ENERGISA": "ENERGISA",    # ajuste se na sua view for outra sigla
-    "NEOENERGIA": "NEOENERGIA",
-    "EDP SP": "EDP_SP",
-    "CPFL PAULISTA": "CPFL_PAULISTA",
-    "CPFL PIRATININGA": "CPFL_PIRATININGA",
-    "CPFL SANTA CRUZ": "CPFL_SANTA_CRUZ",
-}
+# nomes do UI -> chave canônica do dataset_catalog_index ("ENEL DISTRIBUIÇÃO SP" -> ENEL_SP);
+# apelidos históricos (ELETROPAULO, ...) em catalogo.ALIASES
 
 def map_status_ui(db_status: str, observacoes: str | None) -> Literal["concluido","erro","importando","baixando","extraindo","pendente"]:
     s = (db_status or "").lower()
@@ -79,20 +71,22 @@ async def ping():
 async def importar_selecionados(payload: ImportacaoSelecionados, db: AsyncSession = Depends(get_session)):
     """
     Recebe { distribuidoras: string[], anos: number[] }
-    Busca URLs na VIEW dataset_url_normalized e insere import_status = 'queued'.
+    Busca URLs no índice do catálogo (dataset_catalog_index), insere import_status = 'queued'
+    e enfileira download + importers de cada (distribuidora, ano) em lote.
     """
     distribs_ui = payload.distribuidoras or []
     anos = payload.anos or []
     if not distribs_ui or not anos:
         raise HTTPException(status_code=400, detail="Selecione pelo menos 1 distribuidora e 1 ano.")
 
-    # converte UI -> nomes da view
-    distribs_db = [UI_TO_DB.get(d, d) for d in distribs_ui]
+    # converte UI -> chave canônica
+    distribs_db = sorted({catalogo.chave_distribuidora(d) for d in distribs_ui})
 
-    # busca linhas na view
+    # itens do catálogo ainda fora do índice entram antes da busca
+    await asyncio.to_thread(catalogo.garantir_indice)
     q = text("""
-        SELECT id, distribuidora, ano, url, title
-        FROM dataset_url_normalized
+        SELECT catalog_id AS id, distribuidora, ano, url, titulo AS title
+        FROM intel_lead.dataset_catalog_index
         WHERE distribuidora = ANY(:dists) AND ano = ANY(:anos)
         ORDER BY distribuidora, ano
     """)
@@ -125,7 +119,18 @@ async def importar_selecionados(payload: ImportacaoSelecionados, db: AsyncSessio
     await db.execute(insert_q, params)
     await db.commit()
 
-    return {"enfileirados": len(params)}
+    # jobs na import_queue: 1 por (distribuidora, ano), mesmo com várias URLs no catálogo;
+    # o que já estiver queued/running é reaproveitado (dedup_key); psycopg2 bloqueante: fora do loop
+    pares = sorted({(r._mapping["distribuidora"], int(r._mapping["ano"])) for r in rows})
+    jobs = await asyncio.to_thread(
+        admin_service.enfileirar_importacoes,
+        [ImportacaoPayload(distribuidora=d, ano=a) for d, a in pares])
+
+    return {
+        "enfileirados": len(params),
+        "download_jobs": [j["download_job"] for j in jobs],
+        "import_jobs": [i for j in jobs for i in j["import_jobs"]],
+    }
 
 # seus endpoints existentes continuam aqui (ajuste de prefix já aplica)
 @router.post("/admin/importar")
@@ -134,13 +139,10 @@ async def importar(payload: ImportacaoPayload):
 
 @router.post("/download")
 async def download_dataset(payload: DownloadPayload):
-    job_id = enqueue({
-        "download": {
-            "distribuidora": payload.distribuidora,
-            "ano": payload.ano,
-            "max_kbps": 256
-        }
-    }, priority=5)
+    download = {"distribuidora": payload.distribuidora, "ano": payload.ano}
+    if payload.max_kbps:
+        download["max_kbps"] = payload.max_kbps
+    job_id = enqueue({"download": download}, priority=5, dedup_key=f"download:{payload.distribuidora}:{payload.ano}")
     return {"status": "queued", "job_id": job_id}
 
 @router.get("/download/status")
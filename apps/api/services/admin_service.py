@@ -1,12 +1,13 @@
 from __future__ import annotations
 
+import asyncio
 from typing import Any
 
 from pydantic import BaseModel
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from packages.jobs.queue import enqueue
+from packages.jobs.queue import enqueue_many
 
 # Caminhos dos importers (iguais aos que usamos no orquestrador)
 IMPORTERS = {
@@ -21,59 +22,89 @@ class ImportacaoPayload(BaseModel):
     ano: int
     camadas: list[str]
     url: str | None = None
+    max_kbps: int | None = None  # teto só deste download; padrão: orçamento do host
 
 # ============== Import / Download orchestration (enfileira) ==============
 
-async def executar_importacao(payload: ImportacaoPayload) -> dict[str, Any]:
-    dist = payload.distribuidora
-    ano = int(payload.ano)
-    gdb_name = f"{dist}_{ano}"
-    gdb_path = f"data/downloads/{gdb_name}.gdb"
-
-    # 1) Download job (worker resolve URL via catálogo; se você quiser forçar, passe url=...)
-    download_job = enqueue({
-        "download": {
-            "distribuidora": dist,
-            "ano": ano,
-            "max_kbps": 256,
-            # "url": payload.url,  # descomente para forçar URL específica
+def _env_camada(cam: str) -> dict[str, str]:
+    if cam == "UCBT":
+        return {
+            "UCBT_MAX_RSS_MB": "768",
+            "UCBT_CHUNK_SIZE": "3000",
+            "UCBT_SLEEP_MS_BETWEEN": "120",
+        }
+    if cam == "PONNOT":
+        return {
+            "PONNOT_CHUNK_SIZE": "4000",
+            "PONNOT_SLEEP_MS_BETWEEN": "80",
+        }
+    return {}
+
+
+def enfileirar_importacoes(itens: list[ImportacaoPayload]) -> list[dict[str, Any]]:
+    """
+    Enfileira download + importers de vários (distribuidora, ano) em dois
+    INSERTs multi-linha (downloads, depois importers), numa conexão.
+    dedup_key evita duplicar um download/import que já está queued/running:
+    nesse caso o id devolvido é o do job existente.
+    """
+    if not itens:
+        return []
+
+    # 1) Download jobs (worker resolve URL via catálogo; se você quiser forçar, passe url=...)
+    downloads = []
+    for p in itens:
+        gdb_name = f"{p.distribuidora}_{int(p.ano)}"
+        download = {
+            "distribuidora": p.distribuidora,
+            "ano": int(p.ano),
+            # "url": p.url,  # descomente para forçar URL específica
             "nome_destino": gdb_name,
         }
-    }, priority=5)
+        if getattr(p, "max_kbps", None):
+            download["max_kbps"] = int(p.max_kbps)
+        downloads.append({"download": download})
+    download_ids = enqueue_many(
+        downloads,
+        priority=5,
+        dedup_keys=[f"download:{p.distribuidora}:{int(p.ano)}" for p in itens],
+    )
 
     # 2) Importers selecionados
-    job_ids: list[str] = []
-    for camada in payload.camadas:
-        cam = camada.upper().strip()
-        script = IMPORTERS.get(cam)
-        if not script:
-            continue
-
-        env = {}
-        if cam == "UCBT":
-            env.update({
-                "UCBT_CHUNK_SIZE": "3000",
-                "UCBT_ROWS_PER_COPY": "15000",
-                "UCBT_SLEEP_MS_BETWEEN": "120",
-            })
-        if cam == "PONNOT":
-            env.update({
-                "PONNOT_CHUNK_SIZE": "4000",
-                "PONNOT_SLEEP_MS_BETWEEN": "80",
+    imports, deps, chaves, donos = [], [], [], []
+    for i, p in enumerate(itens):
+        dist, ano = p.distribuidora, int(p.ano)
+        gdb_name = f"{dist}_{ano}"
+        gdb_path = f"data/downloads/{gdb_name}.gdb"
+        for camada in p.camadas:
+            cam = camada.upper().strip()
+            script = IMPORTERS.get(cam)
+            if not script:
+                continue
+
+            args = ["--gdb", gdb_path, "--distribuidora", dist, "--ano", str(ano), "--prefixo", gdb_name]
+
+            imports.append({
+                "script": script,
+                "args": args,
+                "env": _env_camada(cam),
             })
+            # só sai da fila quando o download terminar 'done' (o GDB existe)
+            deps.append([download_ids[i]])
+            chaves.append(f"import:{dist}:{ano}:{cam}")
+            donos.append(i)
+    import_ids = enqueue_many(imports, priority=5, depends_on=deps, dedup_keys=chaves)
 
-        job_id = enqueue({
-            "script": script,
-            "args": ["--gdb", gdb_path, "--distribuidora", dist, "--ano", str(ano)],
-            "env": env,
-        }, priority=5)
-        job_ids.append(job_id)
-
-    return {
-        "status": "queued",
-        "download_job": download_job,
-        "import_jobs": job_ids,
-    }
+    out = [{"status": "queued", "download_job": download_ids[i], "import_jobs": []}
+           for i in range(len(itens))]
+    for i, job_id in zip(donos, import_ids):
+        out[i]["import_jobs"].append(job_id)
+    return out
+
+
+async def executar_importacao(payload: ImportacaoPayload) -> dict[str, Any]:
+    # enqueue_many usa psycopg2 (bloqueante): fora do event loop
+    return (await asyncio.to_thread(enfileirar_importacoes, [payload]))[0]
 
 # ============== Métricas / Listagens rápidas ==============
 
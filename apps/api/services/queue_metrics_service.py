@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+"""
+Métricas da import_queue para dimensionar a frota de workers.
+
+Tudo sai do banco (sem estado no processo da API):
+- profundidade por status/prioridade e idade do job mais antigo na fila
+- distribuição de espera e de execução na janela (contagem acumulada por
+  limite `le`, como os buckets de um histograma)
+- vazão (jobs/min) e taxa de retry na janela
+- utilização por worker (segundos ocupados / janela) + último heartbeat (lease)
+- contadores publicados pelos próprios workers (import_worker): slots,
+  segundos ocupados, recusas de admissão e leases perdidas — inclusive de
+  worker ocioso, que não aparece nas linhas da import_queue
+
+Exposto em JSON e em texto Prometheus (formatar_prometheus).
+"""
+
+from typing import Any
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# limites dos buckets (segundos): de segundos (PONNOT/enrich) a horas (UCBT grande)
+BUCKETS_ESPERA = [1, 5, 15, 30, 60, 300, 900, 1800, 3600, 4 * 3600, 12 * 3600]
+BUCKETS_EXECUCAO = [5, 30, 60, 300, 900, 1800, 3600, 2 * 3600, 4 * 3600, 8 * 3600, 24 * 3600]
+
+# ============== Consultas ==============
+
+async def _profundidade(db: AsyncSession) -> list[dict]:
+    rs = await db.execute(text("""
+        SELECT status, priority, COUNT(*) AS jobs,
+               EXTRACT(EPOCH FROM now() - MIN(available_at)) AS idade_max_s
+        FROM import_queue
+        WHERE status IN ('queued', 'running')
+        GROUP BY status, priority
+        ORDER BY status, priority
+    """))
+    return [dict(r._mapping) for r in rs.fetchall()]
+
+
+async def _histograma(db: AsyncSession, expr: str, filtro: str, buckets: list[float], janela_s: int) -> dict:
+    # expr/filtro são constantes deste módulo (não vêm do request)
+    rs = await db.execute(text(f"""
+        WITH d AS (
+            SELECT {expr} AS s
+            FROM import_queue
+            WHERE {filtro}
+        )
+        SELECT ARRAY(
+                   SELECT (SELECT COUNT(*) FROM d WHERE d.s <= b.le)
+                   FROM unnest(CAST(:buckets AS double precision[])) WITH ORDINALITY AS b(le, i)
+                   ORDER BY b.i
+               ) AS acumulado,
+               (SELECT COUNT(*) FROM d) AS n,
+               (SELECT COALESCE(SUM(s), 0) FROM d) AS soma
+    """), {"buckets": [float(b) for b in buckets], "janela": janela_s})
+    acumulado, n, soma = rs.one()
+    return {
+        "buckets": [{"le": float(le), "count": int(c)} for le, c in zip(buckets, acumulado or [])]
+                   + [{"le": "+Inf", "count": int(n or 0)}],  # JSON não tem Infinity
+        "sum": float(soma or 0),
+        "count": int(n or 0),
+    }
+
+
+async def _vazao(db: AsyncSession, janela_s: int) -> dict:
+    rs = await db.execute(text("""
+        SELECT COUNT(*) FILTER (WHERE status = 'done')   AS done,
+               COUNT(*) FILTER (WHERE status = 'failed') AS failed,
+               COUNT(*) FILTER (WHERE tries > 1)          AS com_retry,
+               COALESCE(AVG(tries), 0)                    AS tries_medio
+        FROM import_queue
+        WHERE finished_at >= now() - make_interval(secs => :janela)
+    """), {"janela": janela_s})
+    done, failed, com_retry, tries_medio = rs.one()
+    total = (done or 0) + (failed or 0)
+    minutos = janela_s / 60
+    # requeue por backoff não tem finished_at: tentativas em andamento contam à parte
+    rs_req = await db.execute(text("""
+        SELECT COUNT(*) FROM import_queue
+        WHERE (status = 'queued' AND tries > 0) OR (status = 'running' AND tries > 1)
+    """))
+    return {
+        "done": int(done or 0),
+        "failed": int(failed or 0),
+        "jobs_por_minuto": round(total / minutos, 3) if minutos else 0.0,
+        "taxa_retry": round((com_retry or 0) / total, 4) if total else 0.0,
+        "taxa_falha": round((failed or 0) / total, 4) if total else 0.0,
+        "tries_medio": round(float(tries_medio or 0), 3),
+        "em_retry_agora": int(rs_req.scalar() or 0),
+    }
+
+
+async def _workers(db: AsyncSession, janela_s: int) -> list[dict]:
+    rs = await db.execute(text("""
+        SELECT worker_id,
+               SUM(EXTRACT(EPOCH FROM
+                   LEAST(COALESCE(finished_at, now()), now())
+                   - GREATEST(started_at, now() - make_interval(secs => :janela))
+               )) AS ocupado_s,
+               COUNT(*) FILTER (WHERE status = 'running') AS rodando,
+               COUNT(*) FILTER (WHERE status = 'done')    AS done,
+               COUNT(*) FILTER (WHERE status = 'failed')  AS failed,
+               MAX(heartbeat_at) AS ultimo_heartbeat
+        FROM import_queue
+        WHERE worker_id IS NOT NULL
+          AND started_at IS NOT NULL
+          AND (finished_at IS NULL OR finished_at >= now() - make_interval(secs => :janela))
+        GROUP BY worker_id
+        ORDER BY worker_id
+    """), {"janela": janela_s})
+    out = []
+    for r in rs.fetchall():
+        d = dict(r._mapping)
+        d["ocupado_s"] = round(float(d["ocupado_s"] or 0), 1)
+        # > 1 = mais de um slot ocupado em média (worker multi-slot)
+        d["utilizacao"] = round(d["ocupado_s"] / janela_s, 3) if janela_s else 0.0
+        out.append(d)
+    return out
+
+async def _workers_publicados(db: AsyncSession, janela_s: int) -> list[dict]:
+    # só quem bateu heartbeat na janela (linhas de workers mortos ficam até o arquivamento)
+    rs = await db.execute(text("""
+        SELECT worker_id, slots, ocupados, ocupado_s_total, rejeicoes_admissao, leases_perdidas,
+               heartbeat_em
+        FROM import_worker
+        WHERE heartbeat_em >= now() - make_interval(secs => :janela)
+        ORDER BY worker_id
+    """), {"janela": janela_s})
+    return [dict(r._mapping) for r in rs.fetchall()]
+
+
+def _juntar_workers(da_fila: list[dict], publicados: list[dict]) -> list[dict]:
+    """Une por worker_id o que sai da import_queue com a linha que o worker publica."""
+    por_id = {w["worker_id"]: w for w in da_fila}
+    for p in publicados:
+        w = por_id.setdefault(p["worker_id"], {
+            "worker_id": p["worker_id"], "ocupado_s": 0.0, "utilizacao": 0.0,
+            "rodando": 0, "done": 0, "failed": 0, "ultimo_heartbeat": None,
+        })
+        w["slots"] = int(p["slots"])
+        w["ocupados"] = int(p["ocupados"])
+        w["ocupado_s_total"] = round(float(p["ocupado_s_total"] or 0), 1)
+        w["rejeicoes_admissao"] = int(p["rejeicoes_admissao"])
+        w["leases_perdidas"] = int(p["leases_perdidas"])
+        # fração da capacidade (utilizacao é em slots)
+        w["utilizacao_slots"] = round(w["utilizacao"] / w["slots"], 3) if w["slots"] else 0.0
+        hb = [h for h in (w["ultimo_heartbeat"], p["heartbeat_em"]) if h is not None]
+        w["ultimo_heartbeat"] = max(hb) if hb else None
+    return [por_id[k] for k in sorted(por_id)]
+
+# ============== API ==============
+
+async def coletar_metricas_fila(db: AsyncSession, janela_min: int = 60) -> dict[str, Any]:
+    janela_s = int(janela_min) * 60
+    return {
+        "janela_min": int(janela_min),
+        "profundidade": await _profundidade(db),
+        "espera_s": await _histograma(
+            db, "EXTRACT(EPOCH FROM started_at - available_at)",
+            "started_at >= now() - make_interval(secs => :janela)",
+            BUCKETS_ESPERA, janela_s),
+        "execucao_s": await _histograma(
+            db, "EXTRACT(EPOCH FROM finished_at - started_at)",
+            "finished_at >= now() - make_interval(secs => :janela) AND started_at IS NOT NULL",
+            BUCKETS_EXECUCAO, janela_s),
+        "vazao": await _vazao(db, janela_s),
+        "workers": _juntar_workers(await _workers(db, janela_s), await _workers_publicados(db, janela_s)),
+    }
+
+# ============== Prometheus ==============
+
+def _le(v: float | str) -> str:
+    return v if isinstance(v, str) else f"{v:g}"
+
+
+def formatar_prometheus(m: dict[str, Any]) -> str:
+    """Texto no formato de exposição do Prometheus (text/plain; version=0.0.4)."""
+    linhas: list[str] = []
+
+    def metrica(nome: str, tipo: str, ajuda: str):
+        linhas.append(f"# HELP {nome} {ajuda}")
+        linhas.append(f"# TYPE {nome} {tipo}")
+
+    metrica("import_queue_jobs", "gauge", "Jobs na fila por status e prioridade")
+    for p in m["profundidade"]:
+        linhas.append(f'import_queue_jobs{{status="{p["status"]}",priority="{p["priority"]}"}} {p["jobs"]}')
+
+    metrica("import_queue_idade_max_segundos", "gauge", "Idade do job mais antigo por status e prioridade")
+    for p in m["profundidade"]:
+        linhas.append(f'import_queue_idade_max_segundos{{status="{p["status"]}",priority="{p["priority"]}"}} '
+                      f'{float(p["idade_max_s"] or 0):.3f}')
+
+    # contagens da janela sobem e descem: gauges, não histogram (o Prometheus
+    # exige _bucket/_sum/_count monotônicos; rate()/histogram_quantile quebrariam)
+    for chave, nome, ajuda in (
+        ("espera_s", "import_queue_espera_segundos_janela", "Espera na fila (available_at -> started_at)"),
+        ("execucao_s", "import_queue_execucao_segundos_janela",
+         "Duração da execução (started_at -> finished_at)"),
+    ):
+        h = m[chave]
+        janela = f"janela de {m['janela_min']} min"
+        metrica(nome, "gauge", f"{ajuda}: jobs com duração <= le, {janela}")
+        for b in h["buckets"]:
+            linhas.append(f'{nome}{{le="{_le(b["le"])}"}} {b["count"]}')
+        metrica(f"{nome}_soma", "gauge", f"{ajuda}: soma das durações (s), {janela}")
+        linhas.append(f"{nome}_soma {h['sum']:.3f}")
+        metrica(f"{nome}_jobs", "gauge", f"{ajuda}: jobs, {janela}")
+        linhas.append(f"{nome}_jobs {h['count']}")
+
+    v = m["vazao"]
+    metrica("import_queue_jobs_por_minuto", "gauge", "Jobs finalizados por minuto na janela")
+    linhas.append(f"import_queue_jobs_por_minuto {v['jobs_por_minuto']}")
+    metrica("import_queue_finalizados", "gauge", "Jobs finalizados na janela por status")
+    linhas.append(f'import_queue_finalizados{{status="done"}} {v["done"]}')
+    linhas.append(f'import_queue_finalizados{{status="failed"}} {v["failed"]}')
+    metrica("import_queue_taxa_retry", "gauge", "Fração dos finalizados que precisou de mais de 1 tentativa")
+    linhas.append(f"import_queue_taxa_retry {v['taxa_retry']}")
+    metrica("import_queue_em_retry", "gauge", "Jobs queued/running que já falharam ao menos uma vez")
+    linhas.append(f"import_queue_em_retry {v['em_retry_agora']}")
+
+    metrica("import_worker_utilizacao", "gauge", "Segundos ocupados / janela por worker (>1 = multi-slot)")
+    for w in m["workers"]:
+        linhas.append(f'import_worker_utilizacao{{worker="{w["worker_id"]}"}} {w["utilizacao"]}')
+    metrica("import_worker_rodando", "gauge", "Jobs running por worker")
+    for w in m["workers"]:
+        linhas.append(f'import_worker_rodando{{worker="{w["worker_id"]}"}} {w["rodando"]}')
+
+    # publicados pelo worker (ausentes se ele ainda não rodou a migração import_worker)
+    publicados = [w for w in m["workers"] if "slots" in w]
+    metrica("import_worker_slots", "gauge", "Slots configurados por worker (WORKER_SLOTS)")
+    for w in publicados:
+        linhas.append(f'import_worker_slots{{worker="{w["worker_id"]}"}} {w["slots"]}')
+    metrica("import_worker_ocupados", "gauge", "Jobs em execução no worker segundo o próprio worker")
+    for w in publicados:
+        linhas.append(f'import_worker_ocupados{{worker="{w["worker_id"]}"}} {w["ocupados"]}')
+    # contadores desde o boot do worker (worker_id novo a cada boot): rate() funciona
+    for chave, nome, ajuda in (
+        ("ocupado_s_total", "import_worker_ocupado_segundos_total", "Segundos de job executados pelo worker"),
+        ("rejeicoes_admissao", "import_worker_rejeicoes_admissao_total",
+         "Classes de recurso recusadas na admissão (slots/RAM/CPU/conexões)"),
+        ("leases_perdidas", "import_worker_leases_perdidas_total", "Leases perdidas pelo worker"),
+    ):
+        metrica(nome, "counter", ajuda)
+        for w in publicados:
+            linhas.append(f'{nome}{{worker="{w["worker_id"]}"}} {w[chave]}')
+
+    return "\n".join(linhas) + "\n"
@@ -0,0 +1,144 @@
+# packages/database/migrar.py
+# -*- coding: utf-8 -*-
+"""
+Migrações de schema, rodadas uma vez no deploy (fora do caminho de conexão
+dos workers e da API):
+
+    python -m packages.database.migrar            # aplica o que falta
+    python -m packages.database.migrar --listar   # só mostra o estado
+
+- MIGRACOES: arquivos de packages/database/schema, em ordem. Cada um fica
+  registrado em intel_lead.schema_migracoes (nome, sha256) e só roda de novo
+  se o conteúdo mudar — os scripts continuam idempotentes
+- Comando a comando em autocommit: CREATE INDEX CONCURRENTLY funciona (não
+  roda dentro de transação) e nenhum lock fica preso entre um comando e outro
+- pg_advisory_lock: dois deploys ao mesmo tempo não aplicam em paralelo
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+from pathlib import Path
+
+SCHEMA_DIR = Path(__file__).resolve().parent / "schema"
+
+# ordem de aplicação
+MIGRACOES = [
+    "import_queue.sql",
+    "import_queue_indice_prontos.sql",
+    "import_worker.sql",
+    "cache_geo_cnpj.sql",
+]
+
+_CONTROLE_SQL = """
+    CREATE TABLE IF NOT EXISTS intel_lead.schema_migracoes (
+        nome        TEXT PRIMARY KEY,
+        sha256      TEXT        NOT NULL,
+        aplicada_em TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+"""
+
+
+def separar_comandos(sql: str) -> list[str]:
+    """Divide o script nos `;` de topo (ignora os de strings, $$...$$ e comentários)."""
+    comandos, atual = [], []
+    i, n = 0, len(sql)
+    while i < n:
+        c = sql[i]
+        if sql.startswith("--", i):
+            fim = sql.find("\n", i)
+            i = n if fim < 0 else fim
+            continue
+        if sql.startswith("/*", i):
+            fim = sql.find("*/", i + 2)
+            i = n if fim < 0 else fim + 2
+            continue
+        if c == "'":
+            fim = i + 1
+            while fim < n:
+                if sql[fim] == "'" and not sql.startswith("''", fim):
+                    break
+                fim += 2 if sql.startswith("''", fim) else 1
+            atual.append(sql[i:fim + 1])
+            i = fim + 1
+            continue
+        if c == "$":
+            fim_tag = sql.find("$", i + 1)
+            tag = sql[i:fim_tag + 1] if fim_tag > 0 else ""
+            if tag and (len(tag) == 2 or tag[1:-1].replace("_", "").isalnum()):
+                fim = sql.find(tag, fim_tag + 1)
+                fim = n if fim < 0 else fim + len(tag)
+                atual.append(sql[i:fim])
+                i = fim
+                continue
+        if c == ";":
+            cmd = "".join(atual).strip()
+            if cmd:
+                comandos.append(cmd)
+            atual = []
+        else:
+            atual.append(c)
+        i += 1
+    cmd = "".join(atual).strip()
+    if cmd:
+        comandos.append(cmd)
+    return comandos
+
+
+def _sha256(texto: str) -> str:
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+def pendentes(cur, nomes: list[str] = MIGRACOES) -> list[str]:
+    cur.execute("SELECT nome, sha256 FROM intel_lead.schema_migracoes")
+    aplicadas = dict(cur.fetchall())
+    return [n for n in nomes if aplicadas.get(n) != _sha256((SCHEMA_DIR / n).read_text(encoding="utf-8"))]
+
+
+def migrar(conn, nomes: list[str] = MIGRACOES) -> list[str]:
+    """Aplica as migrações pendentes. Retorna os nomes aplicados."""
+    conn.autocommit = True
+    aplicadas = []
+    with conn.cursor() as cur:
+        cur.execute(_CONTROLE_SQL)
+        cur.execute("SELECT pg_advisory_lock(hashtext('intel_lead.schema_migracoes'))")
+        try:
+            for nome in pendentes(cur, nomes):
+                texto = (SCHEMA_DIR / nome).read_text(encoding="utf-8")
+                for cmd in separar_comandos(texto):
+                    cur.execute(cmd)
+                cur.execute("""
+                    INSERT INTO intel_lead.schema_migracoes (nome, sha256) VALUES (%s, %s)
+                    ON CONFLICT (nome) DO UPDATE SET sha256 = EXCLUDED.sha256, aplicada_em = now()
+                """, (nome, _sha256(texto)))
+                aplicadas.append(nome)
+        finally:
+            cur.execute("SELECT pg_advisory_unlock(hashtext('intel_lead.schema_migracoes'))")
+    return aplicadas
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Aplica as migrações de schema (deploy)")
+    ap.add_argument("--listar", action="store_true", help="só lista as pendentes")
+    args = ap.parse_args()
+
+    import psycopg2
+    from packages.database.connection import DB_CONFIG
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        if args.listar:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(_CONTROLE_SQL)
+                print("\n".join(pendentes(cur)) or "nada pendente")
+            return
+        aplicadas = migrar(conn)
+        print(f"aplicadas: {', '.join(aplicadas)}" if aplicadas else "nada pendente")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+-- ================================
+-- CACHE_GEO_CNPJ — EXTENSÕES
+-- (migração de deploy: python -m packages.database.migrar)
+-- ================================
+-- Idempotente e sem ALTER quando já aplicado. Roda uma vez no deploy: o
+-- enrich_geo_job não aplica schema nem faz backfill ao abrir a conexão.
+
+-- geohash (precisão GEO_CACHE_PRECISAO) do centro da busca: a consulta olha a
+-- célula do ponto + 8 vizinhas e reaproveita buscas com centro a poucos metros.
+-- resultado: o place details já buscado, para o reuso não custar nenhuma chamada.
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.tables
+        WHERE table_schema = 'enriquecimento_lead' AND table_name = 'cache_geo_cnpj'
+    ) AND NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = 'enriquecimento_lead' AND table_name = 'cache_geo_cnpj' AND column_name = 'geohash'
+    ) THEN
+        ALTER TABLE enriquecimento_lead.cache_geo_cnpj
+            ADD COLUMN geohash   TEXT,
+            ADD COLUMN resultado JSONB;
+    END IF;
+END $$;
+
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = 'enriquecimento_lead' AND table_name = 'cache_geo_cnpj' AND column_name = 'geohash'
+    ) THEN
+        CREATE INDEX IF NOT EXISTS cache_geo_cnpj_geohash_idx
+            ON enriquecimento_lead.cache_geo_cnpj (geohash);
+    END IF;
+END $$;
+
+-- Backfill do geohash das linhas anteriores à coluna. Mesmo algoritmo de
+-- cache_geo.geohash(); função temporária (some com a sessão da migração).
+-- Precisão fixa 7 = default de GEO_CACHE_PRECISAO: quem mudar a precisão
+-- precisa recalcular a coluna inteira (as linhas novas já saem na nova).
+CREATE OR REPLACE FUNCTION pg_temp.geohash(lat DOUBLE PRECISION, lon DOUBLE PRECISION, precisao INT)
+RETURNS TEXT LANGUAGE plpgsql IMMUTABLE AS $$
+DECLARE
+    base32  CONSTANT TEXT := '0123456789bcdefghjkmnpqrstuvwxyz';
+    lat_min DOUBLE PRECISION := -90;
+    lat_max DOUBLE PRECISION := 90;
+    lon_min DOUBLE PRECISION := -180;
+    lon_max DOUBLE PRECISION := 180;
+    meio    DOUBLE PRECISION;
+    gh      TEXT := '';
+    bits    INT := 0;
+    n       INT := 0;
+    par     BOOLEAN := TRUE;
+BEGIN
+    WHILE length(gh) < precisao LOOP
+        IF par THEN
+            meio := (lon_min + lon_max) / 2;
+            IF lon >= meio THEN
+                bits := bits * 2 + 1;
+                lon_min := meio;
+            ELSE
+                bits := bits * 2;
+                lon_max := meio;
+            END IF;
+        ELSE
+            meio := (lat_min + lat_max) / 2;
+            IF lat >= meio THEN
+                bits := bits * 2 + 1;
+                lat_min := meio;
+            ELSE
+                bits := bits * 2;
+                lat_max := meio;
+            END IF;
+        END IF;
+        par := NOT par;
+        n := n + 1;
+        IF n = 5 THEN
+            gh := gh || substr(base32, bits + 1, 1);
+            bits := 0;
+            n := 0;
+        END IF;
+    END LOOP;
+    RETURN gh;
+END $$;
+
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = 'enriquecimento_lead' AND table_name = 'cache_geo_cnpj' AND column_name = 'geohash'
+    ) THEN
+        UPDATE enriquecimento_lead.cache_geo_cnpj
+        SET geohash = pg_temp.geohash(latitude::DOUBLE PRECISION, longitude::DOUBLE PRECISION, 7)
+        WHERE geohash IS NULL;
+    END IF;
+END $$;
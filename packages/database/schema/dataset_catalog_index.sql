@@ -0,0 +1,48 @@
+-- ================================
+-- DATASET_CATALOG_INDEX — resolução indexada do catálogo
+-- (aplicado por packages/jobs/download/catalogo.py na 1ª resolução de cada processo)
+-- ================================
+-- Idempotente e sem ALTER quando já aplicado (não pega lock exclusivo à toa).
+
+-- Uma linha por item do dataset_url_catalog, com a chave canônica da
+-- distribuidora (ENEL_SP, CPFL_PAULISTA, ...) e o ano já extraídos do título.
+-- Preenchida pela ingestão do catálogo (catalogo.indexar_catalogo); ids novos
+-- no catálogo entram sozinhos na próxima resolução.
+CREATE TABLE IF NOT EXISTS intel_lead.dataset_catalog_index (
+    catalog_id     BIGINT      PRIMARY KEY,
+    distribuidora  TEXT        NOT NULL,
+    ano            INT,
+    url            TEXT        NOT NULL,
+    url_hash       TEXT,
+    titulo         TEXT,
+    titulo_norm    TEXT        NOT NULL,   -- minúsculo, sem acento (busca textual)
+    atualizado_em  TIMESTAMPTZ,            -- COALESCE(modified, created) do catálogo: frescor
+    indexado_em    TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- caminho quente: (distribuidora, ano) -> mais recente
+CREATE INDEX IF NOT EXISTS dataset_catalog_index_chave_idx
+    ON intel_lead.dataset_catalog_index (distribuidora, ano, atualizado_em DESC);
+
+-- Texto livre: pg_trgm quando disponível (sem privilégio para a extensão,
+-- a resolução cai para LIKE no título normalizado, ainda filtrado por ano)
+-- (o schema da extensão varia com o search_path de quem a criou: qualificado)
+DO $$
+DECLARE
+    esquema TEXT;
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+        BEGIN
+            CREATE EXTENSION pg_trgm;
+        EXCEPTION WHEN insufficient_privilege THEN
+            RAISE NOTICE 'pg_trgm indisponível: resolução textual sem índice trigram';
+        END;
+    END IF;
+    SELECT n.nspname INTO esquema
+    FROM pg_extension e JOIN pg_namespace n ON n.oid = e.extnamespace
+    WHERE e.extname = 'pg_trgm';
+    IF esquema IS NOT NULL THEN
+        EXECUTE format('CREATE INDEX IF NOT EXISTS dataset_catalog_index_titulo_trgm_idx
+                        ON intel_lead.dataset_catalog_index USING gin (titulo_norm %I.gin_trgm_ops)', esquema);
+    END IF;
+END $$;
@@ -0,0 +1,22 @@
+-- ================================
+-- DOWNLOAD_LOG — EXTENSÕES
+-- (aplicado por packages/jobs/download/download_gdb.py no 1º download de cada processo)
+-- ================================
+-- Idempotente e sem ALTER quando já aplicado (não pega lock exclusivo à toa).
+
+-- Integridade: sha256 do arquivo baixado (calculado durante a escrita) e tamanho.
+-- Em cache hit é o digest do conteúdo em data/cache/<url_hash>/ reaproveitado.
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.tables
+        WHERE table_schema = 'intel_lead' AND table_name = 'download_log'
+    ) AND NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = 'intel_lead' AND table_name = 'download_log' AND column_name = 'sha256'
+    ) THEN
+        ALTER TABLE intel_lead.download_log
+            ADD COLUMN sha256 TEXT,
+            ADD COLUMN bytes  BIGINT;
+    END IF;
+END $$;
@@ -0,0 +1,21 @@
+-- ================================
+-- MÉTRICAS POR ETAPA DOS IMPORTERS
+-- (packages/jobs/utils/import_metrics.py)
+-- ================================
+-- Uma linha por (execução, etapa). Execuções do mesmo import_id
+-- (reimportações) se diferenciam por run_started_at.
+CREATE TABLE IF NOT EXISTS intel_lead.import_metrics (
+    import_id       TEXT        NOT NULL,
+    run_started_at  TIMESTAMPTZ NOT NULL,
+    camada          TEXT        NOT NULL,
+    etapa           TEXT        NOT NULL,   -- read | sanitize | hash | to_csv | copy | id_map | ...
+    chunks          INT         NOT NULL,
+    wall_s          DOUBLE PRECISION NOT NULL,
+    linhas          BIGINT      NOT NULL,
+    bytes           BIGINT      NOT NULL,
+    versao          TEXT,                   -- git describe / IMPORT_VERSION, para comparar releases
+    PRIMARY KEY (import_id, run_started_at, etapa)
+);
+
+CREATE INDEX IF NOT EXISTS idx_import_metrics_camada
+    ON intel_lead.import_metrics (camada, run_started_at DESC);
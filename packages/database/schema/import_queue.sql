@@ -0,0 +1,74 @@
+-- ================================
+-- IMPORT_QUEUE — EXTENSÕES
+-- (migração de deploy: python -m packages.database.migrar)
+-- ================================
+-- Idempotente, mas não é barato: CREATE INDEX pega SHARE na import_queue antes
+-- de ver que o índice existe (espera dequeues/heartbeats e trava os INSERTs).
+-- Por isso roda uma vez no deploy, nunca no caminho de conexão; os índices são
+-- CONCURRENTLY (migrar.py executa comando a comando em autocommit).
+
+-- Dependências (DAG): o job só sai da fila quando todos os pais estão 'done'
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = 'intel_lead' AND table_name = 'import_queue' AND column_name = 'depends_on'
+    ) THEN
+        ALTER TABLE intel_lead.import_queue ADD COLUMN depends_on BIGINT[] NOT NULL DEFAULT '{}';
+    END IF;
+END $$;
+
+-- falha em cascata: filhos de um job (depends_on && ARRAY[id])
+CREATE INDEX CONCURRENTLY IF NOT EXISTS import_queue_depends_on_idx
+    ON intel_lead.import_queue USING gin (depends_on);
+
+-- Lease: dono do job renova lease_until por heartbeat; vencida, o reaper re-enfileira
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = 'intel_lead' AND table_name = 'import_queue' AND column_name = 'lease_until'
+    ) THEN
+        ALTER TABLE intel_lead.import_queue
+            ADD COLUMN lease_until  TIMESTAMPTZ,
+            ADD COLUMN heartbeat_at TIMESTAMPTZ;
+    END IF;
+END $$;
+
+-- Dedup: no máximo 1 job ativo (queued/running) por chave, ex. import:ENEL_SP:2023:UCBT
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = 'intel_lead' AND table_name = 'import_queue' AND column_name = 'dedup_key'
+    ) THEN
+        ALTER TABLE intel_lead.import_queue ADD COLUMN dedup_key TEXT;
+    END IF;
+END $$;
+
+-- alvo do ON CONFLICT do enqueue_many (o predicado precisa bater com _DEDUP_ATIVO_SQL)
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS import_queue_dedup_idx
+    ON intel_lead.import_queue (dedup_key)
+    WHERE dedup_key IS NOT NULL AND status IN ('queued', 'running');
+
+-- índice do dequeue: import_queue_indice_prontos.sql (troca única, CONCURRENTLY)
+
+-- reaper: leases vencidas
+CREATE INDEX CONCURRENTLY IF NOT EXISTS import_queue_lease_idx
+    ON intel_lead.import_queue (lease_until)
+    WHERE status = 'running';
+
+-- Arquivo: jobs done/failed antigos saem da tabela quente (queue.arquivar()).
+-- Particionado por mês de finished_at; partições criadas sob demanda
+-- (import_queue_archive_AAAAMM, queue._garantir_particoes — o único DDL em
+-- tempo de execução). A linha inteira fica em `linha` (jsonb),
+-- então colunas novas na import_queue não exigem migrar o arquivo.
+CREATE TABLE IF NOT EXISTS intel_lead.import_queue_archive (
+    id           BIGINT      NOT NULL,
+    status       TEXT        NOT NULL,
+    created_at   TIMESTAMPTZ,
+    finished_at  TIMESTAMPTZ NOT NULL,
+    archived_at  TIMESTAMPTZ NOT NULL DEFAULT now(),
+    linha        JSONB       NOT NULL,
+    PRIMARY KEY (id, finished_at)
+) PARTITION BY RANGE (finished_at);
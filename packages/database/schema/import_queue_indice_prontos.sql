@@ -0,0 +1,19 @@
+-- ================================
+-- IMPORT_QUEUE — ÍNDICE DO DEQUEUE (migração única)
+-- (python -m packages.database.migrar)
+-- ================================
+-- Caminho quente do dequeue: só as linhas 'queued' já disponíveis. O ORDER BY
+-- é calculado (aging + fair share), nenhum índice entrega a ordem; o índice
+-- parcial limita o sort aos candidatos prontos em vez de todo o histórico.
+-- Substitui import_queue_dequeue_idx (priority, available_at, id), que supunha
+-- ordenação por priority.
+--
+-- CONCURRENTLY: não bloqueia enqueue/dequeue durante a criação. Se a criação
+-- falhar no meio, o índice fica INVALID e o IF NOT EXISTS o pularia: apague-o
+-- (DROP INDEX CONCURRENTLY intel_lead.import_queue_prontos_idx) e rode de novo.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS import_queue_prontos_idx
+    ON intel_lead.import_queue (available_at, id)
+    WHERE status = 'queued';
+
+-- o novo já atende o dequeue antes de o antigo sair
+DROP INDEX CONCURRENTLY IF EXISTS intel_lead.import_queue_dequeue_idx;
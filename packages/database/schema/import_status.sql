@@ -0,0 +1,20 @@
+-- ================================
+-- IMPORT_STATUS — EXTENSÕES
+-- (aplicado por packages/jobs/utils/rastreio.py na 1ª escrita/leitura de cada processo)
+-- ================================
+-- Idempotente e sem ALTER quando já aplicado (não pega lock exclusivo à toa).
+
+-- Fingerprint do .gdb importado (gdb_cache.fingerprint_gdb: nome/tamanho/mtime dos
+-- arquivos). O orquestrador compara com o .gdb em disco para pular ou reimportar.
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.tables
+        WHERE table_schema = 'intel_lead' AND table_name = 'import_status'
+    ) AND NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = 'intel_lead' AND table_name = 'import_status' AND column_name = 'fingerprint'
+    ) THEN
+        ALTER TABLE intel_lead.import_status ADD COLUMN fingerprint TEXT;
+    END IF;
+END $$;
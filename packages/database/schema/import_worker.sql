@@ -0,0 +1,24 @@
+-- ================================
+-- IMPORT_WORKER — CONTADORES PUBLICADOS PELOS WORKERS
+-- (migração de deploy: python -m packages.database.migrar)
+-- ================================
+-- 1 linha por processo worker, atualizada a cada tick da thread de manutenção.
+-- Completa o que a import_queue não mostra: worker ocioso (sem job na janela),
+-- slots configurados e o que foi recusado na admissão.
+-- Contadores são acumulados desde o boot do processo (worker_id muda a cada
+-- boot, então nunca voltam para trás na mesma série).
+
+CREATE TABLE IF NOT EXISTS intel_lead.import_worker (
+    worker_id            TEXT PRIMARY KEY,
+    slots                INT         NOT NULL,
+    ocupados             INT         NOT NULL DEFAULT 0,   -- jobs rodando agora
+    ocupado_s_total      DOUBLE PRECISION NOT NULL DEFAULT 0,  -- soma das durações (inclui os em andamento)
+    rejeicoes_admissao   BIGINT      NOT NULL DEFAULT 0,   -- classes recusadas (slots/RAM/CPU/conexões)
+    leases_perdidas      BIGINT      NOT NULL DEFAULT 0,
+    iniciado_em          TIMESTAMPTZ NOT NULL DEFAULT now(),
+    heartbeat_em         TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- workers mortos ficam para trás: queue.arquivar() apaga os sem heartbeat há dias
+CREATE INDEX CONCURRENTLY IF NOT EXISTS import_worker_heartbeat_idx
+    ON intel_lead.import_worker (heartbeat_em);
@@ -0,0 +1,122 @@
+# packages/jobs/download/banda.py
+# -*- coding: utf-8 -*-
+"""
+Limite de banda compartilhado por todos os downloads do host.
+
+GCRA (token bucket "por horário"): o estado é um único float, o horário
+teórico em que o próximo byte estaria liberado (tat). Cada consumidor reserva
+n bytes avançando tat em n/taxa e dorme até lá — fora do lock. Como todos os
+processos (workers, slots, segmentos) disputam o mesmo tat, a banda total
+fica em DOWNLOAD_BANDA_HOST_KBPS e se divide entre quem estiver baixando.
+
+O estado mora num arquivo com lock exclusivo (fcntl/msvcrt); sem lock de
+arquivo disponível, vale só dentro do processo.
+"""
+
+from __future__ import annotations
+
+import os
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+# banda total do host para todos os downloads (0 = sem limite global)
+DOWNLOAD_BANDA_HOST_KBPS = int(os.getenv("DOWNLOAD_BANDA_HOST_KBPS", "1024"))
+# rajada tolerada (segundos de banda): bucket ocioso libera esse volume sem espera
+DOWNLOAD_BANDA_RAJADA_S = float(os.getenv("DOWNLOAD_BANDA_RAJADA_S", "1.0"))
+DOWNLOAD_BANDA_ARQUIVO = Path(os.getenv(
+    "DOWNLOAD_BANDA_ARQUIVO", str(Path(tempfile.gettempdir()) / "intel_lead_download_banda.lock")))
+
+_FMT = "<d"  # tat em segundos (time.time(): comparável entre processos)
+
+
+class LimiteBanda:
+    """
+    limite = LimiteBanda(kbps)                       # processo local
+    limite = LimiteBanda(kbps, arquivo=caminho)      # compartilhado pelo arquivo
+    limite.consumir(len(chunk))                      # bloqueia o necessário
+    """
+
+    def __init__(self, kbps: int, arquivo: Optional[Path] = None, rajada_s: float = DOWNLOAD_BANDA_RAJADA_S):
+        self.taxa = max(0, int(kbps)) * 1024  # bytes/s
+        self.rajada_s = rajada_s
+        self.arquivo = Path(arquivo) if arquivo else None
+        self._lock = threading.Lock()
+        self._tat = 0.0
+        if self.arquivo is not None:
+            self.arquivo.parent.mkdir(parents=True, exist_ok=True)
+            self.arquivo.touch(exist_ok=True)
+
+    @contextmanager
+    def _exclusivo(self):
+        with self._lock:
+            if self.arquivo is None or (fcntl is None and msvcrt is None):
+                yield None
+                return
+            with open(self.arquivo, "r+b") as f:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                try:
+                    yield f
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                    else:
+                        f.seek(0)
+                        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def reservar(self, n_bytes: int) -> float:
+        """Reserva n_bytes e devolve quantos segundos esperar antes de usá-los."""
+        if not self.taxa or n_bytes <= 0:
+            return 0.0
+        with self._exclusivo() as f:
+            agora = time.time()
+            tat = self._tat
+            if f is not None:
+                f.seek(0)
+                bruto = f.read(struct.calcsize(_FMT))
+                tat = struct.unpack(_FMT, bruto)[0] if len(bruto) == struct.calcsize(_FMT) else 0.0
+            # bucket ocioso não acumula crédito: a folga é só a rajada do retorno abaixo
+            tat = max(tat, agora) + n_bytes / self.taxa
+            if f is not None:
+                f.seek(0)
+                f.write(struct.pack(_FMT, tat))
+                f.flush()
+            self._tat = tat
+        return max(0.0, tat - agora - self.rajada_s)
+
+    def consumir(self, n_bytes: int):
+        espera = self.reservar(n_bytes)
+        if espera > 0:
+            time.sleep(espera)
+
+
+_host: Optional[LimiteBanda] = None
+_host_lock = threading.Lock()
+
+
+def limite_do_host() -> Optional[LimiteBanda]:
+    """Limitador global do host (None se DOWNLOAD_BANDA_HOST_KBPS=0)."""
+    global _host
+    if DOWNLOAD_BANDA_HOST_KBPS <= 0:
+        return None
+    with _host_lock:
+        if _host is None:
+            _host = LimiteBanda(DOWNLOAD_BANDA_HOST_KBPS, arquivo=DOWNLOAD_BANDA_ARQUIVO)
+        return _host
@@ -0,0 +1,128 @@
+# packages/jobs/download/cache.py
+# -*- coding: utf-8 -*-
+"""
+Cache de downloads endereçado pela URL (url_hash = sha256 da URL, o mesmo do
+dataset_url_catalog):
+
+  data/cache/<url_hash>/arquivo     conteúdo baixado (zip)
+  data/cache/<url_hash>/meta.json   url, etag, last_modified, tamanho, sha256,
+                                    extraido {nome_destino: sha256}, usado_em,
+                                    baixando (validadores do download em curso)
+
+Revalidação: HEAD condicional (If-None-Match / If-Modified-Since) com os
+validadores da meta; 304 ou validadores iguais = inalterado. Sem nenhum
+validador na resposta não há como saber: mantém o que está em cache.
+
+A poda (DOWNLOAD_CACHE_MAX_GB) apaga só o `arquivo` dos menos usados; a meta
+fica, e com ela a revalidação dos .gdb já extraídos.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+CACHE_DIR = Path(os.getenv("DOWNLOAD_CACHE_DIR", str(Path("data") / "cache")))
+# teto do conteúdo em cache (0 = sem poda)
+DOWNLOAD_CACHE_MAX_GB = float(os.getenv("DOWNLOAD_CACHE_MAX_GB", "20"))
+
+ARQUIVO = "arquivo"
+META = "meta.json"
+
+
+def pasta(url_hash: str) -> Path:
+    return CACHE_DIR / url_hash
+
+
+def arquivo(url_hash: str) -> Path:
+    return pasta(url_hash) / ARQUIVO
+
+
+def ler_meta(url_hash: str) -> Optional[dict]:
+    try:
+        meta = json.loads((pasta(url_hash) / META).read_text(encoding="utf-8"))
+    except Exception:
+        return None
+    meta.setdefault("extraido", {})
+    return meta
+
+
+def gravar_meta(url_hash: str, meta: dict):
+    p = pasta(url_hash)
+    p.mkdir(parents=True, exist_ok=True)
+    meta["usado_em"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    tmp = p / (META + ".tmp")
+    tmp.write_text(json.dumps(meta, indent=2, ensure_ascii=False), encoding="utf-8")
+    tmp.replace(p / META)
+
+
+def conteudo_presente(url_hash: str, meta: dict) -> bool:
+    """O `arquivo` existe e tem o tamanho registrado (não foi podado nem truncado)."""
+    a = arquivo(url_hash)
+    return a.exists() and meta.get("sha256") is not None and a.stat().st_size == meta.get("tamanho")
+
+
+def validadores(headers) -> dict:
+    tamanho = headers.get("Content-Length")
+    return {
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+        "tamanho_remoto": int(tamanho) if tamanho and tamanho.isdigit() else None,
+    }
+
+
+def cabecalhos_condicionais(meta: dict) -> dict:
+    h = {}
+    if meta.get("etag"):
+        h["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        h["If-Modified-Since"] = meta["last_modified"]
+    return h
+
+
+def mudou(meta: dict, status: int, headers) -> bool:
+    """Compara a resposta do HEAD condicional com a meta (o validador mais forte decide)."""
+    if status == 304:
+        return False
+    novo = validadores(headers)
+    for campo in ("etag", "last_modified", "tamanho_remoto"):
+        if novo[campo] is not None and meta.get(campo) is not None:
+            return novo[campo] != meta[campo]
+    return False
+
+
+def descartar_conteudo(url_hash: str):
+    """Remove arquivo e parciais (.part/.segs) de uma versão antiga."""
+    for p in pasta(url_hash).glob(ARQUIVO + "*"):
+        if p.is_dir():
+            shutil.rmtree(p, ignore_errors=True)
+        else:
+            p.unlink(missing_ok=True)
+
+
+def podar(manter: set[str] = frozenset(), max_gb: float = DOWNLOAD_CACHE_MAX_GB) -> list[str]:
+    """Apaga o conteúdo dos menos usados até caber em max_gb. Retorna os url_hash podados."""
+    if max_gb <= 0 or not CACHE_DIR.exists():
+        return []
+    entradas = []
+    for p in CACHE_DIR.iterdir():
+        a = p / ARQUIVO
+        if p.is_dir() and a.exists():
+            meta = ler_meta(p.name) or {}
+            entradas.append((meta.get("usado_em") or "", p.name, a.stat().st_size))
+    total = sum(e[2] for e in entradas)
+    limite = max_gb * 1024 ** 3
+    podados = []
+    for _, url_hash, tamanho in sorted(entradas):
+        if total <= limite:
+            break
+        if url_hash in manter:
+            continue
+        descartar_conteudo(url_hash)
+        total -= tamanho
+        podados.append(url_hash)
+    return podados
@@ -0,0 +1,237 @@
+# packages/jobs/download/catalogo.py
+# -*- coding: utf-8 -*-
+"""
+Resolução (distribuidora, ano) -> item do dataset_url_catalog por índice.
+
+intel_lead.dataset_catalog_index guarda, por item do catálogo, a chave
+canônica da distribuidora e o ano extraídos do título (schema em
+packages/database/schema/dataset_catalog_index.sql). Resolver é:
+  1) igualdade em (distribuidora, ano), mais recente e não importado primeiro
+  2) sem match exato: similaridade trigram do nome no título (pg_trgm),
+     ou LIKE no título normalizado quando a extensão não está disponível
+
+A ingestão do catálogo chama indexar_catalogo(); ids novos que entrarem por
+outro caminho são indexados na próxima resolução (comparação de max(id)).
+
+CLI:
+  python -m packages.jobs.download.catalogo --reindexar
+  python -m packages.jobs.download.catalogo --resolver ENEL_SP 2023
+"""
+
+from __future__ import annotations
+
+import argparse
+import re
+import unicodedata
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Optional
+
+from psycopg2.extras import execute_values
+
+SCHEMA = "intel_lead"
+SCHEMA_SQL = Path(__file__).resolve().parents[2] / "database" / "schema" / "dataset_catalog_index.sql"
+_schema_aplicado = False
+_trgm: dict = {}  # {"schema": nome | None} depois da 1ª consulta
+
+# nomes comerciais/antigos -> chave canônica (já normalizados por _slug)
+ALIASES = {
+    "ENEL_DISTRIBUICAO_SP": "ENEL_SP",
+    "ENEL_DISTRIBUICAO_SAO_PAULO": "ENEL_SP",
+    "ELETROPAULO": "ENEL_SP",
+    "ENEL_DISTRIBUICAO_RIO": "ENEL_RJ",
+    "ENEL_DISTRIBUICAO_RJ": "ENEL_RJ",
+    "AMPLA": "ENEL_RJ",
+    "ENEL_DISTRIBUICAO_CE": "ENEL_CE",
+    "COELCE": "ENEL_CE",
+}
+
+_ANO_RE = re.compile(r"(?<!\d)(20\d{2})(?!\d)")
+
+_COLUNAS = "c.id, c.title, c.url, c.url_hash, c.created, c.modified, c.origem, c.tipo, c.foi_importado"
+
+
+def _sem_acento(s: str) -> str:
+    return "".join(ch for ch in unicodedata.normalize("NFKD", s) if not unicodedata.combining(ch))
+
+
+def _slug(s: str) -> str:
+    return re.sub(r"[^A-Z0-9]+", "_", _sem_acento(str(s)).upper()).strip("_")
+
+
+def chave_distribuidora(nome: str) -> str:
+    """'Enel Distribuição SP' -> 'ENEL_SP'; 'CPFL Paulista' -> 'CPFL_PAULISTA'."""
+    slug = _slug(nome)
+    return ALIASES.get(slug, slug)
+
+
+def titulo_norm(titulo: str) -> str:
+    return " ".join(_sem_acento(str(titulo or "")).lower().split())
+
+
+def extrair_distribuidora_ano(titulo: str, data: Optional[datetime] = None) -> tuple[str, Optional[int]]:
+    """
+    Títulos do ArcGIS da ANEEL: "<DISTRIBUIDORA> - <AAAA-MM-DD> ...".
+    Ano do título; sem ano no título, o de modified/created.
+    """
+    titulo = str(titulo or "")
+    nome = titulo.split(" - ")[0] if " - " in titulo else _ANO_RE.sub(" ", titulo)
+    m = _ANO_RE.search(titulo)
+    ano = int(m.group(1)) if m else (data.year if isinstance(data, datetime) else None)
+    return chave_distribuidora(nome), ano
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Índice
+# ──────────────────────────────────────────────────────────────────────────────
+def _garantir_schema(cur):
+    global _schema_aplicado
+    if not _schema_aplicado:
+        cur.execute(SCHEMA_SQL.read_text(encoding="utf-8"))
+        _schema_aplicado = True
+
+
+def _linha_indice(r) -> tuple:
+    data = r["modified"] or r["created"]
+    dist, ano = extrair_distribuidora_ano(r["title"], data)
+    return (r["id"], dist, ano, r["url"], r["url_hash"], r["title"], titulo_norm(r["title"]), data)
+
+
+def indexar_catalogo(cur, ids: Optional[Iterable[int]] = None, desde_id: Optional[int] = None) -> int:
+    """
+    (Re)indexa itens do catálogo: todos, só `ids`, ou só os com id > desde_id.
+    A reindexação completa também remove do índice o que saiu do catálogo.
+    Retorna quantas linhas foram gravadas.
+    """
+    _garantir_schema(cur)
+    completo = ids is None and desde_id is None
+    if ids is not None:
+        cur.execute(f"SELECT {_COLUNAS} FROM {SCHEMA}.dataset_url_catalog c WHERE c.id = ANY(%s)", (list(ids),))
+    elif desde_id is not None:
+        cur.execute(f"SELECT {_COLUNAS} FROM {SCHEMA}.dataset_url_catalog c WHERE c.id > %s", (desde_id,))
+    else:
+        cur.execute(f"SELECT {_COLUNAS} FROM {SCHEMA}.dataset_url_catalog c")
+    linhas = [_linha_indice(r) for r in cur.fetchall()]
+
+    if linhas:
+        execute_values(cur, f"""
+            INSERT INTO {SCHEMA}.dataset_catalog_index
+                (catalog_id, distribuidora, ano, url, url_hash, titulo, titulo_norm, atualizado_em)
+            VALUES %s
+            ON CONFLICT (catalog_id) DO UPDATE SET
+                distribuidora = EXCLUDED.distribuidora,
+                ano           = EXCLUDED.ano,
+                url           = EXCLUDED.url,
+                url_hash      = EXCLUDED.url_hash,
+                titulo        = EXCLUDED.titulo,
+                titulo_norm   = EXCLUDED.titulo_norm,
+                atualizado_em = EXCLUDED.atualizado_em,
+                indexado_em   = now()
+        """, linhas, page_size=1000)
+    if completo:
+        cur.execute(f"""
+            DELETE FROM {SCHEMA}.dataset_catalog_index i
+            WHERE NOT EXISTS (SELECT 1 FROM {SCHEMA}.dataset_url_catalog c WHERE c.id = i.catalog_id)
+        """)
+    return len(linhas)
+
+
+def sincronizar_indice(cur) -> int:
+    """Indexa os ids do catálogo acima do maior já indexado (2 buscas no PK)."""
+    _garantir_schema(cur)
+    cur.execute(f"""
+        SELECT (SELECT max(id) FROM {SCHEMA}.dataset_url_catalog) AS catalogo,
+               (SELECT max(catalog_id) FROM {SCHEMA}.dataset_catalog_index) AS indice
+    """)
+    r = cur.fetchone()
+    if r["catalogo"] is None or (r["indice"] is not None and r["catalogo"] <= r["indice"]):
+        return 0
+    return indexar_catalogo(cur, desde_id=r["indice"] or 0)
+
+
+def garantir_indice() -> int:
+    """sincronizar_indice() em conexão própria (API / scripts)."""
+    from packages.database.connection import get_db_cursor
+
+    with get_db_cursor(commit=True) as cur:
+        return sincronizar_indice(cur)
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Resolução
+# ──────────────────────────────────────────────────────────────────────────────
+def _schema_trgm(cur) -> Optional[str]:
+    if "schema" not in _trgm:
+        cur.execute("""
+            SELECT n.nspname AS esquema
+            FROM pg_extension e JOIN pg_namespace n ON n.oid = e.extnamespace
+            WHERE e.extname = 'pg_trgm'
+        """)
+        r = cur.fetchone()
+        _trgm["schema"] = r["esquema"] if r else None
+    return _trgm["schema"]
+
+
+def resolver_dataset(cur, distribuidora: str, ano: int) -> Optional[dict]:
+    """
+    Melhor item do catálogo para (distribuidora, ano): não importados primeiro,
+    depois o mais recente. None se nada casar.
+    """
+    sincronizar_indice(cur)
+    chave = chave_distribuidora(distribuidora)
+    cur.execute(f"""
+        SELECT {_COLUNAS}
+        FROM {SCHEMA}.dataset_catalog_index i
+        JOIN {SCHEMA}.dataset_url_catalog c ON c.id = i.catalog_id
+        WHERE i.distribuidora = %s AND i.ano = %s
+        ORDER BY c.foi_importado ASC, i.atualizado_em DESC NULLS LAST, i.catalog_id DESC
+        LIMIT 1
+    """, (chave, int(ano)))
+    row = cur.fetchone()
+    if row:
+        return dict(row)
+
+    # texto livre: o nome como veio (sem os "_" da chave) contra o título
+    termo = titulo_norm(str(distribuidora).replace("_", " "))
+    esquema = _schema_trgm(cur)
+    if esquema:
+        cur.execute(f"""
+            SELECT {_COLUNAS}
+            FROM {SCHEMA}.dataset_catalog_index i
+            JOIN {SCHEMA}.dataset_url_catalog c ON c.id = i.catalog_id
+            WHERE i.ano = %s AND %s OPERATOR({esquema}.<%%) i.titulo_norm
+            ORDER BY {esquema}.word_similarity(%s, i.titulo_norm) DESC,
+                     c.foi_importado ASC, i.atualizado_em DESC NULLS LAST
+            LIMIT 1
+        """, (int(ano), termo, termo))
+    else:
+        cur.execute(f"""
+            SELECT {_COLUNAS}
+            FROM {SCHEMA}.dataset_catalog_index i
+            JOIN {SCHEMA}.dataset_url_catalog c ON c.id = i.catalog_id
+            WHERE i.ano = %s AND i.titulo_norm LIKE %s
+            ORDER BY c.foi_importado ASC, i.atualizado_em DESC NULLS LAST
+            LIMIT 1
+        """, (int(ano), f"%{termo}%"))
+    row = cur.fetchone()
+    return dict(row) if row else None
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Índice de resolução do dataset_url_catalog")
+    ap.add_argument("--reindexar", action="store_true", help="reconstrói o índice a partir do catálogo")
+    ap.add_argument("--resolver", nargs=2, metavar=("DISTRIBUIDORA", "ANO"))
+    args = ap.parse_args()
+
+    from packages.database.connection import get_db_cursor
+
+    with get_db_cursor(commit=True) as cur:
+        if args.reindexar:
+            print(f"[catalogo] {indexar_catalogo(cur)} itens indexados")
+        if args.resolver:
+            row = resolver_dataset(cur, args.resolver[0], int(args.resolver[1]))
+            print(row if row else "[catalogo] nada encontrado")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,23 +2,32 @@
 # -*- coding: utf-8 -*-
 """
 Downloader de FileGDB alinhado ao DB:
-- Busca a URL no intel_lead.dataset_url_catalog (filtra por distribuidora/ano)
-- Faz download retomável (HTTP Range) com limite de banda
-- Extrai .gdb de .zip para data/downloads/{DISTRIBUIDORA}_{ANO}.gdb
-- Registra progresso em intel_lead.download_log
+- Busca a URL no intel_lead.dataset_url_catalog via índice (distribuidora canônica/ano, catalogo.py)
+- Faz download retomável (HTTP Range), segmentado em N requisições quando o
+  servidor aceita Range; a banda é limitada pelo orçamento do host (banda.py),
+  e por download só se o chamador pedir max_kbps
+- Extrai só a pasta .gdb do .zip, em streaming, para data/downloads/{DISTRIBUIDORA}_{ANO}.gdb
+- sha256 calculado durante a escrita; zip verificado (diretório central + CRC) na extração
+- Registra progresso e digest em intel_lead.download_log
 - Marca 'foi_importado'=true no dataset_url_catalog quando concluir
+- Cancelável: com `cancelar` (threading.Event) setado, para no próximo chunk
+  com DownloadCancelado; .part/.segs ficam para a retomada de quem continuar
 
-Compatível com o worker: se o payload tiver "download": {"distribuidora": "...", "ano": 2023, "max_kbps": 256},
+Compatível com o worker: se o payload tiver "download": {"distribuidora": "...", "ano": 2023, "max_kbps": 0},
 o worker chama baixar_gdb(...) e recebe o caminho final do .gdb.
 """
 
 from __future__ import annotations
 import os
 import io
+import json
 import time
 import zipfile
+import zlib
 import shutil
 import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional, Tuple
 
@@ -26,12 +35,21 @@ import requests
 import psycopg2
 from psycopg2.extras import DictCursor
 
+from packages.jobs.download import cache, catalogo
+from packages.jobs.download.banda import LimiteBanda, limite_do_host
+
 # -------------------------------------------------------------------
 # Pastas
 # -------------------------------------------------------------------
 DATA_DIR = Path("data")
 DOWNLOAD_DIR = DATA_DIR / "downloads"
-TMP_DIR = DATA_DIR / "tmp"
+
+# Range em paralelo: nº de segmentos e tamanho mínimo do arquivo para segmentar
+DOWNLOAD_SEGMENTOS = int(os.getenv("DOWNLOAD_SEGMENTOS", "4"))
+DOWNLOAD_SEGMENTO_MIN = int(os.getenv("DOWNLOAD_SEGMENTO_MIN_MB", "8")) * 1024 * 1024
+CHUNK_DOWNLOAD = 1024 * 64  # granularidade do limite de banda
+# .gdb já extraído: confere a origem (1 HEAD condicional) antes de reaproveitar
+DOWNLOAD_REVALIDAR = os.getenv("DOWNLOAD_REVALIDAR", "1") == "1"
 
 # -------------------------------------------------------------------
 # Conexão ao banco (reuso do teu padrão, com fallback por env)
@@ -56,21 +74,12 @@ except Exception:
         return _fallback_conn()
 
 SCHEMA = "intel_lead"
+SCHEMA_SQL = Path(__file__).resolve().parents[2] / "database" / "schema" / "download_log.sql"
+_schema_aplicado = False
 
 # -------------------------------------------------------------------
 # Utilidades
 # -------------------------------------------------------------------
-def _throttle(start_ts: float, bytes_done: int, max_kbps: int):
-    if not max_kbps or max_kbps <= 0:
-        return
-    elapsed = time.monotonic() - start_ts
-    if elapsed <= 0:
-        return
-    target_bps = max_kbps * 1024
-    ideal_time = bytes_done / target_bps
-    if ideal_time > elapsed:
-        time.sleep(ideal_time - elapsed)
-
 def _is_zip_file(path: Path) -> bool:
     if path.suffix.lower() == ".zip":
         return True
@@ -81,8 +90,9 @@ def _is_zip_file(path: Path) -> bool:
     except Exception:
         return False
 
-def _sha1(s: str) -> str:
-    return hashlib.sha1(s.encode("utf-8")).hexdigest()
+def _url_hash(url: str) -> str:
+    # mesmo hash do dataset_url_catalog.url_hash (sync_catalogo): um só diretório de cache por URL
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
 
 def _normalize_dest_name(distribuidora: str, ano: int) -> str:
     base = str(distribuidora).strip().upper().replace(" ", "_")
@@ -91,7 +101,14 @@ def _normalize_dest_name(distribuidora: str, ano: int) -> str:
 # -------------------------------------------------------------------
 # LOGS (intel_lead.download_log)
 # -------------------------------------------------------------------
+def _garantir_schema(cur):
+    global _schema_aplicado
+    if not _schema_aplicado:
+        cur.execute(SCHEMA_SQL.read_text(encoding="utf-8"))
+        _schema_aplicado = True
+
 def _log_start(cur, distribuidora: str, ano: int) -> int:
+    _garantir_schema(cur)
     cur.execute(f"""
         INSERT INTO {SCHEMA}.download_log (distribuidora, ano, status, created_at, updated_at)
         VALUES (%s, %s, 'running', now(), now())
@@ -99,12 +116,13 @@ def _log_start(cur, distribuidora: str, ano: int) -> int:
     """, (distribuidora, int(ano)))
     return cur.fetchone()[0]
 
-def _log_done(cur, log_id: int, tempo_download: float):
+def _log_done(cur, log_id: int, tempo_download: float, sha256: Optional[str] = None,
+              tamanho: Optional[int] = None):
     cur.execute(f"""
         UPDATE {SCHEMA}.download_log
-        SET status='done', tempo_download=%s, erro=NULL, updated_at=now()
+        SET status='done', tempo_download=%s, sha256=%s, bytes=%s, erro=NULL, updated_at=now()
         WHERE id=%s
-    """, (float(tempo_download), log_id))
+    """, (float(tempo_download), sha256, tamanho, log_id))
 
 def _log_error(cur, log_id: int, erro: str):
     cur.execute(f"""
@@ -118,30 +136,14 @@ def _log_error(cur, log_id: int, erro: str):
 # -------------------------------------------------------------------
 def _pick_dataset(cur, distribuidora: str, ano: int) -> Optional[dict]:
     """
-    Escolhe a melhor linha do catálogo para (distribuidora, ano).
-    Critérios:
-      - title ILIKE %distribuidora%
-      - title ILIKE %ano%  (ou created/modified do próprio ano)
-      - preferir não importados (foi_importado=false), depois modificados mais recentes
+    Escolhe a melhor linha do catálogo para (distribuidora, ano) pelo índice
+    dataset_catalog_index (chave canônica + ano; trigram no título como fallback).
+    Preferência: não importados (foi_importado=false), depois modificados mais recentes.
     """
-    like_dist = f"%{distribuidora}%"
-    like_ano = f"%{ano}%"
-    cur.execute(f"""
-        SELECT id, title, url, url_hash, created, modified, origem, tipo, foi_importado
-        FROM {SCHEMA}.dataset_url_catalog
-        WHERE (title ILIKE %s OR origem ILIKE %s OR COALESCE(tipo,'') ILIKE %s)
-          AND (
-                title ILIKE %s
-                OR EXTRACT(YEAR FROM COALESCE(modified, created)) = %s
-              )
-        ORDER BY foi_importado ASC, COALESCE(modified, created) DESC, id DESC
-        LIMIT 1
-    """, (like_dist, like_dist, like_dist, like_ano, int(ano)))
-    row = cur.fetchone()
-    return dict(row) if row else None
+    return catalogo.resolver_dataset(cur, distribuidora, ano)
 
 def _ensure_url_hash(cur, row_id: int, url: str):
-    h = _sha1(url)
+    h = _url_hash(url)
     cur.execute(f"""
       UPDATE {SCHEMA}.dataset_url_catalog
       SET url_hash = COALESCE(url_hash, %s), ultima_verificacao = now()
@@ -159,62 +161,292 @@ def _mark_imported(cur, row_id: int, obs: str):
 # -------------------------------------------------------------------
 # Download + extração
 # -------------------------------------------------------------------
-def _baixar_resumivel(url: str, destino: Path, max_kbps: int = 256, timeout_s: int = 30):
-    destino.parent.mkdir(parents=True, exist_ok=True)
-    parcial = destino.with_suffix(destino.suffix + ".part")
+def _limites(max_kbps: Optional[int]) -> list:
+    # orçamento do host + teto do próprio download (todos os segmentos juntos), se pedido
+    limites = [LimiteBanda(max_kbps)] if max_kbps and max_kbps > 0 else []
+    host = limite_do_host()
+    if host is not None:
+        limites.append(host)
+    return limites
+
+def _consumir(limites: list, n: int):
+    for limite in limites:
+        limite.consumir(n)
+
+def _planejar_segmentos(total: int, n: int) -> list[list[int]]:
+    # [inicio, fim (inclusivo), bytes já baixados]
+    tam = -(-total // n)
+    return [[i, min(i + tam, total) - 1, 0] for i in range(0, total, tam)]
+
+def _ler_segmentos(estado: Path, url: str, total: int) -> Optional[list[list[int]]]:
+    try:
+        d = json.loads(estado.read_text(encoding="utf-8"))
+    except Exception:
+        return None
+    if d.get("url") != url or d.get("total") != total:
+        return None
+    return d.get("segmentos")
+
+def _gravar_segmentos(estado: Path, url: str, total: int, segmentos: list[list[int]]):
+    tmp = estado.with_suffix(estado.suffix + ".tmp")
+    tmp.write_text(json.dumps({"url": url, "total": total, "segmentos": segmentos}), encoding="utf-8")
+    tmp.replace(estado)
+
+class _SemRange(Exception):
+    pass
 
-    # HEAD
+class DownloadCancelado(Exception):
+    """O chamador desistiu do download (ex.: o worker perdeu a lease do job)."""
+
+def _checar(cancelar: Optional[threading.Event]):
+    if cancelar is not None and cancelar.is_set():
+        raise DownloadCancelado("download cancelado")
+
+class _HashContiguo:
+    """
+    sha256 do .part na ordem dos bytes, acompanhando a escrita: o que chega em
+    ordem entra direto (atualizar); o que os segmentos escrevem fora de ordem é
+    lido de volta do page cache assim que o prefixo contíguo cresce (avancar).
+    Só a retomada relê do disco o que já estava baixado.
+    """
+
+    def __init__(self, parcial: Path):
+        self.parcial = parcial
+        self.pos = 0
+        self._h = hashlib.sha256()
+        self._lock = threading.Lock()
+
+    def atualizar(self, chunk: bytes):
+        self._h.update(chunk)
+        self.pos += len(chunk)
+
+    def avancar(self, ate: int, bloquear: bool = True):
+        # sem bloquear: se outro segmento já está lendo, ele alcança este trecho depois
+        if not self._lock.acquire(blocking=bloquear):
+            return
+        try:
+            if ate <= self.pos:
+                return
+            with open(self.parcial, "rb") as f:
+                f.seek(self.pos)
+                while self.pos < ate:
+                    bloco = f.read(min(1024 * 1024, ate - self.pos))
+                    if not bloco:
+                        break
+                    self.atualizar(bloco)
+        finally:
+            self._lock.release()
+
+    def hexdigest(self) -> str:
+        return self._h.hexdigest()
+
+def _fronteira(segmentos: list[list[int]], total: int) -> int:
+    # fim do prefixo contíguo já escrito (segmentos em ordem de início)
+    for ini, fim, feito in segmentos:
+        if ini + feito <= fim:
+            return ini + feito
+    return total
+
+def _baixar_segmentado(url: str, parcial: Path, total: int, segmentos_n: int, limites: list,
+                       timeout_s: int, cancelar: Optional[threading.Event] = None) -> str:
+    """
+    N requisições Range em paralelo, cada uma escrevendo na sua faixa do .part
+    (pré-alocado). Progresso por segmento em <.part>.segs: retomada continua
+    cada faixa de onde parou. Retorna o sha256 do arquivo.
+    """
+    estado = parcial.with_suffix(parcial.suffix + ".segs")
+    segmentos = _ler_segmentos(estado, url, total) if parcial.exists() else None
+    if segmentos is None:
+        segmentos = _planejar_segmentos(total, segmentos_n)
+        with open(parcial, "wb") as f:
+            f.truncate(total)
+    lock = threading.Lock()
+    ultimo_save = [time.monotonic()]
+    hasher = _HashContiguo(parcial)
+
+    def _baixar(seg: list[int]):
+        ini, fim, _ = seg
+        if ini + seg[2] > fim:
+            return
+        with requests.get(url, headers={"Range": f"bytes={ini + seg[2]}-{fim}"}, stream=True,
+                          timeout=timeout_s) as r:
+            r.raise_for_status()
+            if r.status_code != 206:
+                raise _SemRange(f"servidor ignorou Range (HTTP {r.status_code})")
+            # sem buffer do Python: o que o .segs conta já está no SO se o processo morrer
+            with open(parcial, "r+b", buffering=0) as f:
+                f.seek(ini + seg[2])
+                for chunk in r.iter_content(chunk_size=CHUNK_DOWNLOAD):
+                    if not chunk:
+                        continue
+                    _checar(cancelar)
+                    chunk = chunk[:fim - ini + 1 - seg[2]]
+                    _consumir(limites, len(chunk))
+                    f.write(chunk)
+                    with lock:
+                        seg[2] += len(chunk)
+                        if time.monotonic() - ultimo_save[0] > 2:
+                            _gravar_segmentos(estado, url, total, segmentos)
+                            ultimo_save[0] = time.monotonic()
+                        fronteira = _fronteira(segmentos, total)
+                    hasher.avancar(fronteira, bloquear=False)
+                    if ini + seg[2] > fim:
+                        break
+        if ini + seg[2] <= fim:
+            raise RuntimeError(f"segmento {ini}-{fim} incompleto: {seg[2]} bytes")
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(segmentos), thread_name_prefix="seg") as pool:
+            for fut in [pool.submit(_baixar, seg) for seg in segmentos]:
+                fut.result()
+    finally:
+        with lock:
+            _gravar_segmentos(estado, url, total, segmentos)
+
+    feitos = sum(s[2] for s in segmentos)
+    if feitos < total:
+        raise RuntimeError(f"download incompleto: {feitos}/{total} bytes")
+    estado.unlink(missing_ok=True)
+    hasher.avancar(total)
+    return hasher.hexdigest()
+
+def _head(url: str, timeout_s: int = 30) -> dict:
+    """Cabeçalhos do HEAD ({} se falhou)."""
     try:
         h = requests.head(url, timeout=timeout_s, allow_redirects=True)
-        total_size = int(h.headers.get("Content-Length") or 0)
-        accept_ranges = "bytes" in (h.headers.get("Accept-Ranges") or "").lower()
+        return dict(h.headers) if h.ok else {}
     except Exception:
-        total_size = 0
-        accept_ranges = False
+        return {}
+
+def _baixar_resumivel(url: str, destino: Path, max_kbps: Optional[int] = None, timeout_s: int = 30,
+                      segmentos: int = DOWNLOAD_SEGMENTOS,
+                      cabecalhos: Optional[dict] = None,
+                      cancelar: Optional[threading.Event] = None) -> tuple[dict, str]:
+    """
+    Download retomável. Com Accept-Ranges + Content-Length e arquivo grande,
+    usa `segmentos` requisições Range em paralelo; senão, um stream só.
+    DOWNLOAD_BANDA_HOST_KBPS limita o host todo; max_kbps (opcional) limita só este download.
+    cabecalhos: HEAD já feito pelo chamador (None = faz aqui).
+    Retorna (cabeçalhos do HEAD ({} se falhou), sha256 calculado durante a escrita).
+    """
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    parcial = destino.with_suffix(destino.suffix + ".part")
+    limites = _limites(max_kbps)
+
+    if cabecalhos is None:
+        cabecalhos = _head(url, timeout_s)
+    total_size = int(cabecalhos.get("Content-Length") or 0)
+    accept_ranges = "bytes" in (cabecalhos.get("Accept-Ranges") or "").lower()
+
+    if accept_ranges and segmentos > 1 and total_size >= DOWNLOAD_SEGMENTO_MIN:
+        try:
+            sha256 = _baixar_segmentado(url, parcial, total_size, segmentos, limites, timeout_s, cancelar)
+            parcial.replace(destino)
+            return cabecalhos, sha256
+        except _SemRange:
+            # HEAD anunciou Range mas o GET não respeitou: recomeça em stream único
+            parcial.unlink(missing_ok=True)
+            parcial.with_suffix(parcial.suffix + ".segs").unlink(missing_ok=True)
+            accept_ranges = False
+
+    # stream único; .segs de uma tentativa segmentada não serve aqui
+    estado = parcial.with_suffix(parcial.suffix + ".segs")
+    if estado.exists():
+        estado.unlink()
+        parcial.unlink(missing_ok=True)
 
     pos = parcial.stat().st_size if parcial.exists() else 0
     headers = {}
     if accept_ranges and pos > 0:
         headers["Range"] = f"bytes={pos}-"
 
-    start_ts = time.monotonic()
     bytes_done = pos
+    hasher = _HashContiguo(parcial)
 
     with requests.get(url, headers=headers, stream=True, timeout=timeout_s) as r:
         r.raise_for_status()
-        mode = "ab" if headers else "wb"
+        mode = "ab" if headers and r.status_code == 206 else "wb"
+        if mode == "wb":
+            bytes_done = 0
+        else:
+            hasher.avancar(pos)  # retomada: o prefixo já baixado entra no digest
         with open(parcial, mode) as f:
-            for chunk in r.iter_content(chunk_size=1024 * 256):  # 256 KB
+            for chunk in r.iter_content(chunk_size=CHUNK_DOWNLOAD):
                 if not chunk:
                     continue
+                _checar(cancelar)
+                _consumir(limites, len(chunk))
                 f.write(chunk)
+                hasher.atualizar(chunk)
                 bytes_done += len(chunk)
-                _throttle(start_ts, bytes_done, max_kbps)
 
     if total_size and bytes_done < total_size:
         raise RuntimeError(f"download incompleto: {bytes_done}/{total_size} bytes")
 
     parcial.replace(destino)
-
-def _extrair_zip_para_gdb(zip_path: Path, destino_final: Path) -> Path:
+    return cabecalhos, hasher.hexdigest()
+
+def _raiz_gdb(nomes: list[str]) -> Optional[str]:
+    """Prefixo ("pasta/X.gdb/") da primeira pasta .gdb no diretório central do zip."""
+    raizes = set()
+    for nome in nomes:
+        partes = nome.replace("\\", "/").split("/")
+        for i, parte in enumerate(partes[:-1]):
+            if parte.lower().endswith(".gdb"):
+                raizes.add("/".join(partes[:i + 1]) + "/")
+                break
+    return min(raizes, key=lambda r: (r.count("/"), r)) if raizes else None
+
+def _extrair_zip_para_gdb(zip_path: Path, final_path: Path) -> Path:
     """
-    Extrai o .zip para TEMP e retorna o caminho da primeira pasta .gdb encontrada.
+    Extrai só os membros da pasta .gdb do zip, em streaming, para
+    <final_path>.partial e renomeia para final_path no fim (atômico no mesmo disco).
+    O resto do zip (PDFs, shapefiles, ...) nunca toca o disco. O zip fica (é o cache).
+
+    Integridade: o diretório central é validado ao abrir (e cada membro tem de
+    caber no arquivo, pega zip truncado antes de extrair); o CRC-32 e o tamanho
+    de cada membro são conferidos no fim do seu stream. Falha = BadZipFile.
     """
-    sess = TMP_DIR / f"extract_{int(time.time())}"
-    sess.mkdir(parents=True, exist_ok=True)
-    with zipfile.ZipFile(zip_path, 'r') as z:
-        z.extractall(sess)
-    candidatos = [p for p in sess.rglob("*") if p.is_dir() and p.suffix.lower() == ".gdb"]
-    if not candidatos:
-        shutil.rmtree(sess, ignore_errors=True)
-        raise RuntimeError("nenhuma pasta .gdb encontrada dentro do zip")
-    gdb_src = candidatos[0]
-    final_path = destino_final / gdb_src.name
+    parcial = final_path.with_name(final_path.name + ".partial")
+    if parcial.exists():
+        shutil.rmtree(parcial, ignore_errors=True)
+
+    tamanho_zip = zip_path.stat().st_size
+    with zipfile.ZipFile(zip_path, "r") as z:
+        membros = z.infolist()
+        raiz = _raiz_gdb([m.filename for m in membros])
+        if raiz is None:
+            raise RuntimeError("nenhuma pasta .gdb encontrada dentro do zip")
+        for m in membros:
+            if m.header_offset + m.compress_size > tamanho_zip:
+                raise zipfile.BadZipFile(f"zip truncado: {m.filename} passa do fim do arquivo")
+        parcial.mkdir(parents=True)
+        try:
+            for m in membros:
+                nome = m.filename.replace("\\", "/")
+                if m.is_dir() or not nome.startswith(raiz):
+                    continue
+                rel = Path(nome[len(raiz):])
+                if rel.is_absolute() or ".." in rel.parts:
+                    raise RuntimeError(f"membro suspeito no zip: {m.filename}")
+                alvo = parcial / rel
+                alvo.parent.mkdir(parents=True, exist_ok=True)
+                try:
+                    # ZipExtFile confere o CRC-32 ao chegar no fim do membro
+                    with z.open(m) as src, open(alvo, "wb") as dst:
+                        shutil.copyfileobj(src, dst, 1024 * 1024)
+                        escritos = dst.tell()
+                except (zipfile.BadZipFile, zlib.error, EOFError) as e:
+                    raise zipfile.BadZipFile(f"{m.filename}: {e}") from e
+                if escritos != m.file_size:
+                    raise zipfile.BadZipFile(f"{m.filename}: {escritos} de {m.file_size} bytes")
+        except BaseException:
+            shutil.rmtree(parcial, ignore_errors=True)
+            raise
+
     if final_path.exists():
         shutil.rmtree(final_path, ignore_errors=True)
-    shutil.move(str(gdb_src), str(final_path))
-    zip_path.unlink(missing_ok=True)
-    shutil.rmtree(sess, ignore_errors=True)
+    parcial.rename(final_path)
     return final_path
 
 def _maybe_arcgis_data_url(url: str) -> str:
@@ -229,29 +461,104 @@ def _maybe_arcgis_data_url(url: str) -> str:
         return u + "/data"
     return url
 
+def _revalidar(url: str, meta: dict, timeout_s: int = 30) -> bool:
+    """HEAD condicional com os validadores da meta. True = conteúdo mudou."""
+    try:
+        h = requests.head(url, headers=cache.cabecalhos_condicionais(meta), timeout=timeout_s,
+                          allow_redirects=True)
+    except Exception as e:
+        print(f"[download] revalidação falhou ({e}); usando o cache")
+        return False
+    if h.status_code != 304 and not h.ok:
+        print(f"[download] revalidação HTTP {h.status_code}; usando o cache")
+        return False
+    return cache.mudou(meta, h.status_code, h.headers)
+
+def _adotar(url: str, url_hash: str, nome_destino: str) -> Optional[dict]:
+    try:
+        h = requests.head(url, timeout=30, allow_redirects=True)
+    except Exception:
+        return None
+    if not h.ok:
+        return None
+    meta = {"url": url, **cache.validadores(h.headers), "sha256": None, "extraido": {nome_destino: None}}
+    cache.gravar_meta(url_hash, meta)
+    return meta
+
+def _obter_no_cache(url: str, url_hash: str, meta: Optional[dict], mudou: bool,
+                    max_kbps: Optional[int] = None, cancelar: Optional[threading.Event] = None) -> dict:
+    """
+    Garante o conteúdo da URL em data/cache/<url_hash>/arquivo e devolve a meta.
+    Inalterado e presente = nenhum byte baixado.
+    """
+    if meta is not None and not mudou and cache.conteudo_presente(url_hash, meta):
+        return meta
+
+    # versão que vai ser baixada; fica em meta["baixando"] até o download terminar
+    cabecalhos = _head(url)
+    versao = cache.validadores(cabecalhos)
+    baixando = (meta or {}).get("baixando")
+    mesma_versao = baixando is not None and baixando == versao and any(v is not None for v in versao.values())
+    if meta is not None and not mesma_versao and (baixando is not None or meta.get("sha256") is not None):
+        # .part/.segs de outra versão (ou conteúdo podado): não servem.
+        # Da mesma versão, a retomada continua de onde parou
+        cache.descartar_conteudo(url_hash)
+    cache.gravar_meta(url_hash, {**(meta or {"url": url, "sha256": None}), "baixando": versao})
+    cabecalhos, sha256 = _baixar_resumivel(url, cache.arquivo(url_hash), max_kbps=max_kbps,
+                                           cabecalhos=cabecalhos, cancelar=cancelar)
+    anterior = meta or {}
+    meta = {
+        "url": url,
+        **cache.validadores(cabecalhos),
+        "tamanho": cache.arquivo(url_hash).stat().st_size,
+        "sha256": sha256,
+        # extrações de outro sha256 deixam de bater sozinhas; as do mesmo conteúdo seguem válidas
+        "extraido": anterior.get("extraido", {}),
+    }
+    cache.gravar_meta(url_hash, meta)
+    cache.podar(manter={url_hash})
+    return meta
+
 # -------------------------------------------------------------------
 # API externa principal (usada pelo worker e CLI)
 # -------------------------------------------------------------------
 def baixar_gdb(distribuidora: str, ano: int, url: Optional[str] = None,
-               nome_destino: Optional[str] = None, max_kbps: int = 256) -> Path:
+               nome_destino: Optional[str] = None, max_kbps: Optional[int] = None,
+               revalidar: bool = DOWNLOAD_REVALIDAR, cancelar: Optional[threading.Event] = None) -> Path:
     """
     Fluxo completo:
       1) Se nome_destino não vier, usa {DISTRIBUIDORA}_{ANO}
-      2) Se já existir data/downloads/{nome_destino}.gdb, retorna direto
+      2) Se já existir data/downloads/{nome_destino}.gdb e revalidar=False, retorna direto
       3) Se url não vier, busca no dataset_url_catalog pelo melhor match
-      4) Baixa com retomada + throttle; se for zip, extrai para {nome_destino}.gdb
-      5) Loga em download_log e marca dataset como foi_importado
+      4) Cache por url_hash (data/cache/): HEAD condicional; só baixa (retomada
+         segmentada + limite de banda) se a origem mudou ou o conteúdo não está lá
+      5) Extrai o zip para {nome_destino}.gdb se o .gdb não veio deste mesmo conteúdo
+      6) Loga em download_log e marca dataset como foi_importado
+    .gdb existente só é substituído quando a revalidação afirma que a origem
+    mudou; banco, catálogo ou rede indisponíveis = segue com o que está em disco.
+    cancelar setado = DownloadCancelado (nunca cai no .gdb existente).
     Retorna: caminho final da pasta .gdb
     """
     DOWNLOAD_DIR.mkdir(parents=True, exist_ok=True)
-    TMP_DIR.mkdir(parents=True, exist_ok=True)
 
     nome_destino = nome_destino or _normalize_dest_name(distribuidora, ano)
     final_gdb = DOWNLOAD_DIR / f"{nome_destino}.gdb"
-    if final_gdb.exists():
+    if final_gdb.exists() and not revalidar:
         # já disponível
         return final_gdb
 
+    try:
+        return _baixar_gdb(distribuidora, ano, url, nome_destino, final_gdb, max_kbps, cancelar)
+    except DownloadCancelado:
+        raise
+    except Exception as e:
+        if not final_gdb.exists():
+            raise
+        print(f"[download] não revalidou {final_gdb.name} ({e}); usando o .gdb existente")
+        return final_gdb
+
+def _baixar_gdb(distribuidora: str, ano: int, url: Optional[str], nome_destino: str, final_gdb: Path,
+                max_kbps: Optional[int], cancelar: Optional[threading.Event] = None) -> Path:
     with get_db_connection() as conn:
         with conn.cursor(cursor_factory=DictCursor) as cur:
             log_id = _log_start(cur, distribuidora, ano)
@@ -266,44 +573,46 @@ def baixar_gdb(distribuidora: str, ano: int, url: Optional[str] = None,
                     url = str(catalog_row["url"])
                     _ensure_url_hash(cur, catalog_row["id"], url)
                     conn.commit()
+                url_hash = (catalog_row or {}).get("url_hash") or _url_hash(url)
 
                 # heurística para ArcGIS: /data
                 url = _maybe_arcgis_data_url(url)
 
-                tmp_name = Path(url.split("?")[0]).name or f"{nome_destino}.zip"
-                # força .zip quando a URL do ArcGIS não tem extensão
-                if "." not in tmp_name:
-                    tmp_name = f"{nome_destino}.zip"
-                tmp_file = TMP_DIR / tmp_name
-
                 t0 = time.time()
-                _baixar_resumivel(url, tmp_file, max_kbps=max_kbps)
-
-                if _is_zip_file(tmp_file):
-                    # Extrai e renomeia para {nome_destino}.gdb
-                    gdb_extracted = _extrair_zip_para_gdb(tmp_file, DOWNLOAD_DIR)
-                    # move/renomeia para padronizado
-                    if gdb_extracted.name != f"{nome_destino}.gdb":
-                        dest = DOWNLOAD_DIR / f"{nome_destino}.gdb"
-                        if dest.exists():
-                            shutil.rmtree(dest, ignore_errors=True)
-                        shutil.move(str(gdb_extracted), str(dest))
-                        final_path = dest
-                    else:
-                        final_path = gdb_extracted
+                meta = cache.ler_meta(url_hash)
+                if meta is None and final_gdb.exists():
+                    # .gdb de antes do cache: adota com os validadores atuais da origem
+                    meta = _adotar(url, url_hash, nome_destino)
+                    if meta is None:
+                        raise RuntimeError(f"origem indisponível para adotar {final_gdb.name}")
+                    mudou = False
+                else:
+                    mudou = meta is None or _revalidar(url, meta)
+
+                # extraído de outro conteúdo (outro destino baixou a versão nova) também é mudança
+                extraido_de = meta["extraido"].get(nome_destino) if meta else None
+                desatualizado = extraido_de is not None and extraido_de != meta["sha256"]
+                if not mudou and final_gdb.exists() and not desatualizado:
+                    final_path = final_gdb
                 else:
-                    # pouco comum: servidor entrega .gdb direto como pasta/arquivo
-                    if tmp_file.suffix.lower() == ".gdb" and tmp_file.is_dir():
-                        dest = DOWNLOAD_DIR / f"{nome_destino}.gdb"
-                        if dest.exists():
-                            shutil.rmtree(dest, ignore_errors=True)
-                        shutil.move(str(tmp_file), str(dest))
-                        final_path = dest
-                    else:
-                        raise RuntimeError(f"formato inesperado: {tmp_file.name}")
+                    meta = _obter_no_cache(url, url_hash, meta, mudou, max_kbps, cancelar)
+                    # cancelado entre o fim do download e a extração: o .gdb fica como está
+                    _checar(cancelar)
+                    arquivo = cache.arquivo(url_hash)
+                    if not _is_zip_file(arquivo):
+                        raise RuntimeError(f"formato inesperado: {url}")
+                    # extrai direto para {nome_destino}.gdb (via .gdb.partial)
+                    try:
+                        final_path = _extrair_zip_para_gdb(arquivo, final_gdb)
+                    except zipfile.BadZipFile as e:
+                        # corrompido não fica no cache: a próxima tentativa baixa de novo
+                        cache.descartar_conteudo(url_hash)
+                        raise RuntimeError(f"zip corrompido ({meta['sha256']}): {e}") from e
+                    meta["extraido"][nome_destino] = meta["sha256"]
+                    cache.gravar_meta(url_hash, meta)
 
                 dt = time.time() - t0
-                _log_done(cur, log_id, dt)
+                _log_done(cur, log_id, dt, meta.get("sha256"), meta.get("tamanho"))
 
                 if catalog_row:
                     _mark_imported(cur, catalog_row["id"], str(final_path))
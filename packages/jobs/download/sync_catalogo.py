@@ -0,0 +1,164 @@
+# packages/jobs/download/sync_catalogo.py
+# -*- coding: utf-8 -*-
+"""
+Sincroniza o intel_lead.dataset_url_catalog com a listagem de itens do ArcGIS.
+
+- Pagina /sharing/rest/search (num=100, nextStart) numa Session reaproveitada
+- Monta o DataFrame de uma vez (colunas vetorizadas: url, datas, tags)
+- Upsert em lote: COPY para staging temporária + um INSERT ... SELECT com
+  ON CONFLICT (url_hash); só linhas novas ou com title/modified diferente são
+  escritas, e o RETURNING diz quais foram inseridas e quais modificadas
+- Reindexa no dataset_catalog_index só os itens tocados
+
+CLI:
+  python -m packages.jobs.download.sync_catalogo
+  python -m packages.jobs.download.sync_catalogo --query 'BDGD owner:aneel' --relatorio data/logs/catalogo.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import io
+import json
+import os
+from pathlib import Path
+from typing import Iterator, Optional
+
+import pandas as pd
+import requests
+from psycopg2.extras import RealDictCursor
+
+from packages.jobs.download import catalogo
+
+ARCGIS_SEARCH_URL = os.getenv("ARCGIS_SEARCH_URL", "https://www.arcgis.com/sharing/rest/search")
+ARCGIS_ITEM_URL = "https://www.arcgis.com/sharing/rest/content/items"
+ARCGIS_CATALOGO_QUERY = os.getenv("ARCGIS_CATALOGO_QUERY", 'BDGD type:"File Geodatabase"')
+ARCGIS_PAGINA = 100  # máximo aceito pelo search
+
+SCHEMA = "intel_lead"
+COLUNAS = ["title", "description", "url", "url_hash", "created", "modified", "tipo", "snippet", "tags"]
+
+
+def paginar_itens(query: str = ARCGIS_CATALOGO_QUERY, sessao: Optional[requests.Session] = None,
+                  timeout_s: int = 30) -> Iterator[dict]:
+    """Páginas da busca do ArcGIS (dict com results/nextStart), até nextStart = -1."""
+    sessao = sessao or requests.Session()
+    inicio = 1
+    while inicio and inicio > 0:
+        r = sessao.get(ARCGIS_SEARCH_URL, params={
+            "q": query, "f": "json", "num": ARCGIS_PAGINA, "start": inicio,
+            "sortField": "modified", "sortOrder": "desc",
+        }, timeout=timeout_s)
+        r.raise_for_status()
+        pagina = r.json()
+        if "error" in pagina:
+            raise RuntimeError(f"ArcGIS search: {pagina['error']}")
+        yield pagina
+        inicio = pagina.get("nextStart", -1)
+
+
+def itens_para_df(paginas) -> pd.DataFrame:
+    """results de todas as páginas -> DataFrame nas colunas do catálogo (url_hash único)."""
+    itens = [it for p in paginas for it in p.get("results", [])]
+    df = pd.DataFrame(itens, columns=["id", "title", "description", "type", "snippet", "tags", "created", "modified"])
+    df = df[df["id"].notna() & (df["id"].astype(str).str.strip() != "")]
+
+    out = pd.DataFrame({
+        "title": df["title"].fillna("").astype(str).str.strip(),
+        "description": df["description"],
+        "url": ARCGIS_ITEM_URL + "/" + df["id"].astype(str).str.strip() + "/data",
+        # epoch em ms no ArcGIS
+        "created": pd.to_datetime(df["created"], unit="ms", utc=True, errors="coerce"),
+        "modified": pd.to_datetime(df["modified"], unit="ms", utc=True, errors="coerce"),
+        "tipo": df["type"],
+        "snippet": df["snippet"],
+        # array do Postgres via JSON na staging
+        "tags": df["tags"].map(lambda t: json.dumps(t if isinstance(t, list) else [], ensure_ascii=False)),
+    })
+    # mesmo hash do inserir_dataset_urls (sha256 da URL)
+    out["url_hash"] = out["url"].map(lambda u: hashlib.sha256(u.encode()).hexdigest())
+    return out.drop_duplicates("url_hash", keep="first")[COLUNAS].reset_index(drop=True)
+
+
+def upsert_catalogo(cur, df: pd.DataFrame) -> dict:
+    """
+    COPY para staging + merge com ON CONFLICT (url_hash). Retorna
+    {"novos": [...], "modificados": [...], "inalterados": n} ({id, title, url_hash}).
+    """
+    cur.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS catalogo_stage (
+            title TEXT, description TEXT, url TEXT, url_hash TEXT,
+            created TIMESTAMPTZ, modified TIMESTAMPTZ,
+            tipo TEXT, snippet TEXT, tags TEXT
+        ) ON COMMIT DROP
+    """)
+    buf = io.StringIO()
+    df.to_csv(buf, index=False, header=False, columns=COLUNAS, na_rep="\\N", date_format="%Y-%m-%dT%H:%M:%S%z")
+    buf.seek(0)
+    cur.copy_expert(f"COPY catalogo_stage ({','.join(COLUNAS)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buf)
+
+    cur.execute(f"""
+        INSERT INTO {SCHEMA}.dataset_url_catalog AS c
+            (title, description, url, url_hash, created, modified, tipo, snippet, tags, ultima_verificacao)
+        SELECT s.title, s.description, s.url, s.url_hash, s.created, s.modified, s.tipo, s.snippet,
+               ARRAY(SELECT jsonb_array_elements_text(COALESCE(s.tags, '[]')::jsonb)), now()
+        FROM catalogo_stage s
+        ON CONFLICT (url_hash) DO UPDATE SET
+            title              = EXCLUDED.title,
+            description        = EXCLUDED.description,
+            modified           = EXCLUDED.modified,
+            tipo               = EXCLUDED.tipo,
+            snippet            = EXCLUDED.snippet,
+            tags               = EXCLUDED.tags,
+            ultima_verificacao = now()
+        WHERE c.modified IS DISTINCT FROM EXCLUDED.modified
+           OR c.title IS DISTINCT FROM EXCLUDED.title
+        RETURNING c.id, c.title, c.url_hash, (xmax = 0) AS novo
+    """)
+    tocados = cur.fetchall()
+    novos = [{"id": r["id"], "title": r["title"], "url_hash": r["url_hash"]} for r in tocados if r["novo"]]
+    modificados = [{"id": r["id"], "title": r["title"], "url_hash": r["url_hash"]} for r in tocados if not r["novo"]]
+
+    # inalterados só têm a verificação carimbada (sem reescrever a linha inteira)
+    cur.execute(f"""
+        UPDATE {SCHEMA}.dataset_url_catalog c SET ultima_verificacao = now()
+        FROM catalogo_stage s
+        WHERE c.url_hash = s.url_hash AND NOT (c.id = ANY(%s))
+    """, ([r["id"] for r in tocados],))
+
+    if tocados:
+        catalogo.indexar_catalogo(cur, ids=[r["id"] for r in tocados])
+    return {"novos": novos, "modificados": modificados, "inalterados": len(df) - len(tocados)}
+
+
+def sincronizar(query: str = ARCGIS_CATALOGO_QUERY) -> dict:
+    from packages.database.connection import get_db_connection
+
+    df = itens_para_df(paginar_itens(query))
+    with get_db_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            relatorio = upsert_catalogo(cur, df)
+        conn.commit()
+    return relatorio
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Sincroniza dataset_url_catalog com a busca do ArcGIS")
+    ap.add_argument("--query", default=ARCGIS_CATALOGO_QUERY)
+    ap.add_argument("--relatorio", type=Path, help="grava o relatório (JSON) neste caminho")
+    args = ap.parse_args()
+
+    relatorio = sincronizar(args.query)
+    print(f"[catalogo] {len(relatorio['novos'])} novos, {len(relatorio['modificados'])} modificados, "
+          f"{relatorio['inalterados']} inalterados")
+    for tipo in ("novos", "modificados"):
+        for item in relatorio[tipo]:
+            print(f"  [{tipo[:-1]}] {item['title']}")
+    if args.relatorio:
+        args.relatorio.parent.mkdir(parents=True, exist_ok=True)
+        args.relatorio.write_text(json.dumps(relatorio, indent=2, ensure_ascii=False), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+# packages/jobs/enrichers/cache_geo.py
+# -*- coding: utf-8 -*-
+"""
+Cache espacial do enriquecimento via Google Places (enriquecimento_lead.cache_geo_cnpj).
+
+Cada busca em cache fica na célula geohash do seu centro (precisão
+GEO_CACHE_PRECISAO: 7 ≈ 150 m de lado). Para um ponto novo olha-se a célula
+dele + as 8 vizinhas e reaproveita-se a busca mais próxima cujo centro está a
+até GEO_CACHE_TOLERANCIA_M e cujo círculo contém o pedido (r >= raio + d) —
+UCs do mesmo prédio ou da mesma quadra deixam de custar uma chamada cada. A
+tolerância precisa ser menor que o lado da célula (senão um vizinho válido
+pode ficar de fora).
+
+Para o reuso acontecer com raios iguais, a busca na API usa
+raio_de_busca(raio) = raio + tolerância: o círculo salvo contém o de qualquer
+ponto a até GEO_CACHE_TOLERANCIA_M do centro.
+
+Na frente do banco, um LRU de células em memória (GEO_CACHE_LRU células; a
+célula vazia também fica, como resposta negativa). Contadores por origem do
+acerto em CacheGeo.stats.
+
+Schema (coluna geohash, índice e backfill das linhas antigas):
+packages/database/schema/cache_geo_cnpj.sql, aplicado no deploy por
+packages.database.migrar.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+from collections import OrderedDict
+from typing import Optional
+
+from psycopg2.extras import Json, execute_values
+
+GEO_CACHE_PRECISAO = int(os.getenv("GEO_CACHE_PRECISAO", "7"))
+GEO_CACHE_TOLERANCIA_M = float(os.getenv("GEO_CACHE_TOLERANCIA_M", "25"))
+GEO_CACHE_LRU = int(os.getenv("GEO_CACHE_LRU", "4096"))
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_RAIO_TERRA_M = 6371008.8
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Geohash
+# ──────────────────────────────────────────────────────────────────────────────
+def geohash(lat: float, lon: float, precisao: int = GEO_CACHE_PRECISAO) -> str:
+    lat_int, lon_int = [-90.0, 90.0], [-180.0, 180.0]
+    out, bits, n, par = [], 0, 0, True
+    while len(out) < precisao:
+        faixa, v = (lon_int, lon) if par else (lat_int, lat)
+        meio = (faixa[0] + faixa[1]) / 2
+        if v >= meio:
+            bits = (bits << 1) | 1
+            faixa[0] = meio
+        else:
+            bits <<= 1
+            faixa[1] = meio
+        par = not par
+        n += 1
+        if n == 5:
+            out.append(_BASE32[bits])
+            bits, n = 0, 0
+    return "".join(out)
+
+
+def tamanho_celula(precisao: int = GEO_CACHE_PRECISAO) -> tuple[float, float]:
+    """(altura, largura) da célula em graus."""
+    bits = 5 * precisao
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** (bits - bits // 2)
+
+
+def celulas_vizinhas(lat: float, lon: float, precisao: int = GEO_CACHE_PRECISAO) -> list[str]:
+    """Célula do ponto + as 8 em volta (sem repetição nos polos)."""
+    alt, larg = tamanho_celula(precisao)
+    out = []
+    for dy in (0, -1, 1):
+        for dx in (0, -1, 1):
+            la = max(-89.999999, min(89.999999, lat + dy * alt))
+            lo = (lon + dx * larg + 180.0) % 360.0 - 180.0
+            gh = geohash(la, lo, precisao)
+            if gh not in out:
+                out.append(gh)
+    return out
+
+
+def distancia_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * _RAIO_TERRA_M * math.asin(math.sqrt(a))
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Cache
+# ──────────────────────────────────────────────────────────────────────────────
+class CacheGeo:
+    """
+    cache = CacheGeo(conn)
+    hit = cache.buscar(lat, lon, raio)   # {"place_ids", "resultado", "distancia_m", centro/raio} ou None
+    r = cache.raio_de_busca(raio)        # raio da chamada à API em caso de miss
+    cache.salvar(lat, lon, r, place_ids, resultado)
+    cache.gravar(cur)                    # fim do lote, antes do commit
+    """
+
+    def __init__(self, conn, precisao: int = GEO_CACHE_PRECISAO, tolerancia_m: float = GEO_CACHE_TOLERANCIA_M,
+                 max_celulas: int = GEO_CACHE_LRU):
+        self.conn = conn
+        self.precisao = precisao
+        self.tolerancia_m = tolerancia_m
+        self.max_celulas = max_celulas
+        self._celulas: OrderedDict[str, list[tuple]] = OrderedDict()
+        self._pendentes: dict[tuple, tuple] = {}
+        self.stats = {"lru": 0, "banco": 0, "miss": 0, "consultas_banco": 0}
+
+    def raio_de_busca(self, raio: float) -> float:
+        """Raio a pedir à API para que a busca salva cubra os vizinhos dentro da tolerância."""
+        return float(raio) + self.tolerancia_m
+
+    def _lembrar(self, gh: str, entradas: list[tuple]):
+        self._celulas[gh] = entradas
+        self._celulas.move_to_end(gh)
+        while len(self._celulas) > self.max_celulas:
+            self._celulas.popitem(last=False)
+
+    def _carregar(self, celulas: list[str]) -> dict[str, list[tuple]]:
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT geohash, latitude, longitude, raio, cnpjs, resultado
+                FROM enriquecimento_lead.cache_geo_cnpj
+                WHERE geohash = ANY(%s)
+            """, (celulas,))
+            linhas = cur.fetchall()
+        self.stats["consultas_banco"] += 1
+        por_celula: dict[str, list[tuple]] = {gh: [] for gh in celulas}
+        for gh, la, lo, raio, place_ids, resultado in linhas:
+            por_celula[gh].append((float(la), float(lo), float(raio), place_ids, resultado))
+        # ainda não gravadas (célula saiu do LRU antes do gravar())
+        for gh, entrada in self._pendentes.values():
+            if gh in por_celula:
+                por_celula[gh] = [e for e in por_celula[gh] if e[:3] != entrada[:3]] + [entrada]
+        for gh, entradas in por_celula.items():
+            self._lembrar(gh, entradas)
+        return por_celula
+
+    def buscar(self, lat: float, lon: float, raio: float) -> Optional[dict]:
+        lat, lon = float(lat), float(lon)
+        celulas = celulas_vizinhas(lat, lon, self.precisao)
+        # lê as presentes (e as marca como recentes) antes de carregar as outras:
+        # a carga pode despejar células, inclusive alguma desta mesma consulta
+        vistas: dict[str, list[tuple]] = {}
+        for gh in celulas:
+            if gh in self._celulas:
+                self._celulas.move_to_end(gh)
+                vistas[gh] = self._celulas[gh]
+        faltando = [gh for gh in celulas if gh not in vistas]
+        if faltando:
+            vistas.update(self._carregar(faltando))
+
+        melhor = None
+        for gh in celulas:
+            for la, lo, r, place_ids, resultado in vistas[gh]:
+                d = distancia_m(lat, lon, la, lo)
+                # círculo em cache precisa conter o pedido inteiro, não só o centro
+                if r < raio + d or d > self.tolerancia_m:
+                    continue
+                if melhor is None or d < melhor["distancia_m"]:
+                    melhor = {"place_ids": place_ids, "resultado": resultado, "distancia_m": d,
+                              "latitude": la, "longitude": lo, "raio": r}
+
+        self.stats["miss" if melhor is None else ("banco" if faltando else "lru")] += 1
+        return melhor
+
+    def salvar(self, lat: float, lon: float, raio: float, place_ids: list, resultado: Optional[dict] = None):
+        """Entra no LRU na hora; vai para o banco no próximo gravar()."""
+        entrada = (float(lat), float(lon), float(raio), place_ids, resultado)
+        gh = geohash(entrada[0], entrada[1], self.precisao)
+        self._pendentes[entrada[:3]] = (gh, entrada)
+        if gh in self._celulas:
+            self._celulas[gh] = [e for e in self._celulas[gh] if e[:3] != entrada[:3]] + [entrada]
+
+    def gravar(self, cur) -> int:
+        """
+        Grava as buscas pendentes num statement só: atualiza a entrada que já
+        existe no mesmo ponto (completa o resultado das antigas) e insere o resto.
+        """
+        if not self._pendentes:
+            return 0
+        linhas = [(la, lo, r, place_ids, gh, Json(resultado) if resultado is not None else None)
+                  for gh, (la, lo, r, place_ids, resultado) in self._pendentes.values()]
+        execute_values(cur, """
+            WITH v (latitude, longitude, raio, cnpjs, geohash, resultado) AS (VALUES %s),
+            atualizadas AS (
+                UPDATE enriquecimento_lead.cache_geo_cnpj c
+                SET cnpjs = v.cnpjs, geohash = v.geohash, resultado = v.resultado
+                FROM v
+                WHERE c.latitude = v.latitude AND c.longitude = v.longitude AND c.raio = v.raio
+                RETURNING c.latitude, c.longitude, c.raio
+            )
+            INSERT INTO enriquecimento_lead.cache_geo_cnpj
+                (latitude, longitude, raio, cnpjs, fonte, geohash, resultado)
+            SELECT v.latitude, v.longitude, v.raio, v.cnpjs, 'google', v.geohash, v.resultado
+            FROM v
+            WHERE NOT EXISTS (
+                SELECT 1 FROM atualizadas a
+                WHERE a.latitude = v.latitude AND a.longitude = v.longitude AND a.raio = v.raio
+            )
+            ON CONFLICT DO NOTHING
+        """, linhas, template="(%s, %s, %s, %s::text[], %s, %s::jsonb)", page_size=len(linhas))
+        self._pendentes.clear()
+        return len(linhas)
+
+    def taxa_acerto(self) -> float:
+        total = self.stats["lru"] + self.stats["banco"] + self.stats["miss"]
+        return (self.stats["lru"] + self.stats["banco"]) / total if total else 0.0
+
+    def resumo(self) -> str:
+        s = self.stats
+        return (f"cache geo: {self.taxa_acerto():.0%} de acerto "
+                f"(lru={s['lru']}, banco={s['banco']}, miss={s['miss']}, consultas ao banco={s['consultas_banco']})")
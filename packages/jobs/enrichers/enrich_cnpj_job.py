@@ -1,16 +1,32 @@
 import os
 import time
-import requests
-from typing import List
+import random
+import asyncio
+from typing import List, Optional
 from dotenv import load_dotenv
 from datetime import datetime
+import aiohttp
 import psycopg2
+from psycopg2.extras import execute_batch, execute_values
 
 load_dotenv()
 
 CNPJA_BASE_URL = "https://api.cnpja.com.br/companies"
 CNPJA_TOKEN = os.getenv("CNPJA_API_TOKEN")
 
+# requisições simultâneas (conexões keep-alive no pool do aiohttp)
+CNPJA_CONCORRENCIA = int(os.getenv("CNPJA_CONCORRENCIA", "8"))
+# limite do plano da CNPJá: requisições por minuto + rajada tolerada
+CNPJA_RPM = float(os.getenv("CNPJA_RPM", "60"))
+CNPJA_RAJADA = int(os.getenv("CNPJA_RAJADA", "5"))
+# 429/5xx/rede: tentativas e backoff exponencial com jitter (teto em segundos)
+CNPJA_MAX_TENTATIVAS = int(os.getenv("CNPJA_MAX_TENTATIVAS", "5"))
+CNPJA_BACKOFF_BASE_S = float(os.getenv("CNPJA_BACKOFF_BASE_S", "1.0"))
+CNPJA_BACKOFF_MAX_S = float(os.getenv("CNPJA_BACKOFF_MAX_S", "60"))
+CNPJA_TIMEOUT_S = float(os.getenv("CNPJA_TIMEOUT_S", "30"))
+# escritas no banco em lote (log_api + lead_enriquecido)
+CNPJA_LOTE_DB = int(os.getenv("CNPJA_LOTE_DB", "100"))
+
 DB_CONFIG = {
     "host": os.getenv("DB_HOST"),
     "dbname": os.getenv("DB_NAME"),
@@ -27,90 +43,196 @@ HEADERS = {
 def get_db():
     return psycopg2.connect(**DB_CONFIG)
 
-def log_api(conn, endereco, status_code, tempo_ms, erro=None):
+class BaldeTokens:
+    """
+    Token bucket assíncrono: `taxa` tokens/s, até `capacidade` acumulados.
+    Compartilhado por todas as tarefas; quem não tem token espera a reposição.
+    """
+
+    def __init__(self, taxa: float, capacidade: int = 1):
+        self.taxa = taxa
+        self.capacidade = max(1, capacidade)
+        self.tokens = float(self.capacidade)
+        self._ultimo = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def adquirir(self):
+        if self.taxa <= 0:
+            return
+        # o lock enfileira os que esperam: cada um dorme só a sua parte
+        async with self._lock:
+            agora = time.monotonic()
+            self.tokens = min(self.capacidade, self.tokens + (agora - self._ultimo) * self.taxa)
+            self._ultimo = agora
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.taxa)
+                self.tokens = 1.0
+                self._ultimo = time.monotonic()
+            self.tokens -= 1
+
+def _espera(tentativa: int, retry_after: Optional[str] = None) -> float:
+    # Retry-After do 429 manda; senão exponencial com jitter total
+    if retry_after:
+        try:
+            return min(CNPJA_BACKOFF_MAX_S, max(0.0, float(retry_after)))
+        except ValueError:
+            pass
+    return random.uniform(0, min(CNPJA_BACKOFF_MAX_S, CNPJA_BACKOFF_BASE_S * 2 ** (tentativa - 1)))
+
+def buscar_enderecos_google(conn, lead_ids: List[str]) -> dict:
+    """Endereço formatado mais recente de cada lead, numa consulta só."""
     with conn.cursor() as cur:
         cur.execute("""
-            INSERT INTO enriquecimento_lead.log_api
-                (api, tipo, status_code, tempo_resposta_ms, sucesso, erro, endereco)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """, (
-            "cnpja", "endereco", status_code, tempo_ms,
-            status_code == 200, erro, endereco
-        ))
-
-def buscar_endereco_google(conn, lead_id):
-    with conn.cursor() as cur:
-        cur.execute("""
-            SELECT endereco_formatado
+            SELECT DISTINCT ON (lead_id) lead_id, endereco_formatado
             FROM enriquecimento_lead.lead_enriquecido
-            WHERE lead_id = %s
-            ORDER BY data_enriquecimento DESC
-            LIMIT 1
-        """, (lead_id,))
-        result = cur.fetchone()
-        return result[0] if result else None
-
-def buscar_cnpj_por_endereco(endereco: str):
-    url = f"{CNPJA_BASE_URL}?q={endereco}"
-    start = time.time()
-    response = requests.get(url, headers=HEADERS)
-    tempo = int((time.time() - start) * 1000)
-    return response, tempo
-
-def atualizar_enriquecido(conn, lead_id, empresa):
-    now = datetime.utcnow()
-    with conn.cursor() as cur:
-        cur.execute("""
-            UPDATE enriquecimento_lead.lead_enriquecido
-            SET
-                cnpj = %s,
-                cnae_principal = %s,
-                descricao_cnae = %s,
-                situacao_cadastral = %s,
-                capital_social = %s,
-                data_enriquecimento = %s,
-                versao = versao + 1
-            WHERE lead_id = %s
-        """, (
+            WHERE lead_id = ANY(%s)
+            ORDER BY lead_id, data_enriquecimento DESC
+        """, (list(lead_ids),))
+        return {str(lead_id): endereco for lead_id, endereco in cur.fetchall() if endereco}
+
+async def buscar_cnpj_por_endereco(sessao: aiohttp.ClientSession, balde: BaldeTokens, endereco: str,
+                                   logs: list) -> tuple[Optional[int], Optional[list]]:
+    """
+    GET na CNPJá com rate limit e retentativas em 429/5xx/erro de rede.
+    Cada tentativa vira uma linha de log_api (em `logs`). Retorna (status, empresas).
+    """
+    status = None
+    for tentativa in range(1, CNPJA_MAX_TENTATIVAS + 1):
+        await balde.adquirir()
+        start = time.monotonic()
+        retry_after, erro, corpo = None, None, None
+        try:
+            async with sessao.get(CNPJA_BASE_URL, params={"q": endereco}) as res:
+                status = res.status
+                retry_after = res.headers.get("Retry-After")
+                if status == 200:
+                    corpo = await res.json(content_type=None)
+                else:
+                    erro = (await res.text())[:500] or None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            status, erro = None, f"{type(e).__name__}: {e}"
+        logs.append((endereco, status, int((time.monotonic() - start) * 1000), erro))
+
+        if status == 200:
+            empresas = corpo.get("data") if isinstance(corpo, dict) else corpo  # suporte a ambos formatos
+            return status, empresas or []
+        if (status is None or status == 429 or status >= 500) and tentativa < CNPJA_MAX_TENTATIVAS:
+            await asyncio.sleep(_espera(tentativa, retry_after if status == 429 else None))
+            continue
+        break
+    return status, None
+
+class GravadorLote:
+    """
+    Acumula log_api e atualizações de lead_enriquecido e grava em lote
+    (1 INSERT multi-linha + 1 round-trip de UPDATEs por lote, com commit),
+    numa thread para não travar o loop.
+    """
+
+    def __init__(self, conn, lote: int = CNPJA_LOTE_DB):
+        self.conn = conn
+        self.lote = lote
+        self.logs: list = []
+        self.atualizacoes: list = []
+        self._lock = asyncio.Lock()
+
+    def atualizar(self, lead_id, empresa: dict):
+        self.atualizacoes.append((
             empresa.get("cnpj"),
-            empresa.get("cnae", {}).get("code"),
-            empresa.get("cnae", {}).get("description"),
+            (empresa.get("cnae") or {}).get("code"),
+            (empresa.get("cnae") or {}).get("description"),
             empresa.get("status"),
             empresa.get("capital_social"),
-            now,
-            lead_id
+            datetime.utcnow(),
+            lead_id,
         ))
 
-def enriquecer_leads_cnpj(lead_ids: List[str]):
+    async def talvez_gravar(self):
+        if len(self.logs) + len(self.atualizacoes) >= self.lote:
+            await self.gravar()
+
+    async def gravar(self):
+        async with self._lock:
+            logs, self.logs = self.logs, []
+            atualizacoes, self.atualizacoes = self.atualizacoes, []
+            if logs or atualizacoes:
+                await asyncio.to_thread(self._gravar, logs, atualizacoes)
+
+    def _gravar(self, logs: list, atualizacoes: list):
+        with self.conn.cursor() as cur:
+            if logs:
+                execute_values(cur, """
+                    INSERT INTO enriquecimento_lead.log_api
+                        (api, tipo, status_code, tempo_resposta_ms, sucesso, erro, endereco)
+                    VALUES %s
+                """, [("cnpja", "endereco", st, ms, st == 200, erro, end) for end, st, ms, erro in logs],
+                    page_size=self.lote)
+            if atualizacoes:
+                execute_batch(cur, """
+                    UPDATE enriquecimento_lead.lead_enriquecido
+                    SET
+                        cnpj = %s,
+                        cnae_principal = %s,
+                        descricao_cnae = %s,
+                        situacao_cadastral = %s,
+                        capital_social = %s,
+                        data_enriquecimento = %s,
+                        versao = versao + 1
+                    WHERE lead_id = %s
+                """, atualizacoes, page_size=self.lote)
+        self.conn.commit()
+
+async def _enriquecer(conn, lead_ids: List[str], concorrencia: int) -> dict:
+    enderecos = buscar_enderecos_google(conn, lead_ids)
+    resumo = {"atualizados": 0, "sem_endereco": 0, "sem_empresa": 0, "erros": 0}
+    for lead_id in lead_ids:
+        if str(lead_id) not in enderecos:
+            print(f"⚠️ Lead {lead_id} sem endereço formatado — pulei.")
+            resumo["sem_endereco"] += 1
+
+    # leads no mesmo endereço: uma consulta só
+    por_endereco: dict[str, list] = {}
+    for lead_id in lead_ids:
+        if str(lead_id) in enderecos:
+            por_endereco.setdefault(enderecos[str(lead_id)], []).append(lead_id)
+    pendentes = iter(por_endereco.items())
+
+    balde = BaldeTokens(CNPJA_RPM / 60.0, CNPJA_RAJADA)
+    gravador = GravadorLote(conn)
+    conector = aiohttp.TCPConnector(limit=concorrencia, keepalive_timeout=30)
+    timeout = aiohttp.ClientTimeout(total=CNPJA_TIMEOUT_S)
+
+    async with aiohttp.ClientSession(headers=HEADERS, connector=conector, timeout=timeout) as sessao:
+        async def _trabalhador():
+            for endereco, leads in pendentes:
+                print(f"🔎 Buscando CNPJ para {len(leads)} lead(s) ({endereco})")
+                tentativas: list = []
+                status, empresas = await buscar_cnpj_por_endereco(sessao, balde, endereco, tentativas)
+                gravador.logs.extend(tentativas)
+                if empresas is None:
+                    print(f"❌ Erro {status} na API")
+                    resumo["erros"] += len(leads)
+                elif not empresas:
+                    print("⚠️ Nenhuma empresa encontrada no endereço")
+                    resumo["sem_empresa"] += len(leads)
+                else:
+                    empresa = empresas[0]  # pega a primeira empresa retornada
+                    for lead_id in leads:
+                        gravador.atualizar(lead_id, empresa)
+                        print(f"✅ Lead {lead_id} atualizado com CNPJ {empresa.get('cnpj')}")
+                    resumo["atualizados"] += len(leads)
+                await gravador.talvez_gravar()
+
+        try:
+            await asyncio.gather(*(_trabalhador() for _ in range(max(1, concorrencia))))
+        finally:
+            await gravador.gravar()
+    return resumo
+
+def enriquecer_leads_cnpj(lead_ids: List[str], concorrencia: int = CNPJA_CONCORRENCIA) -> dict:
     conn = get_db()
     try:
-        for lead_id in lead_ids:
-            endereco = buscar_endereco_google(conn, lead_id)
-            if not endereco:
-                print(f"⚠️ Lead {lead_id} sem endereço formatado — pulei.")
-                continue
-
-            print(f"🔎 Buscando CNPJ para lead {lead_id} ({endereco})")
-            res, tempo = buscar_cnpj_por_endereco(endereco)
-            status = res.status_code
-            log_api(conn, endereco, status, tempo)
-
-            if status != 200:
-                print(f"❌ Erro {status} na API")
-                continue
-
-            data = res.json()
-            empresas = data.get("data") or data  # suporte a ambos formatos
-
-            if not empresas:
-                print(f"⚠️ Nenhuma empresa encontrada no endereço")
-                continue
-
-            empresa = empresas[0]  # pega a primeira empresa retornada
-            atualizar_enriquecido(conn, lead_id, empresa)
-            print(f"✅ Lead {lead_id} atualizado com CNPJ {empresa.get('cnpj')}")
-
-        conn.commit()
+        return asyncio.run(_enriquecer(conn, lead_ids, concorrencia))
     finally:
         conn.close()
 
@@ -121,6 +243,6 @@ if __name__ == "__main__":
         sys.exit(1)
 
     lead_ids = sys.argv[1:]
-    enriquecer_leads_cnpj(lead_ids)
+    print(enriquecer_leads_cnpj(lead_ids))
 
 enrich_cnpj = enriquecer_leads_cnpj
@@ -7,10 +7,14 @@ from datetime import datetime
 import psycopg2
 from psycopg2.extras import execute_values
 
+from packages.jobs.enrichers.cache_geo import CacheGeo
+
 load_dotenv()
 
 API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
 RAIO_METROS = 100
+# leads por lote: 1 consulta de coordenadas + 1 escrita por tabela + commit
+GEO_LOTE_DB = int(os.getenv("GEO_LOTE_DB", "200"))
 
 DB_CONFIG = {
     "host": os.getenv("DB_HOST"),
@@ -24,31 +28,25 @@ DB_CONFIG = {
 def get_db():
     return psycopg2.connect(**DB_CONFIG)
 
-def log_api(conn, lat, lon, status, tempo, erro=None):
+def buscar_coordenadas(conn, lead_ids: List[str]) -> dict:
+    """Coordenadas de cada UC do lote, numa consulta só."""
     with conn.cursor() as cur:
         cur.execute("""
+            SELECT uc_id, latitude, longitude
+            FROM intel_lead.lead_bruto
+            WHERE uc_id = ANY(%s)
+        """, (list(lead_ids),))
+        return {str(uc_id): (lat, lon) for uc_id, lat, lon in cur.fetchall()}
+
+def gravar_logs(cur, logs: list):
+    """logs: (lat, lon, status, tempo, erro) -> 1 INSERT multi-linha."""
+    if logs:
+        execute_values(cur, """
             INSERT INTO enriquecimento_lead.log_api
                 (api, tipo, latitude, longitude, status_code, tempo_resposta_ms, sucesso, erro)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        """, ("google", "places", lat, lon, status, tempo, status == "200", erro))
-
-def checar_cache(conn, lat, lon, raio):
-    with conn.cursor() as cur:
-        cur.execute("""
-            SELECT cnpjs FROM enriquecimento_lead.cache_geo_cnpj
-            WHERE latitude = %s AND longitude = %s AND raio = %s
-        """, (lat, lon, raio))
-        result = cur.fetchone()
-        return result[0] if result else None
-
-def salvar_cache(conn, lat, lon, raio, place_ids):
-    with conn.cursor() as cur:
-        cur.execute("""
-            INSERT INTO enriquecimento_lead.cache_geo_cnpj
-                (latitude, longitude, raio, cnpjs, fonte)
-            VALUES (%s, %s, %s, %s, %s)
-            ON CONFLICT DO NOTHING
-        """, (lat, lon, raio, place_ids, "google"))
+            VALUES %s
+        """, [("google", "places", lat, lon, st, ms, st == "200", erro) for lat, lon, st, ms, erro in logs],
+            page_size=len(logs))
 
 def buscar_places(lat, lon, raio):
     url = (
@@ -68,51 +66,56 @@ def buscar_place_details(place_id):
     )
     return requests.get(url).json()
 
-def salvar_resultado(conn, lead_id, dados, raio):
-    now = datetime.utcnow()
-    with conn.cursor() as cur:
-        cur.execute("""
+def linha_resultado(lead_id, dados, raio) -> tuple:
+    return (
+        lead_id,
+        dados.get("name"),
+        dados.get("name"),
+        ", ".join(dados.get("types", []))[:200],
+        dados.get("formatted_address"),
+        "google",
+        raio,
+        datetime.utcnow(),
+        1
+    )
+
+def gravar_resultados(cur, linhas: list):
+    if linhas:
+        execute_values(cur, """
             INSERT INTO enriquecimento_lead.lead_enriquecido (
                 lead_id, razao_social, nome_fantasia, descricao_atividade,
                 endereco_formatado, fonte, raio_utilizado, data_enriquecimento, versao
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ) VALUES %s
             ON CONFLICT DO NOTHING
-        """, (
-            lead_id,
-            dados.get("name"),
-            dados.get("name"),
-            ", ".join(dados.get("types", []))[:200],
-            dados.get("formatted_address"),
-            "google",
-            raio,
-            now,
-            1
-        ))
-
-def enriquecer_leads_google(leads: List[str]):
-    conn = get_db()
-    try:
-        for lead_id in leads:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT latitude, longitude
-                    FROM intel_lead.lead_bruto
-                    WHERE uc_id = %s
-                """, (lead_id,))
-                row = cur.fetchone()
-                if not row:
-                    print(f"❌ Lead {lead_id} não encontrado.")
-                    continue
-                lat, lon = row
-
-            if checar_cache(conn, lat, lon, RAIO_METROS):
-                print(f"⚠️ Lead {lead_id} já em cache, ignorando...")
-                continue
-
+        """, linhas, page_size=len(linhas))
+
+def _enriquecer_lote(conn, cache: CacheGeo, lead_ids: List[str]):
+    coordenadas = buscar_coordenadas(conn, lead_ids)
+    logs, resultados = [], []
+    for lead_id in lead_ids:
+        if str(lead_id) not in coordenadas:
+            print(f"❌ Lead {lead_id} não encontrado.")
+            continue
+        lat, lon = coordenadas[str(lead_id)]
+
+        hit = cache.buscar(lat, lon, RAIO_METROS)
+        if hit and hit["resultado"]:
+            # busca vizinha já detalhada: nenhuma chamada
+            resultados.append(linha_resultado(lead_id, hit["resultado"], RAIO_METROS))
+            print(f"♻️ Lead {lead_id} do cache ({hit['distancia_m']:.0f} m): {hit['resultado'].get('name')}")
+            continue
+        if hit and not hit["place_ids"]:
+            print(f"⚠️ Lead {lead_id} já em cache sem lugar no raio, ignorando...")
+            continue
+
+        if hit:
+            # entrada antiga (só place_id): pula o nearby, falta o details
+            place_id = hit["place_ids"][0]
+        else:
             print(f"🔎 Enriquecendo lead {lead_id} via Google...")
-            res, tempo = buscar_places(lat, lon, RAIO_METROS)
+            res, tempo = buscar_places(lat, lon, cache.raio_de_busca(RAIO_METROS))
             status = str(res.status_code)
-            log_api(conn, lat, lon, status, tempo)
+            logs.append((lat, lon, status, tempo, None))
 
             if status != "200":
                 print(f"❌ Erro {status} na API")
@@ -123,18 +126,35 @@ def enriquecer_leads_google(leads: List[str]):
             if not places:
                 print(f"⚠️ Nenhum lugar encontrado no raio para lead {lead_id}")
                 continue
+            place_id = places[0]["place_id"]
+
+        detalhes = buscar_place_details(place_id)
+        result = detalhes.get("result", {})
+        if "name" not in result:
+            continue
+
+        resultados.append(linha_resultado(lead_id, result, RAIO_METROS))
+        if hit:
+            # completa a entrada antiga no centro/raio dela (a busca foi feita lá)
+            cache.salvar(hit["latitude"], hit["longitude"], hit["raio"], [place_id], result)
+        else:
+            cache.salvar(lat, lon, cache.raio_de_busca(RAIO_METROS), [place_id], result)
+        print(f"✅ Enriquecido com {result['name']}")
+
+    # um statement por tabela por lote
+    with conn.cursor() as cur:
+        gravar_logs(cur, logs)
+        gravar_resultados(cur, resultados)
+        cache.gravar(cur)
+    conn.commit()
 
-            melhor = places[0]
-            detalhes = buscar_place_details(melhor["place_id"])
-            result = detalhes.get("result", {})
-            if "name" not in result:
-                continue
-
-            salvar_resultado(conn, lead_id, result, RAIO_METROS)
-            salvar_cache(conn, lat, lon, RAIO_METROS, [melhor["place_id"]])
-            print(f"✅ Enriquecido com {result['name']}")
-
-        conn.commit()
+def enriquecer_leads_google(leads: List[str], lote: int = GEO_LOTE_DB):
+    conn = get_db()
+    try:
+        cache = CacheGeo(conn)
+        for i in range(0, len(leads), max(1, lote)):
+            _enriquecer_lote(conn, cache, leads[i:i + lote])
+        print(cache.resumo())
     finally:
         conn.close()
 
@@ -13,13 +13,15 @@ Colunas que suportamos no banco (usamos só as que existirem):
   distribuidora_id (text) | ano (int)
 
 Execução leve:
-- Fiona em streaming (não carrega tudo em RAM)
+- Fiona em streaming (não carrega tudo em RAM), ou cache Parquet quando fresco
 - Chunk pequeno (default 5k)
 - COPY por micro-batches
+- Métricas por etapa (read/transform/to_csv/copy/commit) em import_metrics; --profile p/ cProfile
 """
 
 from __future__ import annotations
-import os, io, gc, sys, time, argparse, hashlib, math
+import os, io, gc, sys, time, argparse, hashlib, itertools, math
+from contextlib import contextmanager
 from pathlib import Path
 from typing import List, Dict, Optional, Tuple
 
@@ -28,6 +30,10 @@ import fiona
 import psycopg2
 from tqdm import tqdm
 
+from packages.jobs.utils import gdb_cache
+from packages.jobs.utils.import_metrics import MetricasImport, perfilar
+from packages.jobs.utils.rastreio import registrar_status, gerar_import_id
+
 SCHEMA = "intel_lead"
 TABLE  = f"{SCHEMA}.ponto_notavel"
 
@@ -58,7 +64,7 @@ except Exception:
 # ---------------------- Detecção de layer ----------------------
 def detectar_layer_ponnot(gdb_path: Path) -> Optional[str]:
     cand = {"PONNOT","PON_NOT","PONTO_NOTAVEL","PONTOS_NOTAVEIS","ponnot","pon_not","ponto_notavel"}
-    layers = set(fiona.listlayers(str(gdb_path)))
+    layers = set(gdb_cache.listar_layers(gdb_path))
     for name in cand:
         if name in layers: return name
     for ly in layers:
@@ -121,15 +127,20 @@ def stable_bigint_id(dist: str, ano: int, lat: Optional[float], lon: Optional[fl
     # 12 hex (~48 bits) cabe em BIGINT
     return int(hashlib.md5(base.encode()).hexdigest()[:12], 16)
 
-def copy_dataframe(cur, df: pd.DataFrame, table_full: str, columns: List[str]) -> int:
+def copy_dataframe(cur, df: pd.DataFrame, table_full: str, columns: List[str],
+                   metricas: Optional[MetricasImport] = None) -> int:
     if df.empty: return 0
-    buf = io.StringIO()
-    df.to_csv(buf, index=False, header=False, columns=columns, na_rep='\\N')
-    buf.seek(0)
-    cur.copy_expert(
-        f"COPY {table_full} ({','.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
-        buf
-    )
+    metricas = metricas or MetricasImport(None, "PONNOT")
+    with metricas.etapa("to_csv", linhas=len(df)) as reg:
+        buf = io.StringIO()
+        df.to_csv(buf, index=False, header=False, columns=columns, na_rep='\\N')
+        reg["bytes"] = buf.tell()
+        buf.seek(0)
+    with metricas.etapa("copy", linhas=len(df), bytes_=reg["bytes"]):
+        cur.copy_expert(
+            f"COPY {table_full} ({','.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+            buf
+        )
     return len(df)
 
 # ---------------------- Núcleo ----------------------
@@ -139,9 +150,12 @@ def processar_chunk(
     cols_db: List[str],
     include_pn_id: bool,
     dist_text: str,
-    ano: int
+    ano: int,
+    metricas: Optional[MetricasImport] = None
 ) -> int:
     if not feats: return 0
+    metricas = metricas or MetricasImport(None, "PONNOT")
+    t0 = time.perf_counter()
 
     # mapeamento mínimo para o seu banco
     want_cols = [c for c in ["pn_id","latitude","longitude","distribuidora_id","ano"] if c in cols_db]
@@ -176,20 +190,22 @@ def processar_chunk(
     if "latitude" in df:  df["latitude"]  = pd.to_numeric(df["latitude"], errors="coerce")
     if "longitude" in df: df["longitude"] = pd.to_numeric(df["longitude"], errors="coerce")
     if "ano" in df:       df["ano"]       = pd.to_numeric(df["ano"], errors="coerce").astype("Int64")
+    metricas.registrar("transform", time.perf_counter() - t0, linhas=len(df))
 
     # staging + upsert se pn_id faz parte do conjunto
     if include_pn_id and "pn_id" in want_cols:
         cur.execute(f"CREATE TEMP TABLE _stg_pn (LIKE {TABLE} INCLUDING ALL) ON COMMIT DROP;")
-        copy_dataframe(cur, df, "_stg_pn", want_cols)
-        cur.execute(f"""
-            INSERT INTO {TABLE} ({','.join(want_cols)})
-            SELECT {','.join(want_cols)} FROM _stg_pn
-            ON CONFLICT (pn_id) DO NOTHING
-        """)
+        copy_dataframe(cur, df, "_stg_pn", want_cols, metricas)
+        with metricas.etapa("upsert", linhas=len(df)):
+            cur.execute(f"""
+                INSERT INTO {TABLE} ({','.join(want_cols)})
+                SELECT {','.join(want_cols)} FROM _stg_pn
+                ON CONFLICT (pn_id) DO NOTHING
+            """)
         inserted = cur.rowcount
     else:
         # sem pn_id -> assume que a coluna no banco tem DEFAULT/IDENTITY
-        copy_dataframe(cur, df, TABLE, want_cols)
+        copy_dataframe(cur, df, TABLE, want_cols, metricas)
         # não há rowcount para COPY direto; melhor retornar tamanho do df
         inserted = len(df)
 
@@ -197,18 +213,50 @@ def processar_chunk(
     gc.collect()
     return inserted
 
-# ---------------------- Main ----------------------
-def main():
-    ap = argparse.ArgumentParser(description="Importer PONNOT (básico e alinhado ao banco minimalista)")
-    ap.add_argument("--gdb", required=True)
-    ap.add_argument("--distribuidora", required=True)  # vira distribuidora_id (TEXT)
-    ap.add_argument("--ano", type=int, required=True)
-    ap.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
-    ap.add_argument("--sleep-ms-between", type=int, default=SLEEP_MS)
-    ap.add_argument("--modo-debug", action="store_true")
-    args = ap.parse_args()
-
-    gdb = Path(args.gdb)
+@contextmanager
+def _abrir_features(gdb: Path, layer: str):
+    """(iterável de features, total): cache Parquet quando fresco, senão Fiona."""
+    total = gdb_cache.contar_linhas(gdb, layer)
+    if total is not None:
+        yield gdb_cache.iter_features(gdb, layer), total
+        return
+    with fiona.open(str(gdb), layer=layer) as src:
+        yield src, len(src)
+
+# ---------------------- Job ----------------------
+def importar_ponnot(
+    gdb_path: Path,
+    distribuidora: str,
+    ano: int,
+    chunk_size: int = CHUNK_SIZE,
+    sleep_ms_between: int = SLEEP_MS,
+    modo_debug: bool = False,
+    prefixo: Optional[str] = None,
+) -> int:
+    # import_status/import_id pela mesma chave (prefixo, ano, camada) dos outros
+    # importers: o orquestrador pula o gdb inalterado e o fingerprint fica gravado
+    camada = "PONNOT"
+    dist_text = str(distribuidora)
+    prefixo = prefixo or dist_text
+    import_id = gerar_import_id(prefixo, ano, camada)
+    registrar_status(prefixo, ano, camada, "running", distribuidora_nome=dist_text, import_id=import_id)
+    metricas = MetricasImport(import_id, camada)
+    try:
+        total_ins = _importar(Path(gdb_path), dist_text, ano, chunk_size, sleep_ms_between, metricas)
+    except Exception as e:
+        registrar_status(prefixo, ano, camada, "failed", erro=str(e), import_id=import_id)
+        raise
+    finally:
+        metricas.salvar()
+
+    registrar_status(prefixo, ano, camada, "completed", linhas_processadas=total_ins, import_id=import_id)
+    if modo_debug:
+        print(f"Inseridos ponto_notavel: {total_ins}")
+    return total_ins
+
+
+def _importar(gdb: Path, dist_text: str, ano: int, chunk_size: int, sleep_ms_between: int,
+              metricas: MetricasImport) -> int:
     if not gdb.exists():
         raise FileNotFoundError(f"GDB não encontrado: {gdb}")
 
@@ -216,40 +264,57 @@ def main():
     if not layer:
         raise RuntimeError("Camada PONNOT não encontrada no GDB.")
 
-    dist_text = str(args.distribuidora)
-
-    with get_db_connection() as conn, conn.cursor() as cur, fiona.open(str(gdb), layer=layer) as src:
+    with get_db_connection() as conn, conn.cursor() as cur, _abrir_features(gdb, layer) as (src, total):
         # introspecção da tabela do SEU banco
         meta = introspect_table(cur)
         cols_db = meta["cols"]
         include_pn_id = meta["has_pn_id"] and not meta["pn_id_has_default"]
 
-        total = len(src)
-        pbar = tqdm(total=total, desc=f"PONNOT {dist_text} {args.ano}", unit="pt")
+        pbar = tqdm(total=total, desc=f"PONNOT {dist_text} {ano}", unit="pt")
 
-        chunk: List[dict] = []
         total_ins = 0
+        # "read" conta as features da origem (base do seg/linha em custo_import)
+        for chunk in metricas.medir_iter("read", _em_chunks(src, chunk_size)):
+            total_ins += processar_chunk(chunk, cur, cols_db, include_pn_id, dist_text, ano, metricas)
+            with metricas.etapa("commit"):
+                conn.commit()
+            pbar.update(len(chunk))
+            if sleep_ms_between > 0:
+                with metricas.etapa("sleep"):
+                    time.sleep(sleep_ms_between / 1000.0)
 
-        def flush():
-            nonlocal chunk, total_ins
-            if not chunk: return
-            total_ins += processar_chunk(chunk, cur, cols_db, include_pn_id, dist_text, args.ano)
-            conn.commit()
-            chunk = []
-            if args.sleep_ms_between > 0:
-                time.sleep(args.sleep_ms_between / 1000.0)
-
-        for feat in src:
-            chunk.append(feat)
-            if len(chunk) >= args.chunk_size:
-                flush()
-            pbar.update(1)
-
-        flush()
         pbar.close()
+    return total_ins
+
+
+def _em_chunks(src, n: int):
+    it = iter(src)
+    while chunk := list(itertools.islice(it, n)):
+        yield chunk
+
+# ---------------------- Main ----------------------
+def main():
+    ap = argparse.ArgumentParser(description="Importer PONNOT (básico e alinhado ao banco minimalista)")
+    ap.add_argument("--gdb", required=True)
+    ap.add_argument("--distribuidora", required=True)  # vira distribuidora_id (TEXT)
+    ap.add_argument("--ano", type=int, required=True)
+    ap.add_argument("--prefixo", help="chave do import_status (ex. ENEL_SP_2023); padrão: --distribuidora")
+    ap.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    ap.add_argument("--sleep-ms-between", type=int, default=SLEEP_MS)
+    ap.add_argument("--modo-debug", action="store_true")
+    ap.add_argument("--profile", action="store_true", help="dump cProfile/pyinstrument em data/logs/import_metrics")
+    args = ap.parse_args()
 
-        if args.modo_debug:
-            print(f"Inseridos ponto_notavel: {total_ins}")
+    with perfilar(args.profile, gerar_import_id(args.prefixo or str(args.distribuidora), args.ano, "PONNOT")):
+        importar_ponnot(
+            gdb_path=Path(args.gdb),
+            distribuidora=args.distribuidora,
+            ano=args.ano,
+            chunk_size=args.chunk_size,
+            sleep_ms_between=args.sleep_ms_between,
+            modo_debug=args.modo_debug,
+            prefixo=args.prefixo,
+        )
 
 if __name__ == "__main__":
     main()
@@ -3,13 +3,14 @@ import io
 import hashlib
 import argparse
 import pandas as pd
-import geopandas as gpd
 from pathlib import Path
+from time import perf_counter
 from tqdm import tqdm
-from fiona import listlayers
 
 from packages.database.connection import get_db_connection
 from packages.jobs.utils.rastreio import registrar_status, gerar_import_id
+from packages.jobs.utils import gdb_cache
+from packages.jobs.utils.import_metrics import MetricasImport, perfilar
 from packages.jobs.utils.sanitize import (
     sanitize_numeric,
     sanitize_cnae,
@@ -29,25 +30,35 @@ RELEVANT_COLUMNS = [
     "CTAT", "SUB", "TIP_CC", "FAS_CON", "TEN_FORN", "CAR_INST", "DEM_CONT", "SEMRED"
 ]
 
+# projeção usada quando a layer vem do cache Parquet (gdb_cache)
+COLUNAS_LEITURA = RELEVANT_COLUMNS + [
+    f"{p}_{mes:02d}" for p in ("ENE_P", "ENE_F", "DEM_P", "DEM_F", "DIC", "FIC") for mes in range(1, 13)
+]
+
 def detectar_layer(gdb_path: Path) -> str:
-    layers = listlayers(str(gdb_path))
+    layers = gdb_cache.listar_layers(gdb_path)
     return next((l for l in layers if l.upper().startswith("UCAT")), None)
 
 def gerar_uc_id(cod_id: str, ano: int, camada: str, distribuidora_id: int) -> str:
     base = f"{cod_id}_{ano}_{camada}_{distribuidora_id}"
     return hashlib.sha256(base.encode()).hexdigest()
 
-def insert_copy(cur, df: pd.DataFrame, table: str, columns: list[str]):
-    buf = io.StringIO()
-    df.to_csv(buf, index=False, header=False, columns=columns, na_rep='\\N')
-    buf.seek(0)
-    cur.copy_expert(f"COPY {table} ({','.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buf)
+def insert_copy(cur, df: pd.DataFrame, table: str, columns: list[str], metricas: MetricasImport | None = None):
+    metricas = metricas or MetricasImport(None, "UCAT")
+    with metricas.etapa("to_csv", linhas=len(df)) as reg:
+        buf = io.StringIO()
+        df.to_csv(buf, index=False, header=False, columns=columns, na_rep='\\N')
+        reg["bytes"] = buf.tell()
+        buf.seek(0)
+    with metricas.etapa("copy", linhas=len(df), bytes_=reg["bytes"]):
+        cur.copy_expert(f"COPY {table} ({','.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buf)
     tqdm.write(f"Inserido em {table}: {len(df)} registros")
 
 def importar_ucat(gdb_path: Path, distribuidora: str, ano: int, prefixo: str, modo_debug: bool = False):
     camada = "UCAT"
     import_id = gerar_import_id(prefixo, ano, camada)
     registrar_status(prefixo, ano, camada, "running", distribuidora_nome=distribuidora)
+    metricas = MetricasImport(import_id, camada)
 
     try:
         layer = detectar_layer(gdb_path)
@@ -55,7 +66,9 @@ def importar_ucat(gdb_path: Path, distribuidora: str, ano: int, prefixo: str, mo
             raise Exception("Camada UCAT não encontrada no GDB.")
 
         tqdm.write(f"Lendo camada '{layer}'")
-        gdf = gpd.read_file(str(gdb_path), layer=layer)
+        with metricas.etapa("read") as reg:
+            gdf = gdb_cache.ler_layer_ou_gdb(gdb_path, layer, columns=COLUNAS_LEITURA)
+            reg["linhas"] = len(gdf)
         if gdf.empty:
             registrar_status(prefixo, ano, camada, "no_new_rows", import_id=import_id)
             tqdm.write("Camada UCAT vazia. Nada a importar.")
@@ -74,11 +87,15 @@ def importar_ucat(gdb_path: Path, distribuidora: str, ano: int, prefixo: str, mo
         dist_id = int(dist_id[0])
 
         tqdm.write("Transformando UCAT para lead_bruto")
-        df_bruto = pd.DataFrame({
-            "uc_id": [
+        with metricas.etapa("hash", linhas=len(gdf)):
+            uc_ids = [
                 gerar_uc_id(row["COD_ID"], ano, camada, dist_id)
                 for _, row in gdf.iterrows()
-            ],
+            ]
+
+        t0 = perf_counter()
+        df_bruto = pd.DataFrame({
+            "uc_id": uc_ids,
             "import_id": import_id,
             "cod_id": gdf["COD_ID"],
             "distribuidora_id": dist_id,
@@ -101,6 +118,7 @@ def importar_ucat(gdb_path: Path, distribuidora: str, ano: int, prefixo: str, mo
             "pn_con": sanitize_str(gdf["PN_CON"]),
             "descricao": sanitize_str(gdf["DESCR"]),
         })
+        metricas.registrar("sanitize", perf_counter() - t0, linhas=len(df_bruto))
 
         if df_bruto.empty:
             registrar_status(prefixo, ano, camada, "no_new_rows", import_id=import_id)
@@ -113,6 +131,7 @@ def importar_ucat(gdb_path: Path, distribuidora: str, ano: int, prefixo: str, mo
             df_bruto = df_bruto.drop_duplicates(subset=["uc_id"], keep="first").reset_index(drop=True)
             gdf = gdf.loc[df_bruto.index].reset_index(drop=True)
 
+        t0 = perf_counter()
         energia_df = pd.concat([
             pd.DataFrame({
                 "uc_id": df_bruto["uc_id"],
@@ -146,15 +165,18 @@ def importar_ucat(gdb_path: Path, distribuidora: str, ano: int, prefixo: str, mo
                 "origem": camada
             }) for mes in range(1, 13)
         ]).reset_index(drop=True)
+        metricas.registrar("sanitize_series", perf_counter() - t0, linhas=len(energia_df) + len(demanda_df) + len(qualidade_df))
 
         with get_db_connection() as conn:
             with conn.cursor() as cur:
-                insert_copy(cur, df_bruto, "lead_bruto", df_bruto.columns.tolist())
+                insert_copy(cur, df_bruto, "lead_bruto", df_bruto.columns.tolist(), metricas)
             conn.commit()
 
-            df_ids = pd.read_sql("""
-                SELECT id AS lead_bruto_id, uc_id FROM lead_bruto WHERE import_id = %s
-            """, conn, params=(import_id,))
+            with metricas.etapa("id_map") as reg:
+                df_ids = pd.read_sql("""
+                    SELECT id AS lead_bruto_id, uc_id FROM lead_bruto WHERE import_id = %s
+                """, conn, params=(import_id,))
+                reg["linhas"] = len(df_ids)
 
         energia_df = energia_df.merge(df_ids, on="uc_id").drop(columns=["uc_id"])
         demanda_df = demanda_df.merge(df_ids, on="uc_id").drop(columns=["uc_id"])
@@ -162,9 +184,9 @@ def importar_ucat(gdb_path: Path, distribuidora: str, ano: int, prefixo: str, mo
 
         with get_db_connection() as conn:
             with conn.cursor() as cur:
-                insert_copy(cur, energia_df, "lead_energia_mensal", energia_df.columns.tolist())
-                insert_copy(cur, demanda_df, "lead_demanda_mensal", demanda_df.columns.tolist())
-                insert_copy(cur, qualidade_df, "lead_qualidade_mensal", qualidade_df.columns.tolist())
+                insert_copy(cur, energia_df, "lead_energia_mensal", energia_df.columns.tolist(), metricas)
+                insert_copy(cur, demanda_df, "lead_demanda_mensal", demanda_df.columns.tolist(), metricas)
+                insert_copy(cur, qualidade_df, "lead_qualidade_mensal", qualidade_df.columns.tolist(), metricas)
             conn.commit()
 
         registrar_status(
@@ -185,6 +207,8 @@ def importar_ucat(gdb_path: Path, distribuidora: str, ano: int, prefixo: str, mo
         )
         if modo_debug:
             raise
+    finally:
+        metricas.salvar()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -193,12 +217,14 @@ if __name__ == "__main__":
     parser.add_argument("--distribuidora", required=True)
     parser.add_argument("--prefixo", required=True)
     parser.add_argument("--modo_debug", action="store_true")
+    parser.add_argument("--profile", action="store_true", help="dump cProfile/pyinstrument em data/logs/import_metrics")
     args = parser.parse_args()
 
-    importar_ucat(
-        gdb_path=args.gdb,
-        distribuidora=args.distribuidora,
-        ano=args.ano,
-        prefixo=args.prefixo,
-        modo_debug=args.modo_debug
-    )
+    with perfilar(args.profile, gerar_import_id(args.prefixo, args.ano, "UCAT")):
+        importar_ucat(
+            gdb_path=args.gdb,
+            distribuidora=args.distribuidora,
+            ano=args.ano,
+            prefixo=args.prefixo,
+            modo_debug=args.modo_debug
+        )
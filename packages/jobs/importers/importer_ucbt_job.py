@@ -7,14 +7,18 @@ Importer UCBT — alinhado ao UCMT, robusto para alto volume.
 
 - CLI padronizada: --gdb --ano --distribuidora --prefixo [--modo_debug]
 - Detecção automática da layer UCBT
-- Leitura em streaming (Fiona) com chunking (baixa RAM)
+- Leitura em streaming (cache Parquet quando fresco, senão Fiona) com chunking (baixa RAM)
 - COPY em micro-batches (configurável por env/CLI)
+- --max-rss-mb: chunk de leitura e lote de COPY dimensionados pelos bytes/linha
+  medidos nos primeiros chunks, para o processo caber no orçamento de RAM
 - uc_id = sha256(cod_id_ano_camada_dist) (mesmo padrão do UCMT)
 - Séries:
     * energia_total preenchida (ponta/fora_ponta = NULL)
     * demanda_total e demanda_contratada
     * DIC/FIC/sem_rede
 - Idempotência sem depender de UNIQUE(uc_id): dedup local antes do COPY
+- Métricas por etapa (scan/read/sanitize/hash/to_csv/copy/id_map/...) em
+  import_metrics + JSON; --profile gera dump do profiler
 """
 
 import os
@@ -22,7 +26,7 @@ import io
 import hashlib
 import argparse
 from pathlib import Path
-from typing import Iterable, Tuple, List
+from typing import Callable, Iterable, Tuple, List
 
 import pandas as pd
 import fiona
@@ -30,6 +34,9 @@ from tqdm import tqdm
 
 from packages.database.connection import get_db_connection
 from packages.jobs.utils.rastreio import registrar_status, gerar_import_id
+from packages.jobs.utils import gdb_cache
+from packages.jobs.utils.import_metrics import MetricasImport, perfilar, nbytes
+from packages.jobs.utils.memoria import OrcamentoMemoria, IMPORT_MAX_RSS_MB
 from packages.jobs.utils.sanitize import (
     sanitize_cnae,
     sanitize_grupo_tensao,
@@ -49,6 +56,10 @@ from packages.jobs.utils.sanitize import (
 UCBT_CHUNK_SIZE = int(os.getenv("UCBT_CHUNK_SIZE", "500"))
 UCBT_ROWS_PER_COPY = int(os.getenv("UCBT_ROWS_PER_COPY", "20000"))
 UCBT_SLEEP_MS_BETWEEN = int(os.getenv("UCBT_SLEEP_MS_BETWEEN", "120"))
+# orçamento de RAM do processo; > 0 substitui chunk/rows_per_copy fixos (chunk vira só o inicial)
+UCBT_MAX_RSS_MB = int(os.getenv("UCBT_MAX_RSS_MB", str(IMPORT_MAX_RSS_MB)))
+# granularidade de leitura do Parquet quando o tamanho do chunk é dinâmico
+PARQUET_GRAO = 1000
 
 RELEVANT_COLUMNS = [
     "COD_ID", "DIST", "CNAE", "DAT_CON", "PAC", "GRU_TEN", "GRU_TAR", "TIP_SIST",
@@ -64,7 +75,7 @@ RELEVANT_COLUMNS = [
 # ---------------------------------------------------------------------------
 def detectar_layer(gdb_path: Path) -> str | None:
     try:
-        layers = set(fiona.listlayers(str(gdb_path)))
+        layers = set(gdb_cache.listar_layers(gdb_path))
     except Exception:
         return None
     for cand in ("UCBT_tab", "UCBT_TAB", "UCBT", "ucbt_tab"):
@@ -88,16 +99,66 @@ def _ensure_columns(df: pd.DataFrame, cols: Iterable[str]) -> pd.DataFrame:
 def _as_records(props) -> dict:
     return dict(props or {})
 
-def insert_copy(cur, df: pd.DataFrame, table: str, columns: list[str], rows_per_copy: int) -> int:
+def _contar(gdb_path: Path, layer: str) -> int:
+    n = gdb_cache.contar_linhas(gdb_path, layer)
+    if n is not None:
+        return n
+    with fiona.open(str(gdb_path), layer=layer) as src:
+        return len(src)
+
+def _iter_chunks(gdb_path: Path, layer: str, chunk_size: int | Callable[[], int],
+                 columns: list[str]) -> Iterable[pd.DataFrame]:
+    """
+    DataFrames de até chunk_size linhas. Usa o cache Parquet (com projeção em
+    `columns`) quando fresco; senão faz streaming pelo Fiona.
+    chunk_size pode ser um callable (orçamento de memória), reavaliado a cada chunk.
+    """
+    tamanho = chunk_size if callable(chunk_size) else (lambda: chunk_size)
+    if gdb_cache.layer_em_cache(gdb_path, layer):
+        if not callable(chunk_size):
+            yield from gdb_cache.iter_batches(gdb_path, layer, columns=columns, batch_size=chunk_size)
+            return
+        pend: List[pd.DataFrame] = []
+        n, alvo = 0, tamanho()
+        for df in gdb_cache.iter_batches(gdb_path, layer, columns=columns, batch_size=PARQUET_GRAO):
+            pend.append(df)
+            n += len(df)
+            while n >= alvo:
+                bloco = pd.concat(pend, ignore_index=True)
+                yield bloco.iloc[:alvo].reset_index(drop=True)
+                pend = [bloco.iloc[alvo:]]
+                n -= alvo
+                alvo = tamanho()
+        if n:
+            yield pd.concat(pend, ignore_index=True)
+        return
+    with fiona.open(str(gdb_path), layer=layer) as src:
+        bucket = []
+        alvo = tamanho()
+        for feat in src:
+            bucket.append(_as_records(feat.get("properties")))
+            if len(bucket) >= alvo:
+                yield pd.DataFrame(bucket)
+                bucket = []
+                alvo = tamanho()
+        if bucket:
+            yield pd.DataFrame(bucket)
+
+def insert_copy(cur, df: pd.DataFrame, table: str, columns: list[str], rows_per_copy: int,
+                metricas: MetricasImport | None = None) -> int:
     if df.empty:
         return 0
+    metricas = metricas or MetricasImport(None, "UCBT")
     total = 0
     for i in range(0, len(df), rows_per_copy):
         chunk = df.iloc[i:i+rows_per_copy]
-        buf = io.StringIO()
-        chunk.to_csv(buf, index=False, header=False, columns=columns, na_rep='\\N')
-        buf.seek(0)
-        cur.copy_expert(f"COPY {table} ({','.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buf)
+        with metricas.etapa("to_csv", linhas=len(chunk)) as reg:
+            buf = io.StringIO()
+            chunk.to_csv(buf, index=False, header=False, columns=columns, na_rep='\\N')
+            reg["bytes"] = buf.tell()
+            buf.seek(0)
+        with metricas.etapa("copy", linhas=len(chunk), bytes_=reg["bytes"]):
+            cur.copy_expert(f"COPY {table} ({','.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buf)
         total += len(chunk)
     tqdm.write(f"Inserido em {table}: {total} registros")
     return total
@@ -184,35 +245,32 @@ def importar_ucbt(
     rows_per_copy: int = UCBT_ROWS_PER_COPY,
     sleep_ms_between: int = UCBT_SLEEP_MS_BETWEEN,
     modo_debug: bool = False,
+    max_rss_mb: int = UCBT_MAX_RSS_MB,
 ):
     camada = "UCBT"
     import_id = gerar_import_id(prefixo, ano, camada)
     registrar_status(prefixo, ano, camada, "running", distribuidora_nome=distribuidora, import_id=import_id)
+    metricas = MetricasImport(import_id, camada)
 
     try:
         layer = detectar_layer(gdb_path)
         if not layer:
             raise Exception("Camada UCBT não encontrada no GDB.")
 
-        tqdm.write(f"Stream '{layer}' (chunk={chunk_size})")
+        orcamento = OrcamentoMemoria(max_rss_mb, chunk_inicial=chunk_size) if max_rss_mb > 0 else None
+        if orcamento:
+            tqdm.write(f"Stream '{layer}' (max_rss={max_rss_mb}MB, chunk inicial={orcamento.chunk_inicial})")
+        else:
+            tqdm.write(f"Stream '{layer}' (chunk={chunk_size})")
 
         # 1) Varredura rápida para validar DIST único (padrão UCMT)
         dist_vals = []
-        with fiona.open(str(gdb_path), layer=layer) as src:
-            pbar = tqdm(total=len(src), desc=f"UCBT scan {distribuidora} {ano}", unit="reg")
-            bucket = []
-            for feat in src:
-                bucket.append(_as_records(feat.get("properties")))
-                if len(bucket) >= chunk_size:
-                    df_raw = pd.DataFrame(bucket); bucket.clear()
-                    df_raw = _ensure_columns(df_raw, RELEVANT_COLUMNS)
-                    dist_vals.extend(sanitize_int(df_raw["DIST"]).dropna().tolist())
-                pbar.update(1)
-            if bucket:
-                df_raw = pd.DataFrame(bucket); bucket.clear()
-                df_raw = _ensure_columns(df_raw, RELEVANT_COLUMNS)
-                dist_vals.extend(sanitize_int(df_raw["DIST"]).dropna().tolist())
-            pbar.close()
+        pbar = tqdm(total=_contar(gdb_path, layer), desc=f"UCBT scan {distribuidora} {ano}", unit="reg")
+        for df_raw in metricas.medir_iter("scan", _iter_chunks(gdb_path, layer, chunk_size, ["DIST"])):
+            df_raw = _ensure_columns(df_raw, ["DIST"])
+            dist_vals.extend(sanitize_int(df_raw["DIST"]).dropna().tolist())
+            pbar.update(len(df_raw))
+        pbar.close()
 
         dist_unique = pd.Series(dist_vals).dropna().unique()
         if len(dist_unique) != 1:
@@ -233,21 +291,25 @@ def importar_ucbt(
         d_cols = ["uc_id", "mes", "demanda_ponta", "demanda_fora_ponta", "demanda_total", "demanda_contratada", "origem"]
         q_cols = ["uc_id", "mes", "dic", "fic", "sem_rede", "origem"]
 
-        with fiona.open(str(gdb_path), layer=layer) as src, get_db_connection() as conn:
+        with get_db_connection() as conn:
             cur = conn.cursor()
-            pbar = tqdm(total=len(src), desc=f"UCBT import {distribuidora} {ano}", unit="reg")
+            pbar = tqdm(total=_contar(gdb_path, layer), desc=f"UCBT import {distribuidora} {ano}", unit="reg")
 
-            buf_lb: List[dict] = []
-            buf_e: List[dict]  = []
-            buf_d: List[dict]  = []
-            buf_q: List[dict]  = []
+            # buffers como DataFrames (não dicts): menos RAM e bytes mensuráveis p/ o orçamento
+            buf_lb: List[pd.DataFrame] = []
+            buf_e: List[pd.DataFrame]  = []
+            buf_d: List[pd.DataFrame]  = []
+            buf_q: List[pd.DataFrame]  = []
+            buf_linhas = 0
+            orcamento_logado = False
 
             def _flush():
-                nonlocal total_bruto, energia_total, demanda_total, qualidade_total
+                nonlocal total_bruto, energia_total, demanda_total, qualidade_total, buf_linhas
                 if not buf_lb:
                     return
+                copy_rows = orcamento.linhas_buffer() if orcamento else rows_per_copy
 
-                df_lb = pd.DataFrame(buf_lb, columns=lb_cols)
+                df_lb = pd.concat(buf_lb, ignore_index=True)[lb_cols]
 
                 # idempotência: dedup local por uc_id
                 if df_lb.duplicated(subset=["uc_id"]).any():
@@ -255,137 +317,122 @@ def importar_ucbt(
                     tqdm.write(f"{qtd} uc_id duplicados no buffer — removidos.")
                     df_lb = df_lb.drop_duplicates(subset=["uc_id"], keep="first").reset_index(drop=True)
 
-                insert_copy(cur, df_lb, "lead_bruto", lb_cols, rows_per_copy)
+                insert_copy(cur, df_lb, "lead_bruto", lb_cols, copy_rows, metricas)
                 total_bruto += len(df_lb)
-                conn.commit()
+                with metricas.etapa("commit"):
+                    conn.commit()
 
-                # mapear IDs via import_id (padrão UCMT)
-                df_ids = pd.read_sql(
-                    "SELECT id AS lead_bruto_id, uc_id FROM lead_bruto WHERE import_id = %s",
-                    conn, params=(import_id,)
-                )
+                # mapear IDs só dos uc_id deste buffer (o import inteiro deixaria cada flush O(n))
+                with metricas.etapa("id_map") as reg:
+                    df_ids = pd.read_sql(
+                        "SELECT id AS lead_bruto_id, uc_id FROM lead_bruto WHERE import_id = %s AND uc_id = ANY(%s)",
+                        conn, params=(import_id, df_lb["uc_id"].tolist())
+                    )
+                    reg["linhas"] = len(df_ids)
                 if not df_ids.empty:
                     id_map = df_ids.set_index("uc_id")["lead_bruto_id"]
 
                     if buf_e:
-                        df_e = pd.DataFrame(buf_e, columns=e_cols)
+                        df_e = pd.concat(buf_e, ignore_index=True)[e_cols]
                         df_e = df_e.merge(id_map.rename("lead_bruto_id"), left_on="uc_id", right_index=True, how="inner")
                         df_e.drop(columns=["uc_id"], inplace=True)
-                        insert_copy(cur, df_e, "lead_energia_mensal", df_e.columns.tolist(), rows_per_copy)
+                        insert_copy(cur, df_e, "lead_energia_mensal", df_e.columns.tolist(), copy_rows, metricas)
                         energia_total += len(df_e)
 
                     if buf_d:
-                        df_d = pd.DataFrame(buf_d, columns=d_cols)
+                        df_d = pd.concat(buf_d, ignore_index=True)[d_cols]
                         df_d = df_d.merge(id_map.rename("lead_bruto_id"), left_on="uc_id", right_index=True, how="inner")
                         df_d.drop(columns=["uc_id"], inplace=True)
-                        insert_copy(cur, df_d, "lead_demanda_mensal", df_d.columns.tolist(), rows_per_copy)
+                        insert_copy(cur, df_d, "lead_demanda_mensal", df_d.columns.tolist(), copy_rows, metricas)
                         demanda_total += len(df_d)
 
                     if buf_q:
-                        df_q = pd.DataFrame(buf_q, columns=q_cols)
+                        df_q = pd.concat(buf_q, ignore_index=True)[q_cols]
                         df_q = df_q.merge(id_map.rename("lead_bruto_id"), left_on="uc_id", right_index=True, how="inner")
                         df_q.drop(columns=["uc_id"], inplace=True)
-                        insert_copy(cur, df_q, "lead_qualidade_mensal", df_q.columns.tolist(), rows_per_copy)
+                        insert_copy(cur, df_q, "lead_qualidade_mensal", df_q.columns.tolist(), copy_rows, metricas)
                         qualidade_total += len(df_q)
 
-                    conn.commit()
+                    with metricas.etapa("commit"):
+                        conn.commit()
 
                 buf_lb.clear(); buf_e.clear(); buf_d.clear(); buf_q.clear()
+                buf_linhas = 0
+                if orcamento:
+                    orcamento.registrar_flush()
 
                 if sleep_ms_between > 0:
                     # respiro para não saturar I/O em Windows/OneDrive
                     import time as _t
-                    _t.sleep(sleep_ms_between / 1000.0)
-
-            bucket = []
-            for feat in src:
-                bucket.append(_as_records(feat.get("properties")))
-                if len(bucket) >= chunk_size:
-                    df_raw = pd.DataFrame(bucket); bucket.clear()
-                    df_raw = _ensure_columns(df_raw, RELEVANT_COLUMNS)
-                    df_raw = df_raw[df_raw["COD_ID"].notna()].reset_index(drop=True)
-                    if df_raw.empty:
-                        pbar.update(chunk_size); continue
+                    with metricas.etapa("sleep"):
+                        _t.sleep(sleep_ms_between / 1000.0)
+
+            tamanho_leitura = orcamento.linhas_leitura if orcamento else chunk_size
+            for df_raw in metricas.medir_iter("read", _iter_chunks(gdb_path, layer, tamanho_leitura, RELEVANT_COLUMNS)):
+                lidos = len(df_raw)
+                if orcamento:
+                    orcamento.observar_leitura(nbytes(df_raw), lidos)
+                df_raw = _ensure_columns(df_raw, RELEVANT_COLUMNS)
+                df_raw = df_raw[df_raw["COD_ID"].notna()].reset_index(drop=True)
+                if df_raw.empty:
+                    pbar.update(lidos); continue
 
+                with metricas.etapa("sanitize", linhas=len(df_raw)):
                     base = _sanitize_base_cols(df_raw)
+                with metricas.etapa("hash", linhas=len(base)):
                     uc_ids = pd.Series([gerar_uc_id(c, ano, "UCBT", dist_id) for c in base["cod_id"]], index=base.index)
 
-                    df_bruto = pd.DataFrame({
-                        "uc_id": uc_ids,
-                        "import_id": import_id,
-                        "cod_id": base["cod_id"],
-                        "distribuidora_id": dist_id,
-                        "origem": "UCBT",
-                        "ano": ano,
-                        "status": "raw",
-                        "data_conexao": base["data_conexao"],
-                        "cnae": base["cnae"],
-                        "grupo_tensao": base["grupo_tensao"],
-                        "modalidade": base["modalidade"],
-                        "tipo_sistema": base["tipo_sistema"],
-                        "situacao": base["situacao"],
-                        "classe": base["classe"],
-                        "segmento": base["segmento"],
-                        "subestacao": base["subestacao"],
-                        "municipio_id": base["municipio_id"],
-                        "bairro": base["bairro"],
-                        "cep": base["cep"],
-                        "pac": base["pac"],
-                        "pn_con": base["pn_con"],
-                        "descricao": base["descricao"],
-                    })
+                df_bruto = pd.DataFrame({
+                    "uc_id": uc_ids,
+                    "import_id": import_id,
+                    "cod_id": base["cod_id"],
+                    "distribuidora_id": dist_id,
+                    "origem": "UCBT",
+                    "ano": ano,
+                    "status": "raw",
+                    "data_conexao": base["data_conexao"],
+                    "cnae": base["cnae"],
+                    "grupo_tensao": base["grupo_tensao"],
+                    "modalidade": base["modalidade"],
+                    "tipo_sistema": base["tipo_sistema"],
+                    "situacao": base["situacao"],
+                    "classe": base["classe"],
+                    "segmento": base["segmento"],
+                    "subestacao": base["subestacao"],
+                    "municipio_id": base["municipio_id"],
+                    "bairro": base["bairro"],
+                    "cep": base["cep"],
+                    "pac": base["pac"],
+                    "pn_con": base["pn_con"],
+                    "descricao": base["descricao"],
+                })
+                with metricas.etapa("sanitize_series", linhas=len(df_raw)):
                     e_df, d_df, q_df = _build_series_frames(df_raw, uc_ids, "UCBT")
 
-                    buf_lb.extend(df_bruto.to_dict(orient="records"))
-                    buf_e.extend(e_df.to_dict(orient="records"))
-                    buf_d.extend(d_df.to_dict(orient="records"))
-                    buf_q.extend(q_df.to_dict(orient="records"))
-
-                    if len(buf_lb) >= rows_per_copy:
+                with metricas.etapa("buffer", linhas=len(df_bruto)) as reg:
+                    buf_lb.append(df_bruto)
+                    buf_e.append(e_df)
+                    buf_d.append(d_df)
+                    buf_q.append(q_df)
+                    buf_linhas += len(df_bruto)
+                    if orcamento:
+                        reg["bytes"] = sum(nbytes(f) for f in (df_bruto, e_df, d_df, q_df))
+                        orcamento.observar_buffer(reg["bytes"], len(df_bruto))
+                del df_raw, base, df_bruto, e_df, d_df, q_df
+
+                if orcamento:
+                    estourou = orcamento.estourou()
+                    if estourou or not orcamento_logado:
+                        tqdm.write(("RSS acima do limite — flush antecipado. " if estourou else "") + orcamento.descricao())
+                        orcamento_logado = True
+                    if estourou or buf_linhas >= orcamento.linhas_buffer():
                         _flush()
+                elif buf_linhas >= rows_per_copy:
+                    _flush()
 
-                    pbar.update(len(df_raw))
+                pbar.update(lidos)
 
-            if bucket:
-                df_raw = pd.DataFrame(bucket); bucket.clear()
-                df_raw = _ensure_columns(df_raw, RELEVANT_COLUMNS)
-                df_raw = df_raw[df_raw["COD_ID"].notna()].reset_index(drop=True)
-                if not df_raw.empty:
-                    base = _sanitize_base_cols(df_raw)
-                    uc_ids = pd.Series([gerar_uc_id(c, ano, "UCBT", dist_id) for c in base["cod_id"]], index=base.index)
-
-                    df_bruto = pd.DataFrame({
-                        "uc_id": uc_ids,
-                        "import_id": import_id,
-                        "cod_id": base["cod_id"],
-                        "distribuidora_id": dist_id,
-                        "origem": "UCBT",
-                        "ano": ano,
-                        "status": "raw",
-                        "data_conexao": base["data_conexao"],
-                        "cnae": base["cnae"],
-                        "grupo_tensao": base["grupo_tensao"],
-                        "modalidade": base["modalidade"],
-                        "tipo_sistema": base["tipo_sistema"],
-                        "situacao": base["situacao"],
-                        "classe": base["classe"],
-                        "segmento": base["segmento"],
-                        "subestacao": base["subestacao"],
-                        "municipio_id": base["municipio_id"],
-                        "bairro": base["bairro"],
-                        "cep": base["cep"],
-                        "pac": base["pac"],
-                        "pn_con": base["pn_con"],
-                        "descricao": base["descricao"],
-                    })
-                    e_df, d_df, q_df = _build_series_frames(df_raw, uc_ids, "UCBT")
-
-                    buf_lb.extend(df_bruto.to_dict(orient="records"))
-                    buf_e.extend(e_df.to_dict(orient="records"))
-                    buf_d.extend(d_df.to_dict(orient="records"))
-                    buf_q.extend(q_df.to_dict(orient="records"))
-
-                _flush()
+            _flush()
             pbar.close()
 
         registrar_status(
@@ -401,6 +448,8 @@ def importar_ucbt(
         registrar_status(prefixo, ano, camada, "failed", erro=str(e), import_id=import_id)
         if modo_debug:
             raise
+    finally:
+        metricas.salvar()
 
 # ---------------------------------------------------------------------------
 # CLI
@@ -414,16 +463,21 @@ if __name__ == "__main__":
     parser.add_argument("--chunk-size", type=int, default=UCBT_CHUNK_SIZE)
     parser.add_argument("--rows-per-copy", type=int, default=UCBT_ROWS_PER_COPY)
     parser.add_argument("--sleep-ms-between", type=int, default=UCBT_SLEEP_MS_BETWEEN)
+    parser.add_argument("--max-rss-mb", type=int, default=UCBT_MAX_RSS_MB,
+                        help="orçamento de RAM do processo; dimensiona chunk e COPY (0 = usa --chunk-size/--rows-per-copy)")
     parser.add_argument("--modo_debug", action="store_true")
+    parser.add_argument("--profile", action="store_true", help="dump cProfile/pyinstrument em data/logs/import_metrics")
     args = parser.parse_args()
 
-    importar_ucbt(
-        gdb_path=args.gdb,
-        distribuidora=args.distribuidora,
-        ano=args.ano,
-        prefixo=args.prefixo,
-        chunk_size=args.chunk_size,
-        rows_per_copy=args.rows_per_copy,
-        sleep_ms_between=args.sleep_ms_between,
-        modo_debug=args.modo_debug,
-    )
+    with perfilar(args.profile, gerar_import_id(args.prefixo, args.ano, "UCBT")):
+        importar_ucbt(
+            gdb_path=args.gdb,
+            distribuidora=args.distribuidora,
+            ano=args.ano,
+            prefixo=args.prefixo,
+            chunk_size=args.chunk_size,
+            rows_per_copy=args.rows_per_copy,
+            sleep_ms_between=args.sleep_ms_between,
+            modo_debug=args.modo_debug,
+            max_rss_mb=args.max_rss_mb,
+        )
@@ -0,0 +1,291 @@
+# packages/jobs/pool.py
+# -*- coding: utf-8 -*-
+"""
+Pool de processos "quentes" para o worker (WORKER_MODO=pool).
+
+Em vez de `python <script>` por job (reimporta pandas/geopandas/fiona/GDAL/
+psycopg2 a cada vez), o worker mantém processos pré-forkados a partir de um
+forkserver que já importou os módulos pesados e os importers. O job vira uma
+chamada direta à função de entrada (importar_ucbt, importar_ucmt, ...).
+
+- Prioridade baixa (nice 15 / ionice best-effort 7) aplicada em cada processo do pool
+- env do payload aplicado só durante o job; quando o env muda em relação ao
+  último job daquele processo, os módulos com knobs lidos em import time
+  (MODULOS_COM_KNOBS: memoria, gdb_cache) e o importer são recarregados —
+  barato, deps já carregadas. Outros módulos mantêm os valores do boot do pool
+- Lease perdida: interromper(job_id) levanta JobInterrompido dentro do processo
+  (SIGUSR1); se o job não sair em WORKER_POOL_KILL_SEC, o processo é morto e o
+  pool recriado (os outros jobs dele falham e voltam para a fila)
+- Processo reciclado a cada WORKER_POOL_MAX_TASKS jobs (fragmentação de RAM)
+- Scripts sem entrada mapeada continuam no modo subprocess
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import importlib
+import inspect
+import multiprocessing as mp
+import queue as _fila
+import signal
+import subprocess
+import threading
+import typing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+WORKER_POOL_MAX_TASKS = int(os.getenv("WORKER_POOL_MAX_TASKS", "20"))
+# lease perdida: tempo para o job sair sozinho antes de matar o processo
+WORKER_POOL_KILL_SEC = float(os.getenv("WORKER_POOL_KILL_SEC", "30"))
+
+# script do payload -> (módulo, função de entrada, renomeio de args da CLI)
+ENTRADAS: Dict[str, tuple[str, str, Dict[str, str]]] = {
+    "packages/jobs/importers/importer_ucbt_job.py":
+        ("packages.jobs.importers.importer_ucbt_job", "importar_ucbt", {"gdb": "gdb_path"}),
+    "packages/jobs/importers/importer_ucmt_job.py":
+        ("packages.jobs.importers.importer_ucmt_job", "importar_ucmt", {"gdb": "gdb_path"}),
+    "packages/jobs/importers/importer_ucat_job.py":
+        ("packages.jobs.importers.importer_ucat_job", "importar_ucat", {"gdb": "gdb_path"}),
+    "packages/jobs/importers/importer_ponnot_job.py":
+        ("packages.jobs.importers.importer_ponnot_job", "importar_ponnot", {"gdb": "gdb_path"}),
+}
+
+# carregados uma vez no forkserver; os filhos herdam já importados
+MODULOS_QUENTES = [
+    "pandas", "pyarrow", "fiona", "geopandas", "psycopg2", "tqdm",
+    *[mod for mod, _, _ in ENTRADAS.values()],
+]
+
+# knobs lidos em import time usados pelos importers; recarregados antes do importer
+MODULOS_COM_KNOBS = ["packages.jobs.utils.memoria", "packages.jobs.utils.gdb_cache"]
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()  # slots do worker são threads
+_pids_fila = None              # processo do pool -> worker: (job_id, pid) no início de cada job
+_pids: Dict[Any, int] = {}
+
+
+class JobInterrompido(Exception):
+    """Levantada no processo do pool quando o worker perde a lease do job."""
+
+
+def entrada_do_script(script: str) -> Optional[tuple[str, str, Dict[str, str]]]:
+    return ENTRADAS.get(Path(script).as_posix().lstrip("./"))
+
+
+def kwargs_da_cli(func, args: list[str], renomear: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Converte os args de CLI do payload (--gdb x --ano 2023 --modo_debug) em
+    kwargs da função de entrada, com o tipo das anotações (int, Path, bool).
+    Args que a função não aceita são ignorados.
+    """
+    hints = typing.get_type_hints(func)
+    params = inspect.signature(func).parameters
+    kwargs: Dict[str, Any] = {}
+    i = 0
+    while i < len(args):
+        a = str(args[i])
+        if not a.startswith("--"):
+            i += 1
+            continue
+        nome = a[2:].replace("-", "_")
+        nome = renomear.get(nome, nome)
+        tem_valor = i + 1 < len(args) and not str(args[i + 1]).startswith("--")
+        valor: Any = args[i + 1] if tem_valor else True
+        i += 2 if tem_valor else 1
+        if nome not in params:
+            continue
+        tipo = hints.get(nome)
+        if tipo is int:
+            valor = int(valor)
+        elif tipo is float:
+            valor = float(valor)
+        elif tipo is Path:
+            valor = Path(valor)
+        elif tipo is bool and not isinstance(valor, bool):
+            valor = str(valor).lower() in ("1", "true", "sim", "yes")
+        kwargs[nome] = valor
+    return kwargs
+
+
+# ---------------------------------------------------------------------------
+# Lado do processo do pool
+# ---------------------------------------------------------------------------
+def _baixa_prioridade():
+    try:
+        os.nice(15)
+    except (AttributeError, OSError):
+        pass
+    try:
+        import psutil, platform
+        p = psutil.Process()
+        if platform.system() == "Windows":
+            p.nice(psutil.BELOW_NORMAL_PRIORITY_CLASS)
+        else:
+            p.ionice(psutil.IOPRIO_CLASS_BE, 7)
+        return
+    except Exception:
+        pass
+    if os.getenv("USE_IONICE", "1") == "1" and sys.platform.startswith("linux"):
+        try:
+            subprocess.run([os.getenv("IONICE_BIN", "ionice"), "-c2", "-n7", "-p", str(os.getpid())],
+                           check=False, capture_output=True)
+        except FileNotFoundError:
+            pass
+
+
+_fila_no_processo = None
+_env_carregado: Dict[str, str] = {}
+_job_atual: Any = None
+
+
+def _interromper(signum, frame):
+    # sinal atrasado com o processo ocioso não pode derrubar o loop do pool
+    if _job_atual is not None:
+        raise JobInterrompido(f"lease perdida (job {_job_atual})")
+
+
+def _aquecer(fila_pids=None):
+    """initializer: prioridade baixa + garante os módulos (no-op se vieram do forkserver)."""
+    global _fila_no_processo
+    _fila_no_processo = fila_pids
+    _baixa_prioridade()
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, _interromper)
+    for mod in MODULOS_QUENTES:
+        try:
+            importlib.import_module(mod)
+        except Exception:
+            pass
+
+
+def _rodar_entrada(modulo: str, funcao: str, args: list[str], renomear: Dict[str, str],
+                   env: Dict[str, str], job_id: Any = None) -> None:
+    global _env_carregado, _job_atual
+    if _fila_no_processo is not None and job_id is not None:
+        _fila_no_processo.put((job_id, os.getpid()))
+    anterior = {k: os.environ.get(k) for k in env}
+    os.environ.update({str(k): str(v) for k, v in env.items()})
+    _job_atual = job_id
+    try:
+        mod = importlib.import_module(modulo)
+        if env != _env_carregado:
+            # knobs de env são lidos em import time: dependências antes do importer.
+            # Também quando o job anterior tinha env e este não (volta aos padrões)
+            for nome in MODULOS_COM_KNOBS:
+                if nome in sys.modules:
+                    importlib.reload(sys.modules[nome])
+            mod = importlib.reload(mod)
+            _env_carregado = dict(env)
+        func = getattr(mod, funcao)
+        func(**kwargs_da_cli(func, args, renomear))
+    finally:
+        _job_atual = None
+        for k, v in anterior.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+# ---------------------------------------------------------------------------
+# Lado do worker
+# ---------------------------------------------------------------------------
+def _contexto():
+    if sys.platform == "win32":
+        return mp.get_context("spawn")
+    # forkserver: filhos saem de um processo limpo (sem as threads dos slots) e já aquecido
+    ctx = mp.get_context("forkserver")
+    ctx.set_forkserver_preload(MODULOS_QUENTES)
+    return ctx
+
+
+def obter_pool(processos: int) -> ProcessPoolExecutor:
+    global _pool, _pids_fila
+    with _pool_lock:
+        if _pool is None:
+            ctx = _contexto()
+            _pids_fila = ctx.Queue()
+            _pids.clear()
+            _pool = ProcessPoolExecutor(
+                max_workers=processos,
+                mp_context=ctx,
+                initializer=_aquecer,
+                initargs=(_pids_fila,),
+                max_tasks_per_child=WORKER_POOL_MAX_TASKS or None,
+            )
+        return _pool
+
+
+def descartar_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _pid_do_job(job_id: Any) -> Optional[int]:
+    with _pool_lock:
+        while _pids_fila is not None:
+            try:
+                jid, pid = _pids_fila.get_nowait()
+            except (_fila.Empty, OSError, ValueError):
+                break
+            _pids[jid] = pid
+        return _pids.get(job_id)
+
+
+def interromper(job_id: Any) -> bool:
+    """
+    Lease perdida: pede ao processo do pool que largue o job (JobInterrompido)
+    e, se ele não sair em WORKER_POOL_KILL_SEC, mata o processo — o pool fica
+    quebrado e é recriado, os outros jobs dele falham e voltam para a fila.
+    Retorna False se o job não está rodando no pool.
+    """
+    pid = _pid_do_job(job_id)
+    if pid is None:
+        return False
+    sinal = getattr(signal, "SIGUSR1", signal.SIGTERM)
+    try:
+        os.kill(pid, sinal)
+    except OSError:
+        return False
+
+    def _matar_se_preciso():
+        if _pid_do_job(job_id) == pid:
+            try:
+                os.kill(pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+            except OSError:
+                pass
+            descartar_pool()
+
+    if sinal != signal.SIGTERM:
+        t = threading.Timer(WORKER_POOL_KILL_SEC, _matar_se_preciso)
+        t.daemon = True
+        t.start()
+    return True
+
+
+def executar(payload: Dict[str, Any], processos: int, job_id: Any = None) -> None:
+    """
+    Roda o job num processo do pool (bloqueia a thread do slot até terminar).
+    Exceção da função de entrada (ou morte do processo) sobe para o worker -> fail().
+    job_id: permite interromper(job_id) se a lease for perdida.
+    """
+    modulo, funcao, renomear = entrada_do_script(payload["script"])
+    args = [str(a) for a in (payload.get("args") or [])]
+    env = {str(k): str(v) for k, v in (payload.get("env") or {}).items()}
+    try:
+        obter_pool(processos).submit(_rodar_entrada, modulo, funcao, args, renomear, env, job_id).result()
+    except BrokenProcessPool:
+        descartar_pool()  # processo morreu (OOM kill?): próximo job recria o pool
+        raise
+    finally:
+        if job_id is not None:
+            _pid_do_job(job_id)  # drena a fila antes de esquecer o pid
+            with _pool_lock:
+                _pids.pop(job_id, None)
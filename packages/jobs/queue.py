@@ -2,83 +2,558 @@ import os
 import json
 import uuid
 import time
+import re
+import select
+import threading
 from contextlib import contextmanager
+from pathlib import Path
 
-from packages.database.connection import get_db_connection
+import psycopg2
 
+from packages.database.connection import DB_CONFIG
+
+# sem LISTEN disponível: intervalo de polling (comportamento antigo)
 WORKER_POLL_SEC = float(os.getenv("WORKER_POLL_SEC", "2"))
+# com LISTEN: o NOTIFY acorda na hora; o timeout só cobre jobs com available_at futuro
+# (backoff) e notificações perdidas em reconexão
+WORKER_LISTEN_TIMEOUT_SEC = float(os.getenv("WORKER_LISTEN_TIMEOUT_SEC", "30"))
+QUEUE_CHANNEL = os.getenv("IMPORT_QUEUE_CHANNEL", "import_queue")
+# lease do job 'running': o worker renova por heartbeat; vencida, reap() re-enfileira
+WORKER_LEASE_SEC = int(os.getenv("WORKER_LEASE_SEC", "120"))
+# linhas 'running' de antes das leases (lease_until NULL) contam como mortas após isso
+REAPER_SEM_LEASE_SEC = int(os.getenv("REAPER_SEM_LEASE_SEC", str(6 * 3600)))
+# done/failed mais antigos que isso vão para import_queue_archive (arquivar())
+QUEUE_ARCHIVE_DAYS = int(os.getenv("QUEUE_ARCHIVE_DAYS", "14"))
+QUEUE_ARCHIVE_LOTE = int(os.getenv("QUEUE_ARCHIVE_LOTE", "5000"))
+
+# job pronto = todos os pais (depends_on) já 'done'; q2 é o alias do job candidato
+_DEPENDENCIAS_OK_SQL = """NOT EXISTS (
+    SELECT 1 FROM import_queue p
+    WHERE p.id = ANY(q2.depends_on) AND p.status <> 'done')"""
+
+# classes de recurso (payload["recurso"]): download = rede, import = CPU/DB, enrich = cota de API
+RECURSOS = ("download", "import", "enrich")
+# jobs antigos sem "recurso" no payload: mesma regra de classificar_recurso() em SQL
+_RECURSO_SQL = """COALESCE(payload->>'recurso', CASE
+    WHEN NOT payload ? 'script' THEN 'download'
+    WHEN payload->>'script' LIKE '%%enrich%%' THEN 'enrich'
+    ELSE 'import' END)"""
+
+def classificar_recurso(payload: dict) -> str:
+    if payload.get("recurso") in RECURSOS:
+        return payload["recurso"]
+    script = payload.get("script")
+    if not script:
+        return "download"
+    return "enrich" if "enrich" in script else "import"
+
+# ---------------------------------------------------------------------------
+# Política de escalonamento (aplicada no dequeue)
+# ---------------------------------------------------------------------------
+# - fair share: entre jobs de mesma prioridade efetiva, vence a chave (tenant/
+#   distribuidora) com menos jobs running por unidade de peso
+# - aging: a cada QUEUE_AGING_SEC esperando (desde available_at) a prioridade
+#   efetiva melhora 1 nível, até no máximo QUEUE_AGING_MAX níveis (0 = desliga).
+#   Com o teto, um backlog antigo de uma chave não passa à frente de tudo o que
+#   chega depois: jobs novos ficam no máximo QUEUE_AGING_MAX níveis atrás dele
+# - caps por classe: no máximo N running da mesma classe (ex.: UCBT=2), no
+#   cluster inteiro; só quem escolheu um job de classe com cap serializa, num
+#   advisory lock da própria classe (os demais dequeues não esperam)
+QUEUE_AGING_SEC = int(os.getenv("QUEUE_AGING_SEC", "600"))
+QUEUE_AGING_MAX = int(os.getenv("QUEUE_AGING_MAX", "2"))
+_ADVISORY_DEQUEUE = "import_queue:dequeue"
+
+
+def _ler_mapa(valor: str | None, tipo=int) -> dict:
+    # "UCBT=2,UCMT=4" (ou JSON) -> {"UCBT": 2, "UCMT": 4}
+    valor = (valor or "").strip()
+    if not valor:
+        return {}
+    if valor.startswith("{"):
+        return {str(k): tipo(v) for k, v in json.loads(valor).items()}
+    out = {}
+    for item in valor.split(","):
+        if "=" in item:
+            k, v = item.split("=", 1)
+            out[k.strip()] = tipo(v.strip())
+    return out
+
+
+QUEUE_CAPS: dict[str, int] = _ler_mapa(os.getenv("QUEUE_CAPS", "UCBT=2"))
+QUEUE_PESOS: dict[str, float] = _ler_mapa(os.getenv("QUEUE_PESOS"), float)
+
+
+def _arg(args: list, nome: str) -> str | None:
+    args = [str(a) for a in (args or [])]
+    if nome in args and args.index(nome) + 1 < len(args):
+        return args[args.index(nome) + 1]
+    return None
+
+
+def chave_justa(payload: dict) -> str:
+    """Chave de fair share: tenant explícito ou a distribuidora do job."""
+    if payload.get("tenant"):
+        return str(payload["tenant"])
+    dist = (payload.get("download") or {}).get("distribuidora") or _arg(payload.get("args"), "--distribuidora")
+    return str(dist or "")
+
+
+def classe_job(payload: dict) -> str:
+    """Classe para os caps: camada do importer (UCBT, PONNOT, ...), nome do enricher ou download."""
+    script = payload.get("script")
+    if not script:
+        return "download"
+    nome = Path(script).stem
+    m = re.match(r"importer_(\w+?)_job$", nome)
+    return m.group(1).upper() if m else nome
+
+# uma conexão longa por thread (worker, API) em vez de um connect TLS por chamada.
+# DDL da fila (import_queue.sql) não roda aqui: é migração de deploy (packages/database/migrar.py)
+_local = threading.local()
+
+def _connect(autocommit: bool = False):
+    conn = psycopg2.connect(**DB_CONFIG, keepalives=1, keepalives_idle=30,
+                            keepalives_interval=10, keepalives_count=3)
+    conn.autocommit = autocommit
+    return conn
+
+def _conexao(nome: str = "conn", autocommit: bool = False):
+    conn = getattr(_local, nome, None)
+    if conn is None or conn.closed:
+        conn = _connect(autocommit)
+        setattr(_local, nome, conn)
+    return conn
+
+def _descartar(nome: str = "conn"):
+    conn = getattr(_local, nome, None)
+    setattr(_local, nome, None)
+    if conn is not None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+def fechar():
+    """Fecha as conexões da thread atual (fim do worker/testes)."""
+    _descartar("conn")
+    _descartar("listen")
 
 @contextmanager
 def _conn_cursor():
-    with get_db_connection() as conn:
+    conn = _conexao()
+    try:
         with conn.cursor() as cur:
             yield conn, cur
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        # conexão caiu (idle timeout do Azure, failover): próxima chamada reconecta
+        _descartar("conn")
+        raise
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+
+# linhas por INSERT no enqueue_many (5 parâmetros por linha; limite do protocolo é 65535)
+ENQUEUE_LOTE = 1000
+# dedup_key é única só entre jobs não finalizados (índice parcial import_queue_dedup_idx)
+_DEDUP_ATIVO_SQL = "dedup_key IS NOT NULL AND status IN ('queued', 'running')"
 
-def enqueue(payload: dict, priority: int = 5, available_at: str | None = None):
+
+def _preparar_payload(payload: dict) -> dict:
+    return {**payload, "recurso": classificar_recurso(payload),
+            "fair_key": chave_justa(payload), "classe": classe_job(payload)}
+
+
+def enqueue(payload: dict, priority: int = 5, available_at: str | None = None,
+            depends_on: list[int] | None = None, dedup_key: str | None = None):
+    # depends_on: ids que precisam terminar 'done' antes deste job ser liberado
+    # dedup_key: se já houver job queued/running com a mesma chave, devolve o id dele
+    return enqueue_many([payload], priority=priority, available_at=available_at,
+                        depends_on=[depends_on], dedup_keys=[dedup_key])[0]
+
+
+def enqueue_many(payloads: list[dict], priority: int = 5, available_at: str | None = None,
+                 depends_on: list[list[int] | None] | None = None,
+                 dedup_keys: list[str | None] | None = None) -> list[int]:
+    """
+    Enfileira vários jobs com INSERT multi-linha, numa conexão e num commit.
+
+    depends_on / dedup_keys são listas paralelas a `payloads` (um item por job).
+    Jobs cuja dedup_key já está queued/running não são duplicados: o id
+    devolvido na posição é o do job existente (dependentes se penduram nele).
+    """
+    n = len(payloads)
+    if not n:
+        return []
+    depends_on = depends_on or [None] * n
+    dedup_keys = dedup_keys or [None] * n
+    if len(depends_on) != n or len(dedup_keys) != n:
+        raise ValueError("depends_on/dedup_keys precisam ter um item por payload")
+
+    linhas = [(json.dumps(_preparar_payload(p)), priority, available_at,
+               list(d) if d else None, k)
+              for p, d, k in zip(payloads, depends_on, dedup_keys)]
+    por_chave: dict[str, int] = {}
+    sem_chave: list[int] = []
     with _conn_cursor() as (conn, cur):
-        cur.execute("""
-            INSERT INTO import_queue (payload, priority, available_at)
-            VALUES (%s, %s, COALESCE(%s, now()))
-            RETURNING id
-        """, (json.dumps(payload), priority, available_at))
-        job_id = cur.fetchone()[0]
+        for i in range(0, n, ENQUEUE_LOTE):
+            lote = linhas[i:i + ENQUEUE_LOTE]
+            valores = ", ".join(
+                ["(%s::jsonb, %s, COALESCE(%s::timestamptz, now()), COALESCE(%s::bigint[], '{}'), %s)"] * len(lote))
+            # RETURNING segue a ordem do VALUES; conflitos de dedup simplesmente não voltam
+            cur.execute(f"""
+                INSERT INTO import_queue (payload, priority, available_at, depends_on, dedup_key)
+                VALUES {valores}
+                ON CONFLICT (dedup_key) WHERE {_DEDUP_ATIVO_SQL} DO NOTHING
+                RETURNING id, dedup_key
+            """, [v for linha in lote for v in linha])
+            for job_id, chave in cur.fetchall():
+                if chave is None:
+                    sem_chave.append(job_id)
+                else:
+                    por_chave[chave] = job_id
+
+        faltando = sorted({k for k in dedup_keys if k is not None and k not in por_chave})
+        if faltando:
+            # duplicados: id do job ativo (ou do mais recente, se terminou nesse meio tempo)
+            cur.execute("""
+                SELECT DISTINCT ON (dedup_key) dedup_key, id
+                FROM import_queue
+                WHERE dedup_key = ANY(%s)
+                ORDER BY dedup_key, (status IN ('queued', 'running')) DESC, id DESC
+            """, (faltando,))
+            por_chave.update({k: job_id for k, job_id in cur.fetchall()})
+
+        novos = iter(sem_chave)
+        ids = [por_chave.get(k) if k is not None else next(novos) for k in dedup_keys]
+        # entregue aos workers em LISTEN só no commit; um NOTIFY acorda todos
+        cur.execute("SELECT pg_notify(%s, %s)", (QUEUE_CHANNEL, str(ids[-1])))
         conn.commit()
-        return job_id
+        return ids
 
-def dequeue(worker_id: str):
+def dequeue(worker_id: str, recursos: list[str] | None = None):
     # pega 1 job pronto, marca como running (row-level lock, transação atômica)
+    # recursos: só classes com slot livre no worker (None = qualquer)
+    # ordem: prioridade efetiva (aging limitado) -> fair share por chave -> FIFO
     with _conn_cursor() as (conn, cur):
+        excluir: list[str] = []
+        for _ in range(len(QUEUE_CAPS) + 1):
+            cur.execute(f"""
+                WITH rodando AS (
+                  SELECT COALESCE(payload->>'fair_key', '') AS chave,
+                         COALESCE(payload->>'classe', '') AS classe
+                  FROM import_queue
+                  WHERE status = 'running'
+                ),
+                por_chave AS (SELECT chave, COUNT(*) AS n FROM rodando GROUP BY chave),
+                por_classe AS (SELECT classe, COUNT(*) AS n FROM rodando GROUP BY classe)
+                SELECT q2.id, COALESCE(q2.payload->>'classe', '')
+                FROM import_queue q2
+                LEFT JOIN por_chave pk ON pk.chave = COALESCE(q2.payload->>'fair_key', '')
+                LEFT JOIN por_classe pc ON pc.classe = COALESCE(q2.payload->>'classe', '')
+                WHERE q2.status = 'queued'
+                  AND q2.available_at <= now()
+                  AND (%(recursos)s::text[] IS NULL OR {_RECURSO_SQL} = ANY(%(recursos)s::text[]))
+                  AND NOT (COALESCE(q2.payload->>'classe', '') = ANY(%(excluir)s::text[]))
+                  AND {_DEPENDENCIAS_OK_SQL}
+                  AND COALESCE(pc.n, 0) < COALESCE((%(caps)s::jsonb ->> (q2.payload->>'classe'))::int, 2147483647)
+                ORDER BY
+                  q2.priority - CASE WHEN %(aging)s > 0
+                    THEN LEAST(floor(EXTRACT(EPOCH FROM now() - q2.available_at) / %(aging)s), %(aging_max)s)
+                    ELSE 0 END ASC,
+                  (COALESCE(pk.n, 0) + 1)
+                    / COALESCE((%(pesos)s::jsonb ->> (q2.payload->>'fair_key'))::float, 1.0) ASC,
+                  q2.available_at ASC, q2.id ASC
+                FOR UPDATE OF q2 SKIP LOCKED
+                LIMIT 1
+            """, {
+                "recursos": recursos,
+                "excluir": list(excluir),
+                "caps": json.dumps(QUEUE_CAPS),
+                "aging": QUEUE_AGING_SEC,
+                "aging_max": QUEUE_AGING_MAX,
+                "pesos": json.dumps(QUEUE_PESOS),
+            })
+            row = cur.fetchone()
+            if not row:
+                conn.commit()
+                return None
+            job_id, classe = row
+            if classe not in QUEUE_CAPS:
+                break
+            # sem isso dois workers veem "1 UCBT running" ao mesmo tempo e ambos pegam o 2º+3º;
+            # com o lock da classe, a recontagem já enxerga o commit de quem pegou antes
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (f"{_ADVISORY_DEQUEUE}:{classe}",))
+            cur.execute("""
+                SELECT COUNT(*) FROM import_queue
+                WHERE status = 'running' AND COALESCE(payload->>'classe', '') = %s
+            """, (classe,))
+            if cur.fetchone()[0] < QUEUE_CAPS[classe]:
+                break
+            # classe lotou nesse meio tempo: solta o lock e a linha, tenta sem ela
+            conn.rollback()
+            excluir.append(classe)
+        else:
+            conn.commit()
+            return None
+
         cur.execute("""
-            UPDATE import_queue AS q SET
+            UPDATE import_queue SET
               status = 'running',
               started_at = now(),
               worker_id = %s,
-              tries = q.tries + 1
-            WHERE q.id = (
-              SELECT id
-              FROM import_queue
-              WHERE status = 'queued'
-                AND available_at <= now()
-              ORDER BY priority ASC, available_at ASC, id ASC
-              FOR UPDATE SKIP LOCKED
-              LIMIT 1
-            )
+              tries = tries + 1,
+              lease_until = now() + make_interval(secs => %s),
+              heartbeat_at = now()
+            WHERE id = %s
             RETURNING id, payload, tries, max_retries
-        """, (worker_id,))
+        """, (worker_id, WORKER_LEASE_SEC, job_id))
         row = cur.fetchone()
         conn.commit()
-        if not row:
-            return None
         job_id, payload, tries, max_retries = row
         return {"id": job_id, "payload": payload, "tries": tries, "max_retries": max_retries}
 
-def complete(job_id: int):
+def backoff_sec(tries: int) -> int:
+    return min(60 * (tries + 1), 600)
+
+def complete(job_id: int, worker_id: str | None = None) -> bool:
+    # worker_id: só conclui se ainda for o dono (a lease pode ter sido reaped)
     with _conn_cursor() as (conn, cur):
         cur.execute("""
             UPDATE import_queue
-            SET status='done', finished_at=now()
+            SET status='done', finished_at=now(), lease_until=NULL
             WHERE id=%s
-        """, (job_id,))
+              AND (%s::text IS NULL OR (worker_id = %s AND status = 'running'))
+        """, (job_id, worker_id, worker_id))
+        ok = cur.rowcount != 0
+        # dependentes podem ter sido liberados: acorda os workers em LISTEN
+        cur.execute("SELECT pg_notify(%s, %s)", (QUEUE_CHANNEL, str(job_id)))
+        conn.commit()
+        return ok
+
+def heartbeat(job_ids: list[int], worker_id: str) -> set[int]:
+    """Renova a lease dos jobs do worker; devolve os ids que ele ainda possui."""
+    if not job_ids:
+        return set()
+    with _conn_cursor() as (conn, cur):
+        cur.execute("""
+            UPDATE import_queue
+            SET lease_until = now() + make_interval(secs => %s), heartbeat_at = now()
+            WHERE id = ANY(%s) AND worker_id = %s AND status = 'running'
+            RETURNING id
+        """, (WORKER_LEASE_SEC, list(job_ids), worker_id))
+        vivos = {r[0] for r in cur.fetchall()}
         conn.commit()
+        return vivos
 
-def fail(job_id: int, delay_sec: int | None = None):
+def publicar_worker(worker_id: str, slots: int, ocupados: int, ocupado_s: float,
+                    rejeicoes_admissao: int, leases_perdidas: int) -> None:
+    """Grava os contadores do processo worker (tabela import_worker, lida pelas métricas da fila)."""
+    with _conn_cursor() as (conn, cur):
+        cur.execute("""
+            INSERT INTO import_worker
+                (worker_id, slots, ocupados, ocupado_s_total, rejeicoes_admissao, leases_perdidas)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON CONFLICT (worker_id) DO UPDATE SET
+                slots = EXCLUDED.slots,
+                ocupados = EXCLUDED.ocupados,
+                ocupado_s_total = EXCLUDED.ocupado_s_total,
+                rejeicoes_admissao = EXCLUDED.rejeicoes_admissao,
+                leases_perdidas = EXCLUDED.leases_perdidas,
+                heartbeat_em = now()
+        """, (worker_id, slots, ocupados, ocupado_s, rejeicoes_admissao, leases_perdidas))
+        conn.commit()
+
+def _falhar_dependentes(cur, job_id: int):
+    # pai falhou de vez: descendentes nunca seriam liberados
+    cur.execute("""
+        WITH RECURSIVE dep AS (
+            SELECT id FROM import_queue
+            WHERE depends_on && ARRAY[%s]::bigint[] AND status = 'queued'
+            UNION
+            SELECT q.id FROM import_queue q
+            JOIN dep ON q.depends_on && ARRAY[dep.id]
+            WHERE q.status = 'queued'
+        )
+        UPDATE import_queue
+        SET status='failed', finished_at=now()
+        WHERE id IN (SELECT id FROM dep)
+    """, (job_id,))
+
+def _requeue_ou_falhar(cur, job_id: int, tries: int, max_retries: int, delay_sec: int | None):
+    if tries < max_retries:
+        cur.execute("""
+            UPDATE import_queue
+            SET status='queued',
+                available_at = now() + make_interval(secs => %s),
+                worker_id=NULL,
+                started_at=NULL,
+                lease_until=NULL
+            WHERE id=%s
+        """, (delay_sec or 30, job_id))
+    else:
+        cur.execute("""
+            UPDATE import_queue
+            SET status='failed', finished_at=now(), lease_until=NULL
+            WHERE id=%s
+        """, (job_id,))
+        _falhar_dependentes(cur, job_id)
+
+def fail(job_id: int, delay_sec: int | None = None, worker_id: str | None = None) -> bool:
     # re-enfileira com backoff (se ainda não excedeu tentativas)
+    # worker_id: ignora se o job já não é mais deste worker (reaped e pego por outro)
     with _conn_cursor() as (conn, cur):
-        cur.execute("SELECT tries, max_retries FROM import_queue WHERE id=%s", (job_id,))
-        tries, max_retries = cur.fetchone()
-        if tries < max_retries:
-            cur.execute("""
-                UPDATE import_queue
-                SET status='queued',
-                    available_at = now() + make_interval(secs => %s),
-                    worker_id=NULL,
-                    started_at=NULL
-                WHERE id=%s
-            """, (delay_sec or 30, job_id))
-        else:
-            cur.execute("""
-                UPDATE import_queue
-                SET status='failed', finished_at=now()
-                WHERE id=%s
-            """, (job_id,))
+        cur.execute("SELECT tries, max_retries, status, worker_id FROM import_queue WHERE id=%s FOR UPDATE",
+                    (job_id,))
+        row = cur.fetchone()
+        if not row or (worker_id and (row[2] != "running" or row[3] != worker_id)):
+            conn.commit()
+            return False
+        tries, max_retries = row[0], row[1]
+        _requeue_ou_falhar(cur, job_id, tries, max_retries, delay_sec)
+        # vaga liberada (cap por classe / fair share): acorda os workers em LISTEN
+        cur.execute("SELECT pg_notify(%s, %s)", (QUEUE_CHANNEL, str(job_id)))
+        conn.commit()
+        return True
+
+def reap(limite: int = 100) -> list[int]:
+    """
+    Re-enfileira (com o mesmo backoff/limite de tentativas do fail) jobs
+    'running' cuja lease venceu — worker morto no meio do import.
+    """
+    with _conn_cursor() as (conn, cur):
+        cur.execute("""
+            SELECT id, tries, max_retries
+            FROM import_queue
+            WHERE status = 'running'
+              AND (lease_until < now()
+                   OR (lease_until IS NULL AND started_at < now() - make_interval(secs => %s)))
+            ORDER BY id
+            FOR UPDATE SKIP LOCKED
+            LIMIT %s
+        """, (REAPER_SEM_LEASE_SEC, limite))
+        rows = cur.fetchall()
+        for job_id, tries, max_retries in rows:
+            _requeue_ou_falhar(cur, job_id, tries, max_retries, backoff_sec(tries))
+        conn.commit()
+        return [r[0] for r in rows]
+
+def _segundos_ate_proximo(recursos: list[str] | None = None) -> float | None:
+    """
+    Segundos até o próximo job queued que este worker poderia pegar ficar
+    disponível (None se não há nenhum). `recursos`: o mesmo filtro do dequeue —
+    jobs de classes sem slot livre aqui não encurtam a espera.
+    """
+    with _conn_cursor() as (conn, cur):
+        cur.execute(f"""
+            SELECT EXTRACT(EPOCH FROM (min(available_at) - now()))
+            FROM import_queue q2
+            WHERE status = 'queued'
+              AND (%s::text[] IS NULL OR {_RECURSO_SQL} = ANY(%s::text[]))
+              AND {_DEPENDENCIAS_OK_SQL}
+              AND NOT EXISTS (
+                -- classe no cap: quem libera a vaga é o complete()/fail() (NOTIFY)
+                SELECT 1 FROM import_queue r
+                WHERE r.status = 'running'
+                  AND r.payload->>'classe' = q2.payload->>'classe'
+                HAVING COUNT(*) >= COALESCE((%s::jsonb ->> (q2.payload->>'classe'))::int, 2147483647))
+        """, (recursos, recursos, json.dumps(QUEUE_CAPS)))
+        row = cur.fetchone()
+        conn.commit()
+        return None if not row or row[0] is None else max(0.0, float(row[0]))
+
+def aguardar_job(timeout: float | None = None, recursos: list[str] | None = None) -> bool:
+    """
+    Bloqueia até um NOTIFY de enqueue (True) ou timeout (False).
+    O timeout é encurtado para o próximo available_at da fila entre os jobs
+    de `recursos` (o filtro do dequeue que não achou nada). Se o LISTEN
+    falhar (ex.: pgbouncer em modo transaction), cai para sleep(WORKER_POLL_SEC).
+    """
+    timeout = WORKER_LISTEN_TIMEOUT_SEC if timeout is None else timeout
+    try:
+        novo = getattr(_local, "listen", None) is None or _local.listen.closed
+        conn = _conexao("listen", autocommit=True)
+        if novo:
+            with conn.cursor() as cur:
+                cur.execute(f'LISTEN "{QUEUE_CHANNEL}"')
+            return True  # pode ter perdido NOTIFY antes do LISTEN: tenta dequeue já
+
+        proximo = _segundos_ate_proximo(recursos)
+        if proximo is not None:
+            timeout = min(timeout, max(proximo, 1.0))
+
+        if conn.notifies or select.select([conn], [], [], timeout)[0]:
+            conn.poll()
+            acordou = bool(conn.notifies)
+            conn.notifies.clear()
+            return acordou
+        return False
+    except (psycopg2.Error, OSError, ValueError):
+        _descartar("listen")
+        time.sleep(WORKER_POLL_SEC)
+        return False
+
+def _garantir_particoes(cur, dias: int):
+    """Cria as partições mensais do arquivo que o próximo lote vai precisar."""
+    cur.execute("""
+        SELECT DISTINCT date_trunc('month', finished_at)::date
+        FROM import_queue
+        WHERE status IN ('done', 'failed')
+          AND finished_at < now() - make_interval(days => %s)
+    """, (dias,))
+    for (mes,) in cur.fetchall():
+        nome = f"import_queue_archive_{mes:%Y%m}"
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {nome}
+            PARTITION OF import_queue_archive
+            FOR VALUES FROM (%s) TO (%s::date + interval '1 month')
+        """, (mes, mes))
+
+def arquivar(dias: int = QUEUE_ARCHIVE_DAYS, lote: int = QUEUE_ARCHIVE_LOTE) -> int:
+    """
+    Move jobs done/failed com finished_at > `dias` para import_queue_archive,
+    em lotes (transações curtas, SKIP LOCKED: seguro com vários workers).
+    Mantém a import_queue pequena -> dequeue com latência constante.
+    """
+    total = 0
+    with _conn_cursor() as (conn, cur):
+        _garantir_particoes(cur, dias)
+        # workers mortos (sem heartbeat há `dias`) saem das métricas
+        cur.execute("DELETE FROM import_worker WHERE heartbeat_em < now() - make_interval(days => %s)", (dias,))
         conn.commit()
+        while True:
+            cur.execute("""
+                WITH movidos AS (
+                    DELETE FROM import_queue
+                    WHERE id IN (
+                        SELECT id FROM import_queue
+                        WHERE status IN ('done', 'failed')
+                          AND finished_at < now() - make_interval(days => %s)
+                        ORDER BY id
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING *
+                )
+                INSERT INTO import_queue_archive (id, status, created_at, finished_at, linha)
+                SELECT id, status, created_at, finished_at, to_jsonb(movidos) FROM movidos
+            """, (dias, lote))
+            n = cur.rowcount
+            conn.commit()
+            total += n
+            if n < lote:
+                return total
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manutenção da import_queue")
+    parser.add_argument("--arquivar", action="store_true", help="move done/failed antigos para import_queue_archive")
+    parser.add_argument("--reap", action="store_true", help="re-enfileira jobs com lease vencida")
+    parser.add_argument("--dias", type=int, default=QUEUE_ARCHIVE_DAYS)
+    args = parser.parse_args()
+
+    if args.reap:
+        print(f"[queue] reaped: {reap()}")
+    if args.arquivar:
+        print(f"[queue] arquivados: {arquivar(args.dias)}")
@@ -0,0 +1,121 @@
+# packages/jobs/utils/custo_import.py
+# -*- coding: utf-8 -*-
+"""
+Estimativa de custo dos imports para escalonamento LPT (maior primeiro).
+
+- Linhas por camada: manifest do cache Parquet ou contagem do próprio .gdb
+  (OpenFileGDB guarda o total no cabeçalho da tabela: não varre as features)
+- Segundos por linha por camada: histórico em intel_lead.import_metrics
+  (soma das etapas / features lidas da origem na etapa read/scan), com
+  defaults quando não há histórico
+- lpt(): ordem de despacho e makespan estimado para N slots
+"""
+
+from __future__ import annotations
+
+import heapq
+import os
+from pathlib import Path
+from typing import Iterable, Optional
+
+from tqdm import tqdm
+
+# sem histórico em import_metrics: ordem de grandeza medida em máquina modesta
+SEG_POR_LINHA_PADRAO = {"UCBT": 4e-4, "UCMT": 1e-3, "UCAT": 1e-3, "PONNOT": 2e-4}
+# conversão .gdb -> Parquet (gdb_cache), por linha de todas as layers
+SEG_POR_LINHA_CACHE = float(os.getenv("CUSTO_CACHE_SEG_POR_LINHA", "2e-5"))
+# subir o processo + importar pandas/geopandas + abrir o .gdb
+SEG_FIXO_JOB = float(os.getenv("CUSTO_SEG_FIXO_JOB", "5"))
+# layer sem contagem (gdb ilegível, fiona ausente)
+LINHAS_DESCONHECIDAS = int(os.getenv("CUSTO_LINHAS_DESCONHECIDAS", "100000"))
+# janela do histórico usado na estimativa
+CUSTO_JANELA_DIAS = int(os.getenv("CUSTO_JANELA_DIAS", "90"))
+
+# mesmo critério dos detectar_layer* dos importers
+_PREFIXOS_LAYER = {"UCBT": ("UCBT",), "UCMT": ("UCMT",), "UCAT": ("UCAT",), "PONNOT": ("PON",)}
+
+
+def layer_da_camada(layers: Iterable[str], camada: str) -> Optional[str]:
+    layers = list(layers)
+    for ly in layers:
+        if ly.upper() in (camada, f"{camada}_TAB"):
+            return ly
+    for ly in layers:
+        if ly.upper().startswith(_PREFIXOS_LAYER.get(camada, (camada,))):
+            return ly
+    return None
+
+
+def contar_features(gdb_path: Path, camadas: Iterable[str], prefixo: Optional[str] = None) -> dict[str, Optional[int]]:
+    """Linhas por camada (None = sem layer ou sem contagem). Não lê features."""
+    from packages.jobs.utils import gdb_cache
+
+    out: dict[str, Optional[int]] = {c: None for c in camadas}
+    try:
+        layers = gdb_cache.listar_layers(gdb_path, prefixo)
+    except Exception as e:
+        tqdm.write(f"[custo] não listou layers de {gdb_path}: {e}")
+        return out
+    for camada in out:
+        layer = layer_da_camada(layers, camada)
+        if layer is None:
+            continue
+        n = gdb_cache.contar_linhas(gdb_path, layer, prefixo)
+        if n is None:
+            try:
+                import fiona
+                with fiona.open(str(gdb_path), layer=layer) as src:
+                    n = len(src)
+            except Exception:
+                n = None
+        out[camada] = n
+    return out
+
+
+def seg_por_linha_historico(dias: int = CUSTO_JANELA_DIAS) -> dict[str, float]:
+    """Segundos por linha por camada nas execuções recentes de import_metrics ({} se indisponível)."""
+    try:
+        from packages.database.connection import get_db_cursor
+
+        with get_db_cursor() as cur:
+            # linhas = features da origem (read/scan), a mesma unidade de contar_features;
+            # to_csv/copy somam as linhas de todas as tabelas gravadas (séries mensais incluídas)
+            cur.execute("""
+                WITH execucoes AS (
+                    SELECT camada, import_id, run_started_at,
+                           SUM(wall_s) AS wall_s,
+                           MAX(linhas) FILTER (WHERE etapa IN ('read', 'scan')) AS linhas
+                    FROM import_metrics
+                    WHERE run_started_at >= now() - make_interval(days => %s)
+                    GROUP BY camada, import_id, run_started_at
+                )
+                SELECT camada, SUM(wall_s) / NULLIF(SUM(linhas), 0) AS seg_linha
+                FROM execucoes
+                WHERE linhas > 0
+                GROUP BY camada
+            """, (dias,))
+            return {r["camada"]: float(r["seg_linha"]) for r in cur.fetchall() if r["seg_linha"]}
+    except Exception as e:
+        tqdm.write(f"[custo] sem histórico de import_metrics ({e}); usando defaults")
+        return {}
+
+
+def custo_import(camada: str, linhas: Optional[int], seg_linha: dict[str, float]) -> float:
+    taxa = seg_linha.get(camada) or SEG_POR_LINHA_PADRAO.get(camada, 1e-3)
+    return SEG_FIXO_JOB + taxa * (LINHAS_DESCONHECIDAS if linhas is None else linhas)
+
+
+def custo_cache(linhas: Iterable[Optional[int]]) -> float:
+    return SEG_FIXO_JOB + SEG_POR_LINHA_CACHE * sum(LINHAS_DESCONHECIDAS if n is None else n for n in linhas)
+
+
+def lpt(custos: dict, slots: int) -> tuple[list, float]:
+    """
+    Longest Processing Time: ordem decrescente de custo, cada job no slot que
+    libera primeiro. Retorna (ordem de despacho, makespan estimado em segundos).
+    """
+    ordem = sorted(custos, key=lambda k: custos[k], reverse=True)
+    fim = [0.0] * max(1, slots)
+    for k in ordem:
+        heapq.heapreplace(fim, fim[0] + custos[k])
+    return ordem, max(fim)
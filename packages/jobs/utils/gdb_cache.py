@@ -0,0 +1,319 @@
+# packages/jobs/utils/gdb_cache.py
+# -*- coding: utf-8 -*-
+"""
+Cache colunar (Parquet) dos FileGDB baixados.
+
+- Converte cada layer de data/downloads/<prefixo>.gdb uma única vez para
+  data/processed/<prefixo>/<layer>/part-00000.parquet
+- Colunas tipadas a partir do schema do Fiona + estatísticas por row group
+- Geometria guardada como WKB (coluna "geometry"), quando a layer tiver
+- Frescor controlado por fingerprint (tamanho + mtime dos arquivos do .gdb),
+  memorizado no processo enquanto a pasta do .gdb não muda
+- Leitura com projeção (columns=) e predicate pushdown (filters=)
+
+Importers e scripts de exploração usam o cache quando ele está fresco e
+caem para o Fiona caso contrário. Desligue com GDB_PARQUET_CACHE=0.
+
+CLI:
+  python -m packages.jobs.utils.gdb_cache --gdb data/downloads/ENEL_RJ_2023.gdb [--force]
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import shutil
+import hashlib
+import argparse
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+ROOT = Path(__file__).resolve().parents[3]
+PROCESSED_DIR = Path(os.getenv("GDB_PARQUET_DIR", str(ROOT / "data" / "processed")))
+
+GDB_PARQUET_CACHE = os.getenv("GDB_PARQUET_CACHE", "1") == "1"
+GDB_PARQUET_ROW_GROUP = int(os.getenv("GDB_PARQUET_ROW_GROUP", "50000"))
+
+MANIFEST = "_manifest.json"
+GEOMETRY_COL = "geometry"
+
+# fiona -> arrow (o resto vira string)
+_FIONA_TYPES = {
+    "int": pa.int64(),
+    "int32": pa.int32(),
+    "int64": pa.int64(),
+    "float": pa.float64(),
+    "date": pa.timestamp("ms"),
+    "datetime": pa.timestamp("ms"),
+    "bool": pa.bool_(),
+}
+
+_NULLABLE_INTS = {
+    pa.int32(): pd.Int32Dtype(),
+    pa.int64(): pd.Int64Dtype(),
+}
+
+# ---------------------------------------------------------------------------
+# Fingerprint / manifest
+# ---------------------------------------------------------------------------
+def fingerprint_gdb(gdb_path: Path) -> str:
+    """
+    Hash de (nome relativo, tamanho, mtime) de todos os arquivos do .gdb.
+    Não lê conteúdo: custa um stat por arquivo.
+    """
+    gdb_path = Path(gdb_path)
+    h = hashlib.sha1()
+    for p in sorted(gdb_path.rglob("*")):
+        if not p.is_file():
+            continue
+        st = p.stat()
+        h.update(f"{p.relative_to(gdb_path).as_posix()}|{st.st_size}|{st.st_mtime_ns}\n".encode())
+    return h.hexdigest()
+
+# gdb_path -> ((inode, mtime) da pasta, fingerprint). O downloader troca o .gdb
+# inteiro (extrai em .partial + rename), então pasta igual = mesmo conteúdo;
+# cache_fresco roda a cada layer lida e não precisa repetir o rglob + stat.
+_fingerprints: dict[str, tuple[tuple[int, int], str]] = {}
+
+def _fingerprint_memo(gdb_path: Path) -> str:
+    st = Path(gdb_path).stat()
+    chave, memo = (st.st_ino, st.st_mtime_ns), _fingerprints.get(str(gdb_path))
+    if memo is not None and memo[0] == chave:
+        return memo[1]
+    fp = fingerprint_gdb(gdb_path)
+    _fingerprints[str(gdb_path)] = (chave, fp)
+    return fp
+
+def cache_dir(gdb_path: Path, prefixo: Optional[str] = None) -> Path:
+    return PROCESSED_DIR / (prefixo or Path(gdb_path).stem)
+
+def ler_manifest(gdb_path: Path, prefixo: Optional[str] = None) -> Optional[dict]:
+    path = cache_dir(gdb_path, prefixo) / MANIFEST
+    if not path.exists():
+        return None
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except Exception:
+        return None
+
+def cache_fresco(gdb_path: Path, prefixo: Optional[str] = None) -> bool:
+    """True se o cache existe e foi gerado a partir do .gdb atual."""
+    if not GDB_PARQUET_CACHE:
+        return False
+    manifest = ler_manifest(gdb_path, prefixo)
+    if not manifest or not Path(gdb_path).exists():
+        return False
+    return manifest.get("fingerprint") == _fingerprint_memo(gdb_path)
+
+def layer_em_cache(gdb_path: Path, layer: str, prefixo: Optional[str] = None) -> Optional[Path]:
+    """Diretório Parquet da layer, se o cache estiver fresco e contiver a layer."""
+    if not cache_fresco(gdb_path, prefixo):
+        return None
+    manifest = ler_manifest(gdb_path, prefixo) or {}
+    if layer not in (manifest.get("layers") or {}):
+        return None
+    path = cache_dir(gdb_path, prefixo) / layer
+    return path if path.exists() else None
+
+# ---------------------------------------------------------------------------
+# Conversão GDB -> Parquet
+# ---------------------------------------------------------------------------
+def _arrow_schema(fiona_schema: dict, has_geometry: bool) -> pa.Schema:
+    fields = []
+    for nome, tipo in (fiona_schema.get("properties") or {}).items():
+        base = str(tipo).split(":")[0]
+        fields.append(pa.field(nome, _FIONA_TYPES.get(base, pa.string())))
+    if has_geometry:
+        fields.append(pa.field(GEOMETRY_COL, pa.binary()))
+    return pa.schema(fields)
+
+def _batch_to_table(rows: list[dict], geoms: list, schema: pa.Schema) -> pa.Table:
+    df = pd.DataFrame.from_records(rows, columns=[f.name for f in schema if f.name != GEOMETRY_COL])
+    for field in schema:
+        if field.name == GEOMETRY_COL:
+            continue
+        if pa.types.is_timestamp(field.type):
+            df[field.name] = pd.to_datetime(df[field.name], errors="coerce")
+        elif pa.types.is_string(field.type):
+            df[field.name] = df[field.name].map(lambda v: None if v is None else str(v))
+    if GEOMETRY_COL in schema.names:
+        df[GEOMETRY_COL] = geoms
+    return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+def _geom_wkb(geom) -> Optional[bytes]:
+    if not geom:
+        return None
+    from shapely.geometry import shape
+    return shape(geom).wkb
+
+def converter_layer(gdb_path: Path, layer: str, destino: Path,
+                    row_group_size: int = GDB_PARQUET_ROW_GROUP) -> int:
+    """Converte uma layer em streaming (um row group por lote). Retorna nº de linhas."""
+    import fiona
+
+    destino.mkdir(parents=True, exist_ok=True)
+    total = 0
+    with fiona.open(str(gdb_path), layer=layer) as src:
+        has_geometry = (src.schema.get("geometry") or "None") != "None"
+        schema = _arrow_schema(src.schema, has_geometry)
+        with pq.ParquetWriter(str(destino / "part-00000.parquet"), schema,
+                              compression="zstd", write_statistics=True) as writer:
+            rows: list[dict] = []
+            geoms: list = []
+            for feat in src:
+                rows.append(dict(feat.get("properties") or {}))
+                if has_geometry:
+                    geoms.append(_geom_wkb(feat.get("geometry")))
+                if len(rows) >= row_group_size:
+                    writer.write_table(_batch_to_table(rows, geoms, schema))
+                    total += len(rows)
+                    rows.clear(); geoms.clear()
+            if rows or total == 0:
+                writer.write_table(_batch_to_table(rows, geoms, schema))
+                total += len(rows)
+    return total
+
+def converter_gdb(gdb_path: Path, prefixo: Optional[str] = None, layers: Optional[list[str]] = None,
+                  force: bool = False, row_group_size: int = GDB_PARQUET_ROW_GROUP) -> dict:
+    """
+    Escreve todas as layers (ou só `layers`) do .gdb em Parquet e grava o manifest.
+    Escrita em <prefixo>.partial + rename, para nunca deixar cache pela metade.
+    """
+    import fiona
+
+    gdb_path = Path(gdb_path)
+    if not gdb_path.exists():
+        raise FileNotFoundError(f"GDB não encontrado: {gdb_path}")
+
+    if not force and cache_fresco(gdb_path, prefixo):
+        return ler_manifest(gdb_path, prefixo)
+
+    # fora do memo: a conversão sempre grava o fingerprint atual (ex. --force após edição no lugar)
+    fingerprint = fingerprint_gdb(gdb_path)
+    _fingerprints.pop(str(gdb_path), None)
+    final = cache_dir(gdb_path, prefixo)
+    tmp = final.with_name(final.name + ".partial")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True, exist_ok=True)
+
+    manifest = {
+        "gdb": str(gdb_path),
+        "fingerprint": fingerprint,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "layers": {},
+    }
+    for layer in (layers or fiona.listlayers(str(gdb_path))):
+        rows = converter_layer(gdb_path, layer, tmp / layer, row_group_size=row_group_size)
+        manifest["layers"][layer] = {"rows": rows}
+        print(f"[gdb_cache] {layer}: {rows} linhas")
+
+    (tmp / MANIFEST).write_text(json.dumps(manifest, indent=2, ensure_ascii=False), encoding="utf-8")
+    shutil.rmtree(final, ignore_errors=True)
+    tmp.rename(final)
+    return manifest
+
+# ---------------------------------------------------------------------------
+# Leitura
+# ---------------------------------------------------------------------------
+def listar_layers(gdb_path: Path, prefixo: Optional[str] = None) -> list[str]:
+    """Layers do manifest quando o cache está fresco; senão, fiona.listlayers."""
+    if cache_fresco(gdb_path, prefixo):
+        return list((ler_manifest(gdb_path, prefixo) or {}).get("layers") or {})
+    import fiona
+    return list(fiona.listlayers(str(gdb_path)))
+
+def contar_linhas(gdb_path: Path, layer: str, prefixo: Optional[str] = None) -> Optional[int]:
+    if not layer_em_cache(gdb_path, layer, prefixo):
+        return None
+    return (ler_manifest(gdb_path, prefixo) or {})["layers"][layer]["rows"]
+
+def _dataset(gdb_path: Path, layer: str, prefixo: Optional[str]) -> ds.Dataset:
+    path = layer_em_cache(gdb_path, layer, prefixo)
+    if path is None:
+        raise FileNotFoundError(f"layer {layer} fora do cache (ou cache desatualizado)")
+    return ds.dataset(str(path), format="parquet")
+
+def _projecao(dataset: ds.Dataset, columns: Optional[list[str]]) -> Optional[list[str]]:
+    # importers pedem colunas que podem não existir na layer (completam com None depois)
+    if columns is None:
+        return None
+    return [c for c in columns if c in dataset.schema.names]
+
+def _to_pandas(data) -> pd.DataFrame:
+    # inteiros com nulos viram Int64 (não float), como o Fiona entregaria: 383 e não "383.0"
+    return data.to_pandas(types_mapper=_NULLABLE_INTS.get)
+
+def _filtro(filters):
+    if filters is None or isinstance(filters, ds.Expression):
+        return filters
+    return pq.filters_to_expression(filters)
+
+def iter_batches(gdb_path: Path, layer: str, columns: Optional[list[str]] = None,
+                 filters=None, batch_size: int = 5000,
+                 prefixo: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    """
+    Lê a layer do cache em DataFrames de até `batch_size` linhas.
+    filters: expressão pyarrow ou DNF estilo pyarrow.parquet ([("DIST", "=", 383)]).
+    """
+    dataset = _dataset(gdb_path, layer, prefixo)
+    scanner = dataset.scanner(columns=_projecao(dataset, columns), filter=_filtro(filters),
+                              batch_size=batch_size)
+    for batch in scanner.to_batches():
+        if batch.num_rows:
+            yield _to_pandas(batch)
+
+def ler_layer(gdb_path: Path, layer: str, columns: Optional[list[str]] = None,
+              filters=None, prefixo: Optional[str] = None) -> pd.DataFrame:
+    dataset = _dataset(gdb_path, layer, prefixo)
+    table = dataset.to_table(columns=_projecao(dataset, columns), filter=_filtro(filters))
+    return _to_pandas(table)
+
+def ler_layer_ou_gdb(gdb_path: Path, layer: str, columns: Optional[list[str]] = None,
+                     prefixo: Optional[str] = None) -> pd.DataFrame:
+    """
+    Layer inteira: do cache quando fresco (com projeção em `columns`),
+    senão gpd.read_file do .gdb (todas as colunas, como antes).
+    """
+    if layer_em_cache(gdb_path, layer, prefixo):
+        return ler_layer(gdb_path, layer, columns=columns, prefixo=prefixo)
+    import geopandas as gpd
+    return gpd.read_file(str(gdb_path), layer=layer)
+
+def colunas_layer(gdb_path: Path, layer: str, prefixo: Optional[str] = None) -> Optional[list[str]]:
+    """Colunas da layer lidas só do footer Parquet (sem varrer dados)."""
+    if not layer_em_cache(gdb_path, layer, prefixo):
+        return None
+    return list(_dataset(gdb_path, layer, prefixo).schema.names)
+
+def iter_features(gdb_path: Path, layer: str, batch_size: int = 5000,
+                  prefixo: Optional[str] = None) -> Iterator[dict]:
+    """Features no formato do Fiona ({"properties", "geometry"}) a partir do cache."""
+    from shapely import wkb
+    from shapely.geometry import mapping
+
+    for df in iter_batches(gdb_path, layer, batch_size=batch_size, prefixo=prefixo):
+        geoms = df.pop(GEOMETRY_COL) if GEOMETRY_COL in df.columns else None
+        props = df.astype(object).where(df.notna(), None).to_dict(orient="records")
+        for i, p in enumerate(props):
+            g = geoms.iat[i] if geoms is not None else None
+            yield {"properties": p, "geometry": mapping(wkb.loads(g)) if g is not None else None}
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Converte um .gdb para o cache Parquet")
+    parser.add_argument("--gdb", required=True, type=Path)
+    parser.add_argument("--prefixo")
+    parser.add_argument("--layer", action="append", dest="layers")
+    parser.add_argument("--force", action="store_true")
+    args = parser.parse_args()
+
+    m = converter_gdb(args.gdb, prefixo=args.prefixo, layers=args.layers, force=args.force)
+    print(f"[gdb_cache] cache pronto em {cache_dir(args.gdb, args.prefixo)} ({len(m['layers'])} layers)")
@@ -0,0 +1,223 @@
+# packages/jobs/utils/import_metrics.py
+# -*- coding: utf-8 -*-
+"""
+Instrumentação por etapa dos importers (read, sanitize, hash, to_csv, copy, id_map).
+
+- Tempo de parede, linhas e bytes por etapa e por chunk
+- Resumo por etapa em intel_lead.import_metrics (schema/import_metrics.sql)
+- JSON completo (resumo + chunks) em data/logs/import_metrics/<import_id>_<ts>.json
+- --profile nos importers: dump do cProfile (.prof) ou pyinstrument (.html)
+  ao lado do JSON; escolha com IMPORT_PROFILER=cprofile|pyinstrument
+
+Falha ao gravar métricas nunca derruba o import (só avisa).
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import subprocess
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from time import perf_counter
+from typing import Iterable, Iterator, Optional
+
+from tqdm import tqdm
+
+ROOT = Path(__file__).resolve().parents[3]
+METRICS_DIR = Path(os.getenv("IMPORT_METRICS_DIR", str(ROOT / "data" / "logs" / "import_metrics")))
+SCHEMA_SQL = ROOT / "packages" / "database" / "schema" / "import_metrics.sql"
+IMPORT_PROFILER = os.getenv("IMPORT_PROFILER", "cprofile")
+
+
+def _versao() -> Optional[str]:
+    if os.getenv("IMPORT_VERSION"):
+        return os.getenv("IMPORT_VERSION")
+    try:
+        out = subprocess.run(["git", "describe", "--always", "--dirty"], cwd=ROOT,
+                             capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def nbytes(obj) -> int:
+    """Tamanho aproximado em memória de DataFrame/str/bytes (0 se desconhecido)."""
+    if obj is None:
+        return 0
+    if hasattr(obj, "memory_usage"):
+        return int(obj.memory_usage(index=False, deep=True).sum())
+    if isinstance(obj, (bytes, bytearray, str)):
+        return len(obj)
+    return 0
+
+
+class MetricasImport:
+    """
+    Acumulador de métricas de uma execução de importer.
+
+        m = MetricasImport(import_id, "UCBT")
+        for df in m.medir_iter("read", chunks):      # conta 1 chunk por item
+            with m.etapa("sanitize", linhas=len(df)):
+                ...
+        m.salvar()
+    """
+
+    def __init__(self, import_id: Optional[str], camada: str):
+        self.import_id = import_id
+        self.camada = camada
+        self.run_started_at = datetime.now(timezone.utc)
+        self.chunk = 0
+        self.etapas: dict[str, dict] = {}
+        self.chunks: list[dict] = []
+        self._t0 = perf_counter()
+
+    # ------------------------------------------------------------------
+    # Coleta
+    # ------------------------------------------------------------------
+    def registrar(self, etapa: str, segundos: float, linhas: int = 0, bytes_: int = 0):
+        agg = self.etapas.setdefault(etapa, {"chunks": 0, "wall_s": 0.0, "linhas": 0, "bytes": 0})
+        agg["chunks"] += 1
+        agg["wall_s"] += segundos
+        agg["linhas"] += int(linhas or 0)
+        agg["bytes"] += int(bytes_ or 0)
+        self.chunks.append({
+            "chunk": self.chunk, "etapa": etapa, "wall_s": round(segundos, 6),
+            "linhas": int(linhas or 0), "bytes": int(bytes_ or 0),
+        })
+
+    @contextmanager
+    def etapa(self, nome: str, linhas: int = 0, bytes_: int = 0):
+        """Mede o bloco; o chamador pode ajustar reg["linhas"]/reg["bytes"] dentro dele."""
+        reg = {"linhas": linhas, "bytes": bytes_}
+        t0 = perf_counter()
+        try:
+            yield reg
+        finally:
+            self.registrar(nome, perf_counter() - t0, reg["linhas"], reg["bytes"])
+
+    def medir_iter(self, nome: str, iterable: Iterable) -> Iterator:
+        """Mede o tempo de cada next() (ex.: leitura do Fiona/Parquet) e avança o chunk."""
+        it = iter(iterable)
+        while True:
+            t0 = perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            self.chunk += 1
+            self.registrar(nome, perf_counter() - t0, len(item) if hasattr(item, "__len__") else 0, nbytes(item))
+            yield item
+
+    # ------------------------------------------------------------------
+    # Saída
+    # ------------------------------------------------------------------
+    def resumo(self) -> dict:
+        total = perf_counter() - self._t0
+        return {
+            "import_id": self.import_id,
+            "camada": self.camada,
+            "run_started_at": self.run_started_at.isoformat(),
+            "versao": _versao(),
+            "wall_total_s": round(total, 3),
+            "etapas": {
+                k: {**v, "wall_s": round(v["wall_s"], 3),
+                    "pct": round(100 * v["wall_s"] / total, 1) if total else 0.0}
+                for k, v in self.etapas.items()
+            },
+        }
+
+    def base_arquivo(self) -> Path:
+        ts = self.run_started_at.strftime("%Y-%m-%d_%H-%M-%S")
+        return METRICS_DIR / f"{self.import_id or self.camada}_{ts}"
+
+    def salvar_json(self, resumo: Optional[dict] = None) -> Path:
+        resumo = resumo or self.resumo()
+        path = self.base_arquivo().with_suffix(".json")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({**resumo, "chunks": self.chunks}, indent=2, ensure_ascii=False),
+                        encoding="utf-8")
+        return path
+
+    def salvar_db(self, resumo: Optional[dict] = None):
+        from packages.database.connection import get_db_cursor
+
+        resumo = resumo or self.resumo()
+        with get_db_cursor(commit=True) as cur:
+            cur.execute(SCHEMA_SQL.read_text(encoding="utf-8"))
+            for etapa, v in resumo["etapas"].items():
+                cur.execute("""
+                    INSERT INTO import_metrics
+                        (import_id, run_started_at, camada, etapa, chunks, wall_s, linhas, bytes, versao)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (import_id, run_started_at, etapa) DO UPDATE SET
+                        chunks = EXCLUDED.chunks, wall_s = EXCLUDED.wall_s,
+                        linhas = EXCLUDED.linhas, bytes = EXCLUDED.bytes
+                """, (
+                    self.import_id, self.run_started_at, self.camada, etapa,
+                    v["chunks"], v["wall_s"], v["linhas"], v["bytes"], resumo["versao"],
+                ))
+
+    def salvar(self) -> dict:
+        resumo = self.resumo()
+        try:
+            path = self.salvar_json(resumo)
+            tqdm.write(f"[metrics] {self.camada}: {self._linha_resumo(resumo)} -> {path}")
+        except Exception as e:
+            tqdm.write(f"[metrics] falha ao gravar JSON: {e}")
+        if self.import_id:
+            try:
+                self.salvar_db(resumo)
+            except Exception as e:
+                tqdm.write(f"[metrics] falha ao gravar import_metrics: {e}")
+        return resumo
+
+    @staticmethod
+    def _linha_resumo(resumo: dict) -> str:
+        partes = sorted(resumo["etapas"].items(), key=lambda kv: -kv[1]["wall_s"])
+        return " | ".join(f"{k} {v['wall_s']:.1f}s ({v['pct']}%)" for k, v in partes)
+
+
+@contextmanager
+def perfilar(ativo: bool, nome: str):
+    """
+    Envolve o import num profiler quando --profile foi passado (uso no CLI dos importers).
+    cProfile (stdlib) por padrão; pyinstrument se IMPORT_PROFILER=pyinstrument e instalado.
+    Saída: data/logs/import_metrics/<nome>_<ts>.prof|.html
+    """
+    if not ativo:
+        yield
+        return
+
+    ts = datetime.now(timezone.utc).strftime("%Y-%m-%d_%H-%M-%S")
+    base = METRICS_DIR / f"{nome}_{ts}"
+    base.parent.mkdir(parents=True, exist_ok=True)
+
+    if IMPORT_PROFILER == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            tqdm.write("[metrics] pyinstrument não instalado — usando cProfile")
+        else:
+            prof = Profiler()
+            prof.start()
+            try:
+                yield
+            finally:
+                prof.stop()
+                out = base.with_suffix(".html")
+                out.write_text(prof.output_html(), encoding="utf-8")
+                tqdm.write(f"[metrics] profile salvo em {out}")
+            return
+
+    import cProfile
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        yield
+    finally:
+        prof.disable()
+        out = base.with_suffix(".prof")
+        prof.dump_stats(str(out))
+        tqdm.write(f"[metrics] profile salvo em {out} (abrir com snakeviz ou pstats)")
@@ -0,0 +1,179 @@
+# packages/jobs/utils/memoria.py
+# -*- coding: utf-8 -*-
+"""
+Dimensionamento de chunks por orçamento de memória (--max-rss-mb nos importers).
+
+Em vez de UCBT_CHUNK_SIZE/UCBT_ROWS_PER_COPY fixos, o importer mede os bytes
+por linha reais dos primeiros chunks (DataFrame lido e buffers das tabelas de
+destino) e calcula:
+
+- linhas_leitura(): tamanho do próximo chunk de leitura
+- linhas_buffer():  quantas linhas acumular antes do flush/COPY
+
+de forma que RSS do processo fique abaixo do orçamento. Se o RSS real passar
+do limite mesmo assim e tiver crescido desde o último flush, estourou() avisa e
+o orçamento encolhe (fator 0.7). RSS alto mas parado não conta: glibc/pandas
+raramente devolvem memória ao SO, e o buffer seguinte reaproveita a que ficou.
+
+Knobs (env):
+  IMPORT_MAX_RSS_MB       orçamento padrão quando o importer não recebe --max-rss-mb (0 = desligado)
+  IMPORT_FRACAO_LEITURA   fração do orçamento livre reservada ao chunk de leitura (0.3)
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Optional
+
+MB = 1024 * 1024
+
+IMPORT_MAX_RSS_MB = int(os.getenv("IMPORT_MAX_RSS_MB", "0"))
+IMPORT_FRACAO_LEITURA = float(os.getenv("IMPORT_FRACAO_LEITURA", "0.3"))
+
+# quanto um chunk lido "custa" de verdade: cópias do sanitize, frames de série, hashes
+FATOR_TRABALHO = 4.0
+# pico no flush: concat dos buffers + merge com ids + CSV em memória
+FATOR_PICO_FLUSH = 3.0
+# mínimo que sobra para trabalhar mesmo quando o processo já nasce perto do limite
+LIVRE_MINIMO = 64 * MB
+
+
+def rss_bytes(atual: bool = False) -> Optional[int]:
+    """
+    RSS atual do processo (psutil -> /proc -> pico via resource). None se indisponível.
+    atual=True: sem o fallback do pico (ru_maxrss nunca desce).
+    """
+    try:
+        import psutil
+        return int(psutil.Process().memory_info().rss)
+    except Exception:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        pass
+    if atual:
+        return None
+    try:
+        import resource, sys
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return int(pico if sys.platform == "darwin" else pico * 1024)
+    except Exception:
+        return None
+
+
+def memoria_disponivel_bytes() -> Optional[int]:
+    """RAM disponível no host (psutil -> MemAvailable do /proc/meminfo). None se indisponível."""
+    try:
+        import psutil
+        return int(psutil.virtual_memory().available)
+    except Exception:
+        pass
+    try:
+        with open("/proc/meminfo") as f:
+            for linha in f:
+                if linha.startswith("MemAvailable:"):
+                    return int(linha.split()[1]) * 1024
+    except Exception:
+        pass
+    return None
+
+
+class OrcamentoMemoria:
+    """
+    orc = OrcamentoMemoria(1024, chunk_inicial=2000)
+    for df in ler(orc.linhas_leitura):           # chamado a cada chunk
+        orc.observar_leitura(nbytes(df), len(df))
+        ...
+        orc.observar_buffer(nbytes(frames), len(df))
+        if buffer >= orc.linhas_buffer() or orc.estourou():
+            flush()
+    """
+
+    def __init__(
+        self,
+        max_rss_mb: int,
+        chunk_inicial: int = 2000,
+        min_linhas: int = 200,
+        max_linhas: int = 200_000,
+        amostras: int = 3,
+    ):
+        self.limite = int(max_rss_mb) * MB
+        self.chunk_inicial = max(min_linhas, int(chunk_inicial))
+        self.min_linhas = min_linhas
+        self.max_linhas = max_linhas
+        self.amostras = amostras
+        self.escala = 1.0
+        self.rss_base = rss_bytes() or 0
+        self._rss_flush: Optional[int] = None  # RSS logo após o último flush (ou aviso)
+        self._leitura: list[float] = []
+        self._buffer: list[float] = []
+
+    # ------------------------------------------------------------------
+    # Medição
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _media(amostras: list[float], bytes_: int, linhas: int, n: int):
+        if linhas <= 0 or bytes_ <= 0:
+            return
+        amostras.append(bytes_ / linhas)
+        del amostras[:-n]  # janela das últimas n medições
+
+    def observar_leitura(self, bytes_: int, linhas: int):
+        self._media(self._leitura, bytes_, linhas, self.amostras)
+
+    def observar_buffer(self, bytes_: int, linhas: int):
+        """bytes bufferizados (todas as tabelas de destino) por linha lida."""
+        self._media(self._buffer, bytes_, linhas, self.amostras)
+
+    @property
+    def bytes_linha_leitura(self) -> Optional[float]:
+        return max(self._leitura) if self._leitura else None
+
+    @property
+    def bytes_linha_buffer(self) -> Optional[float]:
+        return max(self._buffer) if self._buffer else None
+
+    # ------------------------------------------------------------------
+    # Dimensionamento
+    # ------------------------------------------------------------------
+    def livre(self) -> int:
+        return int(max(LIVRE_MINIMO, self.limite - self.rss_base) * self.escala)
+
+    def _clamp(self, n: float) -> int:
+        return int(min(self.max_linhas, max(self.min_linhas, n)))
+
+    def linhas_leitura(self) -> int:
+        bpl = self.bytes_linha_leitura
+        if bpl is None:
+            return self.chunk_inicial
+        return self._clamp(self.livre() * IMPORT_FRACAO_LEITURA / (bpl * FATOR_TRABALHO))
+
+    def linhas_buffer(self) -> int:
+        bpl = self.bytes_linha_buffer
+        if bpl is None:
+            return self.chunk_inicial
+        return self._clamp(self.livre() * (1 - IMPORT_FRACAO_LEITURA) / (bpl * FATOR_PICO_FLUSH))
+
+    def estourou(self) -> bool:
+        """RSS real acima do limite e crescendo desde o último flush: encolhe o orçamento e pede flush."""
+        rss = rss_bytes(atual=True)
+        if rss is None or rss <= self.limite:
+            return False
+        if self._rss_flush is not None and rss <= self._rss_flush:
+            return False
+        self.escala = max(0.1, self.escala * 0.7)
+        self._rss_flush = rss
+        return True
+
+    def registrar_flush(self):
+        """Chamado após cada flush: o RSS dali é a referência do próximo estourou()."""
+        self._rss_flush = rss_bytes(atual=True)
+
+    def descricao(self) -> str:
+        def _fmt(v):
+            return f"{v:.0f}B" if v is not None else "?"
+        return (f"orçamento {self.limite // MB}MB (base {self.rss_base // MB}MB, escala {self.escala:.2f}) | "
+                f"leitura {_fmt(self.bytes_linha_leitura)}/linha -> {self.linhas_leitura()} | "
+                f"buffer {_fmt(self.bytes_linha_buffer)}/linha -> {self.linhas_buffer()}")
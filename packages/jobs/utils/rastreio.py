@@ -1,6 +1,20 @@
+import os
 import hashlib
+from pathlib import Path
+
 from packages.database.connection import get_db_cursor
 
+SCHEMA_SQL = Path(__file__).resolve().parents[2] / "database" / "schema" / "import_status.sql"
+# o orquestrador passa o fingerprint do .gdb para o importer por env
+FINGERPRINT_ENV = "IMPORT_GDB_FINGERPRINT"
+_schema_aplicado = False
+
+def _garantir_schema(cur):
+    global _schema_aplicado
+    if not _schema_aplicado:
+        cur.execute(SCHEMA_SQL.read_text(encoding="utf-8"))
+        _schema_aplicado = True
+
 def gerar_import_id(prefixo: str, ano: int, camada: str) -> str:
     """
     Gera um ID único baseado nos dados da importação.
@@ -19,34 +33,39 @@ def registrar_status(
     linhas_processadas: int = None,
     observacoes: str = None,
     import_id: str = None,
+    fingerprint: str = None,
 ):
     """
     Registra ou atualiza o status da importação no schema intel_lead.
-    Preenche data_inicio quando status = running.
+    Preenche data_inicio (e o fingerprint do .gdb, se conhecido) quando status = running.
     Preenche data_fim, erro, observacoes e linhas_processadas quando status = completed/failed/no_new_rows.
     """
     import_id = import_id or gerar_import_id(prefixo, ano, camada)
+    fingerprint = fingerprint or os.getenv(FINGERPRINT_ENV) or None
 
     with get_db_cursor(commit=True) as cur:
+        _garantir_schema(cur)
         if status == "running":
             cur.execute("""
                 INSERT INTO import_status (
                     import_id, distribuidora_id, distribuidora_nome,
-                    ano, camada, status, data_inicio
+                    ano, camada, status, data_inicio, fingerprint
                 )
-                VALUES (%s, %s, %s, %s, %s, %s, NOW())
+                VALUES (%s, %s, %s, %s, %s, %s, NOW(), %s)
                 ON CONFLICT (import_id) DO UPDATE SET
                     status = EXCLUDED.status,
                     data_inicio = NOW(),
                     distribuidora_id = EXCLUDED.distribuidora_id,
-                    distribuidora_nome = EXCLUDED.distribuidora_nome
+                    distribuidora_nome = EXCLUDED.distribuidora_nome,
+                    fingerprint = EXCLUDED.fingerprint
             """, (
                 import_id,
                 distribuidora_id,
                 distribuidora_nome,
                 ano,
                 camada,
-                status
+                status,
+                fingerprint
             ))
 
         elif status in ["completed", "failed", "no_new_rows"]:
@@ -76,3 +95,23 @@ def get_status(prefixo: str, ano: int, camada: str) -> str:
         cur.execute("SELECT status FROM import_status WHERE import_id = %s", (import_id,))
         row = cur.fetchone()
         return row["status"] if row else None
+
+def status_em_lote(chaves: list[tuple[str, int, str]]) -> dict[tuple[str, int, str], dict]:
+    """
+    Status + fingerprint de várias (prefixo, ano, camada) numa consulta só.
+    Chaves sem linha em import_status ficam de fora do dict.
+    """
+    if not chaves:
+        return {}
+    por_id = {gerar_import_id(*c): c for c in chaves}
+    with get_db_cursor(commit=True) as cur:
+        _garantir_schema(cur)
+        cur.execute("""
+            SELECT import_id, status, fingerprint
+            FROM import_status
+            WHERE import_id = ANY(%s)
+        """, (list(por_id),))
+        return {
+            por_id[r["import_id"]]: {"status": r["status"], "fingerprint": r["fingerprint"]}
+            for r in cur.fetchall()
+        }
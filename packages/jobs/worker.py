@@ -2,30 +2,115 @@
 # -*- coding: utf-8 -*-
 """
 Worker de importação:
-- Consome jobs da tabela import_queue (packages/jobs/queue.py)
+- Consome jobs da tabela import_queue (packages/jobs/queue.py); ocioso, bloqueia
+  em LISTEN (acorda no NOTIFY do enqueue) com polling de fallback
 - Opcionalmente baixa o GDB (com retomada/limite de banda) antes do import
 - Executa o importer em processo filho com prioridade baixa (nice/ionice/psutil)
+- N slots concorrentes (WORKER_SLOTS); cada job tem classe de recurso
+  (download = rede, import = CPU/DB, enrich = cota de API) e só é admitido se
+  houver vaga na classe, RAM livre, load de CPU e orçamento de conexões ao banco
+- WORKER_MODO=pool: importers rodam num pool pré-forkado com pandas/GDAL já
+  importados, chamando a função de entrada direto (packages/jobs/pool.py)
+- Prefetch: downloads não ocupam slot, então o GDB do próximo distribuidora/ano
+  baixa enquanto o import atual roda (imports dependentes esperam via depends_on)
 - Reenfileira com backoff em falha, finaliza como done em sucesso
+- Lease: thread de manutenção renova a lease dos jobs em execução (heartbeat),
+  cancela o download e mata o processo filho de job cuja lease foi perdida
+  (o novo dono retoma o mesmo .part) e roda o reaper, que
+  re-enfileira jobs de workers mortos; outra thread arquiva done/failed antigos
+  de hora em hora
+- A manutenção também publica os contadores do worker (slots, segundos
+  ocupados, recusas de admissão, leases perdidas) em import_worker
 """
 
 import os
 import shlex
 import subprocess
+import threading
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from typing import Dict, Any, Optional
 
-from packages.jobs.queue import dequeue, complete, fail, WORKER_POLL_SEC
+from packages.jobs.queue import (
+    dequeue, complete, fail, heartbeat, reap, arquivar, backoff_sec, aguardar_job, classificar_recurso,
+    publicar_worker,
+    RECURSOS, WORKER_POLL_SEC, WORKER_LEASE_SEC,
+)
+from packages.jobs.utils.memoria import memoria_disponivel_bytes, MB
+from packages.jobs import pool as warm_pool
 
 # download helper
 try:
-    from packages.jobs.download.download_gdb import baixar_gdb
+    from packages.jobs.download.download_gdb import baixar_gdb, DownloadCancelado
 except Exception:
     baixar_gdb = None  # opcional
 
+    class DownloadCancelado(Exception):
+        pass
+
 NICE_BIN = os.getenv("NICE_BIN", "nice")
 IONICE_BIN = os.getenv("IONICE_BIN", "ionice")
 USE_IONICE = os.getenv("USE_IONICE", "1") == "1"
+# subprocess (python <script> por job) | pool (processos quentes, ver packages/jobs/pool.py)
+WORKER_MODO = os.getenv("WORKER_MODO", "subprocess")
+
+# ---------------------------------------------------------------------------
+# Slots / admissão por recurso
+# ---------------------------------------------------------------------------
+CPUS = os.cpu_count() or 1
+WORKER_SLOTS = int(os.getenv("WORKER_SLOTS", str(CPUS)))
+# máximo simultâneo por classe
+LIMITE_RECURSO = {
+    "download": int(os.getenv("WORKER_MAX_DOWNLOAD", "2")),
+    "import": int(os.getenv("WORKER_MAX_IMPORT", str(max(1, CPUS - 1)))),
+    "enrich": int(os.getenv("WORKER_MAX_ENRICH", "2")),
+}
+# RAM estimada por job (import usa UCBT_MAX_RSS_MB/IMPORT_MAX_RSS_MB do payload quando houver)
+MEM_RECURSO_MB = {
+    "download": int(os.getenv("WORKER_MEM_DOWNLOAD_MB", "64")),
+    "import": int(os.getenv("WORKER_MEM_IMPORT_MB", "1024")),
+    "enrich": int(os.getenv("WORKER_MEM_ENRICH_MB", "256")),
+}
+WORKER_MEM_RESERVA_MB = int(os.getenv("WORKER_MEM_RESERVA_MB", "512"))
+# jobs iniciados há menos disso ainda não alocaram: a estimativa conta integral
+WORKER_RAMPA_SEC = float(os.getenv("WORKER_RAMPA_SEC", "30"))
+# conexões Postgres por job: a do importer/download_log + a da fila na thread do slot
+CONEXOES_RECURSO = {"download": 2, "import": 2, "enrich": 2}
+WORKER_DB_CONNS = int(os.getenv("WORKER_DB_CONNS", "10"))
+# não admite outro import se loadavg(1min)/CPUs passar disso
+WORKER_MAX_LOAD = float(os.getenv("WORKER_MAX_LOAD", "0.9"))
+# downloads (rede) rodam por fora de WORKER_SLOTS, sobrepondo com imports (CPU)
+WORKER_PREFETCH_DOWNLOAD = os.getenv("WORKER_PREFETCH_DOWNLOAD", "1") == "1"
+
+# heartbeat bem abaixo da lease (tolera alguns batimentos perdidos) + período do reaper
+WORKER_HEARTBEAT_SEC = float(os.getenv("WORKER_HEARTBEAT_SEC", str(max(5, WORKER_LEASE_SEC // 4))))
+WORKER_REAPER_SEC = float(os.getenv("WORKER_REAPER_SEC", "60"))
+# arquivamento de done/failed antigos (0 desliga neste worker)
+WORKER_ARCHIVE_SEC = float(os.getenv("WORKER_ARCHIVE_SEC", "3600"))
+
+# processos filhos por job (modo subprocess), para matar quando a lease é perdida
+# (no modo pool: warm_pool.interromper(job_id))
+_procs: Dict[int, subprocess.Popen] = {}
+
+# contadores do processo (desde o boot), publicados em import_worker a cada
+# tick da manutenção: as métricas da fila enxergam worker ocioso e recusas
+_contadores = {"ocupado_s": 0.0, "rejeicoes_admissao": 0, "leases_perdidas": 0}
+_contadores_lock = threading.Lock()
+
+def _contar(chave: str, n: float = 1) -> None:
+    with _contadores_lock:
+        _contadores[chave] += n
+
+def _publicar(worker_id: str, ativos: list[dict]) -> None:
+    """Upsert da linha do worker: concluídos (callback do future) + tempo corrido dos em andamento."""
+    agora = time.monotonic()
+    rodando = [a for a in ativos if "inicio" in a and not a["future"].done()]
+    with _contadores_lock:
+        c = dict(_contadores)
+    publicar_worker(worker_id, WORKER_SLOTS, len(rodando),
+                    round(c["ocupado_s"] + sum(agora - a["inicio"] for a in rodando), 3),
+                    c["rejeicoes_admissao"], c["leases_perdidas"])
 
 def _set_low_priority_psutil(proc: subprocess.Popen) -> None:
     try:
@@ -62,10 +147,11 @@ def _build_cmd(payload: Dict[str, Any]) -> list[str]:
     pybin = os.getenv("PYTHON_BIN", "python")
     return [pybin, script] + args
 
-def _maybe_download(download_spec: Dict[str, Any]) -> Optional[str]:
+def _maybe_download(download_spec: Dict[str, Any], cancelar: Optional[threading.Event] = None) -> Optional[str]:
     """
     Executa download se 'download' veio no payload.
     Espera chaves: distribuidora, ano, nome_destino (opcional), url (opcional), max_kbps (opcional)
+    cancelar: setado pela manutenção quando a lease é perdida (DownloadCancelado).
     Retorna caminho da pasta .gdb final ou None.
     """
     if baixar_gdb is None or not download_spec:
@@ -74,57 +160,229 @@ def _maybe_download(download_spec: Dict[str, Any]) -> Optional[str]:
     ano = int(download_spec.get("ano"))
     url = download_spec.get("url")  # se não vier, a função interna pode resolver
     nome_destino = download_spec.get("nome_destino")  # ex: ENEL_RJ_2023
-    max_kbps = int(download_spec.get("max_kbps") or 256)
-    return str(baixar_gdb(distribuidora=dist, ano=ano, url=url, nome_destino=nome_destino, max_kbps=max_kbps))
+    # sem max_kbps: só o orçamento de banda do host (DOWNLOAD_BANDA_HOST_KBPS)
+    max_kbps = int(download_spec.get("max_kbps") or 0) or None
+    return str(baixar_gdb(distribuidora=dist, ano=ano, url=url, nome_destino=nome_destino, max_kbps=max_kbps,
+                          cancelar=cancelar))
 
-def main():
-    worker_id = f"worker-{uuid.uuid4().hex[:8]}"
-    print(f"[worker] started: {worker_id}")
+def _load1() -> Optional[float]:
+    try:
+        return os.getloadavg()[0]
+    except (OSError, AttributeError):
+        return None  # Windows
+
+def _mem_job_mb(payload: Dict[str, Any], recurso: str) -> int:
+    env = payload.get("env") or {}
+    for k in ("UCBT_MAX_RSS_MB", "IMPORT_MAX_RSS_MB"):
+        if str(env.get(k) or "0") != "0":
+            return int(env[k])
+    return MEM_RECURSO_MB[recurso]
 
-    while True:
-        job = dequeue(worker_id)
-        if not job:
-            time.sleep(WORKER_POLL_SEC)
+def _recursos_livres(ativos: list[dict], mem_disponivel: Optional[int], load1: Optional[float]) -> list[str]:
+    """
+    Classes de recurso que ainda cabem no host dado o que está rodando.
+    ativos: [{"recurso", "inicio" (monotonic), "mem_mb"}]
+    Sem nada rodando, RAM/CPU não bloqueiam (sempre dá para andar 1 job).
+    Com prefetch, downloads não contam nem consomem WORKER_SLOTS.
+    """
+    def _fora_dos_slots(r: str) -> bool:
+        return WORKER_PREFETCH_DOWNLOAD and r == "download"
+
+    ocupados = sum(1 for a in ativos if not _fora_dos_slots(a["recurso"]))
+    agora = time.monotonic()
+    conexoes = sum(CONEXOES_RECURSO[a["recurso"]] for a in ativos)
+    rampa = sum(a["mem_mb"] for a in ativos if agora - a["inicio"] < WORKER_RAMPA_SEC) * MB
+
+    livres = []
+    for r in RECURSOS:
+        if ocupados >= WORKER_SLOTS and not _fora_dos_slots(r):
+            continue
+        if sum(1 for a in ativos if a["recurso"] == r) >= LIMITE_RECURSO[r]:
+            continue
+        if conexoes + CONEXOES_RECURSO[r] > WORKER_DB_CONNS:
             continue
+        if ativos:
+            if mem_disponivel is not None and \
+                    mem_disponivel - rampa - WORKER_MEM_RESERVA_MB * MB < MEM_RECURSO_MB[r] * MB:
+                continue
+            if r == "import" and load1 is not None and load1 / CPUS > WORKER_MAX_LOAD:
+                continue
+        livres.append(r)
+    return livres
 
-        job_id = job["id"]
-        payload: Dict[str, Any] = job["payload"]
-        tries = job.get("tries", 0)
-        max_retries = job.get("max_retries", 3)
+def _lease_valida(job_id: int, worker_id: Optional[str], cancelar: threading.Event) -> bool:
+    """Confere no banco (renovando) que o job ainda é deste worker; perdida, sinaliza `cancelar`."""
+    if not cancelar.is_set() and worker_id is not None and job_id not in heartbeat([job_id], worker_id):
+        cancelar.set()
+    return not cancelar.is_set()
+
+def _executar_job(job: Dict[str, Any], worker_id: Optional[str] = None,
+                  cancelar: Optional[threading.Event] = None) -> None:
+    """
+    Roda 1 job num slot (thread): download opcional + importer em processo filho.
+    Sem a lease (antes/depois do download ou cancelado no meio) o job é de
+    outro worker: sai sem complete/fail.
+    """
+    cancelar = cancelar or threading.Event()
+    job_id = job["id"]
+    payload: Dict[str, Any] = job["payload"]
+    tries = job.get("tries", 0)
+
+    # ambiente do processo filho
+    env = os.environ.copy()
+    for k, v in (payload.get("env") or {}).items():
+        env[str(k)] = str(v)
+
+    try:
+        # 1) download opcional (retomável/limitado)
+        if payload.get("download"):
+            if not _lease_valida(job_id, worker_id, cancelar):
+                print(f"[worker] job {job_id}: lease perdida antes do download")
+                return
+            gdb_path = _maybe_download(payload["download"], cancelar)
+            if not _lease_valida(job_id, worker_id, cancelar):
+                print(f"[worker] job {job_id}: lease perdida durante o download")
+                return
+            # opcional: substituir placeholder --gdb=<auto>
+            if gdb_path:
+                args = payload.get("args") or []
+                for i, a in enumerate(args):
+                    if a == "--gdb" and i + 1 < len(args):
+                        args[i + 1] = gdb_path
+                payload["args"] = args
 
-        # ambiente do processo filho
-        env = os.environ.copy()
-        for k, v in (payload.get("env") or {}).items():
-            env[str(k)] = str(v)
+        # job só de download: nada a executar depois
+        if not payload.get("script"):
+            print(f"[worker] job {job_id} done (download)")
+            complete(job_id, worker_id)
+            return
 
+        # 2) executar importer
+        if WORKER_MODO == "pool" and warm_pool.entrada_do_script(payload["script"]):
+            print(f"[worker] running job {job_id} (pool): {payload['script']} {payload.get('args') or []}")
+            warm_pool.executar(payload, processos=WORKER_SLOTS, job_id=job_id)
+            print(f"[worker] job {job_id} done")
+            complete(job_id, worker_id)
+            return
+
+        cmd = _build_cmd(payload)
+        print(f"[worker] running job {job_id}: {shlex.join(cmd)}")
+        proc = _spawn_low_priority(cmd, env=env)
+        _procs[job_id] = proc
         try:
-            # 1) download opcional (retomável/limitado)
-            if payload.get("download"):
-                gdb_path = _maybe_download(payload["download"])
-                # opcional: substituir placeholder --gdb=<auto>
-                if gdb_path:
-                    args = payload.get("args") or []
-                    for i, a in enumerate(args):
-                        if a == "--gdb" and i + 1 < len(args):
-                            args[i + 1] = gdb_path
-                    payload["args"] = args
-
-            # 2) executar importer
-            cmd = _build_cmd(payload)
-            print(f"[worker] running job {job_id}: {shlex.join(cmd)}")
-            proc = _spawn_low_priority(cmd, env=env)
             ret = proc.wait()
+        finally:
+            _procs.pop(job_id, None)
 
-            if ret == 0:
-                print(f"[worker] job {job_id} done")
-                complete(job_id)
-            else:
-                print(f"[worker] job {job_id} failed (exit={ret})")
-                fail(job_id, delay_sec=min(60 * (tries + 1), 600))  # backoff
+        if ret == 0:
+            print(f"[worker] job {job_id} done")
+            complete(job_id, worker_id)
+        else:
+            print(f"[worker] job {job_id} failed (exit={ret})")
+            fail(job_id, delay_sec=backoff_sec(tries), worker_id=worker_id)
+
+    except DownloadCancelado:
+        print(f"[worker] job {job_id}: download cancelado (lease perdida)")
+    except Exception as e:
+        print(f"[worker] exception on job {job_id}: {e}")
+        fail(job_id, delay_sec=backoff_sec(tries), worker_id=worker_id)
+
+def _manutencao(worker_id: str, ativos: Dict[int, dict], lock: threading.Lock, parar: threading.Event) -> None:
+    """
+    Thread própria (conexão própria): heartbeat dos jobs ativos, reaper
+    periódico e publicação dos contadores do worker (import_worker).
+    """
+    ultimo_reap = 0.0
+    while not parar.wait(WORKER_HEARTBEAT_SEC):
+        with lock:  # o loop principal insere/remove jobs em `ativos`
+            ids = list(ativos)
+            copia = list(ativos.values())
+        try:
+            for perdido in set(ids) - heartbeat(ids, worker_id):
+                print(f"[worker] lease perdida no job {perdido} — interrompendo")
+                _contar("leases_perdidas")
+                with lock:
+                    ativo = ativos.get(perdido) or {}
+                if ativo.get("cancelar") is not None:
+                    ativo["cancelar"].set()  # download em andamento para no próximo chunk
+                proc = _procs.get(perdido)
+                if proc and proc.poll() is None:
+                    proc.terminate()
+                elif WORKER_MODO == "pool":
+                    warm_pool.interromper(perdido)
 
+            if time.monotonic() - ultimo_reap >= WORKER_REAPER_SEC:
+                ultimo_reap = time.monotonic()
+                reaped = reap()
+                if reaped:
+                    print(f"[worker] reaper: jobs com lease vencida re-enfileirados: {reaped}")
+        except Exception as e:
+            print(f"[worker] manutenção falhou: {e}")
+        try:
+            # à parte: sem a migração import_worker, heartbeat/reaper seguem
+            _publicar(worker_id, copia)
         except Exception as e:
-            print(f"[worker] exception on job {job_id}: {e}")
-            fail(job_id, delay_sec=min(60 * (tries + 1), 600))
+            print(f"[worker] publicação dos contadores falhou: {e}")
+
+def _arquivamento(parar: threading.Event) -> None:
+    """
+    Thread separada do heartbeat: o 1º arquivamento de meses de histórico pode
+    levar mais que WORKER_LEASE_SEC e não pode atrasar a renovação das leases.
+    Começa após um período (não arquiva no boot de toda a frota ao mesmo tempo).
+    """
+    while not parar.wait(WORKER_ARCHIVE_SEC):
+        try:
+            n = arquivar()
+            if n:
+                print(f"[worker] {n} jobs finalizados movidos para import_queue_archive")
+        except Exception as e:
+            print(f"[worker] arquivamento falhou: {e}")
+
+def main():
+    worker_id = f"worker-{uuid.uuid4().hex[:8]}"
+    print(f"[worker] started: {worker_id} (slots={WORKER_SLOTS}, modo={WORKER_MODO}, limites={LIMITE_RECURSO})")
+
+    ativos: Dict[int, dict] = {}
+    ativos_lock = threading.Lock()
+    parar = threading.Event()
+    threading.Thread(target=_manutencao, args=(worker_id, ativos, ativos_lock, parar),
+                     name="manutencao", daemon=True).start()
+    if WORKER_ARCHIVE_SEC > 0:
+        threading.Thread(target=_arquivamento, args=(parar,), name="arquivamento", daemon=True).start()
+
+    extra = LIMITE_RECURSO["download"] if WORKER_PREFETCH_DOWNLOAD else 0
+    with ThreadPoolExecutor(max_workers=WORKER_SLOTS + extra, thread_name_prefix="slot") as pool:
+        while True:
+            with ativos_lock:
+                for jid in [j for j, a in ativos.items() if a["future"].done()]:
+                    ativos.pop(jid)
+
+            livres = _recursos_livres(list(ativos.values()), memoria_disponivel_bytes(), _load1())
+            job = dequeue(worker_id, livres) if livres else None
+            if job:
+                recurso = classificar_recurso(job["payload"])
+                inicio = time.monotonic()
+                cancelar = threading.Event()
+                ativo = {
+                    "recurso": recurso,
+                    "inicio": inicio,
+                    "mem_mb": _mem_job_mb(job["payload"], recurso),
+                    "cancelar": cancelar,
+                    "future": pool.submit(_executar_job, job, worker_id, cancelar),
+                }
+                ativo["future"].add_done_callback(lambda _f, t=inicio: _contar("ocupado_s", time.monotonic() - t))
+                with ativos_lock:
+                    ativos[job["id"]] = ativo
+                continue  # tenta encher outro slot
+
+            # vai esperar com classes barradas (slots/RAM/CPU/conexões): recusa de admissão
+            _contar("rejeicoes_admissao", len(RECURSOS) - len(livres))
+            if ativos and not livres:
+                # host cheio: espera um slot terminar
+                wait([a["future"] for a in ativos.values()], timeout=WORKER_POLL_SEC, return_when=FIRST_COMPLETED)
+            else:
+                # fila vazia (para as classes livres): NOTIFY de enqueue ou fim de slot
+                aguardar_job(timeout=WORKER_POLL_SEC if ativos else None, recursos=livres)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,228 @@
+# packages/orquestrator/dag.py
+# -*- coding: utf-8 -*-
+"""
+Runner de DAG declarativo para os pipelines de enriquecimento e diagnóstico.
+
+Cada etapa declara script, entradas e saídas:
+- "tabela:intel_lead.lead_bruto"  -> contadores do pg_stat + relfilenode
+- "schema:intel_lead"             -> todas as tabelas/colunas do schema
+- caminho (aceita glob)           -> o arquivo mais recente que casa (nome/tamanho/mtime)
+
+Dependências: as explícitas (depende=) + as inferidas na ordem de declaração
+(lê o que uma anterior escreve, escreve o que ela lê ou escreve). Etapas
+independentes rodam em paralelo (mesmo despacho do orquestrador de imports).
+
+Skip: a assinatura das entradas é gravada após cada sucesso (depois da etapa,
+para não invalidar quem altera a própria entrada) em data/logs/dag/<pipeline>.json
+e, se o pipeline terminou sem falha, regravada no fim para todas as etapas: uma
+etapa posterior que escreve na entrada de uma anterior (mover grava lead_bruto,
+que priorizar lê) não a faz rodar de novo na próxima vez.
+Entradas iguais + saídas presentes = etapa pulada. Falha pula os dependentes.
+Obs.: contadores do pg_stat são publicados com ~1 s de atraso após o commit.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timezone
+from functools import partial
+from pathlib import Path
+from typing import Iterable, Optional
+
+from tqdm import tqdm
+
+from packages.orquestrator.orquestrador_job import ROOT, PYTHON_EXEC, executar_streaming, despachar_lpt
+
+DAG_STATE_DIR = ROOT / "data" / "logs" / "dag"
+
+
+class Etapa:
+    def __init__(self, nome: str, script: str, entradas: Iterable[str] = (), saidas: Iterable[str] = (),
+                 depende: Iterable[str] = (), args: Iterable[str] = ()):
+        self.nome = nome
+        self.script = script
+        self.entradas = list(entradas)
+        self.saidas = list(saidas)
+        self.depende = set(depende)
+        self.args = [str(a) for a in args]
+
+
+def resolver_dependencias(etapas: list[Etapa]) -> dict[str, set[str]]:
+    """Dependências explícitas + hazards (RAW/WAW/WAR) com etapas declaradas antes."""
+    nomes = [e.nome for e in etapas]
+    if len(set(nomes)) != len(nomes):
+        raise ValueError("nomes de etapa repetidos")
+    deps: dict[str, set[str]] = {}
+    for i, e in enumerate(etapas):
+        desconhecidas = e.depende - set(nomes)
+        if desconhecidas:
+            raise ValueError(f"{e.nome}: depende de etapas inexistentes {sorted(desconhecidas)}")
+        d = set(e.depende)
+        for anterior in etapas[:i]:
+            escritas = set(anterior.saidas)
+            if escritas & set(e.entradas) or escritas & set(e.saidas) or set(anterior.entradas) & set(e.saidas):
+                d.add(anterior.nome)
+        deps[e.nome] = d
+    return deps
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Assinaturas
+# ──────────────────────────────────────────────────────────────────────────────
+def _arquivo_mais_recente(padrao: str) -> Optional[Path]:
+    p = Path(padrao)
+    base = p if p.is_absolute() else ROOT / p
+    if not any(ch in padrao for ch in "*?["):
+        return base if base.exists() else None
+    ancora = Path(base.anchor) if base.is_absolute() else ROOT
+    casos = [c for c in ancora.glob(str(base.relative_to(ancora))) if c.is_file()]
+    return max(casos, key=lambda c: c.stat().st_mtime_ns) if casos else None
+
+
+def _assinatura_arquivo(padrao: str) -> str:
+    p = _arquivo_mais_recente(padrao)
+    if p is None:
+        return "ausente"
+    st = p.stat()
+    return f"{p.relative_to(ROOT).as_posix() if p.is_relative_to(ROOT) else p}|{st.st_size}|{st.st_mtime_ns}"
+
+
+def _assinaturas_banco(recursos: list[str]) -> dict[str, str]:
+    """Uma consulta para todas as tabelas/schemas do conjunto."""
+    tabelas = [r.split(":", 1)[1] for r in recursos if r.startswith("tabela:")]
+    schemas = [r.split(":", 1)[1] for r in recursos if r.startswith("schema:")]
+    if not tabelas and not schemas:
+        return {}
+    from packages.database.connection import get_db_cursor
+
+    with get_db_cursor() as cur:
+        cur.execute("""
+            SELECT s.schemaname, s.relname,
+                   concat_ws('|', c.relfilenode, s.n_tup_ins, s.n_tup_upd, s.n_tup_del,
+                             (SELECT md5(string_agg(a.attname || ':' || a.atttypid, ',' ORDER BY a.attnum))
+                              FROM pg_attribute a
+                              WHERE a.attrelid = s.relid AND a.attnum > 0 AND NOT a.attisdropped)) AS versao
+            FROM pg_stat_user_tables s
+            JOIN pg_class c ON c.oid = s.relid
+            WHERE s.schemaname || '.' || s.relname = ANY(%s) OR s.schemaname = ANY(%s)
+            ORDER BY s.schemaname, s.relname
+        """, (tabelas, schemas))
+        linhas = cur.fetchall()
+
+    out = {f"tabela:{t}": "ausente" for t in tabelas}
+    por_schema: dict[str, list[str]] = {s: [] for s in schemas}
+    for r in linhas:
+        nome = f"{r['schemaname']}.{r['relname']}"
+        if f"tabela:{nome}" in out:
+            out[f"tabela:{nome}"] = r["versao"]
+        if r["schemaname"] in por_schema:
+            por_schema[r["schemaname"]].append(f"{r['relname']}={r['versao']}")
+    for s, partes in por_schema.items():
+        out[f"schema:{s}"] = hashlib.sha1("\n".join(partes).encode()).hexdigest()
+    return out
+
+
+def assinatura(recursos: Iterable[str]) -> str:
+    recursos = sorted(set(recursos))
+    banco = _assinaturas_banco(recursos)
+    partes = [f"{r}={banco[r] if r in banco else _assinatura_arquivo(r)}" for r in recursos]
+    return hashlib.sha1("\n".join(partes).encode()).hexdigest()
+
+
+def _assinatura_ou_none(recursos: Iterable[str]) -> Optional[str]:
+    # sem banco para assinar: a etapa roda (e não grava assinatura)
+    try:
+        return assinatura(recursos)
+    except Exception as e:
+        tqdm.write(f"[dag] sem assinatura das entradas: {e}")
+        return None
+
+
+def saidas_presentes(etapa: Etapa) -> bool:
+    # tabelas sempre "existem"; arquivos precisam de ao menos um match
+    return all(_arquivo_mais_recente(s) is not None for s in etapa.saidas if not s.startswith(("tabela:", "schema:")))
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Execução
+# ──────────────────────────────────────────────────────────────────────────────
+def _ler_estado(pipeline: str) -> dict:
+    path = DAG_STATE_DIR / f"{pipeline}.json"
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+
+
+def _gravar_estado(pipeline: str, estado: dict):
+    DAG_STATE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = DAG_STATE_DIR / f"{pipeline}.json.tmp"
+    tmp.write_text(json.dumps(estado, indent=2, ensure_ascii=False), encoding="utf-8")
+    tmp.replace(DAG_STATE_DIR / f"{pipeline}.json")
+
+
+async def _rodar_etapa(pipeline: str, etapa: Etapa, deps: set[str], estado: dict, resultado: dict,
+                       forcar: bool):
+    falhas = sorted(d for d in deps if resultado.get(d) in ("falhou", "pulada_por_falha"))
+    if falhas:
+        tqdm.write(f"[SKIP] {etapa.nome}: dependência falhou ({', '.join(falhas)})")
+        resultado[etapa.nome] = "pulada_por_falha"
+        return
+
+    anterior = estado.get(etapa.nome) or {}
+    if not forcar and anterior.get("assinatura") and saidas_presentes(etapa):
+        atual = await asyncio.to_thread(_assinatura_ou_none, etapa.entradas)
+        if atual is not None and atual == anterior["assinatura"]:
+            tqdm.write(f"[OK] {etapa.nome}: entradas inalteradas desde {anterior.get('ok_em')}")
+            resultado[etapa.nome] = "pulada"
+            return
+
+    tqdm.write(f"[RUN] {etapa.nome}")
+    try:
+        rc = await executar_streaming([PYTHON_EXEC, str(ROOT / etapa.script), *etapa.args], ROOT, etapa.nome)
+    except Exception as e:
+        tqdm.write(f"[ERR] {etapa.nome}: {e}")
+        rc = -1
+    if rc != 0:
+        tqdm.write(f"[ERR] {etapa.nome} (rc={rc})")
+        resultado[etapa.nome] = "falhou"
+        return
+
+    estado[etapa.nome] = {
+        "assinatura": await asyncio.to_thread(_assinatura_ou_none, etapa.entradas),
+        "ok_em": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    _gravar_estado(pipeline, estado)
+    tqdm.write(f"[DONE] {etapa.nome}")
+    resultado[etapa.nome] = "ok"
+
+
+def rodar_dag(pipeline: str, etapas: list[Etapa], paralelo: int = 2, forcar: bool = False) -> dict[str, str]:
+    """
+    Roda o DAG e devolve {etapa: ok | pulada | falhou | pulada_por_falha}.
+    """
+    deps = resolver_dependencias(etapas)
+    estado = _ler_estado(pipeline)
+    resultado: dict[str, str] = {}
+    tarefas = {
+        e.nome: {
+            "deps": deps[e.nome],
+            "custo": 1.0,
+            # caminho mais longo primeiro: quem tem mais dependentes sai antes
+            "prioridade": sum(e.nome in d for d in deps.values()),
+            "rodar": partial(_rodar_etapa, pipeline, e, deps[e.nome], estado, resultado, forcar),
+        }
+        for e in etapas
+    }
+    asyncio.run(despachar_lpt(tarefas, paralelo))
+
+    if "ok" in resultado.values() and all(r in ("ok", "pulada") for r in resultado.values()):
+        # estado final do pipeline: inclui o que as etapas seguintes escreveram nas entradas
+        for e in etapas:
+            atual = _assinatura_ou_none(e.entradas)
+            if atual is not None and e.nome in estado:
+                estado[e.nome]["assinatura"] = atual
+        _gravar_estado(pipeline, estado)
+    return resultado
@@ -1,39 +1,47 @@
-import subprocess
-from pathlib import Path
+# packages/orquestrator/orquestrador_diagnostico.py
+# -*- coding: utf-8 -*-
+
+import argparse
 import sys
-import os
+from pathlib import Path
 
-# Define o diretório raiz do projeto
-ROOT_DIR = Path(__file__).resolve().parent.parent.parent
-PYTHON_EXECUTAVEL = sys.executable
+ROOT = Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
 
-# Lista de scripts de diagnóstico (com caminho absoluto)
-SCRIPTS = [
-    ROOT_DIR / "packages" / "jobs" / "diagnostico" / "estruturar_banco_job.py",
-    ROOT_DIR / "packages" / "jobs" / "diagnostico" / "documentar_banco_job.py",
-    ROOT_DIR / "packages" / "jobs" / "diagnostico" / "recomendar_melhorias_job.py"
-]
+from packages.orquestrator.dag import Etapa, rodar_dag
 
-def run_script(script_path: Path):
-    print(f"\n🚀 Executando: {script_path.name}...")
+# cada execução do estruturar cria data/diagnosticos/<timestamp>/; os globs pegam a pasta mais recente
+ESTRUTURA_JSON = "data/diagnosticos/*/estrutura_banco.json"
 
-    result = subprocess.run(
-        [PYTHON_EXECUTAVEL, str(script_path)],
-        cwd=ROOT_DIR,
-        capture_output=True,
-        text=True,
-        env={**os.environ, "PYTHONPATH": str(ROOT_DIR)}  # 🔥 ESSENCIAL
-    )
-
-    if result.returncode != 0:
-        print(f"❌ Erro ao rodar {script_path.name}")
-        print(result.stderr)
-    else:
-        print(f"✅ {script_path.name} finalizado com sucesso!")
-        print(result.stdout)
+# documentar e recomendar só leem o JSON do estruturar: rodam em paralelo
+ETAPAS = [
+    Etapa(
+        "estruturar_banco",
+        "packages/jobs/diagnostico/estruturar_banco_job.py",
+        entradas=["schema:intel_lead"],
+        saidas=[ESTRUTURA_JSON],
+    ),
+    Etapa(
+        "documentar_banco",
+        "packages/jobs/diagnostico/documentar_banco_job.py",
+        entradas=[ESTRUTURA_JSON],
+        saidas=["data/diagnosticos/*/diagnostico.md"],
+    ),
+    Etapa(
+        "recomendar_melhorias",
+        "packages/jobs/diagnostico/recomendar_melhorias_job.py",
+        entradas=[ESTRUTURA_JSON],
+        saidas=["data/diagnosticos/*/sugestoes_melhorias.json"],
+    ),
+]
 
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Pipeline de diagnóstico do banco (DAG)")
+    ap.add_argument("--paralelo", type=int, default=2)
+    ap.add_argument("--forcar", action="store_true", help="roda todas as etapas mesmo com entradas inalteradas")
+    args = ap.parse_args()
+
     print("📊 Iniciando pipeline de diagnóstico do banco...")
-    for script in SCRIPTS:
-        run_script(script)
-    print("\n🏁 Diagnóstico completo.")
+    resultado = rodar_dag("diagnostico", ETAPAS, paralelo=args.paralelo, forcar=args.forcar)
+    print(f"\n🏁 Diagnóstico completo: {resultado}")
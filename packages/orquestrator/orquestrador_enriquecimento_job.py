@@ -1,22 +1,42 @@
-import subprocess
+# packages/orquestrator/orquestrador_enriquecimento_job.py
+# -*- coding: utf-8 -*-
 
-def run_job(nome, path):
-    print(f"\n🔹 Executando: {nome}")
-    result = subprocess.run(["python", path])
-    if result.returncode == 0:
-        print(f"✅ {nome} finalizado com sucesso.")
-    else:
-        print(f"❌ Erro ao rodar {nome}.")
+import argparse
+import sys
+from pathlib import Path
 
-if __name__ == "__main__":
-    print("📊 Iniciando orquestração do pipeline de enriquecimento...\n")
+ROOT = Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
 
-    steps = [
-        ("Priorizar Leads", "packages/jobs/classificadores/priorizador_enriquecimento_job.py"),
-        ("Mover Leads Desativados", "packages/jobs/classificadores/mover_leads_inuteis_job.py")
-    ]
+from packages.orquestrator.dag import Etapa, rodar_dag
 
-    for nome, path in steps:
-        run_job(nome, path)
+# mover lê o status que priorizar grava em lead_bruto: a dependência sai das entradas/saídas
+ETAPAS = [
+    Etapa(
+        "Priorizar Leads",
+        "packages/jobs/classificadores/priorizador_enriquecimento_job.py",
+        entradas=["tabela:intel_lead.lead_bruto", "tabela:intel_lead.lead_energia",
+                  "tabela:intel_lead.lead_qualidade", "tabela:public.municipios"],
+        saidas=["tabela:intel_lead.lead_bruto"],
+    ),
+    Etapa(
+        "Mover Leads Desativados",
+        "packages/jobs/classificadores/mover_leads_inuteis_job.py",
+        entradas=["tabela:intel_lead.lead_bruto"],
+        saidas=["tabela:intel_lead.lead_bruto", "tabela:intel_lead.lead_energia",
+                "tabela:intel_lead.lead_demanda", "tabela:intel_lead.lead_qualidade",
+                "tabela:intel_lead.lead_passivo", "tabela:intel_lead.lead_energia_passivo",
+                "tabela:intel_lead.lead_demanda_passivo", "tabela:intel_lead.lead_qualidade_passivo"],
+    ),
+]
 
-    print("\n🏁 Pipeline de enriquecimento executado.")
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Pipeline de enriquecimento (DAG)")
+    ap.add_argument("--paralelo", type=int, default=2)
+    ap.add_argument("--forcar", action="store_true", help="roda todas as etapas mesmo com entradas inalteradas")
+    args = ap.parse_args()
+
+    print("📊 Iniciando orquestração do pipeline de enriquecimento...\n")
+    resultado = rodar_dag("enriquecimento", ETAPAS, paralelo=args.paralelo, forcar=args.forcar)
+    print(f"\n🏁 Pipeline de enriquecimento executado: {resultado}")
@@ -2,9 +2,13 @@
 # -*- coding: utf-8 -*-
 
 import os
+import re
 import sys
+import asyncio
+import argparse
+from functools import partial
+from asyncio.subprocess import PIPE
 from pathlib import Path
-from subprocess import Popen, PIPE
 from tqdm import tqdm
 
 # ──────────────────────────────────────────────────────────────────────────────
@@ -20,9 +24,10 @@ ENV.setdefault("PYTHONIOENCODING", "utf-8")
 ENV.setdefault("PYTHONUTF8", "1")
 
 # knobs default para UCBT (não precisa passar por CLI)
-# ajuste aqui se quiser outros defaults globais
+# orçamento de RAM: o importer mede bytes/linha e dimensiona chunk e COPY sozinho
+# (UCBT_CHUNK_SIZE vira só o chunk inicial; UCBT_MAX_RSS_MB=0 volta aos tamanhos fixos)
+ENV.setdefault("UCBT_MAX_RSS_MB", "1024")
 ENV.setdefault("UCBT_CHUNK_SIZE", "5000")
-ENV.setdefault("UCBT_ROWS_PER_COPY", "20000")
 ENV.setdefault("UCBT_SLEEP_MS_BETWEEN", "120")
 
 # Caminho do Python da venv e PYTHONPATH
@@ -43,78 +48,214 @@ CAMADAS = ["UCAT", "UCMT", "UCBT", "PONNOT"]
 # Pasta onde estão os .gdb (cada .gdb é um diretório)
 DOWNLOADS_DIR = ROOT / "data" / "downloads"
 
+# Estágio de conversão GDB -> Parquet (data/processed/<prefixo>/<layer>) antes dos importers
+GDB_PARQUET_CACHE = ENV.get("GDB_PARQUET_CACHE", "1") == "1"
+
+# Subprocessos simultâneos (cache + importers). Cada UCBT já se limita a UCBT_MAX_RSS_MB.
+ORQ_PARALELO = int(ENV.get("ORQ_PARALELO", "2"))
+
+# Linha de progresso do tqdm do filho: " 42%|████      | 420/1000 [..]"
+_TQDM_RE = re.compile(r"(\d{1,3})%\|")
+
 
 def _build_args(camada: str, gdb_path: Path, distribuidora: str, ano: int, prefixo: str) -> list[str]:
     """
-    UCAT/UCMT usam --prefixo (para gerar import_id e mapear IDs).
-    UCBT/PONNOT não precisam de --prefixo; eles já geram import_id internamente.
+    Todas as camadas recebem --prefixo (import_id e import_status são por prefixo).
+    PONNOT usa --modo-debug (hífen).
     """
-    base = ["--gdb", str(gdb_path), "--distribuidora", distribuidora, "--ano", str(ano)]
-    if camada in ("UCAT", "UCMT"):
-        return base + ["--prefixo", prefixo, "--modo_debug"]
-    else:
-        return base + ["--modo_debug"]
-
-
-def _stream_run(cmd: list[str], cwd: Path):
-    """
-    Executa subprocesso com streaming de stdout/stderr (UTF-8) sem bloquear.
-    Retorna (returncode).
-    """
-    # text=True/universal_newlines garante str; encoding exige Python 3.10+
-    with Popen(
-        cmd,
-        cwd=str(cwd),
-        env=ENV,
-        stdout=PIPE,
-        stderr=PIPE,
-        text=True,
-        universal_newlines=True,
-        bufsize=1,
-    ) as proc:
-        # stream organizado
-        while True:
-            line = proc.stdout.readline()
-            err = proc.stderr.readline()
-            if line:
-                sys.stdout.write(line)
-                sys.stdout.flush()
-            if err:
-                # prefixo ajuda a separar dos prints do importer
-                sys.stdout.write(f"[stderr] {err}")
-                sys.stdout.flush()
-            if not line and not err and proc.poll() is not None:
-                break
-        return proc.returncode
+    base = ["--gdb", str(gdb_path), "--distribuidora", distribuidora, "--ano", str(ano), "--prefixo", prefixo]
+    if camada == "PONNOT":
+        return base + ["--modo-debug"]
+    return base + ["--modo_debug"]
 
 
-def rodar_importer(script_path: str, gdb_path: Path, camada: str, distribuidora: str, ano: int, prefixo: str):
-    # import leve só para checar status (não traz dependências pesadas)
-    try:
-        from packages.jobs.utils.rastreio import get_status
-    except Exception:
-        def get_status(*_a, **_k):  # fallback mudo
-            return None
+def planejar(status: dict | None, fingerprint: str | None) -> tuple[bool, str]:
+    """
+    Decide se a camada roda, a partir do import_status e do fingerprint do .gdb em disco.
+    Retorna (executar, motivo).
+    """
+    if status is None:
+        return True, "novo"
+    anterior, fp = status.get("status"), status.get("fingerprint")
+    if anterior in ("completed", "no_new_rows"):
+        # fp NULL: importado antes de existir fingerprint -> confia no status (comportamento antigo)
+        if fp is None or fp == fingerprint:
+            return False, "ja importado"
+        return True, "gdb substituido (fingerprint mudou)"
+    if fp is not None and fp != fingerprint:
+        return True, f"{anterior} com outro gdb; gdb novo"
+    return True, f"execucao anterior {anterior}"
 
-    status = get_status(prefixo, ano, camada)
-    if status == "completed":
-        tqdm.write(f"[OK] Ja importado: {camada} {prefixo}")
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Execução de subprocessos (asyncio: stdout e stderr drenados ao mesmo tempo)
+# ──────────────────────────────────────────────────────────────────────────────
+class Painel:
+    """
+    Visão combinada: uma barra por subprocesso (alimentada pelo tqdm do filho)
+    + uma barra geral de jobs concluídos. Sem painel, tudo vira linha de log.
+    """
+
+    def __init__(self, total_jobs: int):
+        self.geral = tqdm(total=total_jobs, desc="orquestrador", unit="job", position=0, leave=True)
+        self.barras: dict[str, tqdm] = {}
+        self._posicao: dict[str, int] = {}
+        self._livres: list[int] = []
+
+    def abrir(self, rotulo: str):
+        # reaproveita a linha de uma barra já fechada; senão, a próxima abaixo
+        pos = self._livres.pop(0) if self._livres else len(self.barras) + 1
+        self._posicao[rotulo] = pos
+        self.barras[rotulo] = tqdm(total=100, desc=rotulo, unit="%", position=pos, leave=False,
+                                   bar_format="{desc}: {percentage:3.0f}%|{bar}| {postfix}")
+
+    def progresso(self, rotulo: str, texto: str) -> bool:
+        """Absorve linhas de progresso do tqdm do filho; True = não imprimir."""
+        m = _TQDM_RE.search(texto)
+        barra = self.barras.get(rotulo)
+        if not m or barra is None:
+            return False
+        barra.n = min(int(m.group(1)), 100)
+        barra.set_postfix_str(texto.split("%|")[0].rsplit(":", 1)[0][-30:].strip(), refresh=False)
+        barra.refresh()
+        return True
+
+    def fechar(self, rotulo: str):
+        barra = self.barras.pop(rotulo, None)
+        if barra is not None:
+            self._livres.append(self._posicao.pop(rotulo))
+            barra.close()
+        self.geral.update(1)
+
+    def encerrar(self):
+        for rotulo in list(self.barras):
+            self.barras.pop(rotulo).close()
+        self.geral.close()
+
+
+def _emitir(texto: str, rotulo: str, stderr: bool, painel: Painel | None):
+    texto = texto.rstrip()
+    if not texto:
+        return
+    if painel is not None and painel.progresso(rotulo, texto):
         return
+    prefixo = f"[{rotulo}]" if rotulo else ""
+    # prefixo ajuda a separar dos prints do importer
+    if stderr:
+        prefixo += "[stderr]"
+    tqdm.write(f"{prefixo} {texto}" if prefixo else texto)
+
+
+async def _drenar(stream: asyncio.StreamReader, rotulo: str, stderr: bool, painel: Painel | None):
+    # lê em blocos e quebra em \r ou \n: o tqdm do filho só manda \r entre atualizações
+    pendente = b""
+    while True:
+        bloco = await stream.read(64 * 1024)
+        if not bloco:
+            break
+        *linhas, pendente = re.split(rb"[\r\n]", pendente + bloco)
+        for linha in linhas:
+            _emitir(linha.decode("utf-8", errors="replace"), rotulo, stderr, painel)
+    if pendente:
+        _emitir(pendente.decode("utf-8", errors="replace"), rotulo, stderr, painel)
+
+
+async def executar_streaming(cmd: list[str], cwd: Path, rotulo: str = "", painel: Painel | None = None,
+                   env: dict | None = None) -> int:
+    """
+    Executa subprocesso com streaming de stdout/stderr (UTF-8) sem bloquear:
+    os dois pipes são lidos concorrentemente, então um stderr verboso (tqdm)
+    nunca trava o filho com o buffer cheio. Retorna o returncode.
+    """
+    proc = await asyncio.create_subprocess_exec(*cmd, cwd=str(cwd), env=env or ENV,
+                                                stdout=PIPE, stderr=PIPE)
+    await asyncio.gather(
+        _drenar(proc.stdout, rotulo, False, painel),
+        _drenar(proc.stderr, rotulo, True, painel),
+    )
+    return await proc.wait()
+
 
+def _stream_run(cmd: list[str], cwd: Path, rotulo: str = "") -> int:
+    """Versão síncrona de executar_streaming (um subprocesso, saída prefixada com rotulo)."""
+    return asyncio.run(executar_streaming(cmd, cwd, rotulo))
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Etapas
+# ──────────────────────────────────────────────────────────────────────────────
+def _status_e_fingerprint(alvos: list[tuple[str, Path, str, int]]) -> tuple[dict, dict]:
+    """
+    Uma consulta para todos os (prefixo, ano, camada) + fingerprint de cada .gdb
+    (só stat dos arquivos). Planejar 200 .gdb não abre 800 conexões.
+    """
+    from packages.jobs.utils.gdb_cache import fingerprint_gdb
+    from packages.jobs.utils.rastreio import status_em_lote
+
+    fingerprints = {prefixo: fingerprint_gdb(gdb_dir) for prefixo, gdb_dir, _, _ in alvos}
+    status = status_em_lote([(prefixo, ano, camada) for prefixo, _, _, ano in alvos for camada in CAMADAS])
+    return status, fingerprints
+
+
+async def _rodar_importer(script_path: str, gdb_path: Path, camada: str, distribuidora: str, ano: int,
+                          prefixo: str, painel: Painel | None = None,
+                          fingerprint: str | None = None) -> int | None:
     script_abs = ROOT / script_path
     if not script_abs.exists():
         tqdm.write(f"[ERR] Importer não encontrado: {script_abs}")
-        return
+        return None
 
     args = _build_args(camada, gdb_path, distribuidora, ano, prefixo)
+    rotulo = f"{camada} {prefixo}"
     tqdm.write(f"[RUN] Importando {camada} para {prefixo}")
-
-    rc = _stream_run([PYTHON_EXEC, str(script_abs), *args], cwd=ROOT)
+    if painel is not None:
+        painel.abrir(rotulo)
+    # o importer grava o fingerprint no import_status (rastreio.registrar_status)
+    env = {**ENV, "IMPORT_GDB_FINGERPRINT": fingerprint} if fingerprint else ENV
+    try:
+        rc = await executar_streaming([PYTHON_EXEC, str(script_abs), *args], ROOT, rotulo, painel, env)
+    finally:
+        if painel is not None:
+            painel.fechar(rotulo)
 
     if rc != 0:
         tqdm.write(f"[ERR] Importacao falhou {camada} ({prefixo}) (rc={rc})")
     else:
         tqdm.write(f"[DONE] {camada} {prefixo} importado com sucesso.")
+    return rc
+
+
+def rodar_importer(script_path: str, gdb_path: Path, camada: str, distribuidora: str, ano: int, prefixo: str):
+    status, fingerprints = _status_e_fingerprint([(prefixo, gdb_path, distribuidora, ano)])
+    executar, motivo = planejar(status.get((prefixo, ano, camada)), fingerprints[prefixo])
+    if not executar:
+        tqdm.write(f"[OK] Ja importado: {camada} {prefixo}")
+        return None
+    return asyncio.run(_rodar_importer(script_path, gdb_path, camada, distribuidora, ano, prefixo,
+                                       fingerprint=fingerprints[prefixo]))
+
+
+async def _converter_cache(gdb_path: Path, prefixo: str, painel: Painel | None = None):
+    """
+    Gera/atualiza o cache Parquet do .gdb (no-op se já estiver fresco).
+    Falha aqui não impede o import: os importers caem para o Fiona.
+    """
+    tqdm.write(f"[RUN] Cache Parquet {prefixo}")
+    rotulo = f"cache {prefixo}"
+    if painel is not None:
+        painel.abrir(rotulo)
+    try:
+        rc = await executar_streaming([PYTHON_EXEC, "-m", "packages.jobs.utils.gdb_cache", "--gdb", str(gdb_path)],
+                                      ROOT, rotulo, painel)
+    finally:
+        if painel is not None:
+            painel.fechar(rotulo)
+    if rc != 0:
+        tqdm.write(f"[WARN] Cache Parquet falhou ({prefixo}) (rc={rc}) — importers leem o .gdb direto")
+
+
+def converter_cache(gdb_path: Path, prefixo: str):
+    asyncio.run(_converter_cache(gdb_path, prefixo))
 
 
 def _descobrir_prefixos() -> list[str]:
@@ -124,37 +265,143 @@ def _descobrir_prefixos() -> list[str]:
     return [p.stem for p in DOWNLOADS_DIR.glob("*.gdb")]
 
 
-def orquestrar_importacao():
-    tqdm.write("[INFO] Iniciando orquestrador (streaming)")
+def _parse_prefixo(prefixo: str) -> tuple[str, int] | None:
+    # Prefixo esperado: NOME_UF_YYYY (ex.: CPFL_Paulista_2023)
+    try:
+        return prefixo.rsplit("_", 1)[0], int(prefixo.rsplit("_", 1)[-1])
+    except Exception:
+        tqdm.write(f"[WARN] Prefixo invalido: {prefixo} — use formato NOME_UF_2023")
+        return None
+
 
+async def _orquestrar(paralelo: int):
     prefixos = _descobrir_prefixos()
     if not prefixos:
         tqdm.write(f"[WARN] Nenhum .gdb encontrado em {DOWNLOADS_DIR}")
         return
 
+    alvos = []
     for prefixo in prefixos:
         gdb_dir = DOWNLOADS_DIR / f"{prefixo}.gdb"
         if not gdb_dir.exists():
             tqdm.write(f"[WARN] .gdb nao encontrado: {gdb_dir}")
             continue
+        parsed = _parse_prefixo(prefixo)
+        if parsed:
+            alvos.append((prefixo, gdb_dir, *parsed))
+    if not alvos:
+        return
+
+    status, fingerprints = await asyncio.to_thread(_status_e_fingerprint, alvos)
+    plano = []
+    for prefixo, gdb_dir, distribuidora, ano in alvos:
+        camadas = []
+        for camada in CAMADAS:
+            executar, motivo = planejar(status.get((prefixo, ano, camada)), fingerprints[prefixo])
+            if executar:
+                camadas.append(camada)
+                tqdm.write(f"[PLAN] {camada} {prefixo}: {motivo}")
+            else:
+                tqdm.write(f"[OK] Ja importado: {camada} {prefixo}")
+        if camadas:
+            plano.append((prefixo, gdb_dir, distribuidora, ano, camadas))
+    if not plano:
+        tqdm.write("[INFO] Nada a importar: todos os .gdb já importados com o mesmo fingerprint.")
+        return
 
-        # Prefixo esperado: NOME_UF_YYYY (ex.: CPFL_Paulista_2023)
+    tarefas = await asyncio.to_thread(_planejar_custos, plano, paralelo)
+    painel = Painel(len(tarefas))
+
+    async def _camada(prefixo, gdb_dir, distribuidora, ano, camada):
         try:
-            distribuidora = prefixo.rsplit("_", 1)[0]
-            ano = int(prefixo.rsplit("_", 1)[-1])
-        except Exception:
-            tqdm.write(f"[WARN] Prefixo invalido: {prefixo} — use formato NOME_UF_2023")
-            continue
+            await _rodar_importer(IMPORTERS[camada], gdb_dir, camada, distribuidora, ano, prefixo, painel,
+                                  fingerprints[prefixo])
+        except Exception as e:
+            tqdm.write(f"[ERR] Erro ao rodar {camada} ({prefixo}): {e}")
 
-        for camada in CAMADAS:
+    for (prefixo, etapa), t in tarefas.items():
+        _, gdb_dir, distribuidora, ano, _ = t["alvo"]
+        if etapa == "cache":
+            t["rodar"] = partial(_converter_cache, gdb_dir, prefixo, painel)
+        else:
+            t["rodar"] = partial(_camada, prefixo, gdb_dir, distribuidora, ano, etapa)
+
+    try:
+        await despachar_lpt(tarefas, paralelo)
+    finally:
+        painel.encerrar()
+
+
+def _planejar_custos(plano: list, paralelo: int) -> dict:
+    """
+    Uma tarefa por cache Parquet e por camada, com custo estimado (segundos).
+    Camadas dependem do cache do próprio .gdb (quando GDB_PARQUET_CACHE).
+    """
+    from packages.jobs.utils import custo_import
+
+    historico = custo_import.seg_por_linha_historico()
+    tarefas: dict[tuple[str, str], dict] = {}
+    for alvo in plano:
+        prefixo, gdb_dir, _, _, camadas = alvo
+        linhas = custo_import.contar_features(gdb_dir, CAMADAS, prefixo)
+        deps = {(prefixo, "cache")} if GDB_PARQUET_CACHE else set()
+        if GDB_PARQUET_CACHE:
+            tarefas[(prefixo, "cache")] = {"alvo": alvo, "deps": set(),
+                                           "custo": custo_import.custo_cache(linhas.values())}
+        for camada in camadas:
+            tarefas[(prefixo, camada)] = {"alvo": alvo, "deps": deps,
+                                          "custo": custo_import.custo_import(camada, linhas[camada], historico)}
+
+    # prioridade = custo próprio + custo de quem espera por ela (cache do .gdb com UCBT grande sai antes)
+    for chave, t in tarefas.items():
+        t["prioridade"] = t["custo"] + sum(o["custo"] for o in tarefas.values() if chave in o["deps"])
+
+    _, makespan = custo_import.lpt({k: t["custo"] for k, t in tarefas.items()}, paralelo)
+    tqdm.write(f"[PLAN] {len(tarefas)} tarefas, ~{sum(t['custo'] for t in tarefas.values()) / 60:.0f} min de CPU, "
+               f"makespan estimado ~{makespan / 60:.0f} min com {paralelo} slots")
+    return tarefas
+
+
+async def despachar_lpt(tarefas: dict, paralelo: int):
+    """
+    List scheduling LPT: cada slot livre pega, entre as tarefas prontas (deps
+    concluídas), a de maior prioridade. Falha não bloqueia dependentes: a camada
+    cai para o .gdb quando o cache falha.
+    """
+    pendentes = dict(tarefas)
+    feitas: set = set()
+    cond = asyncio.Condition()
+
+    async def _slot():
+        while True:
+            async with cond:
+                while True:
+                    prontas = [k for k, t in pendentes.items() if t["deps"] <= feitas]
+                    if prontas or not pendentes:
+                        break
+                    await cond.wait()
+                if not prontas:
+                    return
+                chave = max(prontas, key=lambda k: pendentes[k]["prioridade"])
+                tarefa = pendentes.pop(chave)
             try:
-                rodar_importer(IMPORTERS[camada], gdb_dir, camada, distribuidora, ano, prefixo)
-            except Exception as e:
-                tqdm.write(f"[ERR] Erro ao rodar {camada} ({prefixo}): {e}")
-                continue
+                await tarefa["rodar"]()
+            finally:
+                async with cond:
+                    feitas.add(chave)
+                    cond.notify_all()
+
+    await asyncio.gather(*(_slot() for _ in range(max(1, paralelo))))
+
 
+def orquestrar_importacao(paralelo: int = ORQ_PARALELO):
+    tqdm.write(f"[INFO] Iniciando orquestrador (streaming, {paralelo} em paralelo)")
+    asyncio.run(_orquestrar(paralelo))
     tqdm.write("[INFO] Orquestracao finalizada.")
 
 
 if __name__ == "__main__":
-    orquestrar_importacao()
+    ap = argparse.ArgumentParser(description="Roda cache Parquet + importers para todos os .gdb em data/downloads")
+    ap.add_argument("--paralelo", type=int, default=ORQ_PARALELO,
+                    help="subprocessos simultâneos (default: ORQ_PARALELO ou 2)")
+    orquestrar_importacao(ap.parse_args().paralelo)
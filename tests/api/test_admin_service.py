@@ -0,0 +1,32 @@
+# tests/api/test_admin_service.py
+
+from apps.api.services import admin_service
+from apps.api.services.admin_service import ImportacaoPayload
+
+
+def test_enfileirar_importacoes_em_lote(monkeypatch):
+    chamadas = []
+    proximo = iter(range(100, 200))
+
+    def _enqueue_many(payloads, priority=5, available_at=None, depends_on=None, dedup_keys=None):
+        chamadas.append({"payloads": payloads, "depends_on": depends_on, "dedup_keys": dedup_keys})
+        return [next(proximo) for _ in payloads]
+
+    monkeypatch.setattr(admin_service, "enqueue_many", _enqueue_many)
+    out = admin_service.enfileirar_importacoes([
+        ImportacaoPayload(distribuidora="ENEL_SP", ano=2023, camadas=["UCBT", "PONNOT"]),
+        ImportacaoPayload(distribuidora="CPFL", ano=2024, camadas=["ucmt", "XYZ"]),
+    ])
+
+    # 1 INSERT de downloads + 1 de importers, independente do tamanho da seleção
+    assert len(chamadas) == 2
+    assert chamadas[0]["dedup_keys"] == ["download:ENEL_SP:2023", "download:CPFL:2024"]
+    # sem teto por download: só o orçamento de banda do host
+    assert all("max_kbps" not in p["download"] for p in chamadas[0]["payloads"])
+    assert chamadas[1]["dedup_keys"] == ["import:ENEL_SP:2023:UCBT", "import:ENEL_SP:2023:PONNOT",
+                                         "import:CPFL:2024:UCMT"]
+    assert chamadas[1]["depends_on"] == [[100], [100], [101]]
+    assert out == [
+        {"status": "queued", "download_job": 100, "import_jobs": [102, 103]},
+        {"status": "queued", "download_job": 101, "import_jobs": [104]},
+    ]
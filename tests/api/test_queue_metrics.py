@@ -0,0 +1,145 @@
+# tests/api/test_queue_metrics.py
+
+import asyncio
+
+from apps.api.services import queue_metrics_service as qm
+from apps.api.services.queue_metrics_service import formatar_prometheus
+
+
+def _metricas():
+    return {
+        "janela_min": 60,
+        "profundidade": [
+            {"status": "queued", "priority": 5, "jobs": 12, "idade_max_s": 93.5},
+            {"status": "running", "priority": 5, "jobs": 2, "idade_max_s": 10.0},
+        ],
+        "espera_s": {"buckets": [{"le": 1.0, "count": 1}, {"le": 60.0, "count": 3}, {"le": "+Inf", "count": 4}],
+                     "sum": 250.0, "count": 4},
+        "execucao_s": {"buckets": [{"le": 3600.0, "count": 2}, {"le": "+Inf", "count": 2}],
+                       "sum": 1800.0, "count": 2},
+        "vazao": {"done": 5, "failed": 1, "jobs_por_minuto": 0.1, "taxa_retry": 0.3333,
+                  "taxa_falha": 0.1667, "tries_medio": 1.5, "em_retry_agora": 2},
+        "workers": [{"worker_id": "worker-ab12", "ocupado_s": 5400.0, "utilizacao": 1.5, "rodando": 2,
+                     "done": 3, "failed": 0, "ultimo_heartbeat": None}],
+    }
+
+
+def test_formato_prometheus():
+    txt = formatar_prometheus(_metricas())
+    linhas = txt.splitlines()
+
+    assert 'import_queue_jobs{status="queued",priority="5"} 12' in linhas
+    # janela sobe e desce: nada de histogram (exige contadores monotônicos)
+    assert not any(l.endswith(" histogram") for l in linhas)
+    assert "# TYPE import_queue_espera_segundos_janela gauge" in linhas
+    assert 'import_queue_espera_segundos_janela{le="60"} 3' in linhas
+    assert 'import_queue_espera_segundos_janela{le="+Inf"} 4' in linhas
+    assert "import_queue_espera_segundos_janela_jobs 4" in linhas
+    assert "import_queue_espera_segundos_janela_soma 250.000" in linhas
+    assert not any(l.split("{")[0].split(" ")[0].endswith(("_bucket", "_sum", "_count")) for l in linhas)
+    assert 'import_worker_utilizacao{worker="worker-ab12"} 1.5' in linhas
+    assert txt.endswith("\n")
+    # toda métrica declarada tem HELP + TYPE
+    tipos = [l for l in linhas if l.startswith("# TYPE")]
+    assert len(tipos) == len([l for l in linhas if l.startswith("# HELP")])
+
+
+class _Resultado:
+    def __init__(self, linha=None, linhas=None, escalar=None):
+        self._linha, self._linhas, self._escalar = linha, linhas or [], escalar
+
+    def one(self): return self._linha
+    def fetchall(self): return self._linhas
+    def scalar(self): return self._escalar
+
+
+class _Linha:
+    def __init__(self, **kw): self._mapping = kw
+
+
+class FakeSession:
+    def __init__(self, respostas):
+        self.respostas = respostas
+        self.consultas = []
+
+    async def execute(self, sql, params=None):
+        self.consultas.append((" ".join(str(sql).split()), params or {}))
+        return self.respostas.pop(0)
+
+
+def test_histograma_consulta_janela_e_monta_buckets():
+    db = FakeSession([_Resultado(linha=([1, 3, 3], 4, 250.0))])
+    h = asyncio.run(qm._histograma(db, "EXTRACT(EPOCH FROM started_at - available_at)",
+                                   "started_at >= now() - make_interval(secs => :janela)", [1, 60, 300], 3600))
+    sql, params = db.consultas[0]
+    assert "make_interval(secs => :janela)" in sql and "unnest(CAST(:buckets AS double precision[]))" in sql
+    assert params == {"buckets": [1.0, 60.0, 300.0], "janela": 3600}
+    assert h == {"buckets": [{"le": 1.0, "count": 1}, {"le": 60.0, "count": 3}, {"le": 300.0, "count": 3},
+                             {"le": "+Inf", "count": 4}],
+                 "sum": 250.0, "count": 4}
+
+    # janela sem jobs: buckets zerados, +Inf 0
+    db = FakeSession([_Resultado(linha=([0, 0, 0], 0, None))])
+    h = asyncio.run(qm._histograma(db, "1", "true", [1, 60, 300], 60))
+    assert h["buckets"][-1] == {"le": "+Inf", "count": 0} and h["sum"] == 0.0
+
+
+def test_coletar_metricas_fila_usa_a_janela_em_todas_as_consultas():
+    db = FakeSession([
+        _Resultado(linhas=[_Linha(status="queued", priority=5, jobs=3, idade_max_s=12.0)]),
+        _Resultado(linha=([0] * len(qm.BUCKETS_ESPERA), 0, 0)),
+        _Resultado(linha=([0] * len(qm.BUCKETS_EXECUCAO), 0, 0)),
+        _Resultado(linha=(6, 2, 1, 1.25)),
+        _Resultado(escalar=1),
+        _Resultado(linhas=[_Linha(worker_id="w1", ocupado_s=900.0, rodando=1, done=2, failed=0,
+                                  ultimo_heartbeat=None)]),
+        _Resultado(linhas=[]),
+    ])
+    m = asyncio.run(qm.coletar_metricas_fila(db, janela_min=30))
+
+    assert all(p.get("janela", 1800) == 1800 for _, p in db.consultas)
+    assert m["vazao"] == {"done": 6, "failed": 2, "jobs_por_minuto": round(8 / 30, 3), "taxa_retry": 0.125,
+                          "taxa_falha": 0.25, "tries_medio": 1.25, "em_retry_agora": 1}
+    assert m["workers"][0]["utilizacao"] == 0.5
+    assert m["profundidade"] == [{"status": "queued", "priority": 5, "jobs": 3, "idade_max_s": 12.0}]
+    assert "started_at IS NOT NULL" in db.consultas[2][0]
+
+
+def test_worker_ocioso_aparece_pelos_contadores_publicados():
+    import datetime as dt
+
+    hb = dt.datetime(2026, 1, 1, 12, 0, tzinfo=dt.timezone.utc)
+    db = FakeSession([
+        _Resultado(linhas=[]),
+        _Resultado(linha=([0] * len(qm.BUCKETS_ESPERA), 0, 0)),
+        _Resultado(linha=([0] * len(qm.BUCKETS_EXECUCAO), 0, 0)),
+        _Resultado(linha=(0, 0, 0, 0)),
+        _Resultado(escalar=0),
+        # só w1 tem job na janela
+        _Resultado(linhas=[_Linha(worker_id="w1", ocupado_s=1800.0, rodando=1, done=0, failed=0,
+                                  ultimo_heartbeat=hb - dt.timedelta(seconds=30))]),
+        _Resultado(linhas=[
+            _Linha(worker_id="w1", slots=2, ocupados=1, ocupado_s_total=7200.0, rejeicoes_admissao=4,
+                   leases_perdidas=1, heartbeat_em=hb),
+            _Linha(worker_id="w2", slots=4, ocupados=0, ocupado_s_total=0.0, rejeicoes_admissao=0,
+                   leases_perdidas=0, heartbeat_em=hb),
+        ]),
+    ])
+    m = asyncio.run(qm.coletar_metricas_fila(db, janela_min=60))
+
+    assert "FROM import_worker" in db.consultas[-1][0] and db.consultas[-1][1] == {"janela": 3600}
+    w1, w2 = m["workers"]
+    assert w1["utilizacao"] == 0.5 and w1["utilizacao_slots"] == 0.25
+    assert w1["rejeicoes_admissao"] == 4 and w1["leases_perdidas"] == 1 and w1["ultimo_heartbeat"] == hb
+    # ocioso: sem linha na import_queue, mas entra com utilização 0
+    assert w2 == {"worker_id": "w2", "ocupado_s": 0.0, "utilizacao": 0.0, "rodando": 0, "done": 0, "failed": 0,
+                  "ultimo_heartbeat": hb, "slots": 4, "ocupados": 0, "ocupado_s_total": 0.0,
+                  "rejeicoes_admissao": 0, "leases_perdidas": 0, "utilizacao_slots": 0.0}
+
+    linhas = formatar_prometheus(m).splitlines()
+    assert 'import_worker_utilizacao{worker="w2"} 0.0' in linhas
+    assert "# TYPE import_worker_rejeicoes_admissao_total counter" in linhas
+    assert 'import_worker_rejeicoes_admissao_total{worker="w1"} 4' in linhas
+    assert 'import_worker_leases_perdidas_total{worker="w1"} 1' in linhas
+    assert 'import_worker_ocupado_segundos_total{worker="w1"} 7200.0' in linhas
+    assert 'import_worker_slots{worker="w2"} 4' in linhas
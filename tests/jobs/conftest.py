@@ -0,0 +1,82 @@
+# tests/jobs/conftest.py
+"""
+Banco falso (psycopg2) compartilhado pelos testes de jobs.
+
+    conn = banco([resp1, resp2])                    # uma resposta por execute, em ordem
+    conn = banco(responder=lambda sql, params: ...)  # roteada pelo SQL
+    cur = conn.cursor()
+
+Cada execute fica em conn.sqls como (sql com espaços normalizados, params).
+"""
+
+import pytest
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self._row = None
+
+    def __enter__(self): return self
+    def __exit__(self, *a): return False
+
+    def execute(self, sql, params=None):
+        sql = " ".join(sql.split())
+        self.conn.sqls.append((sql, params))
+        self._row = self.conn.responder(sql, params)
+
+    def copy_expert(self, sql, buf):
+        self.conn.sqls.append((" ".join(sql.split()), None))
+        self.conn.copiado = buf.read()
+
+    def fetchone(self):
+        return self._row
+
+    def fetchall(self):
+        return self._row or []
+
+    @property
+    def rowcount(self):
+        return len(self._row) if isinstance(self._row, list) else 1
+
+    # testes que só usam o cursor leem direto dele
+    @property
+    def sqls(self):
+        return self.conn.sqls
+
+    @property
+    def copiado(self):
+        return self.conn.copiado
+
+
+class FakeConn:
+    Cursor = FakeCursor
+
+    def __init__(self, respostas=None, responder=None):
+        self.respostas = list(respostas or [])
+        self._responder = responder
+        self.sqls = []
+        self.commits = 0
+        self.closed = 0
+        self.autocommit = False
+        self.notifies = []
+        self.copiado = None
+
+    def responder(self, sql, params):
+        if self._responder is not None:
+            return self._responder(sql, params)
+        return self.respostas.pop(0) if self.respostas else None
+
+    def __enter__(self): return self
+    def __exit__(self, *a): return False
+
+    def cursor(self, *a, **k): return self.Cursor(self)
+    def commit(self): self.commits += 1
+    def rollback(self): pass
+    def close(self): self.closed = 1
+
+
+@pytest.fixture
+def banco():
+    """Fábrica de FakeConn (banco.Cursor para subclasses do cursor)."""
+    return FakeConn
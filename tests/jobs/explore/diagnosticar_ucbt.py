@@ -2,16 +2,16 @@
 
 
 import sys
-import geopandas as gpd
-from fiona import listlayers
 from pathlib import Path
 
+from packages.jobs.utils import gdb_cache
+
 def diagnosticar_ucbt(caminho_gdb: Path):
     print(f"📁 Verificando GDB: {caminho_gdb}\n")
 
     # Listar todas as camadas
     try:
-        camadas = listlayers(str(caminho_gdb))
+        camadas = gdb_cache.listar_layers(caminho_gdb)
         camada_ucbt = next((c for c in camadas if c.upper().startswith("UCBT")), None)
 
         if not camada_ucbt:
@@ -24,7 +24,7 @@ def diagnosticar_ucbt(caminho_gdb: Path):
         return
 
     try:
-        df = gpd.read_file(str(caminho_gdb), layer=camada_ucbt)
+        df = gdb_cache.ler_layer_ou_gdb(caminho_gdb, camada_ucbt)
         print(f"\n🔸 Camada: {camada_ucbt}")
         print(f"   → {len(df)} registros")
         print(f"   → Colunas: {list(df.columns)}\n")
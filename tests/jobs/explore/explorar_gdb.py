@@ -1,8 +1,9 @@
 import geopandas as gpd
-import fiona
 import json
 from pathlib import Path
 
+from packages.jobs.utils import gdb_cache
+
 def explorar_gdb(gdb_path: str, salvar_json: bool = True) -> dict:
     path = Path(gdb_path)
 
@@ -12,14 +13,17 @@ def explorar_gdb(gdb_path: str, salvar_json: bool = True) -> dict:
     print(f"📂 Explorando Geodatabase: {gdb_path}")
     
     metadata = {}
-    layers = fiona.listlayers(path)
+    layers = gdb_cache.listar_layers(path)
     print(f"🔍 {len(layers)} camadas encontradas: {layers}")
 
     for layer in layers:
         try:
-            df = gpd.read_file(gdb_path, layer=layer, rows=1)
-            metadata[layer] = list(df.columns)
-            print(f"✅ {layer}: {len(df.columns)} colunas")
+            # cache Parquet fresco: colunas vêm do footer, sem abrir o GDB
+            colunas = gdb_cache.colunas_layer(path, layer)
+            if colunas is None:
+                colunas = list(gpd.read_file(gdb_path, layer=layer, rows=1).columns)
+            metadata[layer] = colunas
+            print(f"✅ {layer}: {len(colunas)} colunas")
         except Exception as e:
             metadata[layer] = f"Erro: {str(e)}"
             print(f"❌ {layer}: Erro ao ler - {str(e)}")
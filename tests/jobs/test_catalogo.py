@@ -0,0 +1,54 @@
+# tests/jobs/test_catalogo.py
+
+from datetime import datetime
+
+import pytest
+
+from packages.jobs.download import catalogo
+
+
+@pytest.fixture(autouse=True)
+def sem_schema(monkeypatch):
+    monkeypatch.setattr(catalogo, "_schema_aplicado", True)
+    monkeypatch.setattr(catalogo, "_trgm", {})
+
+
+def test_chave_canonica_e_ano_do_titulo():
+    assert catalogo.chave_distribuidora("ENEL DISTRIBUIÇÃO SP") == "ENEL_SP"
+    assert catalogo.chave_distribuidora("Eletropaulo") == "ENEL_SP"
+    assert catalogo.chave_distribuidora("CPFL Paulista") == "CPFL_PAULISTA"
+    assert catalogo.extrair_distribuidora_ano("CPFL PAULISTA - 2023-12-31") == ("CPFL_PAULISTA", 2023)
+    assert catalogo.extrair_distribuidora_ano("BDGD Light 2022") == ("BDGD_LIGHT", 2022)
+    # sem ano no título: o da data do catálogo
+    assert catalogo.extrair_distribuidora_ano("EDP SP", datetime(2024, 5, 1)) == ("EDP_SP", 2024)
+
+
+def test_resolve_por_igualdade_sem_fallback(banco):
+    item = {"id": 7, "title": "ENEL SP - 2023-12-31", "url": "u", "foi_importado": False}
+    cur = banco([{"catalogo": 10, "indice": 10}, item]).cursor()
+    assert catalogo.resolver_dataset(cur, "Enel Distribuição SP", 2023) == item
+
+    sql, params = cur.sqls[1]
+    assert "WHERE i.distribuidora = %s AND i.ano = %s" in sql and "ILIKE" not in sql
+    assert params == ("ENEL_SP", 2023)
+    assert len(cur.sqls) == 2
+
+
+def test_fallback_trigram_e_sincronizacao_incremental(monkeypatch, banco):
+    indexados = []
+    monkeypatch.setattr(catalogo, "indexar_catalogo", lambda cur, desde_id=None: indexados.append(desde_id) or 2)
+    item = {"id": 12, "title": "Light SESA - 2023", "url": "u"}
+    cur = banco([{"catalogo": 12, "indice": 10}, None, {"esquema": "public"}, item]).cursor()
+
+    assert catalogo.resolver_dataset(cur, "LIGHT", 2023) == item
+    assert indexados == [10]  # só os ids novos do catálogo
+    sql, params = cur.sqls[-1]
+    assert "OPERATOR(public.<%%)" in sql and "public.word_similarity" in sql
+    assert params == (2023, "light", "light")
+
+
+def test_fallback_like_sem_pg_trgm(banco):
+    cur = banco([{"catalogo": 3, "indice": 3}, None, None, None]).cursor()
+    assert catalogo.resolver_dataset(cur, "CPFL_SANTA_CRUZ", 2021) is None
+    sql, params = cur.sqls[-1]
+    assert "i.titulo_norm LIKE %s" in sql and params == (2021, "%cpfl santa cruz%")
@@ -0,0 +1,64 @@
+# tests/jobs/test_custo_import.py
+
+import pytest
+
+from packages.jobs.utils import custo_import as ci
+
+
+def test_layer_da_camada():
+    layers = ["SSDBT", "UCBT_tab", "UCMT", "PONNOT", "UCAT_tab"]
+    assert ci.layer_da_camada(layers, "UCBT") == "UCBT_tab"
+    assert ci.layer_da_camada(layers, "UCMT") == "UCMT"
+    assert ci.layer_da_camada(["PON_NOT"], "PONNOT") == "PON_NOT"
+    assert ci.layer_da_camada(layers, "XYZ") is None
+
+
+def test_custo_usa_historico_e_default():
+    assert ci.custo_import("UCBT", 1_000_000, {"UCBT": 1e-3}) == pytest.approx(ci.SEG_FIXO_JOB + 1000)
+    padrao = ci.custo_import("UCBT", 1_000_000, {})
+    assert padrao == pytest.approx(ci.SEG_FIXO_JOB + ci.SEG_POR_LINHA_PADRAO["UCBT"] * 1_000_000)
+    assert ci.custo_import("UCMT", None, {}) > ci.SEG_FIXO_JOB
+
+
+def test_lpt_maior_primeiro_e_makespan():
+    ordem, makespan = ci.lpt({"a": 2, "b": 10, "c": 3, "d": 7}, slots=2)
+    assert ordem == ["b", "d", "c", "a"]
+    # slot1: b(10); slot2: d(7)+c(3)=10 -> a(2) vai para qualquer um
+    assert makespan == 12
+    assert ci.lpt({"a": 5}, slots=0)[1] == 5
+
+
+def test_historico_divide_pelas_features_lidas(monkeypatch):
+    from contextlib import contextmanager
+
+    from packages.database import connection
+
+    consultas = []
+
+    class _Cur:
+        def execute(self, sql, params=None):
+            consultas.append((" ".join(sql.split()), params))
+
+        def fetchall(self):
+            return [{"camada": "UCBT", "seg_linha": 2e-4}, {"camada": "PONNOT", "seg_linha": None}]
+
+    @contextmanager
+    def _cursor(*a, **k):
+        yield _Cur()
+
+    monkeypatch.setattr(connection, "get_db_cursor", _cursor)
+    assert ci.seg_por_linha_historico(dias=30) == {"UCBT": 2e-4}
+    sql, params = consultas[0]
+    # não MAX(linhas) de todas as etapas: copy/to_csv contam as séries mensais também
+    assert "MAX(linhas) FILTER (WHERE etapa IN ('read', 'scan')) AS linhas" in sql
+    assert params == (30,)
+
+
+def test_ponnot_registra_read_com_as_features_da_origem():
+    from packages.jobs.importers import importer_ponnot_job as ponnot
+    from packages.jobs.utils.import_metrics import MetricasImport
+
+    m = MetricasImport(None, "PONNOT")
+    chunks = list(m.medir_iter("read", ponnot._em_chunks(iter(range(12)), 5)))
+    assert [len(c) for c in chunks] == [5, 5, 2]
+    assert m.etapas["read"]["linhas"] == 12 and m.chunk == 3
@@ -0,0 +1,92 @@
+# tests/jobs/test_dag.py
+
+import pytest
+
+from packages.orquestrator import dag
+from packages.orquestrator.dag import Etapa
+
+
+@pytest.fixture
+def projeto(tmp_path, monkeypatch):
+    monkeypatch.setattr(dag, "ROOT", tmp_path)
+    monkeypatch.setattr(dag, "DAG_STATE_DIR", tmp_path / "estado")
+    monkeypatch.setattr(dag.tqdm, "write", lambda *a, **k: None)
+    (tmp_path / "out").mkdir()
+    (tmp_path / "in.txt").write_text("v1")
+    return tmp_path
+
+
+def _script(root, nome, corpo):
+    path = root / f"{nome}.py"
+    path.write_text("import pathlib, sys\nr = pathlib.Path(sys.argv[0]).parent\n" + corpo)
+    return path.name
+
+
+def _etapas(root, falhar_a=False):
+    a = _script(root, "a", ("sys.exit(3)\n" if falhar_a else "")
+                + "(r / 'out/a.txt').write_text((r / 'in.txt').read_text() + '-a')\n")
+    b = _script(root, "b", "(r / 'out/b.txt').write_text((r / 'out/a.txt').read_text() + '-b')\n")
+    c = _script(root, "c", "(r / 'out/c.txt').write_text((r / 'out/a.txt').read_text() + '-c')\n")
+    return [
+        Etapa("a", a, entradas=["in.txt"], saidas=["out/a.txt"]),
+        Etapa("b", b, entradas=["out/a.txt"], saidas=["out/b*.txt"]),
+        Etapa("c", c, entradas=["out/a.txt"], saidas=["out/c.txt"]),
+    ]
+
+
+def test_dependencias_inferidas():
+    etapas = [
+        Etapa("prior", "x.py", entradas=["tabela:intel_lead.lead_bruto"], saidas=["tabela:intel_lead.lead_bruto"]),
+        Etapa("doc", "y.py", entradas=["data/x.json"], saidas=["data/doc.md"]),
+        Etapa("mover", "z.py", entradas=["tabela:intel_lead.lead_bruto"], saidas=["tabela:intel_lead.lead_passivo"]),
+    ]
+    assert dag.resolver_dependencias(etapas) == {"prior": set(), "doc": set(), "mover": {"prior"}}
+    with pytest.raises(ValueError):
+        dag.resolver_dependencias([Etapa("a", "a.py", depende=["nada"])])
+
+
+def test_pula_etapas_com_entradas_inalteradas(projeto):
+    etapas = _etapas(projeto)
+    assert dag.rodar_dag("t", etapas, paralelo=2) == {"a": "ok", "b": "ok", "c": "ok"}
+    assert (projeto / "out/b.txt").read_text() == "v1-a-b"
+
+    assert dag.rodar_dag("t", etapas, paralelo=2) == {"a": "pulada", "b": "pulada", "c": "pulada"}
+
+    # saída apagada: só a etapa dona dela roda de novo
+    (projeto / "out/c.txt").unlink()
+    assert dag.rodar_dag("t", etapas, paralelo=2) == {"a": "pulada", "b": "pulada", "c": "ok"}
+
+    # entrada mudou: a roda e, como a.txt mudou, b e c também
+    (projeto / "in.txt").write_text("v2")
+    assert dag.rodar_dag("t", etapas, paralelo=2) == {"a": "ok", "b": "ok", "c": "ok"}
+    assert (projeto / "out/c.txt").read_text() == "v2-a-c"
+
+
+def test_falha_pula_dependentes(projeto):
+    res = dag.rodar_dag("t", _etapas(projeto, falhar_a=True), paralelo=2)
+    assert res == {"a": "falhou", "b": "pulada_por_falha", "c": "pulada_por_falha"}
+    assert not (projeto / "estado" / "t.json").exists()
+
+
+def test_enriquecimento_real_pula_na_segunda_vez(projeto, monkeypatch):
+    from packages.orquestrator.orquestrador_enriquecimento_job import ETAPAS
+
+    # banco falso: cada execução de etapa "escreve" nas suas tabelas de saída
+    versoes = {}
+    por_script = {str(projeto / e.script): e for e in ETAPAS}
+
+    async def _executar(cmd, cwd, rotulo=""):
+        for s in por_script[cmd[1]].saidas:
+            versoes[s] = versoes.get(s, 0) + 1
+        return 0
+
+    monkeypatch.setattr(dag, "executar_streaming", _executar)
+    monkeypatch.setattr(dag, "_assinaturas_banco", lambda recursos: {r: str(versoes.get(r, 0)) for r in recursos})
+
+    todas = {e.nome: "ok" for e in ETAPAS}
+    assert dag.rodar_dag("enriquecimento", ETAPAS) == todas
+    # mover escreveu lead_bruto depois de priorizar: nada mudou fora do pipeline, tudo pula
+    assert dag.rodar_dag("enriquecimento", ETAPAS) == {e.nome: "pulada" for e in ETAPAS}
+
+    versoes["tabela:intel_lead.lead_energia"] += 1  # import novo
+    assert dag.rodar_dag("enriquecimento", ETAPAS) == todas
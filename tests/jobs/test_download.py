@@ -0,0 +1,391 @@
+# tests/jobs/test_download.py
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from packages.jobs.download import download_gdb as dg
+from packages.jobs.download.banda import LimiteBanda
+
+DADOS = os.urandom(1024 * 1024 + 123)
+
+
+@pytest.fixture
+def servidor():
+    """Servidor HTTP local; `estado` controla Range e registra o que foi servido."""
+    estado = {"ranges": True, "ignora_range_no_get": False, "pedidos": [], "bytes": 0,
+              "dados": DADOS, "etag": None, "heads": [], "kbps_por_conexao": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *a):
+            pass
+
+        def _cabecalhos(self, status, tamanho, extra=None):
+            self.send_response(status)
+            self.send_header("Content-Length", str(tamanho))
+            if estado["etag"]:
+                self.send_header("ETag", estado["etag"])
+            if estado["ranges"]:
+                self.send_header("Accept-Ranges", "bytes")
+            for k, v in (extra or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+
+        def do_HEAD(self):
+            inm = self.headers.get("If-None-Match")
+            estado["heads"].append(inm)
+            if inm and inm == estado["etag"]:
+                self._cabecalhos(304, 0)
+            else:
+                self._cabecalhos(200, len(estado["dados"]))
+
+        def do_GET(self):
+            rng = self.headers.get("Range")
+            estado["pedidos"].append(rng)
+            dados = estado["dados"]
+            m = re.match(r"bytes=(\d+)-(\d*)", rng or "")
+            if m and estado["ranges"] and not estado["ignora_range_no_get"]:
+                ini = int(m.group(1))
+                fim = int(m.group(2)) if m.group(2) else len(dados) - 1
+                corpo = dados[ini:fim + 1]
+                self._cabecalhos(206, len(corpo), {"Content-Range": f"bytes {ini}-{fim}/{len(dados)}"})
+            else:
+                corpo = dados
+                self._cabecalhos(200, len(corpo))
+            estado["bytes"] += len(corpo)
+            if not estado["kbps_por_conexao"]:
+                self.wfile.write(corpo)
+                return
+            # origem que limita cada conexão (o caso que a segmentação resolve)
+            passo = 16 * 1024
+            for i in range(0, len(corpo), passo):
+                self.wfile.write(corpo[i:i + passo])
+                time.sleep(passo / (estado["kbps_por_conexao"] * 1024))
+
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    t = threading.Thread(target=srv.serve_forever, daemon=True)
+    t.start()
+    estado["url"] = f"http://127.0.0.1:{srv.server_address[1]}/bdgd.zip"
+    yield estado
+    srv.shutdown()
+    srv.server_close()
+
+
+@pytest.fixture(autouse=True)
+def sem_limite_do_host(monkeypatch):
+    monkeypatch.setattr(dg, "limite_do_host", lambda: None)
+    monkeypatch.setattr(dg, "DOWNLOAD_SEGMENTO_MIN", 64 * 1024)
+
+
+def test_download_segmentado(servidor, tmp_path):
+    destino = tmp_path / "a.zip"
+    _, sha256 = dg._baixar_resumivel(servidor["url"], destino, max_kbps=0, segmentos=4)
+    assert destino.read_bytes() == DADOS
+    assert sha256 == hashlib.sha256(DADOS).hexdigest()
+    assert len(servidor["pedidos"]) == 4 and all(p.startswith("bytes=") for p in servidor["pedidos"])
+    assert not (tmp_path / "a.zip.part.segs").exists()
+
+
+def test_retoma_por_segmento(servidor, tmp_path):
+    destino = tmp_path / "a.zip"
+    parcial = tmp_path / "a.zip.part"
+    segs = dg._planejar_segmentos(len(DADOS), 4)
+    # 1º segmento completo e metade do 2º já no disco
+    segs[0][2] = segs[0][1] - segs[0][0] + 1
+    segs[1][2] = 1000
+    with open(parcial, "wb") as f:
+        f.truncate(len(DADOS))
+        f.write(DADOS[:segs[0][1] + 1])
+        f.seek(segs[1][0])
+        f.write(DADOS[segs[1][0]:segs[1][0] + 1000])
+    dg._gravar_segmentos(parcial.with_suffix(".part.segs"), servidor["url"], len(DADOS), segs)
+
+    _, sha256 = dg._baixar_resumivel(servidor["url"], destino, max_kbps=0, segmentos=4)
+    assert destino.read_bytes() == DADOS
+    assert sha256 == hashlib.sha256(DADOS).hexdigest()
+    assert servidor["bytes"] == len(DADOS) - (segs[0][1] + 1) - 1000
+    assert f"bytes={segs[1][0] + 1000}-{segs[1][1]}" in servidor["pedidos"]
+
+
+def test_sem_range_usa_stream_unico(servidor, tmp_path):
+    servidor["ranges"] = False
+    destino = tmp_path / "a.zip"
+    _, sha256 = dg._baixar_resumivel(servidor["url"], destino, max_kbps=0, segmentos=4)
+    assert destino.read_bytes() == DADOS
+    assert sha256 == hashlib.sha256(DADOS).hexdigest()
+    assert servidor["pedidos"] == [None]
+
+
+def test_get_que_ignora_range_cai_para_stream_unico(servidor, tmp_path):
+    servidor["ignora_range_no_get"] = True
+    destino = tmp_path / "a.zip"
+    dg._baixar_resumivel(servidor["url"], destino, max_kbps=0, segmentos=2)
+    assert destino.read_bytes() == DADOS
+    assert servidor["pedidos"][-1] is None
+
+
+def test_segmentos_aceleram_sob_o_orcamento_do_host(servidor, tmp_path, monkeypatch):
+    host = LimiteBanda(8192)
+    monkeypatch.setattr(dg, "limite_do_host", lambda: host)
+    # sem max_kbps o único limitador é o do host
+    assert dg._limites(None) == [host]
+    servidor.update(dados=DADOS[:256 * 1024], kbps_por_conexao=256)
+
+    def _tempo(segmentos, nome):
+        t0 = time.perf_counter()
+        _, sha256 = dg._baixar_resumivel(servidor["url"], tmp_path / nome, segmentos=segmentos)
+        assert sha256 == hashlib.sha256(servidor["dados"]).hexdigest()
+        return time.perf_counter() - t0
+
+    um, dois = _tempo(1, "um.zip"), _tempo(2, "dois.zip")
+    assert dois < um * 0.75
+
+
+def test_limite_de_banda_compartilhado_por_arquivo(tmp_path):
+    arquivo = tmp_path / "banda.lock"
+    # dois "processos" (instâncias independentes) dividem 1 MB/s
+    a = LimiteBanda(1024, arquivo=arquivo, rajada_s=0)
+    b = LimiteBanda(1024, arquivo=arquivo, rajada_s=0)
+
+    def _baixar(limite):
+        for _ in range(8):
+            limite.consumir(32 * 1024)
+
+    t0 = time.monotonic()
+    ts = [threading.Thread(target=_baixar, args=(x,)) for x in (a, b)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    # 512 KB a 1 MB/s no total ~ 0.5 s (cada um sozinho levaria 0.25 s)
+    assert time.monotonic() - t0 >= 0.45
+
+
+def test_extrai_so_a_pasta_gdb_direto_no_destino(tmp_path):
+    zpath = tmp_path / "base.zip"
+    with zipfile.ZipFile(zpath, "w") as z:
+        z.writestr("LEIAME.pdf", b"x" * 1000)
+        z.writestr("shp/rede.shp", b"y" * 1000)
+        z.writestr("Entrega/ENEL_2023.gdb/a00000001.gdbtable", b"tabela")
+        z.writestr("Entrega/ENEL_2023.gdb/sub/a00000001.gdbtablx", b"indice")
+
+    final = tmp_path / "ENEL_SP_2023.gdb"
+    assert dg._extrair_zip_para_gdb(zpath, final) == final
+    assert sorted(p.relative_to(final).as_posix() for p in final.rglob("*") if p.is_file()) == [
+        "a00000001.gdbtable", "sub/a00000001.gdbtablx"]
+    assert (final / "a00000001.gdbtable").read_bytes() == b"tabela"
+    assert not (tmp_path / "ENEL_SP_2023.gdb.partial").exists()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["ENEL_SP_2023.gdb", "base.zip"]
+
+
+def test_extracao_sem_gdb_nao_deixa_parcial(tmp_path):
+    zpath = tmp_path / "base.zip"
+    with zipfile.ZipFile(zpath, "w") as z:
+        z.writestr("rede.shp", b"y")
+    with pytest.raises(RuntimeError):
+        dg._extrair_zip_para_gdb(zpath, tmp_path / "X.gdb")
+    assert not (tmp_path / "X.gdb.partial").exists() and not (tmp_path / "X.gdb").exists()
+
+
+def _zip_gdb(conteudo: bytes) -> bytes:
+    import io
+
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as z:
+        z.writestr("BASE.gdb/a00000001.gdbtable", conteudo)
+    return buf.getvalue()
+
+
+@pytest.fixture
+def conn_log(banco):
+    """download_log falso: todo INSERT ... RETURNING id devolve 1."""
+    return lambda: banco(responder=lambda sql, params: [1])
+
+
+def test_cache_revalida_com_etag_e_reaproveita_entre_destinos(servidor, tmp_path, monkeypatch, conn_log):
+    from packages.jobs.download import cache
+
+    monkeypatch.setattr(dg, "DOWNLOAD_DIR", tmp_path / "downloads")
+    monkeypatch.setattr(cache, "CACHE_DIR", tmp_path / "cache")
+    monkeypatch.setattr(dg, "get_db_connection", conn_log)
+    servidor.update(dados=_zip_gdb(b"v1"), etag='"v1"')
+
+    gdb = dg.baixar_gdb("ENEL SP", 2023, url=servidor["url"])
+    assert (gdb / "a00000001.gdbtable").read_bytes() == b"v1"
+    meta = cache.ler_meta(dg._url_hash(servidor["url"]))
+    assert meta["etag"] == '"v1"' and meta["extraido"] == {"ENEL_SP_2023": meta["sha256"]}
+
+    # inalterado: só o HEAD condicional, nenhum GET
+    servidor["pedidos"].clear()
+    assert dg.baixar_gdb("ENEL SP", 2023, url=servidor["url"]) == gdb
+    assert servidor["pedidos"] == [] and servidor["heads"][-1] == '"v1"'
+
+    # outro nome_destino, mesma URL: extrai do cache sem baixar
+    outro = dg.baixar_gdb("ENEL SP", 2023, url=servidor["url"], nome_destino="ENEL_SP_2023_b")
+    assert servidor["pedidos"] == [] and (outro / "a00000001.gdbtable").read_bytes() == b"v1"
+
+    # origem mudou: ETag novo -> baixa de novo e re-extrai
+    servidor.update(dados=_zip_gdb(b"v2"), etag='"v2"')
+    assert dg.baixar_gdb("ENEL SP", 2023, url=servidor["url"]) == gdb
+    assert servidor["pedidos"] and (gdb / "a00000001.gdbtable").read_bytes() == b"v2"
+
+
+def test_versao_nova_interrompida_retoma_o_parcial(servidor, tmp_path, monkeypatch):
+    from packages.jobs.download import cache
+
+    monkeypatch.setattr(cache, "CACHE_DIR", tmp_path / "cache")
+    url_hash = dg._url_hash(servidor["url"])
+    v1, v2 = _zip_gdb(b"v1" * 50), _zip_gdb(b"v2" * 50)
+    servidor.update(dados=v1, etag='"v1"')
+    meta = dg._obter_no_cache(servidor["url"], url_hash, None, True, 0)
+    assert "baixando" not in meta
+
+    # origem publica v2; o download cai no meio
+    servidor.update(dados=v2, etag='"v2"')
+    real = dg._baixar_resumivel
+
+    def _cai(url, destino, **kw):
+        destino.with_suffix(destino.suffix + ".part").write_bytes(v2[:100])
+        raise ConnectionError("caiu")
+
+    monkeypatch.setattr(dg, "_baixar_resumivel", _cai)
+    with pytest.raises(ConnectionError):
+        dg._obter_no_cache(servidor["url"], url_hash, meta, True, 0)
+    monkeypatch.setattr(dg, "_baixar_resumivel", real)
+    meta = cache.ler_meta(url_hash)
+    assert meta["baixando"]["etag"] == '"v2"' and meta["etag"] == '"v1"'
+
+    # mesma versão em curso: retoma do byte 100, não descarta o .part
+    servidor["pedidos"].clear()
+    meta = dg._obter_no_cache(servidor["url"], url_hash, meta, True, 0)
+    assert servidor["pedidos"] == ["bytes=100-"]
+    assert meta["sha256"] == hashlib.sha256(v2).hexdigest() and meta["etag"] == '"v2"'
+    assert "baixando" not in cache.ler_meta(url_hash)
+
+
+def test_parcial_de_outra_versao_e_descartado(servidor, tmp_path, monkeypatch):
+    from packages.jobs.download import cache
+
+    monkeypatch.setattr(cache, "CACHE_DIR", tmp_path / "cache")
+    url_hash = dg._url_hash(servidor["url"])
+    v3 = _zip_gdb(b"v3" * 50)
+    servidor.update(dados=v3, etag='"v3"')
+    cache.arquivo(url_hash).parent.mkdir(parents=True)
+    cache.arquivo(url_hash).with_suffix(".part").write_bytes(b"x" * 100)  # restos do v2
+    meta = {"url": servidor["url"], "etag": '"v1"', "sha256": "antigo",
+            "baixando": {"etag": '"v2"', "last_modified": None, "tamanho_remoto": 999}}
+
+    meta = dg._obter_no_cache(servidor["url"], url_hash, meta, True, 0)
+    assert servidor["pedidos"] == [None]
+    assert meta["sha256"] == hashlib.sha256(v3).hexdigest()
+
+
+def test_gdb_existente_sem_banco_ou_rede_segue_em_uso(tmp_path, monkeypatch, conn_log):
+    from packages.jobs.download import cache
+
+    monkeypatch.setattr(dg, "DOWNLOAD_DIR", tmp_path / "downloads")
+    monkeypatch.setattr(cache, "CACHE_DIR", tmp_path / "cache")
+    gdb = tmp_path / "downloads" / "ENEL_SP_2023.gdb"
+    gdb.mkdir(parents=True)
+    (gdb / "a00000001.gdbtable").write_bytes(b"bom")
+
+    def _sem_banco():
+        raise ConnectionError("banco fora")
+
+    monkeypatch.setattr(dg, "get_db_connection", _sem_banco)
+    assert dg.baixar_gdb("ENEL SP", 2023, url="http://127.0.0.1:1/x.zip") == gdb
+
+    # banco ok, origem fora do ar: não adota, não baixa, não apaga o .gdb
+    monkeypatch.setattr(dg, "get_db_connection", conn_log)
+    assert dg.baixar_gdb("ENEL SP", 2023, url="http://127.0.0.1:1/x.zip") == gdb
+    assert (gdb / "a00000001.gdbtable").read_bytes() == b"bom"
+    assert cache.ler_meta(dg._url_hash("http://127.0.0.1:1/x.zip")) is None
+
+    # sem .gdb em disco a falha sobe
+    with pytest.raises(Exception):
+        dg.baixar_gdb("CPFL", 2023, url="http://127.0.0.1:1/x.zip")
+
+
+def test_cancelar_para_o_download_e_deixa_o_parcial_para_retomada(servidor, tmp_path):
+    servidor["kbps_por_conexao"] = 512
+    destino = tmp_path / "a.zip"
+    cancelar = threading.Event()
+    threading.Timer(0.3, cancelar.set).start()
+
+    with pytest.raises(dg.DownloadCancelado):
+        dg._baixar_resumivel(servidor["url"], destino, segmentos=4, cancelar=cancelar)
+    assert not destino.exists()
+    segs = json.loads((tmp_path / "a.zip.part.segs").read_text())["segmentos"]
+    feitos = sum(s[2] for s in segs)
+    # parou no próximo chunk, não no fim (~0,5 s por segmento a 512 KB/s)
+    assert 0 < feitos < len(DADOS)
+
+    # quem pegar o job depois continua do mesmo .part
+    servidor.update(kbps_por_conexao=0, bytes=0)
+    _, sha256 = dg._baixar_resumivel(servidor["url"], destino, segmentos=4)
+    assert sha256 == hashlib.sha256(DADOS).hexdigest()
+    assert servidor["bytes"] == len(DADOS) - feitos
+
+
+def test_cancelado_nao_cai_no_gdb_existente(tmp_path, monkeypatch):
+    monkeypatch.setattr(dg, "DOWNLOAD_DIR", tmp_path)
+    (tmp_path / "ENEL_SP_2023.gdb").mkdir()
+
+    def _cancelado(*a):
+        raise dg.DownloadCancelado("download cancelado")
+
+    monkeypatch.setattr(dg, "_baixar_gdb", _cancelado)
+    with pytest.raises(dg.DownloadCancelado):
+        dg.baixar_gdb("ENEL SP", 2023, url="http://127.0.0.1:1/x.zip")
+
+
+def test_url_hash_igual_ao_do_catalogo():
+    from packages.jobs.download import sync_catalogo
+
+    df = sync_catalogo.itens_para_df([{"results": [{"id": "abc", "title": "t", "created": 0, "modified": 0}]}])
+    # mesma URL, mesmo diretório de cache, viesse do catálogo ou não
+    assert df["url_hash"].tolist() == [dg._url_hash(df["url"][0])]
+
+
+def test_mudou_pelo_validador_mais_forte():
+    from packages.jobs.download import cache
+
+    meta = {"etag": '"a"', "last_modified": "Mon, 01 Jan 2024 00:00:00 GMT", "tamanho_remoto": 10}
+    assert cache.mudou(meta, 304, {}) is False
+    assert cache.mudou(meta, 200, {"ETag": '"b"', "Last-Modified": meta["last_modified"]}) is True
+    assert cache.mudou(meta, 200, {"ETag": '"a"', "Content-Length": "99"}) is False
+    assert cache.mudou(meta, 200, {"Content-Length": "11"}) is True
+    assert cache.mudou(meta, 200, {}) is False
+
+
+def test_retomada_em_stream_unico_inclui_prefixo_no_digest(servidor, tmp_path):
+    destino = tmp_path / "a.zip"
+    (tmp_path / "a.zip.part").write_bytes(DADOS[:5000])
+    _, sha256 = dg._baixar_resumivel(servidor["url"], destino, max_kbps=0, segmentos=1)
+    assert servidor["pedidos"] == ["bytes=5000-"]
+    assert sha256 == hashlib.sha256(DADOS).hexdigest()
+
+
+def test_extracao_detecta_crc_e_truncamento(tmp_path):
+    zpath = tmp_path / "base.zip"
+    with zipfile.ZipFile(zpath, "w", compression=zipfile.ZIP_STORED) as z:
+        z.writestr("X.gdb/a00000001.gdbtable", b"A" * 4096)
+    bruto = bytearray(zpath.read_bytes())
+    # corrompe um byte do conteúdo (armazenado sem compressão): só o CRC pega
+    i = bruto.index(b"A" * 4096)
+    bruto[i + 100] = ord("B")
+    zpath.write_bytes(bytes(bruto))
+    with pytest.raises(zipfile.BadZipFile, match="CRC"):
+        dg._extrair_zip_para_gdb(zpath, tmp_path / "X.gdb")
+    assert not (tmp_path / "X.gdb.partial").exists() and not (tmp_path / "X.gdb").exists()
+
+    zpath.write_bytes(bytes(bruto[:i + 10]))
+    with pytest.raises(zipfile.BadZipFile):
+        dg._extrair_zip_para_gdb(zpath, tmp_path / "X.gdb")
@@ -0,0 +1,100 @@
+# tests/jobs/test_enrich_cnpj.py
+
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+
+from packages.jobs.enrichers import enrich_cnpj_job as ec
+
+
+@pytest.fixture
+def lotes(monkeypatch):
+    """Captura as escritas em lote (execute_values/execute_batch) em vez do banco."""
+    gravados = {"logs": [], "updates": [], "lotes": 0}
+
+    def _values(cur, sql, linhas, page_size=None):
+        gravados["logs"].extend(linhas)
+        gravados["lotes"] += 1
+
+    def _batch(cur, sql, linhas, page_size=None):
+        gravados["updates"].extend(linhas)
+
+    monkeypatch.setattr(ec, "execute_values", _values)
+    monkeypatch.setattr(ec, "execute_batch", _batch)
+    monkeypatch.setattr(ec, "CNPJA_BACKOFF_BASE_S", 0.01)
+    return gravados
+
+
+def _rodar_com_api(handler, conn, lead_ids, concorrencia=4):
+    """Sobe a API falsa em localhost, aponta o job para ela e roda o enriquecimento."""
+    async def _main():
+        app = web.Application()
+        app.router.add_get("/companies", handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        porta = site._server.sockets[0].getsockname()[1]
+        ec.CNPJA_BASE_URL = f"http://127.0.0.1:{porta}/companies"
+        try:
+            return await ec._enriquecer(conn, lead_ids, concorrencia)
+        finally:
+            await runner.cleanup()
+
+    original = ec.CNPJA_BASE_URL
+    try:
+        return asyncio.run(_main())
+    finally:
+        ec.CNPJA_BASE_URL = original
+
+
+def test_retentativas_429_5xx_e_escrita_em_lote(lotes, monkeypatch, banco):
+    monkeypatch.setattr(ec, "CNPJA_RPM", 0)  # sem rate limit neste teste
+    pedidos = {}
+
+    async def handler(request):
+        q = request.query["q"]
+        pedidos[q] = pedidos.get(q, 0) + 1
+        if q == "Rua A, 1" and pedidos[q] == 1:
+            return web.Response(status=429, headers={"Retry-After": "0"})
+        if q == "Rua B, 2" and pedidos[q] < 3:
+            return web.Response(status=503)
+        if q == "Rua C, 3":
+            return web.json_response({"data": []})
+        if q == "Rua D, 4":
+            return web.Response(status=400, text="endereço inválido")
+        return web.json_response({"data": [{"cnpj": f"cnpj-{q}", "cnae": {"code": 1, "description": "x"}}]})
+
+    enderecos = [("L1", "Rua A, 1"), ("L2", "Rua B, 2"), ("L3", "Rua C, 3"), ("L4", "Rua D, 4"), ("L5", "Rua A, 1")]
+    conn = banco(responder=lambda sql, params: enderecos)
+    resumo = _rodar_com_api(handler, conn, ["L1", "L2", "L3", "L4", "L5", "L6"])
+
+    assert resumo == {"atualizados": 3, "sem_endereco": 1, "sem_empresa": 1, "erros": 1}
+    # L1 e L5 no mesmo endereço: uma consulta (+1 retentativa do 429)
+    assert pedidos == {"Rua A, 1": 2, "Rua B, 2": 3, "Rua C, 3": 1, "Rua D, 4": 1}
+    # endereços numa consulta só
+    assert len(conn.sqls) == 1 and "lead_id = ANY(%s)" in conn.sqls[0][0]
+
+    assert sorted(u[-1] for u in lotes["updates"]) == ["L1", "L2", "L5"]
+    assert len(lotes["logs"]) == sum(pedidos.values())  # uma linha de log por tentativa
+    assert sorted(l[2] for l in lotes["logs"]) == [200, 200, 200, 400, 429, 503, 503]
+    assert lotes["lotes"] == 1 and conn.commits == 1
+
+
+def test_balde_de_tokens_respeita_taxa():
+    async def _main():
+        balde = ec.BaldeTokens(taxa=20, capacidade=2)
+        t0 = time.monotonic()
+        await asyncio.gather(*(balde.adquirir() for _ in range(6)))
+        return time.monotonic() - t0
+
+    # 2 da rajada + 4 a 20/s = ~0,2 s
+    assert 0.18 <= asyncio.run(_main()) < 1.0
+
+
+def test_espera_usa_retry_after_e_jitter(monkeypatch):
+    monkeypatch.setattr(ec, "CNPJA_BACKOFF_BASE_S", 1.0)
+    assert ec._espera(3, "2") == 2.0
+    assert all(0 <= ec._espera(3) <= 4.0 for _ in range(50))
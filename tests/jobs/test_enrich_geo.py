@@ -0,0 +1,175 @@
+# tests/jobs/test_enrich_geo.py
+
+import pytest
+
+from packages.jobs.enrichers import cache_geo as cg
+from packages.jobs.enrichers import enrich_geo_job as eg
+
+
+@pytest.fixture
+def conexao(banco):
+    """FakeConn com as coordenadas da lead_bruto e as linhas da cache_geo_cnpj."""
+    def _nova(coords=None, cache=None):
+        def _responder(sql, params):
+            if "FROM intel_lead.lead_bruto" in sql:
+                return [(uc, *conn.coords[uc]) for uc in params[0] if uc in conn.coords]
+            if sql.startswith("SELECT geohash"):
+                return [(r["geohash"], r["lat"], r["lon"], r["raio"], r["cnpjs"], r["resultado"])
+                        for r in conn.cache if r["geohash"] in params[0]]
+            return []
+
+        conn = banco(responder=_responder)
+        conn.coords = coords or {}
+        conn.cache = cache or []
+        conn.escritas = []  # (tabela, linhas) de cada execute_values
+        return conn
+    return _nova
+
+
+@pytest.fixture(autouse=True)
+def lotes(monkeypatch):
+    """Escritas em lote vão para conn.escritas (e o cache para conn.cache)."""
+    def _values(cur, sql, linhas, template=None, page_size=None):
+        tabela = "cache_geo_cnpj" if "cache_geo_cnpj" in sql else sql.split("INSERT INTO ")[1].split()[0]
+        cur.conn.escritas.append((tabela, list(linhas)))
+        if tabela == "cache_geo_cnpj":
+            for la, lo, r, cnpjs, gh, resultado in linhas:
+                cur.conn.cache.append({"lat": la, "lon": lo, "raio": r, "cnpjs": cnpjs, "geohash": gh,
+                                       "resultado": resultado.adapted if resultado else None})
+
+    monkeypatch.setattr(eg, "execute_values", _values)
+    monkeypatch.setattr(cg, "execute_values", _values)
+
+
+def test_geohash_vetor_conhecido():
+    assert cg.geohash(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    assert cg.geohash(-23.55052, -46.63331, 5) == "6gyf4"
+
+
+def test_celulas_vizinhas_cobrem_o_entorno():
+    viz = cg.celulas_vizinhas(-23.55052, -46.63331, 7)
+    assert len(viz) == 9 and viz[0] == cg.geohash(-23.55052, -46.63331, 7)
+    alt, larg = cg.tamanho_celula(7)
+    # pontos logo além da borda da célula caem numa vizinha
+    for dlat, dlon in [(alt, 0), (-alt, 0), (0, larg), (0, -larg), (alt, larg)]:
+        assert cg.geohash(-23.55052 + dlat, -46.63331 + dlon, 7) in viz
+
+
+def test_reuso_respeita_tolerancia_e_raio(conexao):
+    conn = conexao(cache=[{"lat": -23.55052, "lon": -46.63331, "raio": 125, "cnpjs": ["p1"],
+                            "geohash": cg.geohash(-23.55052, -46.63331, 7), "resultado": {"name": "Padaria"}}])
+    cache = cg.CacheGeo(conn, precisao=7, tolerancia_m=25)
+    # construir o cache não aplica schema nem faz backfill (migração de deploy)
+    assert conn.sqls == []
+
+    hit = cache.buscar(-23.55060, -46.63335, 100)  # ~10 m
+    assert hit["resultado"] == {"name": "Padaria"} and hit["distancia_m"] < 25
+    assert (hit["latitude"], hit["longitude"], hit["raio"]) == (-23.55052, -46.63331, 125)
+    assert cache.buscar(-23.55052, -46.63331, 200) is None  # raio maior que o do cache
+    assert cache.buscar(-23.55100, -46.63331, 100) is None  # ~53 m
+
+
+def test_reuso_exige_que_o_circulo_em_cache_contenha_o_pedido(conexao):
+    conn = conexao(cache=[{"lat": -23.55052, "lon": -46.63331, "raio": 100, "cnpjs": ["p1"],
+                            "geohash": cg.geohash(-23.55052, -46.63331, 7), "resultado": {"name": "Padaria"}}])
+    cache = cg.CacheGeo(conn, precisao=7, tolerancia_m=25)
+
+    # centro ~10 m fora: mesmo raio 100 deixaria uma faixa de ~10 m sem busca
+    assert cache.buscar(-23.55060, -46.63335, 100) is None
+    assert cache.buscar(-23.55060, -46.63335, 89)["distancia_m"] < 11
+    assert cache.buscar(-23.55052, -46.63331, 100)  # mesmo ponto
+    assert cache.raio_de_busca(100) == 125.0
+
+
+def test_lru_evita_banco_e_conta_acertos(conexao):
+    conn = conexao(cache=[{"lat": -23.55052, "lon": -46.63331, "raio": 125, "cnpjs": ["p1"],
+                            "geohash": cg.geohash(-23.55052, -46.63331, 7), "resultado": None}])
+    cache = cg.CacheGeo(conn, precisao=7, tolerancia_m=25)
+
+    assert cache.buscar(-23.55052, -46.63331, 100)
+    assert cache.buscar(-23.55055, -46.63331, 100)
+    assert cache.stats == {"lru": 1, "banco": 1, "miss": 0, "consultas_banco": 1}
+
+    # célula vazia também fica no LRU
+    assert cache.buscar(-22.90000, -43.20000, 100) is None
+    assert cache.buscar(-22.90000, -43.20000, 100) is None
+    assert cache.stats["miss"] == 2 and cache.stats["consultas_banco"] == 2
+    assert cache.taxa_acerto() == 0.5
+
+
+def test_lru_descarta_celulas_antigas(conexao):
+    cache = cg.CacheGeo(conexao(), precisao=7, max_celulas=9)
+    cache.buscar(-23.55052, -46.63331, 100)
+    cache.buscar(-22.90000, -43.20000, 100)
+    cache.buscar(-23.55052, -46.63331, 100)
+    assert cache.stats["consultas_banco"] == 3
+
+
+def test_lru_despejo_parcial_na_mesma_consulta(conexao):
+    # B divide células com A; a carga das que faltam despeja parte de A
+    conn = conexao(cache=[{"lat": -23.55052, "lon": -46.63331, "raio": 100, "cnpjs": ["p1"],
+                            "geohash": cg.geohash(-23.55052, -46.63331, 7), "resultado": {"name": "Padaria"}}])
+    cache = cg.CacheGeo(conn, precisao=7, max_celulas=12)
+    alt, larg = cg.tamanho_celula(7)
+    assert cache.buscar(-23.55052, -46.63331, 100)
+    assert cache.buscar(-23.55052 + 2 * alt, -46.63331 + 2 * larg, 100) is None
+    hit = cache.buscar(-23.55052, -46.63331, 100)
+    assert hit["resultado"] == {"name": "Padaria"}
+    assert len(cache._celulas) <= 12
+
+
+def _api_falsa(monkeypatch, chamadas):
+    class Resp:
+        status_code = 200
+        def json(self): return {"results": [{"place_id": "p1"}]}
+
+    monkeypatch.setattr(eg, "buscar_places", lambda lat, lon, raio: (chamadas.append(("nearby", raio)) or Resp(), 5))
+    monkeypatch.setattr(eg, "buscar_place_details",
+                        lambda pid: chamadas.append("details") or {"result": {"name": "Padaria", "types": []}})
+
+
+def test_job_reaproveita_vizinho_sem_chamar_api(monkeypatch, conexao):
+    conn = conexao(coords={"uc1": (-23.55052, -46.63331), "uc2": (-23.55058, -46.63333)})
+    chamadas = []
+    monkeypatch.setattr(eg, "get_db", lambda: conn)
+    _api_falsa(monkeypatch, chamadas)
+
+    eg.enriquecer_leads_google(["uc1", "uc2"])
+
+    assert chamadas == [("nearby", 125.0), "details"]
+    resultados = dict(conn.escritas)["enriquecimento_lead.lead_enriquecido"]
+    assert [(r[0], r[1]) for r in resultados] == [("uc1", "Padaria"), ("uc2", "Padaria")]
+    assert len(conn.cache) == 1 and conn.cache[0]["resultado"]["name"] == "Padaria"
+
+
+def test_job_busca_coordenadas_do_lote_e_grava_em_lote(monkeypatch, conexao):
+    coords = {f"uc{i}": (-23.5 - i * 0.01, -46.6) for i in range(5)}
+    conn = conexao(coords=coords)
+    monkeypatch.setattr(eg, "get_db", lambda: conn)
+    _api_falsa(monkeypatch, [])
+
+    eg.enriquecer_leads_google(list(coords) + ["uc_sumida"], lote=3)
+
+    consultas = [sql for sql, _ in conn.sqls if "lead_bruto" in sql]
+    assert len(consultas) == 2 and all("uc_id = ANY(%s)" in sql for sql in consultas)
+    # por lote: log_api, lead_enriquecido e cache, um statement cada
+    assert [t for t, _ in conn.escritas] == ["enriquecimento_lead.log_api", "enriquecimento_lead.lead_enriquecido",
+                                             "cache_geo_cnpj"] * 2
+    assert [len(l) for _, l in conn.escritas] == [3, 3, 3, 2, 2, 2]
+    assert conn.commits == 2
+
+
+def test_job_completa_entrada_antiga_no_centro_dela(monkeypatch, conexao):
+    # entrada antiga: só place_id, sem details
+    conn = conexao(coords={"uc1": (-23.55058, -46.63333)},
+                    cache=[{"lat": -23.55052, "lon": -46.63331, "raio": 125.0, "cnpjs": ["p1"],
+                            "geohash": cg.geohash(-23.55052, -46.63331, 7), "resultado": None}])
+    chamadas = []
+    monkeypatch.setattr(eg, "get_db", lambda: conn)
+    _api_falsa(monkeypatch, chamadas)
+
+    eg.enriquecer_leads_google(["uc1"])
+
+    assert chamadas == ["details"]
+    (la, lo, r, cnpjs, gh, _), = dict(conn.escritas)["cache_geo_cnpj"]
+    assert (la, lo, r, cnpjs) == (-23.55052, -46.63331, 125.0, ["p1"])
@@ -0,0 +1,99 @@
+# tests/jobs/test_gdb_cache.py
+
+import os
+import shutil
+import time
+
+import pytest
+
+fiona = pytest.importorskip("fiona")
+
+from packages.jobs.utils import gdb_cache
+
+
+@pytest.fixture
+def gdb_fake(tmp_path, monkeypatch):
+    """
+    GDB mínimo (OpenFileGDB) com uma layer UCBT_tab de 3 pontos.
+    """
+    monkeypatch.setattr(gdb_cache, "PROCESSED_DIR", tmp_path / "processed")
+    gdb = tmp_path / "CPFL_Paulista_2023.gdb"
+    schema = {
+        "geometry": "Point",
+        "properties": {"COD_ID": "str", "DIST": "int32", "DAT_CON": "datetime", "ENE_01": "float"},
+    }
+    rows = [
+        ("A1", 383, "2020-01-02T00:00:00", 10.5, (-46.6, -23.5)),
+        ("A2", 383, None, None, (-46.7, -23.6)),
+        ("A3", None, "2021-05-06T00:00:00", 3.0, (-46.8, -23.7)),
+    ]
+    with fiona.open(str(gdb), "w", driver="OpenFileGDB", schema=schema, layer="UCBT_tab", crs="EPSG:4326") as dst:
+        for cod, dist, dat, ene, xy in rows:
+            dst.write({
+                "geometry": {"type": "Point", "coordinates": xy},
+                "properties": {"COD_ID": cod, "DIST": dist, "DAT_CON": dat, "ENE_01": ene},
+            })
+    return gdb
+
+
+def test_converter_e_ler(gdb_fake):
+    manifest = gdb_cache.converter_gdb(gdb_fake)
+    assert manifest["layers"]["UCBT_tab"]["rows"] == 3
+    assert gdb_cache.cache_fresco(gdb_fake)
+    assert gdb_cache.listar_layers(gdb_fake) == ["UCBT_tab"]
+
+    df = gdb_cache.ler_layer(gdb_fake, "UCBT_tab", columns=["COD_ID", "DIST", "NAO_EXISTE"])
+    assert list(df.columns) == ["COD_ID", "DIST"]
+    # inteiros com nulo continuam inteiros (não viram "383.0")
+    assert df["DIST"].astype(str).tolist() == ["383", "383", "<NA>"]
+
+
+def test_predicate_pushdown_e_batches(gdb_fake):
+    gdb_cache.converter_gdb(gdb_fake)
+    df = gdb_cache.ler_layer(gdb_fake, "UCBT_tab", columns=["COD_ID"], filters=[("ENE_01", ">", 5)])
+    assert df["COD_ID"].tolist() == ["A1"]
+
+    batches = list(gdb_cache.iter_batches(gdb_fake, "UCBT_tab", batch_size=2))
+    assert sum(len(b) for b in batches) == 3
+
+
+def test_iter_features_formato_fiona(gdb_fake):
+    gdb_cache.converter_gdb(gdb_fake)
+    feats = list(gdb_cache.iter_features(gdb_fake, "UCBT_tab"))
+    assert feats[0]["geometry"]["type"] == "Point"
+    assert feats[0]["properties"]["COD_ID"] == "A1"
+    assert feats[2]["properties"]["DIST"] is None
+
+
+def test_cache_invalida_quando_gdb_muda(gdb_fake):
+    gdb_cache.converter_gdb(gdb_fake)
+    assert gdb_cache.cache_fresco(gdb_fake)
+    # como o downloader troca o .gdb: cópia em .partial, altera, rename por cima
+    parcial = gdb_fake.with_name(gdb_fake.name + ".partial")
+    shutil.copytree(gdb_fake, parcial)
+    alvo = next(p for p in parcial.iterdir() if p.is_file())
+    futuro = time.time() + 60
+    os.utime(alvo, (futuro, futuro))
+    shutil.rmtree(gdb_fake)
+    parcial.rename(gdb_fake)
+
+    assert not gdb_cache.cache_fresco(gdb_fake)
+    assert gdb_cache.layer_em_cache(gdb_fake, "UCBT_tab") is None
+
+
+def test_fingerprint_memorizado_enquanto_a_pasta_nao_muda(gdb_fake, monkeypatch):
+    gdb_cache.converter_gdb(gdb_fake)
+    varreduras = []
+    original = gdb_cache.fingerprint_gdb
+    monkeypatch.setattr(gdb_cache, "fingerprint_gdb", lambda p: varreduras.append(p) or original(p))
+
+    for _ in range(5):
+        assert gdb_cache.layer_em_cache(gdb_fake, "UCBT_tab")
+    assert len(varreduras) == 1
+
+    # arquivo novo na pasta muda o mtime dela: varre de novo
+    futuro = time.time() + 60
+    (gdb_fake / "novo.gdbtable").write_bytes(b"x")
+    os.utime(gdb_fake, (futuro, futuro))
+    assert not gdb_cache.cache_fresco(gdb_fake)
+    assert len(varreduras) == 2
@@ -0,0 +1,48 @@
+# tests/jobs/test_import_metrics.py
+
+import json
+
+from packages.jobs.utils import import_metrics
+from packages.jobs.utils.import_metrics import MetricasImport, perfilar
+
+
+def test_etapas_e_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(import_metrics, "METRICS_DIR", tmp_path)
+    m = MetricasImport(None, "UCBT")
+
+    for lote in m.medir_iter("read", [[1, 2, 3], [4, 5]]):
+        with m.etapa("sanitize", linhas=len(lote)) as reg:
+            reg["bytes"] = 10
+
+    resumo = m.resumo()
+    assert m.chunk == 2
+    assert resumo["etapas"]["read"]["linhas"] == 5
+    san = resumo["etapas"]["sanitize"]
+    assert (san["chunks"], san["linhas"], san["bytes"]) == (2, 5, 20)
+    assert [c["chunk"] for c in m.chunks if c["etapa"] == "sanitize"] == [1, 2]
+
+
+def test_salvar_sem_import_id_grava_so_json(tmp_path, monkeypatch):
+    monkeypatch.setattr(import_metrics, "METRICS_DIR", tmp_path)
+    chamou_db = []
+    monkeypatch.setattr(MetricasImport, "salvar_db", lambda self, resumo=None: chamou_db.append(1))
+
+    m = MetricasImport(None, "UCMT")
+    with m.etapa("copy", linhas=7):
+        pass
+    m.salvar()
+
+    arquivos = list(tmp_path.glob("UCMT_*.json"))
+    assert len(arquivos) == 1
+    dados = json.loads(arquivos[0].read_text(encoding="utf-8"))
+    assert dados["etapas"]["copy"]["linhas"] == 7
+    assert dados["chunks"][0]["etapa"] == "copy"
+    assert chamou_db == []
+
+
+def test_perfilar_cprofile(tmp_path, monkeypatch):
+    monkeypatch.setattr(import_metrics, "METRICS_DIR", tmp_path)
+    monkeypatch.setattr(import_metrics, "IMPORT_PROFILER", "cprofile")
+    with perfilar(True, "abc"):
+        sum(range(1000))
+    assert len(list(tmp_path.glob("abc_*.prof"))) == 1
@@ -0,0 +1,88 @@
+# tests/jobs/test_memoria.py
+
+import pandas as pd
+
+from packages.jobs.utils import memoria
+from packages.jobs.utils.memoria import OrcamentoMemoria, MB
+
+
+def _orcamento(monkeypatch, max_mb=200, base_mb=100, **kw):
+    monkeypatch.setattr(memoria, "rss_bytes", lambda atual=False: base_mb * MB)
+    return OrcamentoMemoria(max_mb, **kw)
+
+
+def test_chunk_inicial_ate_medir(monkeypatch):
+    orc = _orcamento(monkeypatch, chunk_inicial=1500)
+    assert orc.linhas_leitura() == 1500
+    assert orc.linhas_buffer() == 1500
+
+
+def test_dimensiona_pelos_bytes_medidos(monkeypatch):
+    monkeypatch.setattr(memoria, "IMPORT_FRACAO_LEITURA", 0.5)
+    orc = _orcamento(monkeypatch, max_mb=200, base_mb=100, max_linhas=10**9)
+
+    orc.observar_leitura(1000 * 1000, 1000)    # 1000 B/linha lida
+    orc.observar_buffer(10_000 * 1000, 1000)   # 10 kB/linha bufferizada
+
+    livre = 100 * MB
+    assert orc.linhas_leitura() == int(livre * 0.5 / (1000 * memoria.FATOR_TRABALHO))
+    assert orc.linhas_buffer() == int(livre * 0.5 / (10_000 * memoria.FATOR_PICO_FLUSH))
+
+    # linhas mais gordas -> chunks menores
+    antes = orc.linhas_leitura()
+    orc.observar_leitura(4000 * 1000, 1000)
+    assert orc.linhas_leitura() < antes
+
+
+def test_estourou_encolhe_orcamento(monkeypatch):
+    orc = _orcamento(monkeypatch, max_mb=200, base_mb=100)
+    orc.observar_buffer(10_000, 1)
+    antes = orc.linhas_buffer()
+
+    monkeypatch.setattr(memoria, "rss_bytes", lambda atual=False: 250 * MB)
+    assert orc.estourou()
+    assert orc.linhas_buffer() < antes
+
+    monkeypatch.setattr(memoria, "rss_bytes", lambda atual=False: 150 * MB)
+    assert not orc.estourou()
+
+
+def test_estourou_so_com_rss_crescendo_desde_o_flush(monkeypatch):
+    orc = _orcamento(monkeypatch, max_mb=200, base_mb=100)
+    rss = {"mb": 250}
+    monkeypatch.setattr(memoria, "rss_bytes", lambda atual=False: rss["mb"] * MB)
+
+    assert orc.estourou()
+    escala = orc.escala
+    # flush não devolveu a memória ao SO: RSS parado acima do limite não encolhe de novo
+    orc.registrar_flush()
+    assert not orc.estourou() and not orc.estourou()
+    assert orc.escala == escala
+    # o buffer voltou a crescer além do que o flush deixou: aí sim
+    rss["mb"] = 260
+    assert orc.estourou() and orc.escala < escala
+
+
+def test_estourou_ignora_o_pico_do_ru_maxrss(monkeypatch):
+    orc = _orcamento(monkeypatch, max_mb=200, base_mb=100)
+    # sem psutil nem /proc só sobra o pico, que nunca desce
+    monkeypatch.setattr(memoria, "rss_bytes", lambda atual=False: None if atual else 999 * MB)
+    assert not orc.estourou()
+
+
+def test_iter_chunks_tamanho_dinamico(monkeypatch):
+    from packages.jobs.importers import importer_ucbt_job as ucbt
+
+    feats = [{"properties": {"COD_ID": str(i)}} for i in range(10)]
+
+    class _Src(list):
+        def __enter__(self): return self
+        def __exit__(self, *a): return False
+
+    monkeypatch.setattr(ucbt.gdb_cache, "layer_em_cache", lambda *a, **k: None)
+    monkeypatch.setattr(ucbt.fiona, "open", lambda *a, **k: _Src(feats))
+
+    tamanhos = iter([2, 3, 100])
+    chunks = list(ucbt._iter_chunks("x.gdb", "UCBT_tab", lambda: next(tamanhos), ["COD_ID"]))
+    assert [len(c) for c in chunks] == [2, 3, 5]
+    assert pd.concat(chunks)["COD_ID"].tolist() == [str(i) for i in range(10)]
@@ -0,0 +1,64 @@
+# tests/jobs/test_migrar.py
+
+from packages.database import migrar
+
+
+def test_separar_comandos_respeita_dollar_quote_strings_e_comentarios():
+    sql = """
+    -- comentário; com ponto e vírgula
+    CREATE TABLE a (x TEXT DEFAULT 'a;b');
+    DO $$
+    BEGIN
+        PERFORM 1; PERFORM 2;
+    END $$;
+    /* bloco; */ CREATE INDEX CONCURRENTLY IF NOT EXISTS i ON a (x);
+    SELECT $tag$ ; $tag$, 'it''s;'
+    """
+    cmds = migrar.separar_comandos(sql)
+    assert len(cmds) == 4
+    assert cmds[0] == "CREATE TABLE a (x TEXT DEFAULT 'a;b')"
+    assert cmds[1].startswith("DO $$") and "PERFORM 2;" in cmds[1]
+    assert cmds[2] == "CREATE INDEX CONCURRENTLY IF NOT EXISTS i ON a (x)"
+    assert cmds[3] == "SELECT $tag$ ; $tag$, 'it''s;'"
+
+
+def _conn_migracoes(banco, aplicadas: dict):
+    """intel_lead.schema_migracoes falsa: o upsert grava em `aplicadas`, o SELECT lê dela."""
+    def _responder(sql, params):
+        if "INSERT INTO intel_lead.schema_migracoes" in sql:
+            aplicadas[params[0]] = params[1]
+        return list(aplicadas.items())
+    return banco(responder=_responder)
+
+
+def test_migrar_aplica_so_o_que_mudou(tmp_path, monkeypatch, banco):
+    monkeypatch.setattr(migrar, "SCHEMA_DIR", tmp_path)
+    (tmp_path / "a.sql").write_text("CREATE TABLE IF NOT EXISTS a (x INT);\nCREATE INDEX IF NOT EXISTS ai ON a (x);")
+    (tmp_path / "b.sql").write_text("CREATE TABLE IF NOT EXISTS b (x INT);")
+    conn = _conn_migracoes(banco, {})
+
+    def executados():
+        return [sql for sql, _ in conn.sqls]
+
+    assert migrar.migrar(conn, ["a.sql", "b.sql"]) == ["a.sql", "b.sql"]
+    assert conn.autocommit is True
+    # um execute por comando (CONCURRENTLY não roda em script de vários comandos)
+    assert "CREATE INDEX IF NOT EXISTS ai ON a (x)" in executados()
+
+    conn.sqls.clear()
+    assert migrar.migrar(conn, ["a.sql", "b.sql"]) == []
+    assert not any(c.startswith("CREATE TABLE IF NOT EXISTS a") for c in executados())
+
+    (tmp_path / "b.sql").write_text("CREATE TABLE IF NOT EXISTS b (x INT, y INT);")
+    assert migrar.migrar(conn, ["a.sql", "b.sql"]) == ["b.sql"]
+    assert executados()[-1].startswith("SELECT pg_advisory_unlock")
+
+
+def test_indices_da_fila_sao_concurrently_e_fora_do_runtime():
+    for nome in migrar.MIGRACOES:
+        for cmd in migrar.separar_comandos((migrar.SCHEMA_DIR / nome).read_text(encoding="utf-8")):
+            if "INDEX" in cmd.split("(")[0] and cmd.startswith(("CREATE", "DROP")):
+                assert "CONCURRENTLY" in cmd, cmd
+    troca = migrar.separar_comandos((migrar.SCHEMA_DIR / "import_queue_indice_prontos.sql").read_text())
+    assert [c.split()[0:4] for c in troca] == [["CREATE", "INDEX", "CONCURRENTLY", "IF"],
+                                              ["DROP", "INDEX", "CONCURRENTLY", "IF"]]
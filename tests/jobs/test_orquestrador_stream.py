@@ -0,0 +1,158 @@
+# tests/jobs/test_orquestrador_stream.py
+
+import asyncio
+import os
+import sys
+
+from packages.orquestrator import orquestrador_job as orq
+
+
+def _capturar(monkeypatch):
+    linhas = []
+    monkeypatch.setattr(orq.tqdm, "write", lambda s, *a, **k: linhas.append(s))
+    return linhas
+
+
+def test_stderr_verboso_nao_trava_o_filho(monkeypatch, tmp_path):
+    linhas = _capturar(monkeypatch)
+    # ~1 MB em stderr sem nenhum \n em stdout até o fim: com readline alternado isso travava
+    codigo = (
+        "import sys\n"
+        "for i in range(20000): sys.stderr.write('x' * 50 + '\\r')\n"
+        "sys.stderr.write('fim stderr\\n')\n"
+        "print('fim stdout')\n"
+    )
+    rc = orq._stream_run([sys.executable, "-c", codigo], tmp_path, rotulo="UCBT X_2023")
+    assert rc == 0
+    assert "[UCBT X_2023] fim stdout" in linhas
+    assert "[UCBT X_2023][stderr] fim stderr" in linhas
+
+
+def test_paralelo_com_painel(monkeypatch, tmp_path):
+    linhas = _capturar(monkeypatch)
+    painel = orq.Painel(total_jobs=2)
+    codigo = (
+        "import sys, time\n"
+        "sys.stderr.write(' 50%|#####     | 5/10 [00:01<00:01]\\r')\n"
+        "time.sleep(0.2)\n"
+        "print('ok', sys.argv[1])\n"
+    )
+
+    async def _dois():
+        for rot in ("A", "B"):
+            painel.abrir(rot)
+        rcs = await asyncio.gather(*(
+            orq.executar_streaming([sys.executable, "-c", codigo, rot], tmp_path, rot, painel) for rot in ("A", "B")))
+        assert painel.barras["A"].n == 50
+        for rot in ("A", "B"):
+            painel.fechar(rot)
+        return rcs
+
+    try:
+        assert asyncio.run(_dois()) == [0, 0]
+    finally:
+        painel.encerrar()
+    # progresso do filho vai para a barra, não para o log
+    assert sorted(linhas) == ["[A] ok A", "[B] ok B"]
+    assert painel.geral.n == 2
+
+
+def test_planejar_por_status_e_fingerprint():
+    assert orq.planejar(None, "fp1") == (True, "novo")
+    assert orq.planejar({"status": "completed", "fingerprint": "fp1"}, "fp1")[0] is False
+    # importado antes do fingerprint existir: confia no status
+    assert orq.planejar({"status": "completed", "fingerprint": None}, "fp1")[0] is False
+    assert orq.planejar({"status": "completed", "fingerprint": "fp0"}, "fp1") == \
+        (True, "gdb substituido (fingerprint mudou)")
+    assert orq.planejar({"status": "failed", "fingerprint": "fp1"}, "fp1") == (True, "execucao anterior failed")
+
+
+def _rodar_ponnot(monkeypatch, args, fingerprint):
+    """Roda importar_ponnot (sem GDB/banco) e devolve o import_status que ele gravaria."""
+    from packages.jobs import pool
+    from packages.jobs.importers import importer_ponnot_job as ponnot
+    from packages.jobs.utils import rastreio
+
+    gravados = {}
+
+    def _registrar(prefixo, ano, camada, status, import_id=None, **kw):
+        assert import_id == rastreio.gerar_import_id(prefixo, ano, camada)
+        gravados[(prefixo, ano, camada)] = {"status": status, "fingerprint": os.getenv(rastreio.FINGERPRINT_ENV)}
+
+    monkeypatch.setattr(ponnot, "registrar_status", _registrar)
+    monkeypatch.setattr(ponnot, "_importar", lambda *a: 10)
+    monkeypatch.setattr(ponnot.MetricasImport, "salvar", lambda self: None)
+    monkeypatch.setenv(rastreio.FINGERPRINT_ENV, fingerprint)
+    ponnot.importar_ponnot(**pool.kwargs_da_cli(ponnot.importar_ponnot, args, {"gdb": "gdb_path"}))
+    return gravados
+
+
+def test_ponnot_grava_status_na_chave_do_orquestrador(monkeypatch, tmp_path):
+    args = orq._build_args("PONNOT", tmp_path / "ENEL_SP_2022.gdb", "ENEL_SP", 2022, "ENEL_SP_2022")
+    assert _rodar_ponnot(monkeypatch, args, "fp-enel") == \
+        {("ENEL_SP_2022", 2022, "PONNOT"): {"status": "completed", "fingerprint": "fp-enel"}}
+
+
+def test_orquestrar_uma_consulta_e_pula_gdb_inalterado(monkeypatch, tmp_path):
+    _capturar(monkeypatch)
+    for nome in ("CPFL_Paulista_2023", "ENEL_SP_2022"):
+        (tmp_path / f"{nome}.gdb").mkdir()
+    monkeypatch.setattr(orq, "DOWNLOADS_DIR", tmp_path)
+    monkeypatch.setattr(orq, "GDB_PARQUET_CACHE", True)
+
+    # PONNOT do CPFL: status gravado pelo próprio importer, com os args que o orquestrador monta
+    gravados = _rodar_ponnot(monkeypatch, orq._build_args("PONNOT", tmp_path / "CPFL_Paulista_2023.gdb",
+                                                          "CPFL_Paulista", 2023, "CPFL_Paulista_2023"), "fp-cpfl")
+    consultas = []
+
+    def _status(alvos):
+        consultas.append(alvos)
+        feito = {"status": "completed", "fingerprint": "fp-cpfl"}
+        return ({("CPFL_Paulista_2023", 2023, c): feito for c in ("UCAT", "UCMT", "UCBT")}
+                | gravados
+                | {("ENEL_SP_2022", 2022, "UCBT"): {"status": "completed", "fingerprint": "antigo"}},
+                {"CPFL_Paulista_2023": "fp-cpfl", "ENEL_SP_2022": "fp-enel"})
+
+    rodados, caches = [], []
+
+    async def _importer(script, gdb, camada, dist, ano, prefixo, painel=None, fingerprint=None):
+        rodados.append((prefixo, camada, fingerprint))
+        return 0
+
+    async def _cache(gdb, prefixo, painel=None):
+        caches.append(prefixo)
+
+    from packages.jobs.utils import custo_import
+    monkeypatch.setattr(custo_import, "seg_por_linha_historico", lambda: {})
+    monkeypatch.setattr(custo_import, "contar_features", lambda gdb, camadas, prefixo=None: {c: 10 for c in camadas})
+    monkeypatch.setattr(orq, "_status_e_fingerprint", _status)
+    monkeypatch.setattr(orq, "_rodar_importer", _importer)
+    monkeypatch.setattr(orq, "_converter_cache", _cache)
+
+    orq.orquestrar_importacao(paralelo=2)
+
+    assert len(consultas) == 1
+    # CPFL inalterado: nem cache nem importers; ENEL: UCBT reimporta (gdb novo), resto é novo
+    assert caches == ["ENEL_SP_2022"]
+    assert sorted(rodados) == [("ENEL_SP_2022", c, "fp-enel") for c in ("PONNOT", "UCAT", "UCBT", "UCMT")]
+
+
+def test_despachar_lpt_respeita_dependencias():
+    ordem = []
+
+    def _tarefa(nome, custo, deps=()):
+        async def _rodar():
+            ordem.append(nome)
+        return {"custo": custo, "prioridade": custo, "deps": set(deps), "rodar": _rodar}
+
+    tarefas = {
+        "cacheA": _tarefa("cacheA", 1), "cacheB": _tarefa("cacheB", 1),
+        "A-ucbt": _tarefa("A-ucbt", 500, ["cacheA"]), "A-ucat": _tarefa("A-ucat", 5, ["cacheA"]),
+        "B-ucmt": _tarefa("B-ucmt", 50, ["cacheB"]),
+    }
+    # cache com dependente caro herda a prioridade dele
+    tarefas["cacheA"]["prioridade"] = 506
+    tarefas["cacheB"]["prioridade"] = 51
+
+    asyncio.run(orq.despachar_lpt(tarefas, paralelo=1))
+    assert ordem == ["cacheA", "A-ucbt", "cacheB", "B-ucmt", "A-ucat"]
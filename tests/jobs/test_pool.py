@@ -0,0 +1,96 @@
+# tests/jobs/test_pool.py
+
+import os
+import signal
+import sys
+import textwrap
+import time
+from pathlib import Path
+
+import pytest
+
+from packages.jobs import pool
+
+
+def test_entrada_do_script():
+    assert pool.entrada_do_script("./packages/jobs/importers/importer_ucbt_job.py")[1] == "importar_ucbt"
+    assert pool.entrada_do_script("packages/jobs/enrichers/enrich_geo_job.py") is None
+
+
+def test_kwargs_da_cli_tipos_e_renomeio():
+    def importar(gdb_path: Path, distribuidora: str, ano: int, chunk_size: int = 10, modo_debug: bool = False):
+        pass
+
+    kw = pool.kwargs_da_cli(
+        importar,
+        ["--gdb", "data/x.gdb", "--distribuidora", "ENEL", "--ano", "2023",
+         "--chunk-size", "500", "--modo_debug", "--profile"],
+        {"gdb": "gdb_path"},
+    )
+    assert kw == {"gdb_path": Path("data/x.gdb"), "distribuidora": "ENEL", "ano": 2023,
+                  "chunk_size": 500, "modo_debug": True}
+
+
+def test_rodar_entrada_aplica_env_e_restaura(tmp_path, monkeypatch):
+    (tmp_path / "imp_fake.py").write_text(textwrap.dedent("""
+        import os
+        CHUNK = int(os.getenv("FAKE_CHUNK", "1"))
+        CHAMADAS = []
+
+        def importar(ano: int, chunk: int = CHUNK):
+            CHAMADAS.append((ano, chunk))
+    """))
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delenv("FAKE_CHUNK", raising=False)
+
+    pool._rodar_entrada("imp_fake", "importar", ["--ano", "2023"], {}, {"FAKE_CHUNK": "7"})
+    assert sys.modules["imp_fake"].CHAMADAS == [(2023, 7)]  # módulo recarregado com o env do job
+    assert "FAKE_CHUNK" not in os.environ
+
+
+def test_env_recarrega_knobs_e_volta_ao_padrao(tmp_path, monkeypatch):
+    (tmp_path / "knobs_fake.py").write_text("import os\nLIMITE = int(os.getenv('FAKE_LIMITE', '1'))\n")
+    (tmp_path / "imp_knobs.py").write_text(textwrap.dedent("""
+        import knobs_fake
+        VISTOS = []
+
+        def importar(ano: int):
+            VISTOS.append(knobs_fake.LIMITE)
+    """))
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delenv("FAKE_LIMITE", raising=False)
+    monkeypatch.setattr(pool, "MODULOS_COM_KNOBS", ["knobs_fake"])
+    monkeypatch.setattr(pool, "_env_carregado", {})
+
+    import imp_knobs  # noqa: F401 — já carregado, como no forkserver
+    pool._rodar_entrada("imp_knobs", "importar", ["--ano", "1"], {}, {"FAKE_LIMITE": "9"})
+    assert sys.modules["imp_knobs"].VISTOS == [9]
+    # job seguinte sem env: knobs voltam ao padrão do boot
+    pool._rodar_entrada("imp_knobs", "importar", ["--ano", "1"], {}, {})
+    assert sys.modules["imp_knobs"].VISTOS == [1]
+    assert sys.modules["knobs_fake"].LIMITE == 1
+
+
+def test_sinal_so_interrompe_com_job_rodando(monkeypatch):
+    monkeypatch.setattr(pool, "_job_atual", None)
+    pool._interromper(None, None)  # ocioso: ignora
+
+    monkeypatch.setattr(pool, "_job_atual", 42)
+    with pytest.raises(pool.JobInterrompido):
+        pool._interromper(None, None)
+
+
+def test_interromper_sinaliza_o_processo_do_job(monkeypatch):
+    sinais = []
+    monkeypatch.setattr(pool.os, "kill", lambda pid, sig: sinais.append((pid, sig)))
+    monkeypatch.setattr(pool, "_pids_fila", None)
+    monkeypatch.setattr(pool, "_pids", {7: 4321})
+    monkeypatch.setattr(pool, "WORKER_POOL_KILL_SEC", 0.01)
+    descartes = []
+    monkeypatch.setattr(pool, "descartar_pool", lambda: descartes.append(1))
+
+    assert pool.interromper(8) is False
+    assert pool.interromper(7) is True
+    time.sleep(0.2)
+    # não saiu no prazo: SIGKILL + pool recriado
+    assert sinais == [(4321, signal.SIGUSR1), (4321, signal.SIGKILL)] and descartes == [1]
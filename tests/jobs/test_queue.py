@@ -0,0 +1,249 @@
+# tests/jobs/test_queue.py
+
+import json
+
+import pytest
+
+from packages.jobs import queue
+
+
+@pytest.fixture
+def conexoes(monkeypatch, banco):
+    abertas = []
+
+    def _connect(autocommit=False):
+        c = banco()
+        c.autocommit = autocommit
+        abertas.append(c)
+        return c
+
+    monkeypatch.setattr(queue, "_connect", _connect)
+    queue.fechar()
+    yield abertas
+    queue.fechar()
+
+
+def test_reusa_conexao_e_notifica(conexoes):
+    queue._conexao().respostas = [[(1, None)], None, [(2, None)], None]
+    assert queue.enqueue({"script": "a.py"}) == 1
+    assert queue.enqueue({"script": "b.py"}) == 2
+
+    assert len(conexoes) == 1
+    notifies = [p for sql, p in conexoes[0].sqls if "pg_notify" in sql]
+    assert notifies == [(queue.QUEUE_CHANNEL, "1"), (queue.QUEUE_CHANNEL, "2")]
+
+
+def test_reconecta_apos_queda(conexoes, banco):
+    conn = queue._conexao()
+
+    def _cai(*a, **k):
+        raise queue.psycopg2.OperationalError("server closed the connection")
+
+    conn.cursor = lambda: type("C", (banco.Cursor,), {"execute": _cai})(conn)
+    with pytest.raises(queue.psycopg2.OperationalError):
+        queue.complete(1)
+
+    queue.complete(1)
+    assert len(conexoes) == 2
+    assert conn.closed
+
+
+def test_aguardar_job_listen_e_notify(conexoes, monkeypatch):
+    # 1ª chamada só registra o LISTEN e pede um dequeue imediato
+    assert queue.aguardar_job(timeout=5) is True
+    listen = next(c for c in conexoes if c.autocommit)
+    assert listen.sqls[0][0] == f'LISTEN "{queue.QUEUE_CHANNEL}"'
+
+    monkeypatch.setattr(queue, "_segundos_ate_proximo", lambda recursos=None: None)
+    esperas = []
+
+    def _select(r, w, x, timeout):
+        esperas.append(timeout)
+        return ([], [], [])
+
+    monkeypatch.setattr(queue.select, "select", _select)
+    assert queue.aguardar_job(timeout=5) is False
+    assert esperas == [5]
+
+    listen.poll = lambda: None
+    listen.notifies.append("job 3")
+    assert queue.aguardar_job(timeout=5) is True
+    assert listen.notifies == []
+
+
+def test_proximo_usa_o_filtro_de_recursos_do_dequeue(conexoes, monkeypatch):
+    conn = queue._conexao()
+    conn.respostas = [(12.5,)]
+    assert queue._segundos_ate_proximo(["download"]) == 12.5
+    sql, params = conn.sqls[-1]
+    assert "= ANY(%s::text[])" in sql and params[:2] == (["download"], ["download"])
+
+    pedidos = []
+    monkeypatch.setattr(queue, "_segundos_ate_proximo", lambda recursos=None: pedidos.append(recursos))
+    monkeypatch.setattr(queue.select, "select", lambda r, w, x, timeout: ([], [], []))
+    queue.aguardar_job(timeout=5)  # registra o LISTEN
+    queue.aguardar_job(timeout=5, recursos=["download"])
+    assert pedidos == [["download"]]
+
+
+def test_depends_on_e_falha_em_cascata(conexoes):
+    conn = queue._conexao()
+    conn.respostas = [[(9, None)], None]
+    assert queue.enqueue({"script": "imp.py"}, depends_on=[7]) == 9
+    insert = next(p for sql, p in conn.sqls if sql.startswith("INSERT INTO import_queue"))
+    assert insert[3] == [7]
+
+    conn.sqls.clear()
+    conn.respostas = [(3, 3, "running", None), None, None]  # tries == max_retries -> falha definitiva
+    queue.fail(7)
+    sqls = [sql for sql, _ in conn.sqls]
+    assert any("SET status='failed'" in s and "WHERE id=%s" in s for s in sqls)
+    assert any(s.startswith("WITH RECURSIVE dep") for s in sqls)
+
+
+def test_dequeue_so_libera_com_pais_done(conexoes):
+    conn = queue._conexao()
+    queue.dequeue("w1", ["import"])
+    sql, params = conn.sqls[-1]
+    assert "p.status <> 'done'" in sql
+    assert params["recursos"] == ["import"]
+
+
+def test_chave_justa_e_classe():
+    ucbt = {"script": "packages/jobs/importers/importer_ucbt_job.py",
+            "args": ["--gdb", "x.gdb", "--distribuidora", "ENEL_SP", "--ano", "2023"]}
+    assert queue.chave_justa(ucbt) == "ENEL_SP"
+    assert queue.classe_job(ucbt) == "UCBT"
+    assert queue.chave_justa({**ucbt, "tenant": "cliente-a"}) == "cliente-a"
+    assert queue.chave_justa({"download": {"distribuidora": "CPFL", "ano": 2023}}) == "CPFL"
+    assert queue.classe_job({"download": {}}) == "download"
+    assert queue.classe_job({"script": "packages/jobs/enrichers/enrich_cnpj_job.py"}) == "enrich_cnpj_job"
+
+    assert queue._ler_mapa("UCBT=2, UCMT=4") == {"UCBT": 2, "UCMT": 4}
+    assert queue._ler_mapa('{"ENEL_SP": 0.5}', float) == {"ENEL_SP": 0.5}
+    assert queue._ler_mapa("") == {}
+
+
+def test_dequeue_fair_share_aging_e_caps(conexoes, monkeypatch):
+    monkeypatch.setattr(queue, "QUEUE_CAPS", {"UCBT": 2})
+    monkeypatch.setattr(queue, "QUEUE_PESOS", {"CPFL": 2.0})
+    monkeypatch.setattr(queue, "QUEUE_AGING_SEC", 300)
+    monkeypatch.setattr(queue, "QUEUE_AGING_MAX", 2)
+    conn = queue._conexao()
+    # candidato UCBT -> lock da classe -> recontagem (1 < 2) -> UPDATE
+    conn.respostas = [(4, "UCBT"), None, (1,), (4, {"script": "a.py"}, 1, 3)]
+    job = queue.dequeue("w1")
+    assert job["id"] == 4
+
+    sql, params = conn.sqls[0]
+    assert "COALESCE(pc.n, 0) <" in sql and "FOR UPDATE OF q2 SKIP LOCKED" in sql
+    assert "LEAST(floor(" in sql and params["aging_max"] == 2
+    assert json.loads(params["caps"]) == {"UCBT": 2}
+    assert json.loads(params["pesos"]) == {"CPFL": 2.0}
+    assert params["aging"] == 300
+    # lock só da classe escolhida, na mesma transação
+    assert conn.sqls[1][0].startswith("SELECT pg_advisory_xact_lock")
+    assert conn.sqls[1][1] == (f"{queue._ADVISORY_DEQUEUE}:UCBT",)
+    assert conn.sqls[3][0].startswith("UPDATE import_queue SET status = 'running'")
+    assert conn.sqls[3][1] == ("w1", queue.WORKER_LEASE_SEC, 4)
+    assert conn.commits == 1
+
+
+def test_dequeue_sem_lock_para_classe_sem_cap(conexoes, monkeypatch):
+    monkeypatch.setattr(queue, "QUEUE_CAPS", {"UCBT": 2})
+    conn = queue._conexao()
+    conn.respostas = [(5, "PONNOT"), (5, {"script": "p.py"}, 1, 3)]
+    assert queue.dequeue("w1")["id"] == 5
+    assert not any("pg_advisory" in sql for sql, _ in conn.sqls)
+
+
+def test_dequeue_classe_lotou_tenta_outra(conexoes, monkeypatch):
+    monkeypatch.setattr(queue, "QUEUE_CAPS", {"UCBT": 2})
+    conn = queue._conexao()
+    # outro worker pegou o 2º UCBT entre a escolha e o lock
+    conn.respostas = [(4, "UCBT"), None, (2,), (6, "UCMT"), (6, {"script": "m.py"}, 1, 3)]
+    assert queue.dequeue("w1")["id"] == 6
+    selects = [p for sql, p in conn.sqls if sql.startswith("WITH rodando AS")]
+    assert selects[0]["excluir"] == [] and selects[1]["excluir"] == ["UCBT"]
+
+
+def test_enqueue_grava_chave_e_classe(conexoes):
+    conn = queue._conexao()
+    conn.respostas = [[(1, None)], None]
+    queue.enqueue({"script": "packages/jobs/importers/importer_ponnot_job.py",
+                   "args": ["--distribuidora", "CPFL", "--ano", "2024"]})
+    payload = json.loads(conn.sqls[0][1][0])
+    assert payload["fair_key"] == "CPFL" and payload["classe"] == "PONNOT"
+
+
+def test_fail_ignora_job_que_nao_e_mais_do_worker(conexoes):
+    conn = queue._conexao()
+    conn.respostas = [(1, 3, "running", "worker-b")]
+    assert queue.fail(5, worker_id="worker-a") is False
+    assert not any(sql.startswith("UPDATE") for sql, _ in conn.sqls)
+
+
+def test_heartbeat_e_reaper(conexoes):
+    conn = queue._conexao()
+    conn.respostas = [[(1,), (3,)]]
+    assert queue.heartbeat([1, 2, 3], "worker-a") == {1, 3}
+    sql, params = conn.sqls[-1]
+    assert "lease_until = now() + make_interval" in sql
+    assert params == (queue.WORKER_LEASE_SEC, [1, 2, 3], "worker-a")
+
+    conn.sqls.clear()
+    conn.respostas = [[(10, 1, 3), (11, 3, 3)], None, None, None]
+    assert queue.reap() == [10, 11]
+    sqls = conn.sqls
+    assert "lease_until < now()" in sqls[0][0]
+    # 10: ainda tem tentativa -> volta para queued com o backoff do fail
+    assert sqls[1][0].startswith("UPDATE import_queue SET status='queued'")
+    assert sqls[1][1] == (queue.backoff_sec(1), 10)
+    # 11: esgotou -> failed (+ cascata nos dependentes)
+    assert "SET status='failed'" in sqls[2][0] and sqls[2][1] == (11,)
+    assert sqls[3][0].startswith("WITH RECURSIVE dep")
+
+
+def test_arquivar_cria_particoes_e_move_em_lotes(conexoes, banco):
+    import datetime as dt
+
+    conn = queue._conexao()
+    lotes = iter([3, 1])
+
+    class _Cur(banco.Cursor):
+        @property
+        def rowcount(self):
+            return next(lotes) if "INSERT INTO import_queue_archive" in self.conn.sqls[-1][0] else 0
+
+    conn.cursor = lambda: _Cur(conn)
+    conn.respostas = [[(dt.date(2025, 1, 1),), (dt.date(2025, 2, 1),)]]
+
+    assert queue.arquivar(dias=14, lote=3) == 4
+    sqls = [sql for sql, _ in conn.sqls]
+    assert sum("PARTITION OF import_queue_archive" in s for s in sqls) == 2
+    assert any("import_queue_archive_202501" in s for s in sqls)
+    assert sum(s.startswith("WITH movidos AS") for s in sqls) == 2
+
+
+def test_enqueue_many_um_insert_e_dedup(conexoes):
+    conn = queue._conexao()
+    # b já está queued (conflito no índice parcial): não volta no RETURNING
+    conn.respostas = [[(10, "a"), (11, None)], [("b", 7)], None]
+    ids = queue.enqueue_many(
+        [{"script": "x.py"}, {"script": "y.py"}, {"script": "z.py"}],
+        depends_on=[None, [1], None],
+        dedup_keys=["a", "b", None],
+    )
+    assert ids == [10, 7, 11]
+
+    sqls = conn.sqls
+    assert sum(sql.startswith("INSERT INTO import_queue") for sql, _ in sqls) == 1
+    insert_sql, insert_params = sqls[0]
+    assert "ON CONFLICT (dedup_key) WHERE dedup_key IS NOT NULL" in insert_sql
+    assert len(insert_params) == 3 * 5 and insert_params[8] == [1]
+    assert sqls[1][1] == (["b"],)
+    assert sum("pg_notify" in sql for sql, _ in sqls) == 1
+    assert conn.commits == 1
+
+    with pytest.raises(ValueError):
+        queue.enqueue_many([{"script": "x.py"}], dedup_keys=["a", "b"])
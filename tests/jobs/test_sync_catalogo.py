@@ -0,0 +1,82 @@
+# tests/jobs/test_sync_catalogo.py
+
+import csv
+import io
+import json
+from pathlib import Path
+
+import pandas as pd
+
+from packages.jobs.download import sync_catalogo
+
+FIXTURE = Path(__file__).parent / "fixtures" / "arcgis_search.json"
+
+
+class FakeResposta:
+    def __init__(self, corpo):
+        self.corpo = corpo
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.corpo
+
+
+class FakeSessao:
+    """Reproduz as páginas gravadas da busca, pelo param `start`."""
+
+    def __init__(self, paginas):
+        self.paginas = {p["start"]: p for p in paginas}
+        self.pedidos = []
+
+    def get(self, url, params=None, timeout=None):
+        self.pedidos.append(params)
+        return FakeResposta(self.paginas[params["start"]])
+
+
+def _df():
+    sessao = FakeSessao(json.loads(FIXTURE.read_text(encoding="utf-8")))
+    return sync_catalogo.itens_para_df(sync_catalogo.paginar_itens("BDGD", sessao=sessao)), sessao
+
+
+def test_pagina_ate_next_start_e_monta_df():
+    df, sessao = _df()
+    assert [p["start"] for p in sessao.pedidos] == [1, 4]
+    assert all(p["num"] == sync_catalogo.ARCGIS_PAGINA for p in sessao.pedidos)
+
+    # ENEL RJ veio nas duas páginas: uma linha só
+    assert len(df) == 4 and df["url_hash"].is_unique
+    assert list(df.columns) == sync_catalogo.COLUNAS
+    enel = df[df["title"] == "ENEL SP - 2023-12-31"].iloc[0]
+    assert enel["url"].endswith("/115771069b4944bcbbfe0cc0f656a5a7/data")
+    assert enel["modified"] == pd.Timestamp("2025-06-10 19:24:03", tz="UTC")
+    assert json.loads(enel["tags"]) == ["BDGD", "ANEEL", "Distribuição"]
+
+
+def test_upsert_copy_e_merge_unico(monkeypatch, banco):
+    df, _ = _df()
+    indexados = []
+    monkeypatch.setattr(sync_catalogo.catalogo, "indexar_catalogo",
+                        lambda cur, ids=None: indexados.append(ids) or len(ids))
+    cur = banco([None, [
+        {"id": 1, "title": "ENEL SP - 2023-12-31", "url_hash": "a", "novo": True},
+        {"id": 2, "title": "LIGHT - 2022-12-31", "url_hash": "b", "novo": False},
+    ]]).cursor()
+
+    rel = sync_catalogo.upsert_catalogo(cur, df)
+    assert [i["id"] for i in rel["novos"]] == [1]
+    assert [i["id"] for i in rel["modificados"]] == [2]
+    assert rel["inalterados"] == 2
+    assert indexados == [[1, 2]]
+
+    # 4 linhas num COPY só (CSV válido mesmo com aspas e vírgulas no snippet)
+    linhas = list(csv.reader(io.StringIO(cur.copiado)))
+    assert len(linhas) == 4 and all(len(l) == len(sync_catalogo.COLUNAS) for l in linhas)
+    assert 'BDGD CPFL Paulista, "ciclo" 2023' in [l[7] for l in linhas]
+
+    sqls = [s for s, _ in cur.sqls]
+    assert sum(s.startswith("INSERT INTO") for s in sqls) == 1
+    merge = next(s for s in sqls if s.startswith("INSERT INTO"))
+    assert "ON CONFLICT (url_hash) DO UPDATE" in merge and "IS DISTINCT FROM" in merge
+    assert cur.sqls[-1][1] == ([1, 2],)
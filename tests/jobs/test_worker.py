@@ -0,0 +1,189 @@
+# tests/jobs/test_worker.py
+
+import time
+
+import pytest
+
+from packages.jobs import worker
+from packages.jobs.queue import classificar_recurso
+from packages.jobs.utils.memoria import MB
+
+
+@pytest.fixture
+def host(monkeypatch):
+    monkeypatch.setattr(worker, "CPUS", 4)
+    monkeypatch.setattr(worker, "WORKER_SLOTS", 4)
+    monkeypatch.setattr(worker, "LIMITE_RECURSO", {"download": 1, "import": 3, "enrich": 2})
+    monkeypatch.setattr(worker, "MEM_RECURSO_MB", {"download": 64, "import": 1024, "enrich": 256})
+    monkeypatch.setattr(worker, "WORKER_MEM_RESERVA_MB", 512)
+    monkeypatch.setattr(worker, "WORKER_DB_CONNS", 10)
+
+
+def _job(recurso, mem_mb=0, idade=3600):
+    return {"recurso": recurso, "mem_mb": mem_mb, "inicio": time.monotonic() - idade}
+
+
+def test_classificar_recurso():
+    assert classificar_recurso({"download": {"ano": 2023}}) == "download"
+    assert classificar_recurso({"script": "packages/jobs/importers/importer_ucbt_job.py"}) == "import"
+    assert classificar_recurso({"script": "packages/jobs/enrichers/enrich_cnpj_job.py"}) == "enrich"
+    assert classificar_recurso({"script": "x.py", "recurso": "download"}) == "download"
+
+
+def test_ocioso_admite_tudo_mesmo_sem_ram(host):
+    assert worker._recursos_livres([], mem_disponivel=0, load1=99.0) == ["download", "import", "enrich"]
+
+
+def test_limite_por_classe_e_slots(host, monkeypatch):
+    ativos = [_job("download")]
+    assert "download" not in worker._recursos_livres(ativos, None, None)
+
+    ativos = [_job("import")] * 4
+    assert worker._recursos_livres(ativos, None, None) == ["download"]  # prefetch fora dos slots
+
+    monkeypatch.setattr(worker, "WORKER_PREFETCH_DOWNLOAD", False)
+    assert worker._recursos_livres(ativos, None, None) == []
+
+
+def test_ram_cpu_e_conexoes(host, monkeypatch):
+    ativos = [_job("import")]
+    # 1.2 GB livres - 512 MB de reserva: não cabe outro import (1 GB), cabe download/enrich
+    assert worker._recursos_livres(ativos, 1200 * MB, 0.5) == ["download", "enrich"]
+
+    # import recém-iniciado ainda não alocou: a estimativa dele conta contra a RAM livre
+    ativos = [_job("import", mem_mb=1024, idade=1)]
+    assert worker._recursos_livres(ativos, 1700 * MB, 0.5) == ["download"]
+
+    # load alto barra só import
+    assert worker._recursos_livres([_job("enrich")], 64 * 1024 * MB, 3.9) == ["download", "enrich"]
+
+    # 5 jobs x 2 conexões = orçamento esgotado
+    monkeypatch.setattr(worker, "WORKER_SLOTS", 8)
+    assert worker._recursos_livres([_job("enrich")] * 2 + [_job("import")] * 3, None, None) == []
+
+
+class _UmaVolta:
+    """Event falso: deixa o loop da thread rodar uma volta e para."""
+    def __init__(self):
+        self.voltas = 0
+
+    def wait(self, timeout=None):
+        self.voltas += 1
+        return self.voltas > 1
+
+
+def test_manutencao_so_heartbeat_e_reaper(monkeypatch):
+    import threading
+
+    chamadas = []
+    lock = threading.Lock()
+    monkeypatch.setattr(worker, "heartbeat", lambda ids, wid: chamadas.append(("hb", sorted(ids))) or set(ids))
+    monkeypatch.setattr(worker, "reap", lambda: chamadas.append("reap") or [])
+    monkeypatch.setattr(worker, "arquivar", lambda: chamadas.append("arquivar") or 0)
+    monkeypatch.setattr(worker, "publicar_worker", lambda *a: chamadas.append("publicar"))
+
+    worker._manutencao("w1", {3: {}, 1: {}}, lock, _UmaVolta())
+    assert chamadas == [("hb", [1, 3]), "reap", "publicar"]
+    assert not lock.locked()
+
+    # arquivamento roda na thread dele
+    chamadas.clear()
+    worker._arquivamento(_UmaVolta())
+    assert chamadas == ["arquivar"]
+
+
+def test_manutencao_publica_contadores_mesmo_com_falha_no_heartbeat(monkeypatch):
+    import threading
+    from concurrent.futures import Future
+
+    publicados = []
+    monkeypatch.setattr(worker, "WORKER_SLOTS", 3)
+    monkeypatch.setattr(worker, "_contadores", {"ocupado_s": 100.0, "rejeicoes_admissao": 2, "leases_perdidas": 0})
+    monkeypatch.setattr(worker, "publicar_worker", lambda *a: publicados.append(a))
+    monkeypatch.setattr(worker, "reap", lambda: [])
+
+    rodando, terminado = Future(), Future()
+    terminado.set_result(None)
+    ativos = {
+        1: {"recurso": "import", "inicio": time.monotonic() - 50, "future": rodando},
+        2: {"recurso": "import", "inicio": time.monotonic() - 500, "future": terminado},  # já contado no callback
+    }
+    # job 2 perdeu a lease
+    monkeypatch.setattr(worker, "heartbeat", lambda ids, wid: {1})
+    worker._manutencao("w1", ativos, threading.Lock(), _UmaVolta())
+
+    (wid, slots, ocupados, ocupado_s, rejeicoes, perdidas), = publicados
+    assert (wid, slots, ocupados, rejeicoes, perdidas) == ("w1", 3, 1, 2, 1)
+    assert 150 <= ocupado_s < 160
+
+    # banco fora: heartbeat falha, a publicação ainda é tentada (e o erro não derruba a thread)
+    def _cai(*a):
+        raise OSError("sem banco")
+    monkeypatch.setattr(worker, "heartbeat", _cai)
+    worker._manutencao("w1", ativos, threading.Lock(), _UmaVolta())
+    assert len(publicados) == 2
+
+
+def _job_com_download():
+    return {"id": 7, "tries": 0, "payload": {"download": {"distribuidora": "ENEL SP", "ano": 2023},
+                                              "script": "packages/jobs/importers/importer_ucbt_job.py",
+                                              "args": ["--gdb", "<auto>"]}}
+
+
+@pytest.fixture
+def fila(monkeypatch):
+    """complete/fail/heartbeat falsos; `dono` = o job ainda é deste worker."""
+    estado = {"dono": True, "chamadas": []}
+    monkeypatch.setattr(worker, "complete", lambda jid, wid=None: estado["chamadas"].append(("complete", jid)))
+    monkeypatch.setattr(worker, "fail", lambda jid, **k: estado["chamadas"].append(("fail", jid)))
+    monkeypatch.setattr(worker, "heartbeat", lambda ids, wid: set(ids) if estado["dono"] else set())
+    monkeypatch.setattr(worker, "_spawn_low_priority",
+                        lambda cmd, env=None: estado["chamadas"].append(("spawn", cmd[-1])) or _Proc())
+    return estado
+
+
+class _Proc:
+    def wait(self): return 0
+    def poll(self): return 0
+
+
+def test_lease_perdida_durante_o_download_nao_roda_o_import(monkeypatch, fila):
+    def _baixa(spec, cancelar):
+        fila["dono"] = False  # reaper devolveu o job enquanto baixava
+        return "/data/downloads/ENEL_SP_2023.gdb"
+
+    monkeypatch.setattr(worker, "_maybe_download", _baixa)
+    worker._executar_job(_job_com_download(), "w1")
+    # sem import, sem complete/fail: o job agora é de outro worker
+    assert fila["chamadas"] == []
+
+    # lease já perdida antes: nem baixa
+    monkeypatch.setattr(worker, "_maybe_download", lambda *a: pytest.fail("baixou sem lease"))
+    worker._executar_job(_job_com_download(), "w1")
+    assert fila["chamadas"] == []
+
+    # com a lease: import e complete
+    fila["dono"] = True
+    monkeypatch.setattr(worker, "_maybe_download", lambda spec, cancelar: "/data/downloads/ENEL_SP_2023.gdb")
+    worker._executar_job(_job_com_download(), "w1")
+    assert fila["chamadas"] == [("spawn", "/data/downloads/ENEL_SP_2023.gdb"), ("complete", 7)]
+
+
+def test_manutencao_cancela_o_download_do_job_perdido(monkeypatch, fila):
+    import threading
+
+    cancelar = threading.Event()
+
+    def _baixa(spec, c):
+        assert c is cancelar
+        # a manutenção roda uma volta enquanto o download está no meio
+        fila["dono"] = False
+        monkeypatch.setattr(worker, "publicar_worker", lambda *a: None)
+        monkeypatch.setattr(worker, "reap", lambda: [])
+        worker._manutencao("w1", {7: {"cancelar": cancelar}}, threading.Lock(), _UmaVolta())
+        assert c.is_set()
+        raise worker.DownloadCancelado("download cancelado")
+
+    monkeypatch.setattr(worker, "_maybe_download", _baixa)
+    worker._executar_job(_job_com_download(), "w1", cancelar)
+    assert fila["chamadas"] == []
@@ -5,32 +5,23 @@ from pathlib import Path
 CSV_PATH = Path("data/downloads/aneel_catalogo_arcgis.csv")
 OUTPUT_PATH = Path("data/models/aneel_gdb_index.json")
 
-def extrair_distribuidora_ano(title: str) -> tuple[str, int]:
-    try:
-        partes = title.split(" - ")
-        distribuidora = partes[0].strip()
-        ano = int(partes[1].split("-")[0])
-        return distribuidora, ano
-    except Exception:
-        return "DESCONHECIDO", 0
-
 def processar_catalogo():
     df = pd.read_csv(CSV_PATH)
-    registros = []
-
-    for _, row in df.iterrows():
-        distribuidora, ano = extrair_distribuidora_ano(str(row["title"]))
-        dataset_id = row["id"]
-        url_download = f"https://www.arcgis.com/sharing/rest/content/items/{dataset_id}/data"
 
-        registros.append({
-            "distribuidora": distribuidora,
-            "ano": ano,
-            "id": dataset_id,
-            "download": url_download,
-            "created": row["created"],
-            "modified": row["modified"]
-        })
+    # "<DISTRIBUIDORA> - <AAAA>-MM-DD": colunas inteiras de uma vez (sem iterrows)
+    partes = df["title"].astype(str).str.split(" - ", n=1, expand=True).reindex(columns=[0, 1])
+    ano = pd.to_numeric(partes[1].str.split("-").str[0], errors="coerce")
+    ok = ano.notna()
+
+    saida = pd.DataFrame({
+        "distribuidora": partes[0].str.strip().where(ok, "DESCONHECIDO"),
+        "ano": ano.fillna(0).astype(int),
+        "id": df["id"],
+        "download": "https://www.arcgis.com/sharing/rest/content/items/" + df["id"].astype(str) + "/data",
+        "created": df["created"],
+        "modified": df["modified"],
+    })
+    registros = saida.to_dict(orient="records")
 
     OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
     with open(OUTPUT_PATH, "w", encoding="utf-8") as f:
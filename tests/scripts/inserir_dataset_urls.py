@@ -5,7 +5,9 @@ from pathlib import Path
 import sys
 
 sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+from psycopg2.extras import RealDictCursor
 from packages.database.connection import get_db_connection
+from packages.jobs.download.catalogo import indexar_catalogo
 
 CSV_PATH = Path("data/scripts/url.csv")
 URL_BASE = "https://www.arcgis.com/sharing/rest/content/items"
@@ -75,8 +77,12 @@ def inserir_dados_catalogo():
                     else:
                         print(f"⚠️ Já existia: {title}")
 
+            # índice de resolução (distribuidora canônica/ano) usado pelo downloader e pela API
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                indexados = indexar_catalogo(cur)
+
             conn.commit()
-            print(f"\n🎯 Fim da execução: {inseridos} novos registros inseridos.")
+            print(f"\n🎯 Fim da execução: {inseridos} novos registros inseridos, {indexados} indexados.")
 
     except Exception as e:
         print(f"❌ ERRO FATAL: {e}")